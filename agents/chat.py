@@ -4,17 +4,30 @@ AgentChat主类 - 多Agent聊天管理器
 
 import asyncio
 import json
+import sys
 from typing import Dict, List, Optional, AsyncGenerator, Any, Callable
 from datetime import datetime
 from autogen_agentchat.agents import AssistantAgent
+from autogen_agentchat.messages import ModelClientStreamingChunkEvent, TextMessage
 from autogen_ext.models.openai import OpenAIChatCompletionClient
-from autogen_core.models import UserMessage, AssistantMessage
+from autogen_core.model_context import UnboundedChatCompletionContext
+from autogen_core.models import AssistantMessage, LLMMessage, UserMessage
 
 from .types import AgentType
 from .config import AgentConfig
-from database import ConversationDatabase, DB_CONFIG
+from database import ConversationDatabase
 from tools import tools_manager, ToolCategory, ToolPermission
 
+# 会话共享历史保留的消息数（新agent的模型上下文）
+HISTORY_LIMIT = 20
+# 写入新agent系统提示的最近消息数
+HISTORY_PROMPT_MESSAGES = 5
+
+# 内存估算的固定开销（字节）：AgentChat 自身，以及每个 AssistantAgent 不含上下文消息的部分
+# （用 tracemalloc 在 autogen-agentchat 0.7.5 上测得约 1.7KB）
+SESSION_OVERHEAD_BYTES = 1024
+AGENT_OVERHEAD_BYTES = 2048
+
 class AgentChat:
     """
     Multi-agent chat manager with tools and memory functionality.
@@ -31,20 +44,29 @@ class AgentChat:
     - Conversation history management
     """
     
-    def __init__(self, model_client: OpenAIChatCompletionClient, conversation_id: str = "default"):
+    def __init__(self, model_client: OpenAIChatCompletionClient, conversation_id: str = "default",
+                 db: Optional[ConversationDatabase] = None):
         """
         Initialize the AgentChat manager.
         
         Args:
             model_client: OpenAI compatible model client
             conversation_id: Unique identifier for this conversation
+            db: Conversation database; defaults to one borrowing the process-wide shared pool
         """
         self.model_client = model_client
         self.conversation_id = conversation_id
         self.agents: Dict[AgentType, AssistantAgent] = {}
         self.current_agent_type = AgentType.GENERAL
-        self.db = ConversationDatabase(**DB_CONFIG)
+        self.db = db or ConversationDatabase()
+        # 会话共享历史：首次使用时从数据库加载一次，之后随每轮对话增量追加，所有agent从这里初始化
         self.conversation_history: List[Dict] = []
+        self._history_loaded = False
+        self._history_lock = asyncio.Lock()
+        # 加载历史时该会话的序号冲突次数；之后发生冲突（其他进程写入、缓冲写入时重新编号）则重新加载
+        self._history_generation = 0
+        # 每个agent的模型上下文已包含到的消息序号
+        self._agent_seen: Dict[AgentType, int] = {}
     
     def _get_tools_for_agent(self, agent_type: AgentType) -> List[Callable]:
         """为指定agent类型获取工具"""
@@ -63,58 +85,86 @@ class AgentChat:
         # 返回工具函数
         return tools_manager.get_tool_functions(tool_names)
 
-    async def _get_history_context(self) -> str:
-        """获取历史对话上下文字符串（备用方案）"""
-        try:
-            # 获取最近5条消息作为上下文
-            history_messages = await self.db.get_recent_messages(self.conversation_id, limit=5)
+    def _history_current(self) -> bool:
+        return self._history_loaded and self.db.sequences.generation(self.conversation_id) == self._history_generation
 
-            if not history_messages:
-                return ""
+    async def _load_history(self):
+        """
+        每个会话只从数据库加载一次最近的历史，之后由 _append_history 增量追加
 
-            context_lines = []
-            for msg in history_messages:
-                role_name = "用户" if msg["role"] == "user" else "助手"
-                context_lines.append(f"{role_name}: {msg['content']}")
+        序号发生冲突后共享历史中的序号和内容不再可靠：重新加载，并丢弃按旧序号补齐上下文的agent，
+        下次使用时从重新加载的历史创建
+        """
+        if self._history_current():
+            return
+        async with self._history_lock:
+            if self._history_current():
+                return
+            if self._history_loaded:
+                print(f"🔄 会话 {self.conversation_id} 的消息被重新编号，重新加载历史")
+                self.agents.clear()
+                self._agent_seen.clear()
+            self._history_generation = self.db.sequences.generation(self.conversation_id)
+            try:
+                self.conversation_history = await self.db.get_recent_messages(
+                    self.conversation_id, limit=HISTORY_LIMIT
+                )
+                if self.conversation_history:
+                    print(f"📚 会话 {self.conversation_id} 加载了 {len(self.conversation_history)} 条历史消息")
+            except Exception as e:
+                print(f"⚠️ 加载历史消息时出错: {e}")
+                self.conversation_history = []
+            self._history_loaded = True
 
-            return "\n".join(context_lines)
+    def _append_history(self, role: str, content: str, message_index: int):
+        """本进程写入的消息追加到共享历史（只保留最近 HISTORY_LIMIT 条）"""
+        self.conversation_history.append({"role": role, "content": content, "message_index": message_index})
+        del self.conversation_history[:-HISTORY_LIMIT]
 
-        except Exception as e:
-            print(f"⚠️ 获取历史上下文失败: {e}")
-            return ""
+    def _history_since(self, after_index: int, before_index: Optional[int] = None) -> List[Dict]:
+        """共享历史中序号在 (after_index, before_index) 之间的消息"""
+        return [
+            msg for msg in self.conversation_history
+            if msg["message_index"] > after_index and (before_index is None or msg["message_index"] < before_index)
+        ]
 
-    async def _get_history_context(self) -> str:
-        """获取历史对话上下文字符串"""
-        try:
-            # 获取最近5条消息作为上下文
-            history_messages = await self.db.get_recent_messages(self.conversation_id, limit=5)
+    @staticmethod
+    def _to_model_messages(messages: List[Dict]) -> List[LLMMessage]:
+        """历史消息转换为AutoGen模型上下文消息"""
+        context_messages: List[LLMMessage] = []
+        for msg in messages:
+            if msg["role"] == "user":
+                context_messages.append(UserMessage(content=msg["content"], source="user"))
+            elif msg["role"] == "assistant":
+                context_messages.append(AssistantMessage(content=msg["content"], source="assistant"))
+        return context_messages
 
-            if not history_messages:
-                return ""
+    def _history_context(self, messages: List[Dict]) -> str:
+        """最近几条历史消息拼成系统提示中的上下文字符串"""
+        context_lines = []
+        for msg in messages[-HISTORY_PROMPT_MESSAGES:]:
+            role_name = "用户" if msg["role"] == "user" else "助手"
+            context_lines.append(f"{role_name}: {msg['content']}")
+        return "\n".join(context_lines)
 
-            context_lines = []
-            for msg in history_messages:
-                role_name = "用户" if msg["role"] == "user" else "助手"
-                context_lines.append(f"{role_name}: {msg['content']}")
-
-            return "\n".join(context_lines)
+    async def _create_agent(self, agent_type: AgentType, before_index: Optional[int] = None) -> AssistantAgent:
+        """
+        创建指定类型的agent，用会话共享历史初始化系统提示和模型上下文（不访问数据库）
 
-        except Exception as e:
-            print(f"⚠️ 获取历史上下文失败: {e}")
-            return ""
-    
-    async def _create_agent(self, agent_type: AgentType) -> AssistantAgent:
-        """创建指定类型的agent"""
+        Args:
+            before_index: 只使用序号小于它的历史（当前轮的用户消息由 run_stream 传入，不重复放入上下文）
+        """
         config = AgentConfig.get_agent_config(agent_type)
 
         # 从工具管理器获取该agent类型对应的工具
         tools = self._get_tools_for_agent(agent_type)
 
-        # 获取历史消息用于系统提示
-        history_context = await self._get_history_context()
+        await self._load_history()
+        history = self._history_since(0, before_index)
 
         # 如果有历史记录，将其添加到系统消息中
         system_message = config["system_message"]
+        history_context = self._history_context(history)
         if history_context:
             system_message += f"\n\n## 对话历史上下文\n{history_context}\n\n请基于以上历史记录继续对话。"
 
@@ -123,59 +173,48 @@ class AgentChat:
             model_client=self.model_client,
             # tools=tools,
             system_message=system_message,
+            model_context=UnboundedChatCompletionContext(initial_messages=self._to_model_messages(history)),
             reflect_on_tool_use=True,
             model_client_stream=True,
         )
+        self._agent_seen[agent_type] = history[-1]["message_index"] if history else 0
 
-        # 尝试加载历史记忆（如果支持）
-        await self._load_agent_memory(agent)
-
-        print(f"🤖 创建了 {agent_type.value} agent，包含 {len(tools)} 个工具")
+        print(f"🤖 创建了 {agent_type.value} agent，包含 {len(tools)} 个工具、{len(history)} 条历史消息")
 
         return agent
-    
-    async def _load_agent_memory(self, agent: AssistantAgent):
-        """为agent加载历史记忆"""
-        try:
-            # 从数据库加载最近20条消息
-            history_messages = await self.db.get_recent_messages(self.conversation_id, limit=20)
-
-            if history_messages:
-                print(f"📚 为agent加载了 {len(history_messages)} 条历史消息")
 
-                # 将历史消息转换为AutoGen消息格式
-                context_messages = []
-                for msg in history_messages:
-                    if msg["role"] == "user":
-                        context_messages.append(
-                            UserMessage(content=msg["content"], source="user")
-                        )
-                    elif msg["role"] == "assistant":
-                        context_messages.append(
-                            AssistantMessage(content=msg["content"], source="assistant")
-                        )
+    async def _messages_between(self, after_index: int, before_index: int) -> List[Dict]:
+        """
+        序号在 (after_index, before_index) 之间的消息，最多 HISTORY_LIMIT 条（只取最近的）
 
-                # 尝试使用正确的方法加载历史消息
-                try:
-                    if hasattr(agent, '_add_messages_to_context'):
-                        # 使用正确的方法名
-                        await agent._add_messages_to_context(context_messages)
-                        print(f"✅ 成功加载 {len(context_messages)} 条历史消息到Agent上下文")
-                    else:
-                        print("⚠️ Agent不支持 _add_messages_to_context 方法，使用系统消息方式")
+        共享历史只保留最近 HISTORY_LIMIT 条：after_index 早于其中最早的消息时（agent 闲置期间其他agent处理了
+        更多消息），从数据库读取 before_index 之前最近的 HISTORY_LIMIT 条，闲置再久也不会把整段缺口读入上下文
+        """
+        retained = self.conversation_history
+        if not retained or retained[0]["message_index"] <= after_index + 1:
+            return self._history_since(after_index, before_index)[-HISTORY_LIMIT:]
+        try:
+            page = await self.db.get_messages_page(
+                self.conversation_id, limit=HISTORY_LIMIT, before=before_index
+            )
+            return [msg for msg in page["messages"] if msg["message_index"] > after_index]
+        except Exception as e:
+            print(f"⚠️ 读取agent错过的历史消息时出错，只补齐最近的消息: {e}")
+            return self._history_since(after_index, before_index)
 
-                except Exception as history_error:
-                    print(f"⚠️ 历史消息加载失败，但Agent创建成功: {history_error}")
-                    # 即使历史加载失败，也不影响Agent的正常使用
+    async def _catch_up_agent(self, agent_type: AgentType, agent: AssistantAgent, before_index: int):
+        """把该agent上次运行之后、由其他agent处理的消息追加到它的模型上下文"""
+        missed = await self._messages_between(self._agent_seen.get(agent_type, 0), before_index)
+        for message in self._to_model_messages(missed):
+            await agent.model_context.add_message(message)
+        if missed:
+            self._agent_seen[agent_type] = missed[-1]["message_index"]
 
-        except Exception as e:
-            print(f"⚠️ 加载历史消息时出错: {e}")
-    
-    async def get_agent(self, agent_type: AgentType) -> AssistantAgent:
+    async def get_agent(self, agent_type: AgentType, before_index: Optional[int] = None) -> AssistantAgent:
         """获取或创建指定类型的agent"""
         if agent_type not in self.agents:
             print(f"🤖 创建新的 {agent_type.value} agent")
-            self.agents[agent_type] = await self._create_agent(agent_type)
+            self.agents[agent_type] = await self._create_agent(agent_type, before_index)
         
         return self.agents[agent_type]
     
@@ -219,9 +258,11 @@ class AgentChat:
         """初始化数据库连接"""
         await self.db.init_database()
     
-    async def save_message(self, role: str, content: str):
-        """保存消息到数据库"""
-        await self.db.save_message(self.conversation_id, role, content)
+    async def save_message(self, role: str, content: str) -> int:
+        """保存消息到数据库并追加到共享历史，返回消息序号"""
+        message_index = await self.db.save_message(self.conversation_id, role, content)
+        self._append_history(role, content, message_index)
+        return message_index
     
     async def get_conversation_history(self, limit: int = 50) -> List[Dict]:
         """获取会话历史"""
@@ -230,8 +271,11 @@ class AgentChat:
     async def clear_conversation(self):
         """清除当前会话"""
         await self.db.delete_conversation(self.conversation_id)
-        # 清除内存中的agents
+        # 清除内存中的agents和共享历史
         self.agents.clear()
+        self._agent_seen.clear()
+        self.conversation_history = []
+        self._history_loaded = True
         print(f"🗑️ 已清除会话 {self.conversation_id}")
     
     async def process_message(self, message: str, auto_detect: bool = True) -> AsyncGenerator[str, None]:
@@ -246,8 +290,9 @@ class AgentChat:
             str: AI回复的文本片段
         """
         try:
-            # 保存用户消息
-            await self.save_message("user", message)
+            # 先加载共享历史（每个会话一次），再保存用户消息，避免新消息被重复加载
+            await self._load_history()
+            user_index = await self.save_message("user", message)
 
             # 自动检测agent类型（如果启用）
             if auto_detect:
@@ -255,20 +300,30 @@ class AgentChat:
                 if detected_type != self.current_agent_type:
                     await self.switch_agent(detected_type)
             
-            # 获取当前agent
-            current_agent = await self.get_agent(self.current_agent_type)
+            # 获取当前agent，补上它错过的、由其他agent处理的对话
+            agent_type = self.current_agent_type
+            current_agent = await self.get_agent(agent_type, before_index=user_index)
+            await self._catch_up_agent(agent_type, current_agent, before_index=user_index)
             
             # 处理消息并获取流式响应
             response_text = ""
             async for response in current_agent.run_stream(task=message):
-                if hasattr(response, 'content') and response.content:
+                # 只输出模型的流式片段：run_stream 还会产出任务本身（用户消息）和完整的回复消息
+                if isinstance(response, ModelClientStreamingChunkEvent):
                     chunk = response.content
+                elif isinstance(response, TextMessage) and response.source != "user" and not response_text:
+                    # 模型不支持流式输出时只有完整的回复消息
+                    chunk = response.content
+                else:
+                    continue
+                if chunk:
                     response_text += chunk
                     yield chunk
             
-            # 保存AI回复
+            # 保存AI回复；本轮的用户消息和回复已在该agent的上下文中
+            self._agent_seen[agent_type] = user_index
             if response_text:
-                await self.save_message("assistant", response_text)
+                self._agent_seen[agent_type] = await self.save_message("assistant", response_text)
                 
         except Exception as e:
             error_msg = f"处理消息时出错: {str(e)}"
@@ -326,7 +381,23 @@ class AgentChat:
         except ValueError:
             return []
     
+    def estimate_memory(self) -> int:
+        """粗略估算常驻内存（字节）：固定开销加上各agent的系统消息和模型上下文中的消息内容"""
+        total = SESSION_OVERHEAD_BYTES
+        for agent in self.agents.values():
+            total += AGENT_OVERHEAD_BYTES
+            context = getattr(agent, "model_context", None)
+            messages = list(getattr(agent, "_system_messages", [])) + list(getattr(context, "_messages", []))
+            for message in messages:
+                content = getattr(message, "content", "")
+                total += sys.getsizeof(content) if isinstance(content, str) else sys.getsizeof(str(content))
+        return total
+
     async def close(self):
-        """关闭资源"""
+        """关闭资源，释放agent及其模型上下文（共享连接池由应用关闭）；之后继续使用时重新加载历史"""
         await self.db.close_connection_pool()
-        print("👋 AgentChat 已关闭")
+        self.agents.clear()
+        self._agent_seen.clear()
+        self.conversation_history.clear()
+        self._history_loaded = False
+        print(f"👋 会话 {self.conversation_id} 的 AgentChat 已关闭")
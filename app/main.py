@@ -4,18 +4,21 @@ FastAPI主应用
 
 import asyncio
 import json
-from typing import AsyncGenerator, Dict
+from typing import AsyncGenerator, Optional
 
 from autogen_core.models import ModelFamily
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.responses import StreamingResponse, HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from autogen_ext.models.openai import OpenAIChatCompletionClient
 import uvicorn
 
 from .models import ChatRequest, ChatResponse, AgentSwitchRequest
+from .sessions import SESSION_CONFIG, SessionManager
 from agents import AgentChat, AgentType
-from rag.api import router as rag_router
+from rag.api import router as rag_router, start_ingestion, stop_ingestion
+from rag.responses import FastJSONResponse, dumps
+from database import ConversationDatabase, conversation_replicas, conversation_store, db_pool, message_buffer, message_cache, message_sequences, query_metrics, retention_job
 
 app = FastAPI(title="AI Assistant with Multi-Agent Chat", description="Advanced AI Assistant with Multiple Specialized Agents")
 
@@ -39,29 +42,43 @@ model_client = OpenAIChatCompletionClient(
     }
 )
 
-# 会话管理：为每个conversation_id创建独立的AgentChat
-conversation_chats: Dict[str, AgentChat] = {}
+async def create_chat(conversation_id: str) -> AgentChat:
+    """创建并初始化会话的AgentChat（历史在创建agent时从存储加载）"""
+    chat = AgentChat(model_client, conversation_id)
+    await chat.initialize_database()
+    return chat
+
+# 会话管理：每个conversation_id一个AgentChat，数量有上限，空闲会话自动淘汰
+session_manager = SessionManager(create_chat, **SESSION_CONFIG)
+
+# 会话列表等不属于单个会话的查询（使用共享存储）
+conversation_db = ConversationDatabase()
 
 async def get_or_create_chat(conversation_id: str) -> AgentChat:
-    """获取或创建指定会话的AgentChat"""
-    if conversation_id not in conversation_chats:
-        print(f"🆕 为会话 {conversation_id} 创建新的AgentChat")
-        chat = AgentChat(model_client, conversation_id)
-        await chat.initialize_database()
-        conversation_chats[conversation_id] = chat
-    
-    return conversation_chats[conversation_id]
+    """获取或创建指定会话的AgentChat（被淘汰的会话透明重建）"""
+    return await session_manager.get(conversation_id)
 
 @app.on_event("startup")
 async def startup_event():
     """应用启动时初始化"""
+    await start_ingestion()
+    retention_job.start()
+    session_manager.start()
     print("🚀 Multi-Agent AI Assistant 启动完成")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """应用关闭时清理资源"""
-    for chat in conversation_chats.values():
-        await chat.close()
+    await stop_ingestion()
+    await retention_job.stop()
+    await session_manager.close()
+    # 先写完缓冲中的消息再关闭存储和连接池
+    await message_buffer.close()
+    await conversation_store.close()
+    if conversation_replicas:
+        await conversation_replicas.close()
+    await db_pool.close()
+    query_metrics.close()
     print("👋 Multi-Agent AI Assistant 已关闭")
 
 @app.get("/", response_class=HTMLResponse)
@@ -79,6 +96,9 @@ async def rag_page():
 @app.post("/chat")
 async def chat_endpoint(request: ChatRequest):
     """Handle chat requests with multi-agent support and streaming response"""
+    # 从获取会话到流式回复结束一直持有会话，防止返回响应之后、生成器开始之前被淘汰；生成器结束时释放
+    session_manager.acquire(request.conversation_id)
+    streaming = False
     try:
         print(f"💬 收到会话 {request.conversation_id} 的消息: {request.message}")
         print(f"🤖 请求agent类型: {request.agent_type}, 自动检测: {request.auto_detect}")
@@ -113,8 +133,10 @@ async def chat_endpoint(request: ChatRequest):
                 print(f"❌ 流式处理错误: {stream_error}")
                 error_msg = f"处理请求时出错: {str(stream_error)}"
                 yield f"data: {json.dumps({'chunk': error_msg, 'done': True, 'error': True, 'agent_type': current_agent_type})}\n\n"
+            finally:
+                session_manager.release(request.conversation_id)
         
-        return StreamingResponse(
+        response = StreamingResponse(
             generate_response(),
             media_type="text/plain",
             headers={
@@ -123,9 +145,15 @@ async def chat_endpoint(request: ChatRequest):
                 "Access-Control-Allow-Origin": "*",
             }
         )
+        # 之后由生成器负责释放
+        streaming = True
+        return response
     except Exception as e:
         print(f"❌ 会话 {request.conversation_id} 处理错误: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if not streaming:
+            session_manager.release(request.conversation_id)
 
 @app.post("/chat/simple")
 async def chat_simple(request: ChatRequest):
@@ -133,20 +161,21 @@ async def chat_simple(request: ChatRequest):
     try:
         print(f"💬 收到简单会话 {request.conversation_id} 的消息: {request.message}")
         
-        # 获取或创建AgentChat
-        chat = await get_or_create_chat(request.conversation_id)
-        
-        # 如果指定了特定的agent类型，则切换到该agent
-        if request.agent_type != "auto":
-            try:
-                agent_type = AgentType(request.agent_type)
-                await chat.switch_agent(agent_type)
-            except ValueError:
-                pass  # 忽略无效的agent类型
-        
         response_text = ""
-        async for chunk in chat.process_message(request.message, auto_detect=request.auto_detect):
-            response_text += chunk
+        with session_manager.hold(request.conversation_id):
+            # 获取或创建AgentChat
+            chat = await get_or_create_chat(request.conversation_id)
+            
+            # 如果指定了特定的agent类型，则切换到该agent
+            if request.agent_type != "auto":
+                try:
+                    agent_type = AgentType(request.agent_type)
+                    await chat.switch_agent(agent_type)
+                except ValueError:
+                    pass  # 忽略无效的agent类型
+            
+            async for chunk in chat.process_message(request.message, auto_detect=request.auto_detect):
+                response_text += chunk
         
         print(f"✅ 简单会话 {request.conversation_id} 回复完成")
         return ChatResponse(
@@ -201,16 +230,62 @@ async def switch_agent(request: AgentSwitchRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/conversations", response_class=FastJSONResponse)
+async def list_conversations(limit: int = Query(20, ge=1, le=200), cursor: Optional[str] = None):
+    """
+    按最后消息时间倒序分页列出会话（键集分页，只读会话摘要表）
+
+    - cursor: 上一页返回的 next_cursor
+    """
+    try:
+        await conversation_db.init_database()
+        conversations, next_cursor = await conversation_db.list_conversations(limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return FastJSONResponse({
+        "conversations": conversations,
+        "next_cursor": next_cursor,
+        "has_more": next_cursor is not None
+    })
+
+@app.get("/conversations/search", response_class=FastJSONResponse)
+async def search_conversations(q: str = Query(..., min_length=2),
+                               limit: int = Query(20, ge=1, le=100),
+                               cursor: Optional[str] = None):
+    """
+    全文搜索会话消息，按时间倒序分页，返回带 <mark> 高亮的片段
+
+    - q: 搜索词（不区分大小写，至少2个字符）
+    - cursor: 上一页返回的 next_cursor
+    """
+    try:
+        await conversation_db.init_database()
+        results, next_cursor = await conversation_db.search_messages(q, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return FastJSONResponse({
+        "query": q,
+        "results": results,
+        "next_cursor": next_cursor,
+        "has_more": next_cursor is not None
+    })
+
 @app.get("/conversations/{conversation_id}/agent")
 async def get_current_agent(conversation_id: str):
     """获取指定会话当前使用的agent类型"""
     try:
-        if conversation_id in conversation_chats:
-            chat = conversation_chats[conversation_id]
+        agent_type = session_manager.get_agent_type(conversation_id)
+        if agent_type is not None:
             return {
                 "conversation_id": conversation_id,
-                "current_agent": chat.current_agent_type.value,
-                "available_agents": await chat.get_available_agents()
+                "current_agent": agent_type.value,
+                "available_agents": [available.value for available in AgentType]
             }
         else:
             return {
@@ -221,31 +296,60 @@ async def get_current_agent(conversation_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/conversations/{conversation_id}/history")
-async def get_conversation_history(conversation_id: str, limit: int = 50):
-    """获取指定会话的历史记录"""
+@app.get("/conversations/{conversation_id}/history", response_class=FastJSONResponse)
+async def get_conversation_history(conversation_id: str,
+                                   limit: int = Query(50, ge=1, le=500),
+                                   before: Optional[int] = None,
+                                   after: Optional[int] = None):
+    """
+    获取指定会话的历史记录（按消息序号键集分页）
+
+    - 不带参数时返回最新一页
+    - before: 上一页的 oldest_index，向更早翻页
+    - after: 上一页的 newest_index，向更新翻页
+    """
     try:
-        chat = await get_or_create_chat(conversation_id)
-        messages = await chat.get_conversation_history(limit)
-        
-        return {
-            "conversation_id": conversation_id,
-            "messages": messages,
-            "total": len(messages),
-            "current_agent": chat.current_agent_type.value
-        }
+        # 只读历史不创建会话（AgentChat），直接查询共享存储
+        await conversation_db.init_database()
+        page = await conversation_db.get_messages_page(conversation_id, limit=limit, before=before, after=after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    return FastJSONResponse({
+        "conversation_id": conversation_id,
+        **page,
+        "total": len(page["messages"]),
+        "current_agent": (session_manager.get_agent_type(conversation_id) or AgentType.GENERAL).value
+    })
+
+@app.get("/conversations/{conversation_id}/export")
+async def export_conversation(conversation_id: str):
+    """以 NDJSON 流式导出会话的全部消息（服务器端游标，内存占用与会话长度无关）"""
+    async def generate() -> AsyncGenerator[bytes, None]:
+        await conversation_db.init_database()
+        async for batch in conversation_db.iter_messages(conversation_id):
+            yield b"".join(dumps({"conversation_id": conversation_id, **message}) + b"\n" for message in batch)
+    
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{conversation_id}.ndjson"'}
+    )
 
 @app.delete("/conversations/{conversation_id}")
 async def clear_conversation(conversation_id: str):
     """清除指定会话"""
     try:
-        if conversation_id in conversation_chats:
-            chat = conversation_chats[conversation_id]
+        chat = session_manager.peek(conversation_id)
+        if chat is not None:
             await chat.clear_conversation()
-            await chat.close()
-            del conversation_chats[conversation_id]
+        else:
+            # 会话不在内存中（从未加载或已被淘汰）时也要删除存储中的消息
+            await conversation_db.init_database()
+            await conversation_db.delete_conversation(conversation_id)
+        await session_manager.remove(conversation_id)
         
         return {"message": f"会话 {conversation_id} 已清除"}
     except Exception as e:
@@ -306,33 +410,47 @@ async def health_check():
     return {
         "status": "healthy", 
         "message": "Multi-Agent AI Assistant is running",
-        "active_conversations": len(conversation_chats),
+        "active_conversations": len(session_manager),
         "available_agents": [agent_type.value for agent_type in AgentType]
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """运行指标：数据库连接池使用情况、等待时间和按操作统计的查询耗时"""
+    return {
+        "db_pool": db_pool.get_metrics(),
+        "conversation_store": conversation_store.get_metrics(),
+        "replicas": conversation_replicas.get_stats() if conversation_replicas else None,
+        "message_sequences": message_sequences.get_stats(),
+        "message_buffer": message_buffer.get_stats(),
+        "message_cache": message_cache.get_stats(),
+        "retention": retention_job.get_stats(),
+        "queries": query_metrics.get_stats(),
+        "sessions": session_manager.get_stats()
+    }
+
 @app.get("/stats")
 async def get_stats():
     """获取系统统计信息"""
     try:
         stats = {
-            "active_conversations": len(conversation_chats),
+            "active_conversations": len(session_manager),
             "available_agents": len(AgentType),
             "agent_types": [agent_type.value for agent_type in AgentType]
         }
         
         # 统计每个会话使用的agent类型
         agent_usage = {}
-        for conv_id, chat in conversation_chats.items():
+        for conv_id, chat in session_manager.items():
             agent_type = chat.current_agent_type.value
             agent_usage[agent_type] = agent_usage.get(agent_type, 0) + 1
         
         stats["agent_usage"] = agent_usage
         
         # 添加工具统计
-        if conversation_chats:
-            temp_chat = list(conversation_chats.values())[0]
-            tools_stats = await temp_chat.get_tools_usage_stats()
-            stats["tools_usage"] = tools_stats
+        for _, temp_chat in session_manager.items():
+            stats["tools_usage"] = await temp_chat.get_tools_usage_stats()
+            break
         
         return stats
     except Exception as e:
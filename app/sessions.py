@@ -0,0 +1,215 @@
+"""
+会话（AgentChat）管理
+
+每个 conversation_id 对应一个 AgentChat，最多持有六个 AssistantAgent 及其模型上下文。SessionManager 按 LRU
+限制常驻的会话数，并定期淘汰空闲超过 TTL 的会话：淘汰时关闭 AgentChat 释放 agent 和上下文，
+会话的消息都已写入存储，下一次请求时重新创建、创建 agent 时从存储加载历史，对调用方透明。
+正在处理请求（流式回复中）的会话不会被淘汰。
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+from agents import AgentChat, AgentType
+
+SESSION_CONFIG = {
+    # 最多常驻的会话数，超过后淘汰最久未使用的
+    "max_sessions": int(os.getenv("CHAT_MAX_SESSIONS", 1000)),
+    # 空闲超过该时间（秒）的会话被淘汰，0为不按空闲时间淘汰
+    "idle_ttl": float(os.getenv("CHAT_SESSION_IDLE_TTL", 1800)),
+    # 检查空闲会话的间隔（秒）
+    "sweep_interval": float(os.getenv("CHAT_SESSION_SWEEP_INTERVAL", 60)),
+}
+
+class SessionManager:
+    """有上限的 AgentChat 会话缓存（LRU + 空闲淘汰）"""
+
+    def __init__(self,
+                 factory: Callable[[str], Awaitable[AgentChat]],
+                 max_sessions: int = 1000,
+                 idle_ttl: float = 1800,
+                 sweep_interval: float = 60):
+        """
+        Args:
+            factory: 为会话ID创建并初始化 AgentChat
+            max_sessions: 最多常驻的会话数
+            idle_ttl: 空闲淘汰时间（秒），为0则不按空闲时间淘汰
+            sweep_interval: 检查空闲会话的间隔（秒）
+        """
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+
+        # 按最近使用排序，末尾为最近使用
+        self._sessions: "OrderedDict[str, AgentChat]" = OrderedDict()
+        self._last_used: Dict[str, float] = {}
+        self._in_use: Dict[str, int] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # 已淘汰会话当时使用的 agent 类型，重建时恢复（只保存字符串，数量有上限）
+        self._evicted: "OrderedDict[str, AgentType]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+
+        # 统计
+        self.hits = 0
+        self.created = 0
+        self.rehydrated = 0
+        self.evicted_lru = 0
+        self.evicted_idle = 0
+        self.removed = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def items(self) -> Iterator[Tuple[str, AgentChat]]:
+        return iter(list(self._sessions.items()))
+
+    async def get(self, conversation_id: str) -> AgentChat:
+        """获取会话，不存在（或已被淘汰）时创建"""
+        chat = self._touch(conversation_id)
+        if chat is not None:
+            self.hits += 1
+            return chat
+
+        # 同一会话的并发请求只创建一次
+        lock = self._locks.setdefault(conversation_id, asyncio.Lock())
+        async with lock:
+            chat = self._touch(conversation_id)
+            if chat is None:
+                print(f"🆕 为会话 {conversation_id} 创建新的AgentChat")
+                chat = await self.factory(conversation_id)
+                agent_type = self._evicted.pop(conversation_id, None)
+                if agent_type is not None:
+                    chat.current_agent_type = agent_type
+                    self.rehydrated += 1
+                self._sessions[conversation_id] = chat
+                self._last_used[conversation_id] = time.monotonic()
+                self.created += 1
+            else:
+                self.hits += 1
+        self._locks.pop(conversation_id, None)
+
+        await self._evict_over_capacity()
+        return chat
+
+    def peek(self, conversation_id: str) -> Optional[AgentChat]:
+        """只查看常驻的会话，不创建也不更新最近使用时间"""
+        return self._sessions.get(conversation_id)
+
+    def get_agent_type(self, conversation_id: str) -> Optional[AgentType]:
+        """会话当前（或淘汰前）使用的 agent 类型"""
+        chat = self._sessions.get(conversation_id)
+        return chat.current_agent_type if chat is not None else self._evicted.get(conversation_id)
+
+    def acquire(self, conversation_id: str):
+        """持有会话，防止处理请求期间被淘汰（可以在会话创建之前调用）；与 release 成对调用"""
+        self._in_use[conversation_id] = self._in_use.get(conversation_id, 0) + 1
+
+    def release(self, conversation_id: str):
+        count = self._in_use.pop(conversation_id) - 1
+        if count:
+            self._in_use[conversation_id] = count
+        if conversation_id in self._sessions:
+            self._last_used[conversation_id] = time.monotonic()
+
+    @contextmanager
+    def hold(self, conversation_id: str):
+        """处理请求期间持有会话，防止回复中途被淘汰"""
+        self.acquire(conversation_id)
+        try:
+            yield
+        finally:
+            self.release(conversation_id)
+
+    async def remove(self, conversation_id: str):
+        """会话被清除：关闭并移除，不保留 agent 类型"""
+        self._evicted.pop(conversation_id, None)
+        chat = self._sessions.pop(conversation_id, None)
+        self._last_used.pop(conversation_id, None)
+        if chat is not None:
+            self.removed += 1
+            await chat.close()
+
+    def _touch(self, conversation_id: str) -> Optional[AgentChat]:
+        chat = self._sessions.get(conversation_id)
+        if chat is not None:
+            self._sessions.move_to_end(conversation_id)
+            self._last_used[conversation_id] = time.monotonic()
+        return chat
+
+    async def _evict(self, conversation_id: str):
+        chat = self._sessions.pop(conversation_id)
+        self._last_used.pop(conversation_id, None)
+        self._evicted[conversation_id] = chat.current_agent_type
+        while len(self._evicted) > self.max_sessions * 10:
+            self._evicted.popitem(last=False)
+        try:
+            await chat.close()
+        except Exception as e:
+            print(f"⚠️ 关闭会话 {conversation_id} 失败: {e}")
+
+    async def _evict_over_capacity(self):
+        """超过上限时从最久未使用的开始淘汰（跳过正在使用的会话）"""
+        while len(self._sessions) > self.max_sessions:
+            victim = next((cid for cid in self._sessions if cid not in self._in_use), None)
+            if victim is None:
+                return
+            await self._evict(victim)
+            self.evicted_lru += 1
+
+    async def sweep(self) -> int:
+        """淘汰空闲超过 TTL 的会话，返回淘汰数"""
+        if self.idle_ttl <= 0:
+            return 0
+        deadline = time.monotonic() - self.idle_ttl
+        idle = [cid for cid, used in self._last_used.items() if used < deadline and cid not in self._in_use]
+        for conversation_id in idle:
+            if conversation_id in self._sessions:
+                await self._evict(conversation_id)
+                self.evicted_idle += 1
+        if idle:
+            print(f"🧹 淘汰了 {len(idle)} 个空闲会话，常驻 {len(self._sessions)} 个")
+        return len(idle)
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"⚠️ 淘汰空闲会话失败: {e}")
+
+    def start(self):
+        """启动定期淘汰空闲会话的后台任务"""
+        if self._task is None and self.idle_ttl > 0 and self.sweep_interval > 0:
+            self._task = asyncio.create_task(self._sweep_loop())
+
+    async def close(self):
+        """停止后台任务并关闭所有会话（应用关闭时调用）"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        for conversation_id, chat in self.items():
+            await chat.close()
+        self._sessions.clear()
+        self._last_used.clear()
+
+    def get_stats(self) -> Dict:
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "idle_ttl": self.idle_ttl,
+            "in_use": len(self._in_use),
+            "agents": sum(len(chat.agents) for chat in self._sessions.values()),
+            "memory_estimate_bytes": sum(chat.estimate_memory() for chat in self._sessions.values()),
+            "hits": self.hits,
+            "created": self.created,
+            "rehydrated": self.rehydrated,
+            "evicted_lru": self.evicted_lru,
+            "evicted_idle": self.evicted_idle,
+            "removed": self.removed,
+        }
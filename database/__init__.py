@@ -2,11 +2,31 @@
 数据库模块
 
 包含数据库相关的所有功能：
+- conversation: 会话存储（序号分配、写缓冲、最近消息缓存），与后端无关
+- backend: 存储后端接口
 - mysql: MySQL数据库实现
+- schema / migration: MySQL 表结构版本（代理键、长消息压缩、按月分区）和在线迁移
+- sqlite: 嵌入式 SQLite 实现（WAL模式）
+- replica: 只读副本路由（读己之写、故障转移）
+- pool: 进程内共享的连接池
+- metrics: 按操作统计的查询耗时直方图和慢查询日志
+- sequence: 会话消息序号分配
+- cache: 最近消息缓存
+- retention: 旧消息分批清理和归档
 - config: 数据库配置
 """
 
-from .mysql import ConversationDatabase
-from .config import DB_CONFIG
+from .conversation import ConversationDatabase, MessageWriteBuffer, conversation_store, conversation_replicas, create_conversation_store, message_buffer, message_cache
+from .backend import ConversationStore, DuplicateMessageError
+from .mysql import MySQLConversationStore
+from .sqlite import SQLiteConversationStore
+from .replica import ReplicaSet
+from .migration import SchemaMigration, schema_stats
+from .cache import MessageCache
+from .retention import RetentionJob, retention_job
+from .pool import DatabasePool, db_pool
+from .metrics import QueryMetrics, query_metrics
+from .sequence import SequenceAllocator, message_sequences
+from .config import DB_CONFIG, DB_POOL_CONFIG, DB_WRITE_CONFIG, DB_CACHE_CONFIG, DB_RETENTION_CONFIG, DB_BACKEND_CONFIG, DB_REPLICA_CONFIG, DB_SCHEMA_CONFIG, DB_METRICS_CONFIG
 
-__all__ = ['ConversationDatabase', 'DB_CONFIG']
+__all__ = ['ConversationDatabase', 'MessageWriteBuffer', 'conversation_store', 'conversation_replicas', 'create_conversation_store', 'ReplicaSet', 'SchemaMigration', 'schema_stats', 'ConversationStore', 'DuplicateMessageError', 'MySQLConversationStore', 'SQLiteConversationStore', 'message_buffer', 'MessageCache', 'message_cache', 'RetentionJob', 'retention_job', 'DatabasePool', 'db_pool', 'QueryMetrics', 'query_metrics', 'SequenceAllocator', 'message_sequences', 'DB_CONFIG', 'DB_POOL_CONFIG', 'DB_WRITE_CONFIG', 'DB_CACHE_CONFIG', 'DB_RETENTION_CONFIG', 'DB_BACKEND_CONFIG', 'DB_REPLICA_CONFIG', 'DB_SCHEMA_CONFIG', 'DB_METRICS_CONFIG']
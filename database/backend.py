@@ -0,0 +1,143 @@
+"""
+会话存储后端接口
+
+ConversationDatabase 负责序号分配、写缓冲和最近消息缓存，具体的SQL由存储后端实现。
+目前有 MySQL（mysql.py）和嵌入式 SQLite（sqlite.py，WAL模式）两个后端，
+通过 database/config.py 的 DB_BACKEND_CONFIG 选择。
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+# 一条待写入的消息：(conversation_id, role, content, message_index)
+MessageRow = Tuple[str, str, str, int]
+
+# 一条过期消息：(id, conversation_id, role, content, timestamp, message_index)
+ExpiredRow = Tuple[int, str, str, str, datetime, int]
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+class DuplicateMessageError(Exception):
+    """(conversation_id, message_index) 已存在：序号被其他进程占用"""
+
+def summary_rows(batch: List[MessageRow]) -> List[Tuple[str, int, int]]:
+    """把一批消息合并为每个会话一行摘要更新：(conversation_id, 消息数, 最大序号)"""
+    summaries: Dict[str, List[int]] = {}
+    for conversation_id, _, _, message_index in batch:
+        summary = summaries.setdefault(conversation_id, [0, message_index])
+        summary[0] += 1
+        summary[1] = max(summary[1], message_index)
+    return [(conversation_id, count, last_index) for conversation_id, (count, last_index) in summaries.items()]
+
+def encode_conversation_cursor(last_message_time: Optional[str], conversation_id: str) -> str:
+    """生成指向该会话之后的分页游标"""
+    raw = json.dumps([last_message_time, conversation_id], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_conversation_cursor(cursor: str) -> Tuple[str, str]:
+    """解析分页游标"""
+    try:
+        last_message_time, conversation_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return last_message_time, conversation_id
+    except Exception:
+        raise ValueError("无效的分页游标")
+
+class ConversationStore:
+    """
+    会话存储后端接口
+
+    消息以字典返回：role、content、timestamp（'%Y-%m-%d %H:%M:%S'）、message_index；
+    会话摘要以字典返回：conversation_id、total_messages、first_message_time、last_message_time、last_message_index
+    """
+
+    name = "base"
+
+    async def init(self):
+        """建立连接并初始化表结构，可重复调用"""
+
+    async def close(self):
+        """释放连接"""
+
+    async def load_max_index(self, conversation_id: str) -> int:
+        """会话当前的最大消息序号，没有消息时为0"""
+        raise NotImplementedError
+
+    async def insert_messages(self, rows: List[MessageRow]):
+        """
+        在一个事务中写入一批消息并更新会话摘要
+
+        Raises:
+            DuplicateMessageError: 某条消息的序号已存在，整批回滚
+        """
+        raise NotImplementedError
+
+    async def fetch_messages(self, conversation_id: str, limit: int,
+                             before: Optional[int] = None, after: Optional[int] = None) -> List[Dict]:
+        """
+        按序号正序返回消息
+
+        after 不为空时返回序号大于 after 的前 limit 条；
+        否则返回序号小于 before（为空则不限）的最后 limit 条
+        """
+        raise NotImplementedError
+
+    def iter_messages(self, conversation_id: str, batch_size: int = 1000) -> AsyncIterator[List[Dict]]:
+        """按序号正序分批流式读取会话的全部消息"""
+        raise NotImplementedError
+
+    async def search_messages(self, query: str, limit: int, before_id: Optional[int] = None) -> List[Dict]:
+        """
+        全文搜索包含 query（不区分大小写的子串）的消息，按主键倒序（最新的在前）
+
+        返回的消息字典另含 id 和 conversation_id；before_id 为上一页最后一条的 id
+        """
+        raise NotImplementedError
+
+    async def get_summary(self, conversation_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def list_summaries(self, limit: int, after: Optional[Tuple[str, str]] = None) -> List[Dict]:
+        """按 (last_message_time, conversation_id) 倒序，返回排在 after 之后的最多 limit 个会话摘要"""
+        raise NotImplementedError
+
+    async def list_conversation_ids(self) -> List[str]:
+        """按最后消息时间倒序列出全部会话ID"""
+        raise NotImplementedError
+
+    async def delete_conversation(self, conversation_id: str):
+        """删除会话的全部消息和摘要"""
+        raise NotImplementedError
+
+    async def rebuild_summaries(self) -> int:
+        """从消息表重建全部会话摘要，返回会话数"""
+        raise NotImplementedError
+
+    async def get_cutoff(self, days: int) -> datetime:
+        """数据库时钟下 days 天前的时间点"""
+        raise NotImplementedError
+
+    async def fetch_expired(self, last_id: int, cutoff: datetime, limit: int) -> List[ExpiredRow]:
+        """按主键顺序读取 id > last_id 的最多 limit 条消息，遇到第一条不早于 cutoff 的消息即停止"""
+        raise NotImplementedError
+
+    async def delete_expired(self, first_id: int, last_id: int, removed: Dict[str, int]) -> int:
+        """
+        在一个事务中删除主键范围内的消息，并按 removed（会话 -> 删除条数）更新会话摘要
+
+        Returns:
+            删除的行数
+        """
+        raise NotImplementedError
+
+    async def server_info(self) -> Dict:
+        """后端版本和消息总数（管理工具的连接测试）"""
+        raise NotImplementedError
+
+    def is_healthy(self) -> bool:
+        """后端自身的健康状态（例如连接池的健康检查结果），未知时视为健康"""
+        return True
+
+    def get_metrics(self) -> Dict:
+        return {"backend": self.name}
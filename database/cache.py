@@ -0,0 +1,153 @@
+"""
+最近消息缓存
+
+每个会话缓存最近的若干条消息（环形缓冲），多个会话之间按LRU淘汰。
+get_recent_messages 先查缓存，未命中时从数据库读取并填充；save_message 写入后追加到缓存，
+活跃会话的历史读取基本不需要访问MySQL。
+"""
+
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional
+
+class _Entry:
+    """一个会话的缓存：按序号排列的最近消息"""
+
+    __slots__ = ("messages", "complete")
+
+    def __init__(self, messages: List[Dict], capacity: int, complete: bool):
+        self.messages: Deque[Dict] = deque(messages, maxlen=capacity)
+        # 是否包含该会话的全部消息（会话消息数不超过缓存容量）
+        self.complete = complete
+
+class MessageCache:
+    """按会话的最近消息读穿缓存"""
+
+    def __init__(self, messages_per_conversation: int = 50, max_conversations: int = 1000):
+        """
+        Args:
+            messages_per_conversation: 每个会话缓存的消息数，为0则不缓存
+            max_conversations: 最多缓存的会话数，超过后淘汰最久未使用的会话
+        """
+        self.capacity = messages_per_conversation
+        self.max_conversations = max_conversations
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # 正在从数据库读取的会话：[读取中的请求数, 期间的写入次数]
+        self._fills: Dict[str, List[int]] = {}
+
+        # 统计
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0 and self.max_conversations > 0
+
+    def get(self, conversation_id: str, limit: int) -> Optional[List[Dict]]:
+        """缓存中有足够的消息时返回最近 limit 条（按序号正序），否则返回 None"""
+        entry = self._entries.get(conversation_id)
+        if entry is None or (len(entry.messages) < limit and not entry.complete):
+            self.misses += 1
+            return None
+        self._entries.move_to_end(conversation_id)
+        self.hits += 1
+        messages = list(entry.messages)
+        if limit < len(messages):
+            messages = messages[len(messages) - limit:] if limit > 0 else []
+        return [dict(message) for message in messages]
+
+    def begin_fill(self, conversation_id: str) -> int:
+        """开始从数据库读取，返回用于 end_fill 的标记"""
+        state = self._fills.setdefault(conversation_id, [0, 0])
+        state[0] += 1
+        return state[1]
+
+    def end_fill(self, conversation_id: str, token: int) -> bool:
+        """读取结束；读取期间该会话有写入时返回 False，读到的结果可能已过期，不应填充缓存"""
+        state = self._fills[conversation_id]
+        state[0] -= 1
+        if state[0] == 0:
+            del self._fills[conversation_id]
+        return state[1] == token
+
+    def _touch(self, conversation_id: str):
+        """记录写入，使进行中的读取结果不再用于填充"""
+        state = self._fills.get(conversation_id)
+        if state is not None:
+            state[1] += 1
+
+    def put(self, conversation_id: str, messages: List[Dict], complete: bool):
+        """
+        用从数据库读取的最近消息填充缓存
+
+        Args:
+            messages: 按序号正序排列
+            complete: messages 是否为该会话的全部消息
+        """
+        if not self.enabled:
+            return
+        messages = messages[-self.capacity:]
+        complete = complete and len(messages) <= self.capacity
+        self._entries[conversation_id] = _Entry([dict(message) for message in messages], self.capacity, complete)
+        self._entries.move_to_end(conversation_id)
+        self._evict()
+
+    def start(self, conversation_id: str):
+        """新会话（第一条消息之前没有历史）：创建空的完整缓存"""
+        if self.enabled and conversation_id not in self._fills and conversation_id not in self._entries:
+            self._entries[conversation_id] = _Entry([], self.capacity, complete=True)
+            self._evict()
+
+    def append(self, conversation_id: str, message: Dict):
+        """写入后追加消息；会话未缓存时不处理，下次读取时再从数据库填充"""
+        self._touch(conversation_id)
+        entry = self._entries.get(conversation_id)
+        if entry is None:
+            return
+        self._entries.move_to_end(conversation_id)
+
+        messages = entry.messages
+        if len(messages) == messages.maxlen:
+            entry.complete = False
+        index = message["message_index"]
+        if not messages or messages[-1]["message_index"] < index:
+            messages.append(dict(message))
+            return
+
+        # 并发写入可能乱序完成：按序号插入到正确位置
+        ordered = sorted([*messages, dict(message)], key=lambda m: m["message_index"])
+        entry.messages = deque(ordered[-self.capacity:], maxlen=self.capacity)
+
+    def invalidate(self, conversation_id: str):
+        """丢弃会话的缓存（会话被删除或被其他进程写入）"""
+        self._touch(conversation_id)
+        if self._entries.pop(conversation_id, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        """丢弃全部缓存（批量清理旧消息后）"""
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        for state in self._fills.values():
+            state[1] += 1
+
+    def _evict(self):
+        while len(self._entries) > self.max_conversations:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "conversations": len(self._entries),
+            "messages": sum(len(entry.messages) for entry in self._entries.values()),
+            "messages_per_conversation": self.capacity,
+            "max_conversations": self.max_conversations,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -12,3 +12,96 @@ DB_CONFIG = {
     "password": os.getenv("MYSQL_PASSWORD", "damon123"),
     "database": os.getenv("MYSQL_DATABASE", "ai_assistant")
 }
+
+# 共享连接池配置
+DB_POOL_CONFIG = {
+    "minsize": int(os.getenv("MYSQL_POOL_MINSIZE", 1)),
+    "maxsize": int(os.getenv("MYSQL_POOL_MAXSIZE", 10)),
+    # 连接空闲多久后重建（秒）
+    "pool_recycle": int(os.getenv("MYSQL_POOL_RECYCLE", 3600)),
+    # 等待空闲连接的超时时间（秒）
+    "acquire_timeout": float(os.getenv("MYSQL_POOL_ACQUIRE_TIMEOUT", 10)),
+    # 健康检查间隔（秒），为0则不检查
+    "health_check_interval": float(os.getenv("MYSQL_POOL_HEALTH_INTERVAL", 30)),
+}
+
+# 消息写入配置
+DB_WRITE_CONFIG = {
+    # strict: 每条消息写入数据库后才返回；buffered: 先确认，由写缓冲批量写入（进程崩溃会丢失未写入的消息）
+    "durability": os.getenv("MYSQL_WRITE_DURABILITY", "strict"),
+    # 每批写入的最大条数
+    "batch_size": int(os.getenv("MYSQL_WRITE_BATCH_SIZE", 100)),
+    # 最长等待时间（秒）
+    "flush_interval": float(os.getenv("MYSQL_WRITE_FLUSH_INTERVAL", 0.05)),
+    # 队列上限，超过后写入等待刷新完成
+    "max_pending": int(os.getenv("MYSQL_WRITE_MAX_PENDING", 10000)),
+    # 进程内缓存下一个消息序号的会话数上限（LRU淘汰，淘汰后再写入时重新读取最大序号）
+    "sequence_conversations": int(os.getenv("MYSQL_SEQUENCE_CONVERSATIONS", 10000)),
+}
+
+# 最近消息缓存配置
+DB_CACHE_CONFIG = {
+    # 每个会话缓存的最近消息数，为0则关闭缓存
+    "messages_per_conversation": int(os.getenv("MYSQL_CACHE_MESSAGES", 50)),
+    # 最多缓存的会话数（LRU淘汰）
+    "max_conversations": int(os.getenv("MYSQL_CACHE_CONVERSATIONS", 1000)),
+}
+
+# 旧消息保留策略配置
+DB_RETENTION_CONFIG = {
+    # 保留天数，为0则不自动清理
+    "days": int(os.getenv("MYSQL_RETENTION_DAYS", 0)),
+    # 每批删除的行数（每批一个短事务）
+    "batch_size": int(os.getenv("MYSQL_RETENTION_BATCH_SIZE", 1000)),
+    # 批次之间的休眠时间（秒）
+    "batch_sleep": float(os.getenv("MYSQL_RETENTION_BATCH_SLEEP", 0.1)),
+    # 删除前归档为 gzip 压缩的 NDJSON 分段文件的目录，为空则不归档
+    "archive_dir": os.getenv("MYSQL_RETENTION_ARCHIVE_DIR", ""),
+    # 每个归档分段文件的最大行数
+    "segment_rows": int(os.getenv("MYSQL_RETENTION_SEGMENT_ROWS", 100000)),
+    # 自动清理的间隔（秒）
+    "interval": float(os.getenv("MYSQL_RETENTION_INTERVAL", 86400)),
+}
+
+# 会话存储后端配置
+DB_BACKEND_CONFIG = {
+    # mysql: MySQL（默认）；sqlite: 嵌入式 SQLite（WAL模式），单机部署无需数据库服务
+    "backend": os.getenv("CONVERSATION_BACKEND", "mysql"),
+    # SQLite 数据库文件路径
+    "sqlite_path": os.getenv("CONVERSATION_SQLITE_PATH", "data/conversations.db"),
+}
+
+# 只读副本配置（仅 MySQL 后端）：只读查询路由到副本，用户名、密码和库名与主库相同
+DB_REPLICA_CONFIG = {
+    # 副本地址列表，逗号分隔，例如 "replica1:3306,replica2:3306"；为空则全部读主库
+    "hosts": [host.strip() for host in os.getenv("MYSQL_REPLICA_HOSTS", "").split(",") if host.strip()],
+    # 会话写入后在该时间（秒）内的读取走主库（读己之写）
+    "sticky_seconds": float(os.getenv("MYSQL_REPLICA_STICKY_SECONDS", 5)),
+    # 副本读取失败后多久（秒）再尝试
+    "retry_interval": float(os.getenv("MYSQL_REPLICA_RETRY_INTERVAL", 30)),
+}
+
+# MySQL 表结构配置（见 database/schema.py）
+DB_SCHEMA_CONFIG = {
+    # 新建数据库使用的表结构版本；已有的 v1 数据库用 db_manager migrate-schema 在线迁移
+    "version": int(os.getenv("MYSQL_SCHEMA_VERSION", 2)),
+    # v2：UTF-8 编码后达到该字节数的消息压缩存储，0为不压缩（默认）。压缩存储的消息不参与搜索，
+    # 需要搜索全部消息时保持为0
+    "compress_threshold": int(os.getenv("MYSQL_COMPRESS_THRESHOLD", 0)),
+    # v2：none 不分区；month 按月分区（唯一约束需包含时间列、不支持全文索引，只适合单个写入进程）
+    "partition": os.getenv("MYSQL_SCHEMA_PARTITION", "none"),
+    # 只有一个进程写入会话消息（设为1才允许按月分区）
+    "single_writer": int(os.getenv("MYSQL_SINGLE_WRITER", 0)) == 1,
+    # 按月分区时预先创建的未来月份数
+    "partition_months_ahead": int(os.getenv("MYSQL_SCHEMA_PARTITION_MONTHS_AHEAD", 3)),
+}
+
+# 查询耗时统计和日志（见 database/metrics.py）
+DB_METRICS_CONFIG = {
+    # 超过该耗时（毫秒）的存储操作总是记录慢查询日志，0为不记录
+    "slow_query_ms": float(os.getenv("DB_SLOW_QUERY_MS", 200)),
+    # 其余操作记录日志的采样率（0~1）
+    "sample_rate": float(os.getenv("DB_QUERY_LOG_SAMPLE_RATE", 0.01)),
+    # 日志文件（JSON 行），为空则写到标准输出
+    "log_file": os.getenv("DB_QUERY_LOG_FILE", ""),
+}
@@ -0,0 +1,549 @@
+"""
+会话存储
+
+ConversationDatabase 负责序号分配、写缓冲和最近消息缓存，与存储后端无关；
+SQL 由 ConversationStore 的实现（mysql.py / sqlite.py）执行，后端由 DB_BACKEND_CONFIG 选择。
+配置了只读副本时，历史消息、会话摘要和会话列表的读取经 ReplicaSet 路由到副本（见 replica.py）。
+"""
+
+import asyncio
+import time
+from datetime import datetime
+from typing import AsyncIterator, Callable, List, Dict, Optional, Tuple
+
+from .backend import (ConversationStore, DuplicateMessageError, MessageRow, TIME_FORMAT,
+                      decode_conversation_cursor, encode_conversation_cursor)
+from .cache import MessageCache
+from .config import DB_BACKEND_CONFIG, DB_CACHE_CONFIG, DB_CONFIG, DB_POOL_CONFIG, DB_REPLICA_CONFIG, DB_RETENTION_CONFIG, DB_WRITE_CONFIG
+from .metrics import query_metrics
+from .mysql import MySQLConversationStore
+from .pool import DatabasePool, db_pool
+from .replica import ReplicaSet
+from .search import highlight, normalize_query
+from .sequence import SequenceAllocator, message_sequences
+from .sqlite import SQLiteConversationStore
+
+# 写入冲突（其他进程占用了同一序号）时的最大重试次数
+MAX_APPEND_RETRIES = 3
+
+# 写入模式：strict 每条消息写入后才返回；buffered 先确认，由写缓冲批量写入
+DURABILITY_MODES = ("strict", "buffered")
+
+# 可选的存储后端
+BACKENDS = ("mysql", "sqlite")
+
+def create_conversation_store(pool: Optional[DatabasePool] = None) -> ConversationStore:
+    """
+    按 DB_BACKEND_CONFIG 创建存储后端
+
+    Args:
+        pool: MySQL 后端使用的连接池；为空时按 DB_CONFIG 创建独立的连接池（命令行工具使用）
+    """
+    backend = DB_BACKEND_CONFIG["backend"]
+    if backend == "mysql":
+        return MySQLConversationStore(pool or DatabasePool(**DB_CONFIG, health_check_interval=0))
+    if backend == "sqlite":
+        return SQLiteConversationStore(DB_BACKEND_CONFIG["sqlite_path"])
+    raise ValueError(f"未知的会话存储后端: {backend}，可选 {', '.join(BACKENDS)}")
+
+def create_replica_set() -> Optional[ReplicaSet]:
+    """按 DB_REPLICA_CONFIG 创建只读副本（仅 MySQL 后端），没有配置副本时返回 None"""
+    if DB_BACKEND_CONFIG["backend"] != "mysql" or not DB_REPLICA_CONFIG["hosts"]:
+        return None
+    replicas = []
+    for endpoint in DB_REPLICA_CONFIG["hosts"]:
+        host, _, port = endpoint.partition(":")
+        pool = DatabasePool(**{**DB_CONFIG, "host": host, "port": int(port or 3306)},
+                            **DB_POOL_CONFIG, create_database=False)
+        replicas.append(MySQLConversationStore(pool, read_only=True))
+    return ReplicaSet(replicas,
+                      sticky_seconds=DB_REPLICA_CONFIG["sticky_seconds"],
+                      retry_interval=DB_REPLICA_CONFIG["retry_interval"])
+
+async def insert_message(store: ConversationStore, sequences: SequenceAllocator, conversation_id: str,
+                         role: str, content: str, message_index: Optional[int] = None) -> int:
+    """
+    单条写入消息，返回最终的序号
+
+    Args:
+        message_index: 已分配的序号；为空时从分配器获取。序号被其他进程占用时重新分配
+    """
+    for attempt in range(MAX_APPEND_RETRIES):
+        if message_index is None:
+            message_index = await sequences.allocate(
+                conversation_id, lambda: store.load_max_index(conversation_id)
+            )
+        try:
+            await store.insert_messages([(conversation_id, role, content, message_index)])
+            return message_index
+        except DuplicateMessageError:
+            # 序号已被其他进程占用：重新读取最大值后重试
+            if attempt + 1 < MAX_APPEND_RETRIES:
+                print(f"⚠️ 消息序号冲突: {conversation_id} - 序号{message_index}，重新分配")
+                sequences.conflict(conversation_id)
+                message_index = None
+                continue
+            raise
+
+class MessageWriteBuffer:
+    """
+    消息写缓冲（write-behind）
+
+    save_message 分配好序号后立即返回，消息按到达顺序排队，
+    攒够 batch_size 条或等待 flush_interval 秒后批量写入，
+    连同每个会话一行的摘要更新在一个事务中提交。队列先进先出、同一时刻只有一个写入者，所以同一会话的消息按序号顺序落库。
+    写入失败的消息留在队列中，下次刷新时重试；应用关闭时 close() 写完剩余消息。
+    """
+
+    def __init__(self, store: ConversationStore, sequences: SequenceAllocator,
+                 batch_size: int = 100, flush_interval: float = 0.05, max_pending: int = 10000):
+        """
+        Args:
+            batch_size: 每批写入的最大条数，队列达到该长度时立即刷新
+            flush_interval: 最长等待时间（秒）
+            max_pending: 队列上限，超过后 append 等待刷新完成（反压）
+        """
+        self.store = store
+        self.sequences = sequences
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._rows: List[MessageRow] = []
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # 逐条写入时消息被重新分配了序号，回调通知（用于丢弃该会话的消息缓存）
+        self.on_reindex: Optional[Callable[[str], None]] = None
+
+        # 统计
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.max_batch = 0
+        self.failures = 0
+        self.flush_time_total = 0.0
+
+    @property
+    def pending(self) -> int:
+        return len(self._rows)
+
+    def has_pending(self, conversation_id: Optional[str] = None) -> bool:
+        """是否有尚未写入的消息（可限定会话）"""
+        if conversation_id is None:
+            return bool(self._rows)
+        return any(row[0] == conversation_id for row in self._rows)
+
+    async def append(self, row: MessageRow):
+        """消息入队，立即返回"""
+        if len(self._rows) >= self.max_pending:
+            await self.flush()
+        self._rows.append(row)
+        self.enqueued += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop())
+        if len(self._rows) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self):
+        """把队列中的消息全部写入；失败时未写入的消息保留在队列中"""
+        async with self._flush_lock:
+            while self._rows:
+                batch = self._rows[:self.batch_size]
+                size = len(batch)
+                started = time.perf_counter()
+                try:
+                    await self._write(batch)
+                except Exception:
+                    # 逐条写入时已写入的消息已经出队
+                    self.written += size - len(batch)
+                    self.failures += 1
+                    raise
+                # append 只会在队尾追加，写入期间新到的消息不受影响
+                del self._rows[:len(batch)]
+                self.written += size
+                self.batches += 1
+                self.max_batch = max(self.max_batch, size)
+                self.flush_time_total += time.perf_counter() - started
+
+    async def _write(self, batch: List[MessageRow]):
+        """
+        一个事务写入一批消息，并更新涉及的会话摘要
+
+        batch 是队首的消息；逐条写入时每写入一条就从 batch 和队列中移除，
+        之后某条消息写入失败时，重试不会重复写入前面已经写入的消息
+        """
+        try:
+            await self.store.insert_messages(batch)
+        except DuplicateMessageError:
+            # 其他进程占用了其中某些序号：整批回滚，逐条写入并为冲突的消息重新分配序号
+            print(f"⚠️ 批量写入出现序号冲突，改为逐条写入 {len(batch)} 条消息")
+            while batch:
+                conversation_id, role, content, message_index = batch[0]
+                written = await insert_message(self.store, self.sequences, conversation_id, role, content, message_index)
+                del batch[0]
+                del self._rows[0]
+                if written != message_index and self.on_reindex:
+                    self.on_reindex(conversation_id)
+
+    async def _flush_loop(self):
+        """后台刷新：达到批量大小或超时后写入"""
+        while self._rows:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"❌ 消息批量写入失败，{len(self._rows)} 条消息等待重试: {e}")
+                await asyncio.sleep(self.flush_interval)
+
+    async def close(self):
+        """写完剩余消息并停止后台刷新（应用关闭时调用）"""
+        # 先等进行中的批次写完再停止后台任务，避免写了一半的批次被重复写入
+        count = len(self._rows)
+        await self.flush()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if count:
+            print(f"💾 已写入缓冲中剩余的 {count} 条消息")
+
+    def get_stats(self) -> Dict:
+        return {
+            "pending": len(self._rows),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "batches": self.batches,
+            "avg_batch": round(self.written / self.batches, 2) if self.batches else 0.0,
+            "max_batch": self.max_batch,
+            "failures": self.failures,
+            "avg_flush_ms": round(self.flush_time_total / self.batches * 1000, 3) if self.batches else 0.0,
+        }
+
+# 进程内共享的存储后端（MySQL 后端借用共享连接池）
+conversation_store = create_conversation_store(db_pool)
+
+# 共享存储的只读副本（没有配置时为 None）
+conversation_replicas = create_replica_set()
+
+# 与共享存储配套的进程内写缓冲
+message_buffer = MessageWriteBuffer(
+    conversation_store, message_sequences,
+    batch_size=DB_WRITE_CONFIG["batch_size"],
+    flush_interval=DB_WRITE_CONFIG["flush_interval"],
+    max_pending=DB_WRITE_CONFIG["max_pending"]
+)
+
+# 与共享存储配套的进程内最近消息缓存
+message_cache = MessageCache(**DB_CACHE_CONFIG)
+message_buffer.on_reindex = message_cache.invalidate
+
+class ConversationDatabase:
+    def __init__(self,
+                 host: Optional[str] = None,
+                 port: int = 3306,
+                 user: str = "root",
+                 password: str = "",
+                 database: str = "ai_assistant",
+                 durability: Optional[str] = None,
+                 store: Optional[ConversationStore] = None,
+                 replicas: Optional[List[ConversationStore]] = None):
+        """
+        默认使用进程内共享的存储后端（由应用负责关闭）；
+        传入 MySQL 连接参数或 store 时使用独立的存储（命令行工具、测试使用），由 close_connection_pool 关闭。
+
+        Args:
+            durability: 写入模式 strict / buffered，默认读取 MYSQL_WRITE_DURABILITY
+            store: 存储后端，例如 SQLiteConversationStore
+            replicas: 独立存储的只读副本，由 close_connection_pool 关闭；共享存储使用 MYSQL_REPLICA_HOSTS 配置的副本
+        """
+        durability = durability or DB_WRITE_CONFIG["durability"]
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"未知的写入模式: {durability}，可选 {', '.join(DURABILITY_MODES)}")
+        self.durability = durability
+
+        if store is None and host is not None:
+            store = MySQLConversationStore(DatabasePool(host=host, port=port, user=user, password=password,
+                                                        database=database, health_check_interval=0))
+        self.owns_store = store is not None and store is not conversation_store
+        self.store = store or conversation_store
+        # 序号缓存、写缓冲和最近消息缓存与存储对应：共享存储使用进程内共享的实例
+        if not self.owns_store:
+            self.sequences = message_sequences
+            self.buffer = message_buffer
+            self.cache = message_cache
+            self.replicas = conversation_replicas
+        else:
+            self.sequences = SequenceAllocator()
+            self.buffer = MessageWriteBuffer(
+                self.store, self.sequences,
+                batch_size=DB_WRITE_CONFIG["batch_size"],
+                flush_interval=DB_WRITE_CONFIG["flush_interval"],
+                max_pending=DB_WRITE_CONFIG["max_pending"]
+            )
+            self.cache = MessageCache(**DB_CACHE_CONFIG)
+            self.buffer.on_reindex = self.cache.invalidate
+            self.replicas = ReplicaSet(replicas,
+                                       sticky_seconds=DB_REPLICA_CONFIG["sticky_seconds"],
+                                       retry_interval=DB_REPLICA_CONFIG["retry_interval"]) if replicas else None
+
+    async def init_connection_pool(self):
+        """建立存储连接（共享存储只会初始化一次）"""
+        await self.store.init()
+
+    async def close_connection_pool(self):
+        """关闭自己创建的存储；共享存储（及其写缓冲）由应用关闭"""
+        if self.owns_store:
+            await self.buffer.close()
+            await self.store.close()
+            if self.replicas:
+                await self.replicas.close()
+
+    async def init_database(self):
+        """初始化数据库表（每个存储只执行一次）"""
+        await self.store.init()
+
+    async def rebuild_summaries(self) -> int:
+        """从消息表重建全部会话摘要，返回会话数"""
+        await self._flush_pending()
+        count = await self.store.rebuild_summaries()
+        print(f"🔧 已重建 {count} 个会话的摘要")
+        return count
+
+    async def save_message(self, conversation_id: str, role: str, content: str) -> int:
+        """
+        保存单条消息，返回分配的序号
+
+        strict 模式写入数据库后返回；buffered 模式进入写缓冲后立即返回，由缓冲批量写入
+        """
+        allocated = await self.sequences.allocate(
+            conversation_id, lambda: self._load_max_index(conversation_id)
+        )
+        if self.durability == "buffered":
+            await self.buffer.append((conversation_id, role, content, allocated))
+            new_index = allocated
+        else:
+            new_index = await insert_message(self.store, self.sequences, conversation_id, role, content, allocated)
+            query_metrics.log("message_saved", sampled=True,
+                              conversation_id=conversation_id, role=role, message_index=new_index)
+
+        if new_index != allocated:
+            # 其他进程也在写这个会话，缓存的历史不再完整
+            self.cache.invalidate(conversation_id)
+        else:
+            if new_index == 1:
+                self.cache.start(conversation_id)
+            self.cache.append(conversation_id, {
+                "role": role,
+                "content": content,
+                "timestamp": datetime.now().strftime(TIME_FORMAT),
+                "message_index": new_index
+            })
+        if self.replicas:
+            self.replicas.pin(conversation_id)
+        return new_index
+
+    async def _load_max_index(self, conversation_id: str) -> int:
+        """分配器中没有该会话（第一次写入或已被淘汰）时读取最大序号；先写入缓冲中该会话的消息，避免分配到重复的序号"""
+        await self._flush_pending(conversation_id)
+        return await self.store.load_max_index(conversation_id)
+
+    async def _flush_pending(self, conversation_id: Optional[str] = None):
+        """读取前先写入缓冲中的消息，保证读到自己刚写的内容"""
+        if self.buffer.has_pending(conversation_id):
+            await self.buffer.flush()
+
+    async def _read(self, read: Callable, conversation_id: Optional[str] = None,
+                    fresh: Optional[Callable] = None):
+        """只读查询：配置了副本时经副本路由，否则读主库"""
+        if self.replicas is None:
+            return await read(self.store)
+        return await self.replicas.read(self.store, read, conversation_id, fresh)
+
+    def _caught_up(self, conversation_id: str, last_index: int) -> bool:
+        """副本读到的最后序号不落后于本进程为该会话分配过的序号"""
+        allocated = self.sequences.last_allocated(conversation_id)
+        return allocated is None or last_index >= allocated
+
+    async def get_recent_messages(self, conversation_id: str, limit: int = 20) -> List[Dict]:
+        """获取指定会话的最近N条消息（优先从最近消息缓存读取，未命中时读副本）"""
+        cached = self.cache.get(conversation_id, limit)
+        if cached is not None:
+            return cached
+
+        # 未命中时至少读取缓存容量条，填充缓存供后续读取
+        fetch_limit = max(limit, self.cache.capacity)
+        token = self.cache.begin_fill(conversation_id)
+        try:
+            await self._flush_pending(conversation_id)
+            messages = await self._read(
+                lambda store: store.fetch_messages(conversation_id, fetch_limit),
+                conversation_id,
+                fresh=lambda rows: self._caught_up(conversation_id, rows[-1]["message_index"] if rows else 0)
+            )
+        finally:
+            fresh = self.cache.end_fill(conversation_id, token)
+
+        if fresh:
+            self.cache.put(conversation_id, messages, complete=len(messages) < fetch_limit)
+        messages = messages[-limit:] if limit > 0 else []
+        query_metrics.log("history_loaded", sampled=True, conversation_id=conversation_id, messages=len(messages))
+        return messages
+
+    async def get_messages_page(self, conversation_id: str, limit: int = 50,
+                                before: Optional[int] = None, after: Optional[int] = None) -> Dict:
+        """
+        按 (conversation_id, message_index) 键集分页读取消息，结果按序号正序排列
+
+        Args:
+            before: 读取序号小于它的消息（向更早翻页），传入上一页的 oldest_index
+            after: 读取序号大于它的消息（向更新翻页），传入上一页的 newest_index
+            两者都为空时返回最新一页
+
+        Returns:
+            messages、has_older、has_newer，以及本页的 oldest_index / newest_index
+        """
+        if before is not None and after is not None:
+            raise ValueError("before 和 after 不能同时指定")
+
+        if before is None and after is None:
+            # 最新一页走最近消息缓存；序号从1开始，首条序号大于1说明还有更早的消息
+            messages = await self.get_recent_messages(conversation_id, limit)
+            has_older = bool(messages) and messages[0]["message_index"] > 1
+            has_newer = False
+        elif before is not None:
+            # 向更早翻页：多取一条判断是否还有更早的消息
+            await self._flush_pending(conversation_id)
+            messages = await self.store.fetch_messages(conversation_id, limit + 1, before=before)
+            has_older = len(messages) > limit
+            has_newer = True
+            messages = messages[-limit:] if limit > 0 else []
+        else:
+            # 向更新翻页：多取一条判断是否还有更新的消息
+            await self._flush_pending(conversation_id)
+            messages = await self.store.fetch_messages(conversation_id, limit + 1, after=after)
+            has_older = True
+            has_newer = len(messages) > limit
+            messages = messages[:limit]
+
+        return {
+            "messages": messages,
+            "has_older": has_older,
+            "has_newer": has_newer,
+            "oldest_index": messages[0]["message_index"] if messages else None,
+            "newest_index": messages[-1]["message_index"] if messages else None
+        }
+
+    async def iter_messages(self, conversation_id: str, batch_size: int = 1000) -> AsyncIterator[List[Dict]]:
+        """
+        按序号正序分批流式读取会话的全部消息（内存占用与会话长度无关）
+
+        MySQL 后端导出期间一直占用一个连接，调用方应尽快消费
+        """
+        await self._flush_pending(conversation_id)
+        async for batch in self.store.iter_messages(conversation_id, batch_size):
+            yield batch
+
+    async def get_conversation_summary(self, conversation_id: str) -> Dict:
+        """获取会话摘要信息（主键查询摘要表，可读副本）"""
+        await self._flush_pending(conversation_id)
+        summary = await self._read(
+            lambda store: store.get_summary(conversation_id),
+            conversation_id,
+            fresh=lambda row: self._caught_up(conversation_id, row["last_message_index"] if row else 0)
+        )
+        if summary is None:
+            return {
+                "conversation_id": conversation_id,
+                "total_messages": 0,
+                "first_message_time": None,
+                "last_message_time": None,
+                "last_message_index": 0
+            }
+        return summary
+
+    async def list_conversations(self, limit: int = 20, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """
+        按最后消息时间倒序分页列出会话摘要（键集分页，只读摘要表）
+
+        Args:
+            cursor: 上一页返回的游标
+
+        Returns:
+            (本页会话摘要, 下一页游标；没有下一页时为 None)
+        """
+        after = decode_conversation_cursor(cursor) if cursor else None
+
+        await self._flush_pending()
+        summaries = await self.store.list_summaries(limit + 1, after)
+
+        has_more = len(summaries) > limit
+        summaries = summaries[:limit]
+        next_cursor = None
+        if has_more:
+            last = summaries[-1]
+            next_cursor = encode_conversation_cursor(last["last_message_time"], last["conversation_id"])
+        return summaries, next_cursor
+
+    async def search_messages(self, query: str, limit: int = 20, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """
+        全文搜索消息内容，按写入时间倒序分页（最新的在前）
+
+        Args:
+            query: 搜索词（不区分大小写的子串，至少2个字符）
+            cursor: 上一页返回的游标
+
+        Returns:
+            (本页结果, 下一页游标；没有下一页时为 None)。每条结果含 conversation_id、message_index、role、
+            timestamp，以及截取的片段 snippet（匹配部分用 <mark> 标出）和匹配次数 matches
+        """
+        query = normalize_query(query)
+        try:
+            before_id = int(cursor) if cursor else None
+        except ValueError:
+            raise ValueError("无效的分页游标")
+
+        await self._flush_pending()
+        rows = await self.store.search_messages(query, limit + 1, before_id)
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        results = []
+        for row in rows:
+            snippet, matches = highlight(row["content"], query)
+            results.append({
+                "conversation_id": row["conversation_id"],
+                "message_index": row["message_index"],
+                "role": row["role"],
+                "timestamp": row["timestamp"],
+                "snippet": snippet,
+                "matches": matches
+            })
+        next_cursor = str(rows[-1]["id"]) if has_more else None
+        return results, next_cursor
+
+    async def get_all_conversations(self) -> List[str]:
+        """获取所有会话ID列表（按最后消息时间倒序；读副本时可能有复制延迟）"""
+        await self._flush_pending()
+        return await self._read(lambda store: store.list_conversation_ids())
+
+    async def delete_conversation(self, conversation_id: str):
+        """删除指定会话的所有消息"""
+        await self._flush_pending(conversation_id)
+        await self.store.delete_conversation(conversation_id)
+        self.sequences.forget(conversation_id)
+        self.cache.invalidate(conversation_id)
+        if self.replicas:
+            self.replicas.pin(conversation_id)
+
+        query_metrics.log("conversation_deleted", conversation_id=conversation_id)
+
+    async def cleanup_old_messages(self, days: int = 30) -> Dict:
+        """按主键分批、限速清理超过指定天数的旧消息，返回清理报告（见 retention.RetentionJob）"""
+        from .retention import RetentionJob
+
+        job = RetentionJob(self, **{**DB_RETENTION_CONFIG, "days": days})
+        return await job.run_once()
@@ -0,0 +1,312 @@
+"""
+数据库查询耗时统计和慢查询日志
+
+每个存储操作（load_max_index、insert_messages、fetch_messages ……）按操作名记录耗时直方图，
+分为 acquire（等待连接）、execute（执行语句）、fetch（读取结果）和 total（整个操作）四个阶段，
+用来区分一次慢对话是耗在 LLM 还是数据库上。
+
+超过慢查询阈值的操作总是记录日志，其余按采样率记录。日志是 JSON 行，由 QueueHandler 放入有界队列、
+后台线程写出，事件循环只做一次入队；队列满时丢弃并计数，不会阻塞请求。
+"""
+
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Callable, Dict, Optional
+
+from .config import DB_METRICS_CONFIG
+
+# 直方图各桶的上界（毫秒），最后一个桶为 +Inf
+BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# 日志队列长度上限
+LOG_QUEUE_SIZE = 10000
+
+class LatencyHistogram:
+    """固定桶的耗时直方图"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, q: float) -> float:
+        """按桶估算分位数（返回所在桶的上界，不超过最大值）"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target:
+                upper = BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.max_ms
+                return min(upper, self.max_ms)
+        return self.max_ms
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max_ms, 3),
+            # 各桶（上界毫秒）的次数
+            "buckets": {
+                **{str(upper): self.counts[i] for i, upper in enumerate(BUCKETS_MS)},
+                "+Inf": self.counts[-1]
+            },
+        }
+
+class QueryTimer:
+    """一次存储操作内各阶段的累计耗时（秒）"""
+
+    __slots__ = ("operation", "acquire", "execute", "fetch", "statements")
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.acquire = 0.0
+        self.execute = 0.0
+        self.fetch = 0.0
+        self.statements = 0
+
+# 当前正在执行的存储操作；asyncio.to_thread 会复制上下文，SQLite 的线程内也能取到
+_current_query: contextvars.ContextVar[Optional[QueryTimer]] = contextvars.ContextVar("current_query", default=None)
+
+class _DroppingQueueHandler(QueueHandler):
+    """队列满时丢弃日志而不是阻塞或报错"""
+
+    def __init__(self, log_queue: queue.Queue, metrics: "QueryMetrics"):
+        super().__init__(log_queue)
+        self.metrics = metrics
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.metrics.dropped += 1
+
+class QueryMetrics:
+    """按操作名统计的数据库耗时直方图 + 采样的结构化日志"""
+
+    def __init__(self, slow_query_ms: float = 200, sample_rate: float = 0.01, log_file: str = ""):
+        """
+        Args:
+            slow_query_ms: 慢查询阈值（毫秒），为0则不记录慢查询
+            sample_rate: 非慢查询记录日志的采样率
+            log_file: 日志文件，为空则写到标准输出
+        """
+        self.slow_query_ms = slow_query_ms
+        self.sample_rate = sample_rate
+        self.log_file = log_file
+
+        # 操作名 -> 阶段 -> 直方图；SQLite 在线程池中记录，用锁保护
+        self.histograms: Dict[str, Dict[str, LatencyHistogram]] = {}
+        self._lock = threading.Lock()
+        self._logger: Optional[logging.Logger] = None
+        self._listener: Optional[QueueListener] = None
+
+        # 统计
+        self.slow_queries = 0
+        self.errors = 0
+        self.logged = 0
+        self.dropped = 0
+
+    def observe(self, operation: str, phase: str, seconds: float):
+        with self._lock:
+            phases = self.histograms.setdefault(operation, {})
+            histogram = phases.get(phase)
+            if histogram is None:
+                histogram = phases[phase] = LatencyHistogram()
+            histogram.observe(seconds * 1000)
+
+    def record(self, phase: str, seconds: float, statements: int = 0):
+        """记录当前操作的一个阶段（acquire / execute / fetch）；不在存储操作内时记为 other"""
+        timer = _current_query.get()
+        if timer is not None:
+            setattr(timer, phase, getattr(timer, phase) + seconds)
+            timer.statements += statements
+        self.observe(timer.operation if timer else "other", phase, seconds)
+
+    def timed(self, method: Callable) -> Callable:
+        """存储操作的装饰器：以方法名为操作名记录总耗时，期间的连接等待和语句耗时归入该操作"""
+        operation = method.__name__
+
+        if inspect.isasyncgenfunction(method):
+            @functools.wraps(method)
+            async def generator_wrapper(*args, **kwargs):
+                # 只在生成器内部执行时设置当前操作，消费方处理每批数据的代码不计入
+                timer = QueryTimer(operation)
+                started = time.perf_counter()
+                error = None
+                generator = method(*args, **kwargs)
+                try:
+                    while True:
+                        token = _current_query.set(timer)
+                        try:
+                            item = await generator.__anext__()
+                        except StopAsyncIteration:
+                            break
+                        finally:
+                            _current_query.reset(token)
+                        yield item
+                except GeneratorExit:
+                    # 消费方提前结束读取，不算错误
+                    raise
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    await generator.aclose()
+                    self._finish(timer, time.perf_counter() - started, error)
+            return generator_wrapper
+
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            timer = QueryTimer(operation)
+            token = _current_query.set(timer)
+            started = time.perf_counter()
+            error = None
+            try:
+                return await method(*args, **kwargs)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                _current_query.reset(token)
+                self._finish(timer, time.perf_counter() - started, error)
+        return wrapper
+
+    def _finish(self, timer: QueryTimer, seconds: float, error: Optional[BaseException]):
+        self.observe(timer.operation, "total", seconds)
+        ms = seconds * 1000
+        slow = 0 < self.slow_query_ms <= ms
+        if slow:
+            self.slow_queries += 1
+        if error is not None:
+            self.errors += 1
+        if not slow and error is None and random.random() >= self.sample_rate:
+            return
+        self.log(
+            "slow_query" if slow else "query",
+            level=logging.WARNING if slow or error is not None else logging.INFO,
+            operation=timer.operation,
+            total_ms=round(ms, 3),
+            acquire_ms=round(timer.acquire * 1000, 3),
+            execute_ms=round(timer.execute * 1000, 3),
+            fetch_ms=round(timer.fetch * 1000, 3),
+            statements=timer.statements,
+            error=f"{type(error).__name__}: {error}" if error is not None else None,
+        )
+
+    def log(self, event: str, sampled: bool = False, level: int = logging.INFO, **fields):
+        """
+        写一条 JSON 行日志（只入队，由后台线程写出）
+
+        Args:
+            sampled: 按采样率记录（高频事件）
+        """
+        if sampled and random.random() >= self.sample_rate:
+            return
+        self.logged += 1
+        record = {"time": datetime.now().isoformat(timespec="milliseconds"), "event": event, **fields}
+        self._get_logger().log(level, json.dumps(record, ensure_ascii=False, default=str))
+
+    def _get_logger(self) -> logging.Logger:
+        if self._logger is None:
+            log_queue: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+            output = logging.FileHandler(self.log_file, encoding="utf-8") if self.log_file \
+                else logging.StreamHandler(sys.stdout)
+            output.setFormatter(logging.Formatter("%(message)s"))
+            self._listener = QueueListener(log_queue, output)
+            self._listener.start()
+
+            logger = logging.getLogger("database.queries")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.handlers = [_DroppingQueueHandler(log_queue, self)]
+            self._logger = logger
+        return self._logger
+
+    def close(self):
+        """写出队列中剩余的日志并停止后台线程（应用关闭时调用）"""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+            self._logger = None
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+        self.slow_queries = self.errors = self.logged = self.dropped = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            operations = {
+                operation: {phase: histogram.get_stats() for phase, histogram in phases.items()}
+                for operation, phases in sorted(self.histograms.items())
+            }
+        return {
+            "slow_query_ms": self.slow_query_ms,
+            "sample_rate": self.sample_rate,
+            "slow_queries": self.slow_queries,
+            "errors": self.errors,
+            "logged": self.logged,
+            "dropped_logs": self.dropped,
+            "operations": operations,
+        }
+
+class TimedCursor:
+    """记录 execute / fetch 耗时的游标代理，其他属性（rowcount、lastrowid ……）透传"""
+
+    def __init__(self, cursor, metrics: QueryMetrics):
+        self._cursor = cursor
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    async def _timed(self, phase: str, call, *args, statements: int = 0):
+        started = time.perf_counter()
+        try:
+            return await call(*args)
+        finally:
+            self._metrics.record(phase, time.perf_counter() - started, statements)
+
+    async def execute(self, *args):
+        return await self._timed("execute", self._cursor.execute, *args, statements=1)
+
+    async def executemany(self, *args):
+        return await self._timed("execute", self._cursor.executemany, *args, statements=1)
+
+    async def fetchone(self):
+        return await self._timed("fetch", self._cursor.fetchone)
+
+    async def fetchmany(self, *args):
+        return await self._timed("fetch", self._cursor.fetchmany, *args)
+
+    async def fetchall(self):
+        return await self._timed("fetch", self._cursor.fetchall)
+
+# 进程内共享的查询统计
+query_metrics = QueryMetrics(**DB_METRICS_CONFIG)
+
+# 存储操作的装饰器
+timed_query = query_metrics.timed
@@ -0,0 +1,334 @@
+"""
+会话表结构在线迁移（v1 -> v2，见 schema.py）
+
+1. 创建 v2 的 conversation_keys / messages 表，记录状态 copying
+2. 按主键分批把 conversations 复制到 messages（保留原主键，长消息压缩），批次之间休眠，
+   直到追上正在写入的数据；中断后重新运行从已复制的最大主键继续
+3. 切换：状态改为 cutover，把 conversations 改名为 conversations_v1。正在运行的进程在下一次访问时
+   遇到"表不存在"，等待切换完成后改用 v2
+4. 复制改名前最后写入的增量，删除复制后在 v1 中被删除的消息，记录版本 2、状态 done
+
+并发写入时自增主键的提交顺序与分配顺序不一致：较小的主键可能在较大的主键复制之后才提交，
+按"主键大于已复制的最大值"继续复制会永久漏掉它。所以复制时记录每批主键之间的空洞，
+切换后（v1 表不再有写入）用反连接（conversations_v1 LEFT JOIN messages ... WHERE m.id IS NULL）
+分批补齐这些空洞中的消息；中断后重新运行时空洞未知，反连接扫描整张表。
+
+conversations_v1 保留作为回退，确认无误后手动 DROP。
+"""
+
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+from .config import DB_SCHEMA_CONFIG
+from .pool import DatabasePool
+from .schema import (
+    check_partition, create_v2_tables, pack_content, read_schema_state, table_exists, unpack_content, write_schema_state,
+)
+
+# 读取延迟统计时每个会话读取的消息数（与 get_recent_messages 的默认条数一致）
+HISTORY_LIMIT = 20
+
+class SchemaMigration:
+    """把 v1 的 conversations 表在线迁移到 v2"""
+
+    def __init__(self,
+                 pool: DatabasePool,
+                 batch_size: int = 1000,
+                 batch_sleep: float = 0.05,
+                 partition: str = DB_SCHEMA_CONFIG["partition"],
+                 compress_threshold: int = DB_SCHEMA_CONFIG["compress_threshold"],
+                 single_writer: bool = DB_SCHEMA_CONFIG["single_writer"]):
+        """
+        Args:
+            batch_size: 每批复制的行数
+            batch_sleep: 批次之间的休眠时间（秒）
+            partition: v2 消息表的分区方式（none / month）
+            compress_threshold: 达到该字节数的消息压缩存储，0为不压缩（压缩的消息不参与搜索）
+            single_writer: 只有一个写入进程（按月分区的前提）
+        """
+        check_partition(partition, single_writer)
+        self.pool = pool
+        self.batch_size = batch_size
+        self.batch_sleep = batch_sleep
+        self.partition = partition
+        self.compress_threshold = compress_threshold
+        self.single_writer = single_writer
+
+        self.copied = 0
+        self.compressed = 0
+        self.batches = 0
+        self.late_copied = 0
+        # 复制时遇到的主键空洞 [[起, 止], ...]（相邻的合并）；None 表示未知（中断后继续），需要扫描整张表
+        self.gaps: Optional[List[List[int]]] = []
+
+    async def run(self) -> Dict:
+        """执行迁移，返回报告"""
+        started = time.monotonic()
+        await self.pool.init()
+
+        async with self.pool.cursor() as cursor:
+            version, state = await read_schema_state(cursor)
+            if version == 2 and state in (None, "done"):
+                print("✅ 会话表已经是 v2，无需迁移")
+                return self._report(started)
+
+            if state != "cutover":
+                if not await table_exists(cursor, "conversations"):
+                    raise RuntimeError("没有找到 v1 的 conversations 表")
+                await cursor.execute("SELECT MIN(timestamp) FROM conversations")
+                oldest = (await cursor.fetchone())[0]
+                await write_schema_state(cursor, version=1, state="copying")
+                await create_v2_tables(
+                    cursor, self.partition, DB_SCHEMA_CONFIG["partition_months_ahead"],
+                    start=oldest.date() if oldest else None, single_writer=self.single_writer
+                )
+
+        if state == "cutover":
+            self.gaps = None
+        else:
+            print("📦 开始复制 conversations -> messages ...")
+            await self._copy_all("conversations")
+
+            # 切换：改名会等待进行中的事务结束，之后 v1 表不再有写入
+            async with self.pool.cursor() as cursor:
+                await write_schema_state(cursor, state="cutover")
+                await cursor.execute("RENAME TABLE conversations TO conversations_v1")
+            print("🔀 已切换：conversations 改名为 conversations_v1")
+
+        # 切换期间其他进程等待，尽快完成增量复制；再用反连接补齐复制之后才提交的较小主键
+        await self._copy_all("conversations_v1", sleep=False)
+        await self._copy_missing()
+        removed = await self._remove_deleted()
+
+        async with self.pool.cursor() as cursor:
+            await write_schema_state(cursor, version=2, state="done")
+
+        report = self._report(started)
+        report["removed"] = removed
+        print(f"✅ 迁移完成：复制 {self.copied} 条消息（压缩 {self.compressed} 条，补齐迟到 {self.late_copied} 条），"
+              f"{self.batches} 批，耗时 {report['elapsed_seconds']}s")
+        return report
+
+    def _report(self, started: float) -> Dict:
+        return {
+            "copied": self.copied,
+            "compressed": self.compressed,
+            "batches": self.batches,
+            "late_copied": self.late_copied,
+            "elapsed_seconds": round(time.monotonic() - started, 2),
+        }
+
+    async def _copy_all(self, source: str, sleep: bool = True):
+        """从已复制的最大主键继续，分批复制到没有新数据为止"""
+        async with self.pool.cursor() as cursor:
+            await cursor.execute("SELECT COALESCE(MAX(id), 0) FROM messages")
+            last_id = (await cursor.fetchone())[0]
+        if last_id and self.copied == 0:
+            # 中断后继续：之前复制的部分中有哪些空洞已经不知道了
+            self.gaps = None
+
+        while True:
+            last_id, count = await self._copy_batch(source, last_id)
+            if count == 0:
+                return
+            if self.batches % 100 == 0:
+                print(f"   已复制 {self.copied} 条（主键 {last_id}）")
+            if sleep and self.batch_sleep > 0:
+                await asyncio.sleep(self.batch_sleep)
+
+    async def _copy_batch(self, source: str, last_id: int):
+        """复制一批，返回 (本批最大主键, 行数)；一个短事务"""
+        async with self.pool.transaction() as cursor:
+            await cursor.execute(f"""
+                SELECT id, conversation_id, role, content, timestamp, message_index
+                FROM {source}
+                WHERE id > %s
+                ORDER BY id
+                LIMIT %s
+            """, (last_id, self.batch_size))
+            rows = await cursor.fetchall()
+            if not rows:
+                return last_id, 0
+            self._record_gaps(last_id, [row[0] for row in rows])
+            await self._insert_rows(cursor, rows)
+
+        self.copied += len(rows)
+        self.batches += 1
+        return rows[-1][0], len(rows)
+
+    def _record_gaps(self, last_id: int, ids: List[int]):
+        """记录本批主键之间的空洞（已删除、回滚，或尚未提交）；间隔不超过一批的空洞合并为一个区间"""
+        if self.gaps is None:
+            return
+        previous = last_id
+        for message_id in ids:
+            if message_id > previous + 1:
+                if self.gaps and previous + 1 - self.gaps[-1][1] <= self.batch_size:
+                    self.gaps[-1][1] = message_id - 1
+                else:
+                    self.gaps.append([previous + 1, message_id - 1])
+            previous = message_id
+
+    async def _copy_missing(self):
+        """
+        切换后补齐 conversations_v1 中 messages 里没有的消息（反连接，按主键分批）。
+
+        只扫描复制时记录的空洞；空洞未知时扫描整张表。区间内不存在的主键不产生读取，
+        正常情况下空洞中没有迟到的消息，每个区间只是一次空的范围查询。
+        """
+        if self.gaps is None:
+            async with self.pool.cursor() as cursor:
+                await cursor.execute("SELECT MIN(id), MAX(id) FROM conversations_v1")
+                first_id, max_id = await cursor.fetchone()
+            ranges = [[first_id, max_id]] if first_id is not None else []
+        else:
+            ranges = self.gaps
+
+        for first_id, max_id in ranges:
+            after = first_id - 1
+            while True:
+                async with self.pool.transaction() as cursor:
+                    await cursor.execute("""
+                        SELECT c.id, c.conversation_id, c.role, c.content, c.timestamp, c.message_index
+                        FROM conversations_v1 c
+                        LEFT JOIN messages m ON m.id = c.id
+                        WHERE c.id > %s AND c.id <= %s AND m.id IS NULL
+                        ORDER BY c.id
+                        LIMIT %s
+                    """, (after, max_id, self.batch_size))
+                    rows = await cursor.fetchall()
+                    if not rows:
+                        break
+                    await self._insert_rows(cursor, rows)
+                self.copied += len(rows)
+                self.late_copied += len(rows)
+                self.batches += 1
+                after = rows[-1][0]
+        if self.late_copied:
+            print(f"🧩 补齐了 {self.late_copied} 条复制之后才提交的消息")
+
+    async def _insert_rows(self, cursor, rows):
+        """把 v1 的行写入 v2（保留原主键）；在调用方的事务中执行"""
+        conversation_ids = list(dict.fromkeys(row[1] for row in rows))
+        await cursor.executemany(
+            "INSERT IGNORE INTO conversation_keys (conversation_id) VALUES (%s)",
+            [(cid,) for cid in conversation_ids]
+        )
+        placeholders = ", ".join("%s" for _ in conversation_ids)
+        await cursor.execute(
+            f"SELECT conversation_id, id FROM conversation_keys WHERE conversation_id IN ({placeholders})",
+            tuple(conversation_ids)
+        )
+        keys = dict(await cursor.fetchall())
+
+        values = []
+        for message_id, conversation_id, role, content, timestamp, message_index in rows:
+            text, packed = pack_content(content, self.compress_threshold)
+            self.compressed += packed is not None
+            values.append((message_id, keys[conversation_id], role, text, packed, timestamp, message_index))
+        # 保留原主键：游标、搜索分页和保留策略的按主键扫描在迁移后继续有效
+        await cursor.executemany("""
+            INSERT IGNORE INTO messages
+                (id, conversation_key, role, content, content_z, timestamp, message_index)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, values)
+
+    async def _remove_deleted(self) -> int:
+        """删除已复制、但之后在 v1 中被删除（删除会话 / 保留策略）的消息"""
+        async with self.pool.cursor() as cursor:
+            await cursor.execute("SELECT COALESCE(MAX(id), 0) FROM conversations_v1")
+            max_id = (await cursor.fetchone())[0]
+
+        removed = 0
+        step = self.batch_size * 10
+        for first_id in range(0, max_id + 1, step):
+            async with self.pool.transaction() as cursor:
+                await cursor.execute("""
+                    DELETE m FROM messages m
+                    LEFT JOIN conversations_v1 c ON c.id = m.id
+                    WHERE m.id >= %s AND m.id < %s AND c.id IS NULL
+                """, (first_id, first_id + step))
+                removed += cursor.rowcount
+        if removed:
+            print(f"🧹 删除了 {removed} 条迁移期间在 v1 中被删除的消息")
+        return removed
+
+async def schema_stats(pool: DatabasePool, samples: int = 50) -> Dict:
+    """
+    迁移前后对比：各表的数据 / 索引大小，以及两种表结构读取最近消息的延迟（p50 / p95，毫秒）
+
+    大小来自 information_schema.TABLES（InnoDB 的估算值，先 ANALYZE TABLE 刷新）；
+    延迟对最近活跃的 samples 个会话各读取一次最近 HISTORY_LIMIT 条消息（v2 包含解压时间）。
+    """
+    await pool.init()
+    tables = ["conversations", "conversations_v1", "messages", "conversation_keys", "conversation_summaries"]
+    report: Dict = {"tables": {}, "read_latency_ms": {}}
+
+    async with pool.cursor() as cursor:
+        existing = [table for table in tables if await table_exists(cursor, table)]
+        for table in existing:
+            await cursor.execute(f"ANALYZE TABLE {table}")
+            await cursor.fetchall()
+        placeholders = ", ".join("%s" for _ in existing)
+        await cursor.execute(f"""
+            SELECT TABLE_NAME, TABLE_ROWS, DATA_LENGTH, INDEX_LENGTH
+            FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({placeholders})
+        """, tuple(existing))
+        for name, rows, data_length, index_length in await cursor.fetchall():
+            report["tables"][name] = {
+                "rows": rows,
+                "data_mb": round(data_length / 1024 / 1024, 2),
+                "index_mb": round(index_length / 1024 / 1024, 2),
+            }
+
+        await cursor.execute("""
+            SELECT conversation_id FROM conversation_summaries
+            ORDER BY last_message_time DESC
+            LIMIT %s
+        """, (samples,))
+        conversation_ids = [row[0] for row in await cursor.fetchall()]
+
+        v1_table = next((table for table in ("conversations", "conversations_v1") if table in existing), None)
+        queries = {}
+        if v1_table:
+            queries["v1"] = f"""
+                SELECT role, content, timestamp, message_index
+                FROM {v1_table}
+                WHERE conversation_id = %s
+                ORDER BY message_index DESC
+                LIMIT {HISTORY_LIMIT}
+            """
+        if "messages" in existing:
+            queries["v2"] = f"""
+                SELECT role, content, content_z, timestamp, message_index
+                FROM messages
+                WHERE conversation_key = (SELECT id FROM conversation_keys WHERE conversation_id = %s)
+                ORDER BY message_index DESC
+                LIMIT {HISTORY_LIMIT}
+            """
+
+        for version, sql in queries.items():
+            timings: List[float] = []
+            for conversation_id in conversation_ids:
+                started = time.perf_counter()
+                await cursor.execute(sql, (conversation_id,))
+                rows = await cursor.fetchall()
+                if version == "v2":
+                    for row in rows:
+                        unpack_content(row[1], row[2])
+                timings.append((time.perf_counter() - started) * 1000)
+            report["read_latency_ms"][version] = _percentiles(timings)
+
+    return report
+
+def _percentiles(timings: List[float]) -> Optional[Dict]:
+    if not timings:
+        return None
+    timings = sorted(timings)
+    return {
+        "samples": len(timings),
+        "p50": round(timings[len(timings) // 2], 3),
+        "p95": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+    }
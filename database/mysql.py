@@ -1,199 +1,613 @@
 """
 MySQL数据库实现
+
+支持两个表结构版本（见 schema.py）：v1 的 conversations 表，以及 v2 的 conversation_keys + messages 表
+（BIGINT 代理键、长消息压缩）。版本在初始化时从 schema_meta 读取；在线迁移切换时 v1 表会被改名，
+正在运行的进程遇到"表不存在"后重新读取版本并重试一次。
 """
 
+import asyncio
+import functools
+import time
 import aiomysql
 from datetime import datetime
-from typing import List, Dict
-from contextlib import asynccontextmanager
-
-class ConversationDatabase:
-    def __init__(self, 
-                 host: str = "localhost",
-                 port: int = 3306,
-                 user: str = "root",
-                 password: str = "",
-                 database: str = "ai_assistant"):
-        self.host = host
-        self.port = port
-        self.user = user
-        self.password = password
-        self.database = database
-        self.pool = None
-    
-    async def init_connection_pool(self):
-        """初始化数据库连接池"""
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from .backend import ConversationStore, DuplicateMessageError, ExpiredRow, MessageRow, TIME_FORMAT, summary_rows
+from .config import DB_SCHEMA_CONFIG
+from .metrics import timed_query
+from .pool import DatabasePool
+from .schema import (
+    SUMMARIES_DDL, V1_MESSAGES_DDL, create_v2_tables, index_exists, pack_content, read_schema_state,
+    table_exists, unpack_content, write_schema_state,
+)
+
+# MySQL 错误码：唯一键冲突、表不存在
+ER_DUP_ENTRY = 1062
+ER_NO_SUCH_TABLE = 1146
+
+# 在线迁移切换表时最长等待多久（秒）
+CUTOVER_WAIT_SECONDS = 60
+# 进程内缓存的会话代理键数量上限，超过后清空重新查询
+MAX_CACHED_KEYS = 100000
+
+V1_INSERT_SQL = """
+    INSERT INTO conversations (conversation_id, role, content, message_index)
+    VALUES (%s, %s, %s, %s)
+"""
+
+V2_INSERT_SQL = """
+    INSERT INTO messages (conversation_key, role, content, content_z, message_index)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+# v2 按会话ID过滤：唯一索引上的子查询只执行一次
+V2_CONVERSATION = "conversation_key = (SELECT id FROM conversation_keys WHERE conversation_id = %s)"
+
+# 会话摘要随消息写入在同一事务中更新：消息数、首末消息时间、最后序号
+UPSERT_SUMMARY_SQL = """
+    INSERT INTO conversation_summaries
+        (conversation_id, message_count, first_message_time, last_message_time, last_message_index)
+    VALUES (%s, %s, NOW(), NOW(), %s)
+    ON DUPLICATE KEY UPDATE
+        message_count = message_count + VALUES(message_count),
+        last_message_time = VALUES(last_message_time),
+        last_message_index = GREATEST(last_message_index, VALUES(last_message_index))
+"""
+
+# 从消息表重新统计摘要（回填 / 重建使用）
+REBUILD_SUMMARY_SQL = {
+    1: """
+        INSERT INTO conversation_summaries
+            (conversation_id, message_count, first_message_time, last_message_time, last_message_index)
+        SELECT conversation_id, COUNT(*), MIN(timestamp), MAX(timestamp), MAX(message_index)
+        FROM conversations
+        GROUP BY conversation_id
+        ON DUPLICATE KEY UPDATE
+            message_count = VALUES(message_count),
+            first_message_time = VALUES(first_message_time),
+            last_message_time = VALUES(last_message_time),
+            last_message_index = VALUES(last_message_index)
+    """,
+    2: """
+        INSERT INTO conversation_summaries
+            (conversation_id, message_count, first_message_time, last_message_time, last_message_index)
+        SELECT k.conversation_id, m.message_count, m.first_time, m.last_time, m.last_index
+        FROM (
+            SELECT conversation_key, COUNT(*) AS message_count, MIN(timestamp) AS first_time,
+                   MAX(timestamp) AS last_time, MAX(message_index) AS last_index
+            FROM messages
+            GROUP BY conversation_key
+        ) m
+        JOIN conversation_keys k ON k.id = m.conversation_key
+        ON DUPLICATE KEY UPDATE
+            message_count = VALUES(message_count),
+            first_message_time = VALUES(first_message_time),
+            last_message_time = VALUES(last_message_time),
+            last_message_index = VALUES(last_message_index)
+    """,
+}
+
+SUMMARY_COLUMNS = "conversation_id, message_count, first_message_time, last_message_time, last_message_index"
+
+def _format_time(value: Optional[datetime]) -> Optional[str]:
+    return value.strftime(TIME_FORMAT) if value else None
+
+def _message_dict(row) -> Dict:
+    """(role, content, timestamp, message_index) 转为消息字典"""
+    return {
+        "role": row[0],
+        "content": row[1],
+        "timestamp": _format_time(row[2]),
+        "message_index": row[3]
+    }
+
+def _packed_message_dict(row) -> Dict:
+    """v2 的 (role, content, content_z, timestamp, message_index) 转为消息字典"""
+    return _message_dict((row[0], unpack_content(row[1], row[2]), row[3], row[4]))
+
+def _summary_dict(row) -> Dict:
+    """conversation_summaries 的一行转为摘要字典"""
+    return {
+        "conversation_id": row[0],
+        "total_messages": row[1],
+        "first_message_time": _format_time(row[2]),
+        "last_message_time": _format_time(row[3]),
+        "last_message_index": row[4]
+    }
+
+def _is_duplicate(error: aiomysql.IntegrityError) -> bool:
+    return bool(error.args) and error.args[0] == ER_DUP_ENTRY
+
+def _schema_call(method):
+    """按当前表结构版本执行；迁移切换导致表不存在时重新读取版本后重试一次"""
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        if self.version is None:
+            await self.init()
         try:
-            # 首先连接到MySQL服务器（不指定数据库）
-            temp_pool = await aiomysql.create_pool(
-                host=self.host,
-                port=self.port,
-                user=self.user,
-                password=self.password,
-                charset='utf8mb4',
-                autocommit=True
-            )
-            
-            # 创建数据库（如果不存在）
-            async with temp_pool.acquire() as conn:
-                async with conn.cursor() as cursor:
-                    await cursor.execute(f"CREATE DATABASE IF NOT EXISTS {self.database} CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci")
-            
-            temp_pool.close()
-            await temp_pool.wait_closed()
-            
-            # 创建连接到指定数据库的连接池
-            self.pool = await aiomysql.create_pool(
-                host=self.host,
-                port=self.port,
-                user=self.user,
-                password=self.password,
-                db=self.database,
-                charset='utf8mb4',
-                autocommit=True,
-                minsize=5,
-                maxsize=20
-            )
-            print("✅ MySQL连接池初始化完成")
-        except Exception as e:
-            print(f"❌ MySQL连接池初始化失败: {e}")
-            raise
-    
-    async def close_connection_pool(self):
-        """关闭数据库连接池"""
-        if self.pool:
-            self.pool.close()
-            await self.pool.wait_closed()
-            print("✅ MySQL连接池已关闭")
-    
-    @asynccontextmanager
-    async def get_connection(self):
-        """获取数据库连接的上下文管理器"""
-        if not self.pool:
-            await self.init_connection_pool()
-        
-        async with self.pool.acquire() as conn:
-            async with conn.cursor() as cursor:
-                yield cursor
-    
-    async def init_database(self):
-        """初始化数据库表"""
-        async with self.get_connection() as cursor:
-            # 创建会话表
+            return await method(self, *args, **kwargs)
+        except aiomysql.ProgrammingError as e:
+            if not (e.args and e.args[0] == ER_NO_SUCH_TABLE):
+                raise
+            await self._detect_schema()
+            return await method(self, *args, **kwargs)
+    return wrapper
+
+class MySQLConversationStore(ConversationStore):
+    """MySQL会话存储（借用 DatabasePool 连接池）"""
+
+    name = "mysql"
+
+    def __init__(self, pool: DatabasePool, read_only: bool = False,
+                 compress_threshold: int = DB_SCHEMA_CONFIG["compress_threshold"]):
+        """
+        Args:
+            pool: 连接池，由创建者负责关闭
+            read_only: 只读副本，不建表也不做迁移（表结构由主库复制而来）
+            compress_threshold: v2 中达到该字节数的消息压缩存储，0为不压缩（压缩的消息不参与搜索）
+        """
+        self.pool = pool
+        self.read_only = read_only
+        self.compress_threshold = compress_threshold
+
+        # 当前表结构版本，init 时读取
+        self.version: Optional[int] = None
+        # 消息表有全文索引时用 MATCH 筛选，否则搜索退化为 LIKE 扫描；init 时读取
+        self.fulltext = False
+        self._init_lock = asyncio.Lock()
+        # v2 会话ID -> 代理键（只缓存已提交的键）
+        self._keys: Dict[str, int] = {}
+
+        # 统计
+        self.compressed = 0
+        self.schema_switches = 0
+
+    async def init(self):
+        """初始化数据库表（每个连接池只建一次表），读取表结构版本"""
+        await self.pool.init()
+        if self.version is not None:
+            return
+        async with self._init_lock:
+            if self.version is not None:
+                return
+            if not self.read_only and "conversations" not in self.pool.schemas:
+                await self._create_tables()
+                self.pool.schemas.add("conversations")
+            await self._detect_schema()
+
+    async def _create_tables(self):
+        async with self.pool.cursor() as cursor:
+            version, _ = await read_schema_state(cursor)
+            if version is None:
+                # 旧版本升级（已有 conversations 表）继续使用 v1，新建的数据库按配置
+                version = 1 if await table_exists(cursor, "conversations") else DB_SCHEMA_CONFIG["version"]
+                if version not in (1, 2):
+                    raise ValueError(f"未知的表结构版本: {version}，可选 1、2")
+                await write_schema_state(cursor, version=version)
+
+            if version == 1:
+                await cursor.execute(V1_MESSAGES_DDL)
+                await self._ensure_unique_message_index(cursor)
+            else:
+                await create_v2_tables(
+                    cursor, DB_SCHEMA_CONFIG["partition"], DB_SCHEMA_CONFIG["partition_months_ahead"],
+                    single_writer=DB_SCHEMA_CONFIG["single_writer"]
+                )
+                if self.compress_threshold > 0:
+                    print(f"⚠️ 达到 {self.compress_threshold} 字节的消息将压缩存储，这些消息不参与搜索")
+
+            await cursor.execute(SUMMARIES_DDL)
+            await self._backfill_summaries(cursor, version)
+            print(f"✅ MySQL数据库和表初始化完成（表结构 v{version}）")
+
+    async def _detect_schema(self):
+        """读取当前表结构版本；迁移正在切换表时等待切换完成"""
+        deadline = time.monotonic() + CUTOVER_WAIT_SECONDS
+        while True:
+            async with self.pool.cursor() as cursor:
+                version, state = await read_schema_state(cursor)
+                version = version or 1
+                if state != "cutover":
+                    table = "conversations" if version == 1 else "messages"
+                    fulltext = await index_exists(cursor, table, "ft_content")
+                    break
+            if time.monotonic() > deadline:
+                raise TimeoutError("等待会话表结构迁移切换超时")
+            await asyncio.sleep(0.2)
+
+        if self.version is not None and version != self.version:
+            self.schema_switches += 1
+            print(f"🔄 会话表结构已切换到 v{version}")
+        self.version = version
+        self.fulltext = fulltext
+
+    async def close(self):
+        await self.pool.close()
+
+    async def _backfill_summaries(self, cursor, version: int):
+        """摘要表为空但已有消息（从旧版本升级）时，从消息表回填"""
+        await cursor.execute("SELECT 1 FROM conversation_summaries LIMIT 1")
+        if await cursor.fetchone():
+            return
+        await cursor.execute(f"SELECT 1 FROM {'conversations' if version == 1 else 'messages'} LIMIT 1")
+        if not await cursor.fetchone():
+            return
+        await cursor.execute(REBUILD_SUMMARY_SQL[version])
+        print("🔧 已从消息表回填会话摘要")
+
+    async def _ensure_unique_message_index(self, cursor):
+        """旧版本的表只有普通索引：先给重复的序号重新编号，再换成唯一约束"""
+        if await index_exists(cursor, "conversations", "uniq_conversation_message"):
+            return
+
+        # 并发写入可能产生过重复序号，按原序号和插入顺序重新编号
+        await cursor.execute("""
+            SELECT COUNT(*) FROM (
+                SELECT 1 FROM conversations
+                GROUP BY conversation_id, message_index
+                HAVING COUNT(*) > 1
+            ) duplicates
+        """)
+        row = await cursor.fetchone()
+        if row and row[0]:
             await cursor.execute("""
-                CREATE TABLE IF NOT EXISTS conversations (
-                    id BIGINT AUTO_INCREMENT PRIMARY KEY,
-                    conversation_id VARCHAR(255) NOT NULL,
-                    role ENUM('user', 'assistant') NOT NULL,
-                    content TEXT NOT NULL,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    message_index INT NOT NULL,
-                    INDEX idx_conversation_id (conversation_id),
-                    INDEX idx_conversation_timestamp (conversation_id, timestamp),
-                    INDEX idx_message_index (conversation_id, message_index)
-                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+                UPDATE conversations c
+                JOIN (
+                    SELECT id, ROW_NUMBER() OVER (PARTITION BY conversation_id ORDER BY message_index, id) AS new_index
+                    FROM conversations
+                ) numbered ON numbered.id = c.id
+                SET c.message_index = numbered.new_index
             """)
-            
-            print("✅ MySQL数据库和表初始化完成")
-    
-    async def save_message(self, conversation_id: str, role: str, content: str):
-        """保存单条消息到数据库"""
-        async with self.get_connection() as cursor:
-            # 获取当前会话的最大消息序号
-            await cursor.execute("""
-                SELECT COALESCE(MAX(message_index), 0) 
-                FROM conversations 
-                WHERE conversation_id = %s
+            print(f"🔧 已为 {row[0]} 组重复的消息序号重新编号")
+
+        await cursor.execute("""
+            ALTER TABLE conversations
+            DROP INDEX idx_message_index,
+            ADD UNIQUE KEY uniq_conversation_message (conversation_id, message_index)
+        """)
+        print("🔧 已添加 (conversation_id, message_index) 唯一约束")
+
+    async def add_fulltext_index(self) -> bool:
+        """
+        给旧版本升级来的消息表添加 ngram 分词的 FULLTEXT 索引（db_manager add-fulltext-index），返回是否新建
+
+        InnoDB 添加全文索引不能和写入并发（LOCK=SHARED），建索引期间消息写入被阻塞，大表需要较长时间：
+        不在 init 中执行，在低峰期手动运行。索引建好之前搜索使用 LIKE 扫描；
+        已运行的进程在重启（或表结构切换）后改用全文索引。
+        """
+        await self.init()
+        async with self.pool.cursor() as cursor:
+            if await index_exists(cursor, self._table, "ft_content"):
+                return False
+            await cursor.execute(f"ALTER TABLE {self._table} ADD FULLTEXT INDEX ft_content (content) WITH PARSER ngram")
+        self.fulltext = True
+        print("🔧 已添加消息内容全文索引（ngram）")
+        return True
+
+    @property
+    def _table(self) -> str:
+        return "conversations" if self.version == 1 else "messages"
+
+    @property
+    def _where_conversation(self) -> str:
+        return "conversation_id = %s" if self.version == 1 else V2_CONVERSATION
+
+    @property
+    def _message_columns(self) -> str:
+        if self.version == 1:
+            return "role, content, timestamp, message_index"
+        return "role, content, content_z, timestamp, message_index"
+
+    def _message(self, row) -> Dict:
+        return _message_dict(row) if self.version == 1 else _packed_message_dict(row)
+
+    @timed_query
+    @_schema_call
+    async def load_max_index(self, conversation_id: str) -> int:
+        async with self.pool.cursor() as cursor:
+            await cursor.execute(f"""
+                SELECT COALESCE(MAX(message_index), 0)
+                FROM {self._table}
+                WHERE {self._where_conversation}
             """, (conversation_id,))
-            
+
             result = await cursor.fetchone()
-            max_index = result[0] if result else 0
-            new_index = max_index + 1
-            
-            # 插入新消息
-            await cursor.execute("""
-                INSERT INTO conversations (conversation_id, role, content, message_index)
-                VALUES (%s, %s, %s, %s)
-            """, (conversation_id, role, content, new_index))
-            
-            print(f"💾 保存消息: {conversation_id} - {role} - 序号{new_index}")
-    
-    async def get_recent_messages(self, conversation_id: str, limit: int = 20) -> List[Dict]:
-        """获取指定会话的最近N条消息"""
-        async with self.get_connection() as cursor:
-            await cursor.execute("""
-                SELECT role, content, timestamp, message_index
-                FROM conversations 
-                WHERE conversation_id = %s
-                ORDER BY message_index DESC
-                LIMIT %s
-            """, (conversation_id, limit))
-            
+            return result[0] if result else 0
+
+    async def _conversation_keys(self, cursor, conversation_ids: Iterable[str]) -> Dict[str, int]:
+        """取得（必要时分配）会话的代理键；在调用方的事务中执行"""
+        keys = {cid: self._keys[cid] for cid in conversation_ids if cid in self._keys}
+        missing = [cid for cid in conversation_ids if cid not in keys]
+        if missing:
+            await cursor.executemany(
+                "INSERT IGNORE INTO conversation_keys (conversation_id) VALUES (%s)",
+                [(cid,) for cid in missing]
+            )
+            placeholders = ", ".join("%s" for _ in missing)
+            await cursor.execute(
+                f"SELECT conversation_id, id FROM conversation_keys WHERE conversation_id IN ({placeholders})",
+                tuple(missing)
+            )
+            keys.update(dict(await cursor.fetchall()))
+        return keys
+
+    @timed_query
+    @_schema_call
+    async def insert_messages(self, rows: List[MessageRow]):
+        """一条（多行）INSERT 写入消息，连同摘要更新在一个事务中提交"""
+        keys: Dict[str, int] = {}
+        compressed = 0
+        try:
+            async with self.pool.transaction() as cursor:
+                if self.version == 1:
+                    sql, values = V1_INSERT_SQL, rows
+                else:
+                    keys = await self._conversation_keys(cursor, list(dict.fromkeys(row[0] for row in rows)))
+                    values = []
+                    for conversation_id, role, content, message_index in rows:
+                        text, packed = pack_content(content, self.compress_threshold)
+                        compressed += packed is not None
+                        values.append((keys[conversation_id], role, text, packed, message_index))
+                    sql = V2_INSERT_SQL
+
+                if len(values) == 1:
+                    await cursor.execute(sql, values[0])
+                else:
+                    await cursor.executemany(sql, values)
+                await cursor.executemany(UPSERT_SUMMARY_SQL, summary_rows(rows))
+        except aiomysql.IntegrityError as e:
+            if _is_duplicate(e):
+                raise DuplicateMessageError(str(e)) from e
+            raise
+
+        # 事务回滚时新分配的键也会回滚，提交后才放入缓存
+        if len(self._keys) + len(keys) > MAX_CACHED_KEYS:
+            self._keys.clear()
+        self._keys.update(keys)
+        self.compressed += compressed
+
+    @timed_query
+    @_schema_call
+    async def fetch_messages(self, conversation_id: str, limit: int,
+                             before: Optional[int] = None, after: Optional[int] = None) -> List[Dict]:
+        columns, table, where = self._message_columns, self._table, self._where_conversation
+        async with self.pool.cursor() as cursor:
+            if after is not None:
+                await cursor.execute(f"""
+                    SELECT {columns}
+                    FROM {table}
+                    WHERE {where} AND message_index > %s
+                    ORDER BY message_index ASC
+                    LIMIT %s
+                """, (conversation_id, after, limit))
+                return [self._message(row) for row in await cursor.fetchall()]
+
+            if before is not None:
+                await cursor.execute(f"""
+                    SELECT {columns}
+                    FROM {table}
+                    WHERE {where} AND message_index < %s
+                    ORDER BY message_index DESC
+                    LIMIT %s
+                """, (conversation_id, before, limit))
+            else:
+                await cursor.execute(f"""
+                    SELECT {columns}
+                    FROM {table}
+                    WHERE {where}
+                    ORDER BY message_index DESC
+                    LIMIT %s
+                """, (conversation_id, limit))
             rows = await cursor.fetchall()
-            
-            # 转换为字典格式并按时间正序排列
-            messages = []
-            for row in reversed(rows):  # 反转以获得正确的时间顺序
-                messages.append({
-                    "role": row[0],
-                    "content": row[1],
-                    "timestamp": row[2].strftime('%Y-%m-%d %H:%M:%S') if row[2] else None,
-                    "message_index": row[3]
-                })
-            
-            print(f"📖 读取会话 {conversation_id} 的 {len(messages)} 条历史消息")
-            return messages
-    
-    async def get_conversation_summary(self, conversation_id: str) -> Dict:
-        """获取会话摘要信息"""
-        async with self.get_connection() as cursor:
-            await cursor.execute("""
-                SELECT 
-                    COUNT(*) as total_messages,
-                    MIN(timestamp) as first_message_time,
-                    MAX(timestamp) as last_message_time
-                FROM conversations 
+            # 反转以获得正确的时间顺序
+            return [self._message(row) for row in reversed(rows)]
+
+    @timed_query
+    async def iter_messages(self, conversation_id: str, batch_size: int = 1000) -> AsyncIterator[List[Dict]]:
+        """服务器端游标（SSCursor）流式读取，导出期间一直占用一个连接"""
+        if self.version is None:
+            await self.init()
+        async with self.pool.cursor(aiomysql.SSCursor) as cursor:
+            await cursor.execute(f"""
+                SELECT {self._message_columns}
+                FROM {self._table}
+                WHERE {self._where_conversation}
+                ORDER BY message_index ASC
+            """, (conversation_id,))
+            while True:
+                rows = await cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [self._message(row) for row in rows]
+
+    @timed_query
+    @_schema_call
+    async def search_messages(self, query: str, limit: int, before_id: Optional[int] = None) -> List[Dict]:
+        """
+        FULLTEXT 短语检索筛选候选，再用 LIKE 校验子串（排除 ngram 分词带来的误匹配）
+
+        InnoDB 的全文索引更新先写入内存中的 FTS 缓存、由后台批量合并，不增加消息写入的延迟。
+        旧版本升级来的表在运行 db_manager add-fulltext-index 之前没有全文索引，只用 LIKE 扫描。
+        v2 中压缩存储的长消息（content 为 NULL）不参与搜索，所以默认不压缩；按月分区的表没有全文索引，退化为 LIKE 扫描。
+        """
+        phrase = '"' + query.replace('"', ' ') + '"'
+        pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        match = "MATCH(m.content) AGAINST (%s IN BOOLEAN MODE) AND" if self.fulltext else ""
+        conditions = "AND m.id < %s" if before_id is not None else ""
+        params = ((phrase,) if self.fulltext else ()) + (pattern,) \
+            + ((before_id,) if before_id is not None else ()) + (limit,)
+
+        if self.version == 1:
+            source = "conversations m"
+            columns = "m.id, m.conversation_id, m.role, m.content, m.timestamp, m.message_index"
+        else:
+            source = "messages m JOIN conversation_keys k ON k.id = m.conversation_key"
+            columns = "m.id, k.conversation_id, m.role, m.content, m.content_z, m.timestamp, m.message_index"
+
+        async with self.pool.cursor() as cursor:
+            await cursor.execute(f"""
+                SELECT {columns}
+                FROM {source}
+                WHERE {match} m.content LIKE %s
+                  {conditions}
+                ORDER BY m.id DESC
+                LIMIT %s
+            """, params)
+            return [
+                {"id": row[0], "conversation_id": row[1], **self._message(row[2:])}
+                for row in await cursor.fetchall()
+            ]
+
+    @timed_query
+    async def get_summary(self, conversation_id: str) -> Optional[Dict]:
+        async with self.pool.cursor() as cursor:
+            await cursor.execute(f"""
+                SELECT {SUMMARY_COLUMNS}
+                FROM conversation_summaries
                 WHERE conversation_id = %s
             """, (conversation_id,))
-            
             row = await cursor.fetchone()
-            
-            return {
-                "conversation_id": conversation_id,
-                "total_messages": row[0] if row else 0,
-                "first_message_time": row[1].strftime('%Y-%m-%d %H:%M:%S') if row and row[1] else None,
-                "last_message_time": row[2].strftime('%Y-%m-%d %H:%M:%S') if row and row[2] else None
-            }
-    
-    async def get_all_conversations(self) -> List[str]:
-        """获取所有会话ID列表"""
-        async with self.get_connection() as cursor:
+            return _summary_dict(row) if row else None
+
+    @timed_query
+    async def list_summaries(self, limit: int, after: Optional[Tuple[str, str]] = None) -> List[Dict]:
+        conditions = ""
+        params: list = []
+        if after:
+            last_message_time, conversation_id = after
+            conditions = "WHERE (last_message_time < %s OR (last_message_time = %s AND conversation_id < %s))"
+            params = [last_message_time, last_message_time, conversation_id]
+
+        async with self.pool.cursor() as cursor:
+            await cursor.execute(f"""
+                SELECT {SUMMARY_COLUMNS}
+                FROM conversation_summaries
+                {conditions}
+                ORDER BY last_message_time DESC, conversation_id DESC
+                LIMIT %s
+            """, (*params, limit))
+            return [_summary_dict(row) for row in await cursor.fetchall()]
+
+    @timed_query
+    async def list_conversation_ids(self) -> List[str]:
+        async with self.pool.cursor() as cursor:
             await cursor.execute("""
-                SELECT DISTINCT conversation_id 
-                FROM conversations 
-                GROUP BY conversation_id
-                ORDER BY MAX(timestamp) DESC
+                SELECT conversation_id
+                FROM conversation_summaries
+                ORDER BY last_message_time DESC, conversation_id DESC
             """)
-            
-            rows = await cursor.fetchall()
-            return [row[0] for row in rows]
-    
+            return [row[0] for row in await cursor.fetchall()]
+
+    @timed_query
+    @_schema_call
     async def delete_conversation(self, conversation_id: str):
-        """删除指定会话的所有消息"""
-        async with self.get_connection() as cursor:
+        # 代理键保留不删：同一会话ID再次写入时沿用原来的键
+        async with self.pool.transaction() as cursor:
+            await cursor.execute(f"""
+                DELETE FROM {self._table}
+                WHERE {self._where_conversation}
+            """, (conversation_id,))
             await cursor.execute("""
-                DELETE FROM conversations 
+                DELETE FROM conversation_summaries
                 WHERE conversation_id = %s
             """, (conversation_id,))
-            
-            print(f"🗑️ 已删除会话 {conversation_id} 的所有消息")
-    
-    async def cleanup_old_messages(self, days: int = 30):
-        """清理超过指定天数的旧消息"""
-        async with self.get_connection() as cursor:
-            await cursor.execute("""
-                DELETE FROM conversations 
-                WHERE timestamp < DATE_SUB(NOW(), INTERVAL %s DAY)
-            """, (days,))
-            
-            print(f"🧹 已清理超过 {days} 天的旧消息")
+
+    @timed_query
+    @_schema_call
+    async def rebuild_summaries(self) -> int:
+        async with self.pool.transaction() as cursor:
+            await cursor.execute("DELETE FROM conversation_summaries")
+            await cursor.execute(REBUILD_SUMMARY_SQL[self.version])
+            await cursor.execute("SELECT COUNT(*) FROM conversation_summaries")
+            row = await cursor.fetchone()
+        return row[0]
+
+    @timed_query
+    async def get_cutoff(self, days: int) -> datetime:
+        async with self.pool.cursor() as cursor:
+            await cursor.execute("SELECT DATE_SUB(NOW(), INTERVAL %s DAY)", (days,))
+            return (await cursor.fetchone())[0]
+
+    @timed_query
+    @_schema_call
+    async def fetch_expired(self, last_id: int, cutoff: datetime, limit: int) -> List[ExpiredRow]:
+        async with self.pool.cursor() as cursor:
+            if self.version == 1:
+                await cursor.execute("""
+                    SELECT id, conversation_id, role, content, timestamp, message_index
+                    FROM conversations
+                    WHERE id > %s
+                    ORDER BY id
+                    LIMIT %s
+                """, (last_id, limit))
+                rows = [tuple(row) for row in await cursor.fetchall()]
+            else:
+                await cursor.execute("""
+                    SELECT m.id, k.conversation_id, m.role, m.content, m.content_z, m.timestamp, m.message_index
+                    FROM messages m
+                    JOIN conversation_keys k ON k.id = m.conversation_key
+                    WHERE m.id > %s
+                    ORDER BY m.id
+                    LIMIT %s
+                """, (last_id, limit))
+                rows = [
+                    (row[0], row[1], row[2], unpack_content(row[3], row[4]), row[5], row[6])
+                    for row in await cursor.fetchall()
+                ]
+
+        expired = []
+        for row in rows:
+            if row[4] is not None and row[4] >= cutoff:
+                break
+            expired.append(row)
+        return expired
+
+    @timed_query
+    @_schema_call
+    async def delete_expired(self, first_id: int, last_id: int, removed: Dict[str, int]) -> int:
+        table, where = self._table, self._where_conversation
+        async with self.pool.transaction() as cursor:
+            await cursor.execute(
+                f"DELETE FROM {table} WHERE id >= %s AND id <= %s",
+                (first_id, last_id)
+            )
+            deleted = cursor.rowcount
+            await cursor.executemany(f"""
+                UPDATE conversation_summaries
+                SET message_count = message_count - %s,
+                    first_message_time = (
+                        SELECT MIN(timestamp) FROM {table} WHERE {where}
+                    )
+                WHERE conversation_id = %s
+            """, [(count, conversation_id, conversation_id) for conversation_id, count in removed.items()])
+            placeholders = ", ".join("%s" for _ in removed)
+            await cursor.execute(
+                f"DELETE FROM conversation_summaries WHERE message_count <= 0 AND conversation_id IN ({placeholders})",
+                tuple(removed)
+            )
+        return deleted
+
+    @timed_query
+    @_schema_call
+    async def server_info(self) -> Dict:
+        async with self.pool.cursor() as cursor:
+            await cursor.execute("SELECT VERSION()")
+            version = (await cursor.fetchone())[0]
+            await cursor.execute(f"SELECT COUNT(*) FROM {self._table}")
+            count = (await cursor.fetchone())[0]
+        return {"backend": self.name, "version": f"MySQL {version}", "schema": self.version, "messages": count}
+
+    def is_healthy(self) -> bool:
+        return self.pool.healthy is not False
+
+    def get_metrics(self) -> Dict:
+        return {
+            "backend": self.name,
+            "schema_version": self.version,
+            "fulltext": self.fulltext,
+            "compressed_messages": self.compressed,
+            "cached_keys": len(self._keys),
+            "schema_switches": self.schema_switches,
+            **self.pool.get_metrics()
+        }
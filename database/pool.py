@@ -0,0 +1,225 @@
+"""
+进程内共享的MySQL连接池
+
+由应用统一创建和关闭，所有会话（AgentChat / ConversationDatabase）和RAG目录都从这里借用连接，
+连接数不再随活跃会话数增长。提供定期健康检查和获取连接的等待时间统计；
+等待连接、执行语句和读取结果的耗时按当前存储操作记入 query_metrics（见 metrics.py）。
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+
+import aiomysql
+
+from .config import DB_CONFIG, DB_POOL_CONFIG
+from .metrics import TimedCursor, query_metrics
+
+class DatabasePool:
+    """共享MySQL连接池"""
+
+    def __init__(self,
+                 host: str = "localhost",
+                 port: int = 3306,
+                 user: str = "root",
+                 password: str = "",
+                 database: str = "ai_assistant",
+                 minsize: int = 1,
+                 maxsize: int = 10,
+                 pool_recycle: int = 3600,
+                 acquire_timeout: float = 10.0,
+                 health_check_interval: float = 30.0,
+                 create_database: bool = True):
+        """
+        Args:
+            minsize / maxsize: 连接池的最小、最大连接数
+            pool_recycle: 连接空闲多久后重建（秒），避免使用被服务器关闭的连接
+            acquire_timeout: 等待空闲连接的超时时间（秒）
+            health_check_interval: 健康检查间隔（秒），为0则不检查
+            create_database: 初始化时创建数据库（只读副本上为 False）
+        """
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.database = database
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self.pool_recycle = pool_recycle
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+        self.create_database = create_database
+
+        self.pool: Optional[aiomysql.Pool] = None
+        self._init_lock = asyncio.Lock()
+        self._health_task: Optional[asyncio.Task] = None
+        # 已在该数据库上初始化过的表结构，避免每个会话重复建表和检查迁移
+        self.schemas: Set[str] = set()
+
+        # 获取连接的统计
+        self.acquired = 0
+        self.waiting = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.slow_acquires = 0  # 等待超过1毫秒（没有空闲连接）的次数
+
+        # 健康状态
+        self.healthy: Optional[bool] = None
+        self.last_health_check: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+
+    async def init(self):
+        """创建数据库（如果不存在）和连接池，可重复调用"""
+        if self.pool is not None:
+            return
+        async with self._init_lock:
+            if self.pool is not None:
+                return
+            try:
+                if self.create_database:
+                    # 先用单个连接创建数据库，不再为此创建临时连接池
+                    conn = await aiomysql.connect(
+                        host=self.host, port=self.port, user=self.user, password=self.password,
+                        charset='utf8mb4', autocommit=True
+                    )
+                    try:
+                        async with conn.cursor() as cursor:
+                            await cursor.execute(f"CREATE DATABASE IF NOT EXISTS {self.database} CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci")
+                    finally:
+                        conn.close()
+
+                self.pool = await aiomysql.create_pool(
+                    host=self.host,
+                    port=self.port,
+                    user=self.user,
+                    password=self.password,
+                    db=self.database,
+                    charset='utf8mb4',
+                    autocommit=True,
+                    minsize=self.minsize,
+                    maxsize=self.maxsize,
+                    pool_recycle=self.pool_recycle
+                )
+                self.healthy = True
+                print(f"✅ MySQL共享连接池初始化完成（{self.minsize}-{self.maxsize} 个连接）")
+            except Exception as e:
+                self.healthy = False
+                self.last_error = str(e)
+                print(f"❌ MySQL连接池初始化失败: {e}")
+                raise
+
+            if self.health_check_interval > 0:
+                self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        """关闭连接池（应用关闭时调用）"""
+        if self._health_task:
+            self._health_task.cancel()
+            self._health_task = None
+        if self.pool:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+            print("✅ MySQL共享连接池已关闭")
+
+    @asynccontextmanager
+    async def acquire(self):
+        """借用一个连接，记录等待时间"""
+        if self.pool is None:
+            await self.init()
+
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            conn = await asyncio.wait_for(self.pool.acquire(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise TimeoutError(f"等待数据库连接超时（{self.acquire_timeout}s，连接池上限 {self.maxsize}）")
+        finally:
+            self.waiting -= 1
+
+        waited = time.perf_counter() - started
+        self.acquired += 1
+        self.wait_time_total += waited
+        self.wait_time_max = max(self.wait_time_max, waited)
+        if waited > 0.001:
+            self.slow_acquires += 1
+        query_metrics.record("acquire", waited)
+
+        try:
+            yield conn
+        finally:
+            self.pool.release(conn)
+
+    @asynccontextmanager
+    async def cursor(self, cursor_class=None):
+        """借用一个连接并创建游标（记录语句耗时）"""
+        async with self.acquire() as conn:
+            async with (conn.cursor(cursor_class) if cursor_class else conn.cursor()) as cursor:
+                yield TimedCursor(cursor, query_metrics)
+
+    @asynccontextmanager
+    async def transaction(self, cursor_class=None):
+        """借用一个连接并在事务中执行，正常退出时提交，异常时回滚"""
+        async with self.acquire() as conn:
+            await conn.begin()
+            try:
+                async with (conn.cursor(cursor_class) if cursor_class else conn.cursor()) as cursor:
+                    yield TimedCursor(cursor, query_metrics)
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                raise
+
+    async def check_health(self) -> bool:
+        """执行一次健康检查"""
+        try:
+            async with self.acquire() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.execute("SELECT 1")
+            if self.healthy is False:
+                print("✅ MySQL连接已恢复")
+            self.healthy = True
+            self.last_error = None
+        except Exception as e:
+            if self.healthy is not False:
+                print(f"⚠️ MySQL健康检查失败: {e}")
+            self.healthy = False
+            self.last_error = str(e)
+        self.last_health_check = datetime.now()
+        return self.healthy
+
+    async def _health_loop(self):
+        """定期健康检查"""
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await self.check_health()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """连接池使用情况和等待时间统计"""
+        size = self.pool.size if self.pool else 0
+        free = self.pool.freesize if self.pool else 0
+        return {
+            "endpoint": f"{self.host}:{self.port}",
+            "initialized": self.pool is not None,
+            "healthy": self.healthy,
+            "last_health_check": self.last_health_check.isoformat() if self.last_health_check else None,
+            "last_error": self.last_error,
+            "minsize": self.minsize,
+            "maxsize": self.maxsize,
+            "size": size,
+            "free": free,
+            "in_use": size - free,
+            "waiting": self.waiting,
+            "acquired": self.acquired,
+            "slow_acquires": self.slow_acquires,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": round(self.wait_time_total / self.acquired * 1000, 3) if self.acquired else 0.0,
+            "max_wait_ms": round(self.wait_time_max * 1000, 3),
+        }
+
+# 进程内共享的连接池
+db_pool = DatabasePool(**DB_CONFIG, **DB_POOL_CONFIG)
@@ -0,0 +1,148 @@
+"""
+只读副本路由
+
+会话历史、会话摘要和会话列表的读取路由到只读副本（轮询），减轻主库的读压力：
+- 读己之写：会话写入或删除后 sticky_seconds 秒内，该会话的读取走主库；
+  超过这个时间后，如果副本返回的最后序号仍落后于本进程分配过的序号（复制延迟较大），也改读主库
+- 故障转移：副本读取失败或其连接池健康检查失败时，标记为不可用并改读其他副本或主库，
+  retry_interval 秒后再试探一次，成功即恢复
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .backend import ConversationStore
+
+class _Replica:
+    __slots__ = ("store", "healthy", "retry_at", "reads", "failures", "last_error")
+
+    def __init__(self, store: ConversationStore):
+        self.store = store
+        self.healthy = True
+        self.retry_at = 0.0
+        self.reads = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+class ReplicaSet:
+    """一组只读副本及其路由状态"""
+
+    def __init__(self, replicas: List[ConversationStore], sticky_seconds: float = 5.0, retry_interval: float = 30.0):
+        """
+        Args:
+            replicas: 副本存储，由本对象负责关闭
+            sticky_seconds: 会话写入后读主库的时间（秒）
+            retry_interval: 副本不可用后再次尝试的间隔（秒）
+        """
+        self.replicas = [_Replica(store) for store in replicas]
+        self.sticky_seconds = sticky_seconds
+        self.retry_interval = retry_interval
+        # 会话 -> 读主库截止时间，按截止时间先后排列
+        self._pinned: "OrderedDict[str, float]" = OrderedDict()
+        self._next = 0
+
+        # 统计
+        self.primary_reads = 0
+        self.pinned_reads = 0
+        self.stale_reads = 0
+        self.failovers = 0
+
+    def pin(self, conversation_id: str):
+        """会话刚被写入：sticky_seconds 秒内读主库"""
+        now = time.monotonic()
+        self._pinned.pop(conversation_id, None)
+        self._pinned[conversation_id] = now + self.sticky_seconds
+        while self._pinned:
+            oldest, expires = next(iter(self._pinned.items()))
+            if expires > now:
+                break
+            del self._pinned[oldest]
+
+    def is_pinned(self, conversation_id: str) -> bool:
+        expires = self._pinned.get(conversation_id)
+        return expires is not None and expires > time.monotonic()
+
+    async def read(self,
+                   primary: ConversationStore,
+                   read: Callable[[ConversationStore], Awaitable[Any]],
+                   conversation_id: Optional[str] = None,
+                   fresh: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        执行只读查询：会话未被固定到主库时轮询可用的副本，全部不可用时读主库
+
+        Args:
+            read: 接收存储、执行查询的函数
+            conversation_id: 查询所属的会话，用于读己之写
+            fresh: 校验副本结果是否足够新，返回 False 时改读主库
+        """
+        if conversation_id is not None and self.is_pinned(conversation_id):
+            self.pinned_reads += 1
+            return await read(primary)
+
+        now = time.monotonic()
+        count = len(self.replicas)
+        for offset in range(count):
+            replica = self.replicas[(self._next + offset) % count]
+            if now < replica.retry_at:
+                continue
+            if replica.healthy and not replica.store.is_healthy():
+                self._mark_down(replica, "健康检查失败")
+                continue
+            try:
+                result = await read(replica.store)
+            except Exception as e:
+                self._mark_down(replica, str(e))
+                continue
+            self._next = (self._next + offset + 1) % count
+            if not replica.healthy:
+                replica.healthy = True
+                replica.retry_at = 0.0
+                print(f"✅ 只读副本已恢复: {self._describe(replica)}")
+            replica.reads += 1
+            if fresh is not None and not fresh(result):
+                # 副本落后于本进程的写入
+                self.stale_reads += 1
+                break
+            return result
+
+        self.primary_reads += 1
+        return await read(primary)
+
+    def _mark_down(self, replica: _Replica, error: str):
+        if replica.healthy:
+            print(f"⚠️ 只读副本不可用，改读其他副本或主库: {self._describe(replica)} - {error}")
+        replica.healthy = False
+        replica.retry_at = time.monotonic() + self.retry_interval
+        replica.failures += 1
+        replica.last_error = error
+        self.failovers += 1
+
+    @staticmethod
+    def _describe(replica: _Replica) -> str:
+        metrics = replica.store.get_metrics()
+        return metrics.get("endpoint") or metrics.get("path") or replica.store.name
+
+    async def close(self):
+        for replica in self.replicas:
+            await replica.store.close()
+
+    def get_stats(self) -> Dict:
+        return {
+            "replicas": [
+                {
+                    "endpoint": self._describe(replica),
+                    "healthy": replica.healthy,
+                    "reads": replica.reads,
+                    "failures": replica.failures,
+                    "last_error": replica.last_error,
+                }
+                for replica in self.replicas
+            ],
+            "sticky_seconds": self.sticky_seconds,
+            "pinned_conversations": sum(1 for expires in self._pinned.values() if expires > time.monotonic()),
+            "primary_reads": self.primary_reads,
+            "pinned_reads": self.pinned_reads,
+            "stale_reads": self.stale_reads,
+            "failovers": self.failovers,
+        }
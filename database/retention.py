@@ -0,0 +1,206 @@
+"""
+消息保留策略
+
+按主键分批删除超过保留天数的消息，每批一个短事务，批次之间休眠，避免长时间持锁阻塞对话写入。
+可选在删除前把过期消息归档为 gzip 压缩的 NDJSON 分段文件。应用内按配置的间隔定期运行，
+每次运行报告删除速度（行/秒）。
+
+消息的自增主键与写入时间同序，所以按主键从小到大扫描，遇到第一条未过期的消息即可停止，
+每批只读取主键范围内的 batch_size 行，不需要时间列上的索引。
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from .config import DB_RETENTION_CONFIG
+from .conversation import ConversationDatabase
+
+class RetentionJob:
+    """分批、限速的旧消息清理任务"""
+
+    def __init__(self,
+                 db: ConversationDatabase,
+                 days: int = 0,
+                 batch_size: int = 1000,
+                 batch_sleep: float = 0.1,
+                 archive_dir: str = "",
+                 segment_rows: int = 100000,
+                 interval: float = 86400):
+        """
+        Args:
+            days: 保留天数，为0则不自动清理
+            batch_size: 每批删除的行数
+            batch_sleep: 批次之间的休眠时间（秒）
+            archive_dir: 归档目录，为空则不归档直接删除
+            segment_rows: 每个归档分段文件的最大行数
+            interval: 自动清理的间隔（秒）
+        """
+        self.db = db
+        self.days = days
+        self.batch_size = batch_size
+        self.batch_sleep = batch_sleep
+        self.archive_dir = archive_dir
+        self.segment_rows = segment_rows
+        self.interval = interval
+
+        self._task: Optional[asyncio.Task] = None
+        self._run_lock = asyncio.Lock()
+        self.last_report: Optional[Dict] = None
+
+    async def run_once(self, days: Optional[int] = None) -> Dict:
+        """执行一次清理，返回报告"""
+        days = self.days if days is None else days
+        if days <= 0:
+            raise ValueError("保留天数必须大于0")
+
+        async with self._run_lock:
+            await self.db.init_database()
+            # 缓冲中的消息先落库，保证主键顺序与写入顺序一致
+            await self.db.buffer.flush()
+
+            started = time.perf_counter()
+            cutoff = await self.db.store.get_cutoff(days)
+
+            archive = _ArchiveWriter(self.archive_dir, cutoff, self.segment_rows) if self.archive_dir else None
+            deleted = 0
+            batches = 0
+            conversations = set()
+            last_id = 0
+            try:
+                while True:
+                    rows = await self._next_batch(last_id, cutoff)
+                    if not rows:
+                        break
+                    if archive:
+                        await asyncio.to_thread(archive.write, rows)
+                    deleted += await self._delete_batch(rows)
+                    conversations.update(row[1] for row in rows)
+                    batches += 1
+                    last_id = rows[-1][0]
+                    if len(rows) < self.batch_size:
+                        break
+                    # 让出锁和连接，给对话写入留出空隙
+                    await asyncio.sleep(self.batch_sleep)
+            finally:
+                if archive:
+                    await asyncio.to_thread(archive.close)
+
+            elapsed = time.perf_counter() - started
+            report = {
+                "days": days,
+                "cutoff": cutoff.strftime('%Y-%m-%d %H:%M:%S'),
+                "deleted_rows": deleted,
+                "conversations": len(conversations),
+                "batches": batches,
+                "elapsed_seconds": round(elapsed, 3),
+                "rows_per_second": round(deleted / elapsed, 1) if elapsed > 0 else 0.0,
+                "archive_files": archive.files if archive else [],
+                "finished_at": datetime.now().isoformat()
+            }
+            self.last_report = report
+            print(f"🧹 已清理超过 {days} 天的旧消息: {deleted} 条（{len(conversations)} 个会话，{batches} 批），"
+                  f"{report['rows_per_second']} 行/秒" + (f"，归档 {len(report['archive_files'])} 个文件" if archive else ""))
+            return report
+
+    async def _next_batch(self, last_id: int, cutoff: datetime) -> List[Tuple]:
+        """按主键顺序读取下一批过期消息，遇到第一条未过期的消息即停止"""
+        return await self.db.store.fetch_expired(last_id, cutoff, self.batch_size)
+
+    async def _delete_batch(self, rows: List[Tuple]) -> int:
+        """在一个短事务中删除一批消息并更新涉及的会话摘要"""
+        removed: Dict[str, int] = {}
+        for row in rows:
+            removed[row[1]] = removed.get(row[1], 0) + 1
+
+        # 读取时主键范围内的行全部过期；自增主键不会再落入该范围
+        deleted = await self.db.store.delete_expired(rows[0][0], rows[-1][0], removed)
+
+        for conversation_id in removed:
+            self.db.cache.invalidate(conversation_id)
+        return deleted
+
+    def start(self):
+        """启动定期清理（保留天数为0时不启动）"""
+        if self.days <= 0 or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._loop())
+        print(f"🗓️ 消息保留策略已启用: 保留 {self.days} 天，每 {self.interval:g} 秒清理一次")
+
+    async def stop(self):
+        """停止定期清理"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"❌ 旧消息清理失败: {e}")
+            await asyncio.sleep(self.interval)
+
+    def get_stats(self) -> Dict:
+        return {
+            "enabled": self.days > 0,
+            "days": self.days,
+            "batch_size": self.batch_size,
+            "batch_sleep": self.batch_sleep,
+            "interval": self.interval,
+            "archive_dir": self.archive_dir or None,
+            "running": self._run_lock.locked(),
+            "last_run": self.last_report,
+        }
+
+class _ArchiveWriter:
+    """把过期消息写入 gzip 压缩的 NDJSON 分段文件"""
+
+    def __init__(self, directory: str, cutoff: datetime, segment_rows: int):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = f"conversations-before-{cutoff.strftime('%Y%m%d%H%M%S')}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        self.segment_rows = segment_rows
+        self.files: List[str] = []
+        self._file = None
+        self._rows = 0
+
+    def write(self, rows: List[Tuple]):
+        for row_id, conversation_id, role, content, timestamp, message_index in rows:
+            if self._file is None or self._rows >= self.segment_rows:
+                self._open_segment()
+            self._file.write((json.dumps({
+                "id": row_id,
+                "conversation_id": conversation_id,
+                "message_index": message_index,
+                "role": role,
+                "content": content,
+                "timestamp": timestamp.strftime('%Y-%m-%d %H:%M:%S') if timestamp else None
+            }, ensure_ascii=False) + "\n").encode("utf-8"))
+            self._rows += 1
+        # 删除前确保这批数据已写到磁盘
+        self._file.flush()
+        os.fsync(self._file.fileobj.fileno())
+
+    def _open_segment(self):
+        self.close()
+        path = os.path.join(self.directory, f"{self.prefix}-{len(self.files) + 1:04d}.ndjson.gz")
+        self._file = gzip.open(path, "wb")
+        self._rows = 0
+        self.files.append(path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+# 应用内定期运行的清理任务（使用共享存储）
+retention_job = RetentionJob(ConversationDatabase(), **DB_RETENTION_CONFIG)
@@ -0,0 +1,213 @@
+"""
+MySQL 会话表结构版本
+
+v1: conversations 表。conversation_id VARCHAR(255)（utf8mb4 最长 1020 字节）出现在三个二级索引中，
+    content 为 TEXT 原文
+v2: conversation_keys 把会话ID映射为 BIGINT 代理键；messages 表只有主键和 (conversation_key, message_index)
+    唯一索引，超过阈值的长消息用 zlib 压缩后存入 content_z（content 为 NULL，不参与搜索，默认不压缩）；
+    可选按月分区（只适合单个写入进程）
+
+当前版本记录在 schema_meta 表中，新建的数据库使用 DB_SCHEMA_CONFIG 配置的版本，
+已有的 v1 数据库由 migration.SchemaMigration 在线迁移到 v2。
+"""
+
+import zlib
+from datetime import date
+from typing import List, Optional, Tuple
+
+SCHEMA_META_DDL = """
+    CREATE TABLE IF NOT EXISTS schema_meta (
+        name VARCHAR(64) NOT NULL PRIMARY KEY,
+        value VARCHAR(255) NOT NULL
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+V1_MESSAGES_DDL = """
+    CREATE TABLE IF NOT EXISTS conversations (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        conversation_id VARCHAR(255) NOT NULL,
+        role ENUM('user', 'assistant') NOT NULL,
+        content TEXT NOT NULL,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        message_index INT NOT NULL,
+        INDEX idx_conversation_id (conversation_id),
+        INDEX idx_conversation_timestamp (conversation_id, timestamp),
+        UNIQUE KEY uniq_conversation_message (conversation_id, message_index),
+        FULLTEXT INDEX ft_content (content) WITH PARSER ngram
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+V2_KEYS_DDL = """
+    CREATE TABLE IF NOT EXISTS conversation_keys (
+        id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+        conversation_id VARCHAR(255) NOT NULL,
+        UNIQUE KEY uniq_conversation_id (conversation_id)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+V2_MESSAGES_DDL = """
+    CREATE TABLE IF NOT EXISTS messages (
+        id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+        conversation_key BIGINT UNSIGNED NOT NULL,
+        role ENUM('user', 'assistant') NOT NULL,
+        content TEXT NULL,
+        content_z MEDIUMBLOB NULL,
+        timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        message_index INT UNSIGNED NOT NULL,
+        UNIQUE KEY uniq_conversation_message (conversation_key, message_index),
+        FULLTEXT INDEX ft_content (content) WITH PARSER ngram
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+# 分区表的唯一键必须包含分区列，且不支持 FULLTEXT 索引：
+# 唯一键加上 timestamp 后只能在单个写入进程内保证序号不重复，全文搜索退化为 LIKE 扫描
+V2_PARTITIONED_MESSAGES_DDL = """
+    CREATE TABLE IF NOT EXISTS messages (
+        id BIGINT UNSIGNED AUTO_INCREMENT,
+        conversation_key BIGINT UNSIGNED NOT NULL,
+        role ENUM('user', 'assistant') NOT NULL,
+        content TEXT NULL,
+        content_z MEDIUMBLOB NULL,
+        timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        message_index INT UNSIGNED NOT NULL,
+        PRIMARY KEY (id, timestamp),
+        UNIQUE KEY uniq_conversation_message (conversation_key, message_index, timestamp)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    PARTITION BY RANGE COLUMNS (timestamp) ({partitions})
+"""
+
+# 会话摘要表：会话列表和摘要只读这张表，不再扫描消息表（两个版本共用）
+SUMMARIES_DDL = """
+    CREATE TABLE IF NOT EXISTS conversation_summaries (
+        conversation_id VARCHAR(255) NOT NULL PRIMARY KEY,
+        message_count INT NOT NULL DEFAULT 0,
+        first_message_time TIMESTAMP NULL,
+        last_message_time TIMESTAMP NULL,
+        last_message_index INT NOT NULL DEFAULT 0,
+        INDEX idx_summaries_last_message (last_message_time, conversation_id)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+def pack_content(content: str, threshold: int) -> Tuple[Optional[str], Optional[bytes]]:
+    """
+    长消息压缩存储
+
+    Returns:
+        (content, content_z)：UTF-8 编码后达到 threshold 字节且压缩后更小时返回 (None, 压缩数据)，否则返回 (原文, None)
+    """
+    if threshold > 0:
+        encoded = content.encode("utf-8")
+        if len(encoded) >= threshold:
+            compressed = zlib.compress(encoded, 6)
+            if len(compressed) < len(encoded):
+                return None, compressed
+    return content, None
+
+def unpack_content(content: Optional[str], content_z: Optional[bytes]) -> str:
+    return zlib.decompress(content_z).decode("utf-8") if content_z is not None else content
+
+def _next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+def month_partitions(start: date, end: date) -> List[Tuple[str, str]]:
+    """start 所在月到 end 所在月的分区：[(分区名, 上界)]"""
+    month = date(start.year, start.month, 1)
+    partitions = []
+    while month <= end:
+        upper = _next_month(month)
+        partitions.append((f"p{month:%Y%m}", upper.isoformat()))
+        month = upper
+    return partitions
+
+def partition_clause(start: date, end: date) -> str:
+    parts = [f"PARTITION {name} VALUES LESS THAN ('{upper}')" for name, upper in month_partitions(start, end)]
+    parts.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+    return ", ".join(parts)
+
+def months_ahead(today: date, months: int) -> date:
+    month = date(today.year, today.month, 1)
+    for _ in range(months):
+        month = _next_month(month)
+    return month
+
+async def table_exists(cursor, table: str) -> bool:
+    await cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (table,))
+    return (await cursor.fetchone())[0] > 0
+
+async def index_exists(cursor, table: str, index: str) -> bool:
+    await cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+    """, (table, index))
+    return (await cursor.fetchone())[0] > 0
+
+async def read_schema_state(cursor) -> Tuple[Optional[int], Optional[str]]:
+    """(版本, 迁移状态)；没有 schema_meta 表或没有记录时版本为 None"""
+    if not await table_exists(cursor, "schema_meta"):
+        return None, None
+    await cursor.execute("SELECT name, value FROM schema_meta WHERE name IN ('conversation_schema', 'migration_state')")
+    values = dict(await cursor.fetchall())
+    version = values.get("conversation_schema")
+    return (int(version) if version else None), values.get("migration_state")
+
+async def write_schema_state(cursor, version: Optional[int] = None, state: Optional[str] = None):
+    await cursor.execute(SCHEMA_META_DDL)
+    if version is not None:
+        await cursor.execute(
+            "REPLACE INTO schema_meta (name, value) VALUES ('conversation_schema', %s)", (str(version),)
+        )
+    if state is not None:
+        await cursor.execute("REPLACE INTO schema_meta (name, value) VALUES ('migration_state', %s)", (state,))
+
+async def ensure_partitions(cursor, table: str, months: int) -> int:
+    """分区表保留未来 months 个月的分区：从 pmax 中拆出缺少的月份，返回新增的分区数"""
+    await cursor.execute("""
+        SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+    """, (table,))
+    names = {row[0] for row in await cursor.fetchall()}
+    if "pmax" not in names:
+        return 0
+    months_named = sorted(name for name in names if name != "pmax")
+    if not months_named:
+        return 0
+    last = months_named[-1]
+    start = _next_month(date(int(last[1:5]), int(last[5:7]), 1))
+    end = months_ahead(date.today(), months)
+    if start > end:
+        return 0
+    await cursor.execute(f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO ({partition_clause(start, end)})")
+    return len(month_partitions(start, end))
+
+def check_partition(partition: str, single_writer: bool):
+    """
+    按月分区的唯一键是 (conversation_key, message_index, timestamp)，不同时间写入的相同序号不会冲突，
+    多个写入进程无法靠唯一约束发现序号冲突：只在确认单个写入进程时允许
+    """
+    if partition not in ("none", "month"):
+        raise ValueError(f"未知的分区方式: {partition}，可选 none、month")
+    if partition == "month" and not single_writer:
+        raise ValueError("按月分区只支持单个写入进程：确认只有一个进程写入会话消息后设置 MYSQL_SINGLE_WRITER=1")
+
+async def create_v2_tables(cursor, partition: str = "none", partition_months_ahead: int = 3,
+                           start: Optional[date] = None, single_writer: bool = False):
+    """
+    创建 v2 的表（已存在时不改变分区方式），按月分区时补齐未来的分区
+
+    Args:
+        start: 按月分区的第一个月（迁移时为最早的消息时间），默认当前月
+        single_writer: 只有一个写入进程（按月分区的前提）
+    """
+    check_partition(partition, single_writer)
+    await cursor.execute(V2_KEYS_DDL)
+    if partition == "month":
+        today = date.today()
+        await cursor.execute(V2_PARTITIONED_MESSAGES_DDL.format(
+            partitions=partition_clause(start or today, months_ahead(today, partition_months_ahead))
+        ))
+    else:
+        await cursor.execute(V2_MESSAGES_DDL)
+    await ensure_partitions(cursor, "messages", partition_months_ahead)
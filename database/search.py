@@ -0,0 +1,105 @@
+"""
+会话消息全文搜索
+
+MySQL 后端使用 ngram 分词的 FULLTEXT 索引；SQLite 后端使用本模块的进程内倒排索引。
+倒排索引以二元组（相邻两个字符）为词项，按消息主键增量构建：写入消息时不更新索引，
+搜索时先补齐上次索引之后新增的消息，所以索引维护不在消息写入的延迟路径上。
+
+二元组交集只用于筛选候选消息，最终结果都按子串匹配校验（同时过滤已删除的消息）。
+"""
+
+import html
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# 搜索词最短长度（与 MySQL ngram_token_size 默认值一致）
+MIN_QUERY_LENGTH = 2
+
+def normalize_query(query: str) -> str:
+    """去掉首尾空白并校验长度"""
+    query = (query or "").strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        raise ValueError(f"搜索词至少 {MIN_QUERY_LENGTH} 个字符")
+    return query
+
+def bigrams(text: str) -> Set[str]:
+    """文本的二元组集合（不区分大小写）"""
+    text = text.lower()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+def highlight(content: str, query: str, context: int = 40) -> Tuple[str, int]:
+    """
+    截取第一处匹配前后 context 个字符，匹配部分用 <mark> 标出（其余内容做 HTML 转义）
+
+    Returns:
+        (片段, 匹配次数)
+    """
+    lowered, needle = content.lower(), query.lower()
+    spans = []
+    start = lowered.find(needle)
+    while start != -1:
+        spans.append(start)
+        start = lowered.find(needle, start + len(needle))
+    if not spans:
+        return html.escape(content[:context * 2]), 0
+
+    begin = max(0, spans[0] - context)
+    end = min(len(content), spans[0] + len(needle) + context)
+    parts = ["…" if begin > 0 else ""]
+    position = begin
+    for start in spans:
+        if start < begin or start + len(needle) > end:
+            continue
+        parts.append(html.escape(content[position:start]))
+        parts.append(f"<mark>{html.escape(content[start:start + len(needle)])}</mark>")
+        position = start + len(needle)
+    parts.append(html.escape(content[position:end]))
+    parts.append("…" if end < len(content) else "")
+    return "".join(parts), len(spans)
+
+class MessageSearchIndex:
+    """按消息主键增量构建的二元组倒排索引"""
+
+    def __init__(self):
+        self._postings: Dict[str, Set[int]] = {}
+        # 已删除的消息（搜索时发现），从候选中排除
+        self._removed: Set[int] = set()
+        # 已索引到的最大主键
+        self.last_id = 0
+        self.documents = 0
+
+    def add(self, rows: Iterable[Tuple[int, str]]):
+        """索引一批 (id, content)，id 需大于 last_id"""
+        for row_id, content in rows:
+            for token in bigrams(content):
+                self._postings.setdefault(token, set()).add(row_id)
+            self.documents += 1
+            self.last_id = max(self.last_id, row_id)
+
+    def discard(self, row_ids: Iterable[int]):
+        """标记已删除的消息（自增主键不会复用，只需从候选中排除）"""
+        row_ids = set(row_ids) - self._removed
+        self._removed |= row_ids
+        self.documents = max(0, self.documents - len(row_ids))
+
+    def candidates(self, query: str, before_id: Optional[int] = None) -> List[int]:
+        """包含查询全部二元组的消息主键，按主键倒序（最新的在前）"""
+        postings = sorted((self._postings.get(token, set()) for token in bigrams(query)), key=len)
+        if not postings or not postings[0]:
+            return []
+        matched = set(postings[0])
+        for posting in postings[1:]:
+            matched &= posting
+            if not matched:
+                return []
+        matched -= self._removed
+        if before_id is not None:
+            matched = {row_id for row_id in matched if row_id < before_id}
+        return sorted(matched, reverse=True)
+
+    def get_stats(self) -> Dict:
+        return {
+            "documents": self.documents,
+            "terms": len(self._postings),
+            "removed": len(self._removed),
+            "last_id": self.last_id,
+        }
@@ -0,0 +1,103 @@
+"""
+会话消息序号分配器
+
+每个会话的下一个 message_index 缓存在进程内，只在第一次分配时从数据库读取一次当前最大值，
+之后追加消息只需要一条 INSERT。同一会话的并发分配在进程内串行，不会得到重复的序号；
+多进程写同一会话时由 (conversation_id, message_index) 唯一约束兜底，冲突后重新读取最大值再分配。
+缓存的会话数有上限，超过后淘汰最久未分配的会话，之后再分配时重新读取最大值。
+"""
+
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+from .config import DB_WRITE_CONFIG
+
+class SequenceAllocator:
+    """按会话分配递增的消息序号"""
+
+    def __init__(self, max_conversations: int = 10000):
+        """
+        Args:
+            max_conversations: 最多缓存的会话数，超过后淘汰最久未使用的会话
+        """
+        self.max_conversations = max_conversations
+        self._next: "OrderedDict[str, int]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # 每个会话最近一次序号冲突的编号（只记录发生过冲突的会话，同样按 LRU 淘汰）
+        self._generations: "OrderedDict[str, int]" = OrderedDict()
+
+        # 统计
+        self.seeded = 0      # 从数据库读取最大值的次数
+        self.allocated = 0
+        self.conflicts = 0   # 唯一约束冲突后重新读取的次数
+        self.evictions = 0
+
+    async def allocate(self, conversation_id: str, load_max: Callable[[], Awaitable[int]]) -> int:
+        """
+        分配下一个序号
+
+        Args:
+            load_max: 缓存中没有该会话时调用，返回数据库中当前的最大序号
+        """
+        if conversation_id not in self._next:
+            lock = self._locks.setdefault(conversation_id, asyncio.Lock())
+            async with lock:
+                if conversation_id not in self._next:
+                    self._next[conversation_id] = await load_max() + 1
+                    self.seeded += 1
+            self._locks.pop(conversation_id, None)
+
+        # 读取和递增之间没有 await，同一进程内的并发分配不会重复
+        index = self._next[conversation_id]
+        self._next[conversation_id] = index + 1
+        self._next.move_to_end(conversation_id)
+        self.allocated += 1
+        self._evict(self._next)
+        return index
+
+    def last_allocated(self, conversation_id: str) -> Optional[int]:
+        """本进程为该会话分配的最后一个序号；未缓存时返回 None"""
+        next_index = self._next.get(conversation_id)
+        return next_index - 1 if next_index is not None else None
+
+    def conflict(self, conversation_id: str):
+        """序号已被其他进程占用：丢弃缓存，下次分配时重新读取最大值"""
+        self._next.pop(conversation_id, None)
+        self.conflicts += 1
+        # 使用全局递增的冲突编号：记录被淘汰后再次冲突，也不会回到调用方保存过的旧值
+        self._generations[conversation_id] = self.conflicts
+        self._generations.move_to_end(conversation_id)
+        self._evict(self._generations)
+
+    def generation(self, conversation_id: str) -> int:
+        """
+        该会话最近一次序号冲突的编号：其他进程写入了这个会话，或者写缓冲中的消息被重新编号。
+        变化时按旧序号保存在内存中的历史（AgentChat 的共享历史）不再完整，需要重新加载
+        （记录被淘汰后返回0，调用方最多多重新加载一次）
+        """
+        return self._generations.get(conversation_id, 0)
+
+    def forget(self, conversation_id: str):
+        """会话被删除或从会话管理器中淘汰后丢弃缓存"""
+        self._next.pop(conversation_id, None)
+        self._generations.pop(conversation_id, None)
+
+    def _evict(self, entries: "OrderedDict[str, int]"):
+        """超过上限时淘汰最久未使用的会话"""
+        while len(entries) > self.max_conversations:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "cached_conversations": len(self._next),
+            "max_conversations": self.max_conversations,
+            "evictions": self.evictions,
+            "seeded": self.seeded,
+            "allocated": self.allocated,
+            "conflicts": self.conflicts,
+        }
+
+# 与共享连接池配套的进程内分配器
+message_sequences = SequenceAllocator(DB_WRITE_CONFIG["sequence_conversations"])
@@ -0,0 +1,392 @@
+"""
+嵌入式 SQLite 实现
+
+单机部署时不需要 MySQL 服务：数据保存在一个本地文件中，使用 WAL 模式（读不阻塞写），
+synchronous=NORMAL（每次提交只追加 WAL，检查点时才同步主文件）。
+sqlite3 是同步接口，所有语句在线程池中执行，同一时刻只有一个语句使用连接。
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from .backend import ConversationStore, DuplicateMessageError, ExpiredRow, MessageRow, TIME_FORMAT, summary_rows
+from .metrics import query_metrics, timed_query
+from .search import MessageSearchIndex
+
+# 搜索索引每次补齐读取的消息数
+INDEX_BATCH_SIZE = 5000
+# 搜索时每次按主键读取的候选消息数
+SEARCH_FETCH_SIZE = 200
+
+INSERT_MESSAGE_SQL = """
+    INSERT INTO conversations (conversation_id, role, content, message_index)
+    VALUES (?, ?, ?, ?)
+"""
+
+UPSERT_SUMMARY_SQL = """
+    INSERT INTO conversation_summaries
+        (conversation_id, message_count, first_message_time, last_message_time, last_message_index)
+    VALUES (?, ?, datetime('now', 'localtime'), datetime('now', 'localtime'), ?)
+    ON CONFLICT (conversation_id) DO UPDATE SET
+        message_count = message_count + excluded.message_count,
+        last_message_time = excluded.last_message_time,
+        last_message_index = MAX(last_message_index, excluded.last_message_index)
+"""
+
+REBUILD_SUMMARY_SQL = """
+    INSERT OR REPLACE INTO conversation_summaries
+        (conversation_id, message_count, first_message_time, last_message_time, last_message_index)
+    SELECT conversation_id, COUNT(*), MIN(timestamp), MAX(timestamp), MAX(message_index)
+    FROM conversations
+    GROUP BY conversation_id
+"""
+
+SUMMARY_COLUMNS = "conversation_id, message_count, first_message_time, last_message_time, last_message_index"
+
+def _message_dict(row) -> Dict:
+    """(role, content, timestamp, message_index) 转为消息字典"""
+    return {"role": row[0], "content": row[1], "timestamp": row[2], "message_index": row[3]}
+
+def _summary_dict(row) -> Dict:
+    """conversation_summaries 的一行转为摘要字典"""
+    return {
+        "conversation_id": row[0],
+        "total_messages": row[1],
+        "first_message_time": row[2],
+        "last_message_time": row[3],
+        "last_message_index": row[4]
+    }
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    return datetime.strptime(value, TIME_FORMAT) if value else None
+
+class SQLiteConversationStore(ConversationStore):
+    """SQLite会话存储（WAL模式，单个连接）"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = "data/conversations.db"):
+        """
+        Args:
+            path: 数据库文件路径，":memory:" 为内存数据库（测试使用）
+        """
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._init_lock = asyncio.Lock()
+        # 全文搜索的进程内倒排索引，搜索时增量补齐（只在持有 _lock 时访问）
+        self.search_index = MessageSearchIndex()
+        self._index_lock = asyncio.Lock()
+
+        # 统计
+        self.operations = 0
+        self.transactions = 0
+
+    async def _run(self, func: Callable, *args):
+        """在线程池中执行 func(conn, *args)"""
+        if self._conn is None:
+            await self.init()
+        return await asyncio.to_thread(self._call, func, *args)
+
+    def _call(self, func: Callable, *args):
+        # 等待连接锁记为 acquire，语句执行和读取结果一起记为 execute
+        started = time.perf_counter()
+        with self._lock:
+            locked = time.perf_counter()
+            query_metrics.record("acquire", locked - started)
+            self.operations += 1
+            try:
+                return func(self._conn, *args)
+            finally:
+                query_metrics.record("execute", time.perf_counter() - locked, statements=1)
+
+    async def _transaction(self, func: Callable, *args):
+        """在一个事务中执行 func(conn, *args)，异常时回滚"""
+        def run(conn: sqlite3.Connection):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(conn, *args)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            self.transactions += 1
+            return result
+        return await self._run(run)
+
+    async def init(self):
+        """打开数据库文件并初始化表结构，可重复调用"""
+        if self._conn is not None:
+            return
+        async with self._init_lock:
+            if self._conn is not None:
+                return
+            self._conn = await asyncio.to_thread(self._open)
+            print(f"✅ SQLite数据库初始化完成: {self.path}")
+
+    def _open(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.path)
+        if directory and self.path != ":memory:":
+            os.makedirs(directory, exist_ok=True)
+        # 自动提交模式，事务由 _transaction 显式开启
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA busy_timeout = 5000")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                conversation_id TEXT NOT NULL,
+                role TEXT NOT NULL CHECK (role IN ('user', 'assistant')),
+                content TEXT NOT NULL,
+                timestamp TEXT NOT NULL DEFAULT (datetime('now', 'localtime')),
+                message_index INTEGER NOT NULL,
+                UNIQUE (conversation_id, message_index)
+            );
+            CREATE TABLE IF NOT EXISTS conversation_summaries (
+                conversation_id TEXT NOT NULL PRIMARY KEY,
+                message_count INTEGER NOT NULL DEFAULT 0,
+                first_message_time TEXT,
+                last_message_time TEXT,
+                last_message_index INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_summaries_last_message
+                ON conversation_summaries (last_message_time, conversation_id);
+        """)
+        return conn
+
+    async def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await asyncio.to_thread(conn.close)
+
+    @timed_query
+    async def load_max_index(self, conversation_id: str) -> int:
+        def query(conn):
+            return conn.execute(
+                "SELECT COALESCE(MAX(message_index), 0) FROM conversations WHERE conversation_id = ?",
+                (conversation_id,)
+            ).fetchone()[0]
+        return await self._run(query)
+
+    @timed_query
+    async def insert_messages(self, rows: List[MessageRow]):
+        def insert(conn):
+            conn.executemany(INSERT_MESSAGE_SQL, rows)
+            conn.executemany(UPSERT_SUMMARY_SQL, summary_rows(rows))
+        try:
+            await self._transaction(insert)
+        except sqlite3.IntegrityError as e:
+            if "UNIQUE" in str(e):
+                raise DuplicateMessageError(str(e)) from e
+            raise
+
+    @timed_query
+    async def fetch_messages(self, conversation_id: str, limit: int,
+                             before: Optional[int] = None, after: Optional[int] = None) -> List[Dict]:
+        def query(conn):
+            if after is not None:
+                return conn.execute("""
+                    SELECT role, content, timestamp, message_index
+                    FROM conversations
+                    WHERE conversation_id = ? AND message_index > ?
+                    ORDER BY message_index ASC
+                    LIMIT ?
+                """, (conversation_id, after, limit)).fetchall()
+            rows = conn.execute("""
+                SELECT role, content, timestamp, message_index
+                FROM conversations
+                WHERE conversation_id = ? AND message_index < ?
+                ORDER BY message_index DESC
+                LIMIT ?
+            """, (conversation_id, before if before is not None else 2 ** 62, limit)).fetchall()
+            rows.reverse()
+            return rows
+        return [_message_dict(row) for row in await self._run(query)]
+
+    @timed_query
+    async def iter_messages(self, conversation_id: str, batch_size: int = 1000) -> AsyncIterator[List[Dict]]:
+        """按序号键集分批读取，批次之间不占用连接"""
+        last_index = 0
+        while True:
+            batch = await self.fetch_messages(conversation_id, batch_size, after=last_index)
+            if not batch:
+                break
+            yield batch
+            if len(batch) < batch_size:
+                break
+            last_index = batch[-1]["message_index"]
+
+    async def _catch_up_index(self):
+        """把上次索引之后写入的消息加入倒排索引"""
+        def index_batch(conn):
+            rows = conn.execute(
+                "SELECT id, content FROM conversations WHERE id > ? ORDER BY id LIMIT ?",
+                (self.search_index.last_id, INDEX_BATCH_SIZE)
+            ).fetchall()
+            self.search_index.add(rows)
+            return len(rows)
+
+        async with self._index_lock:
+            while await self._run(index_batch) == INDEX_BATCH_SIZE:
+                pass
+
+    @timed_query
+    async def search_messages(self, query: str, limit: int, before_id: Optional[int] = None) -> List[Dict]:
+        """倒排索引筛选候选，按主键倒序读取并校验子串"""
+        await self._catch_up_index()
+        needle = query.lower()
+
+        def search(conn):
+            candidates = self.search_index.candidates(query, before_id)
+            results, missing = [], []
+            for start in range(0, len(candidates), SEARCH_FETCH_SIZE):
+                chunk = candidates[start:start + SEARCH_FETCH_SIZE]
+                placeholders = ", ".join("?" for _ in chunk)
+                rows = {row[0]: row for row in conn.execute(f"""
+                    SELECT id, conversation_id, role, content, timestamp, message_index
+                    FROM conversations
+                    WHERE id IN ({placeholders})
+                """, chunk)}
+                for row_id in chunk:
+                    row = rows.get(row_id)
+                    if row is None:
+                        missing.append(row_id)
+                    elif needle in row[3].lower():
+                        results.append(row)
+                        if len(results) >= limit:
+                            break
+                if len(results) >= limit:
+                    break
+            # 已删除的消息不再作为候选
+            self.search_index.discard(missing)
+            return results
+
+        return [
+            {"id": row[0], "conversation_id": row[1], **_message_dict(row[2:])}
+            for row in await self._run(search)
+        ]
+
+    @timed_query
+    async def get_summary(self, conversation_id: str) -> Optional[Dict]:
+        def query(conn):
+            return conn.execute(
+                f"SELECT {SUMMARY_COLUMNS} FROM conversation_summaries WHERE conversation_id = ?",
+                (conversation_id,)
+            ).fetchone()
+        row = await self._run(query)
+        return _summary_dict(row) if row else None
+
+    @timed_query
+    async def list_summaries(self, limit: int, after: Optional[Tuple[str, str]] = None) -> List[Dict]:
+        def query(conn):
+            if after:
+                last_message_time, conversation_id = after
+                return conn.execute(f"""
+                    SELECT {SUMMARY_COLUMNS}
+                    FROM conversation_summaries
+                    WHERE (last_message_time < ? OR (last_message_time = ? AND conversation_id < ?))
+                    ORDER BY last_message_time DESC, conversation_id DESC
+                    LIMIT ?
+                """, (last_message_time, last_message_time, conversation_id, limit)).fetchall()
+            return conn.execute(f"""
+                SELECT {SUMMARY_COLUMNS}
+                FROM conversation_summaries
+                ORDER BY last_message_time DESC, conversation_id DESC
+                LIMIT ?
+            """, (limit,)).fetchall()
+        return [_summary_dict(row) for row in await self._run(query)]
+
+    @timed_query
+    async def list_conversation_ids(self) -> List[str]:
+        def query(conn):
+            return conn.execute("""
+                SELECT conversation_id
+                FROM conversation_summaries
+                ORDER BY last_message_time DESC, conversation_id DESC
+            """).fetchall()
+        return [row[0] for row in await self._run(query)]
+
+    @timed_query
+    async def delete_conversation(self, conversation_id: str):
+        def delete(conn):
+            conn.execute("DELETE FROM conversations WHERE conversation_id = ?", (conversation_id,))
+            conn.execute("DELETE FROM conversation_summaries WHERE conversation_id = ?", (conversation_id,))
+        await self._transaction(delete)
+
+    @timed_query
+    async def rebuild_summaries(self) -> int:
+        def rebuild(conn):
+            conn.execute("DELETE FROM conversation_summaries")
+            conn.execute(REBUILD_SUMMARY_SQL)
+            return conn.execute("SELECT COUNT(*) FROM conversation_summaries").fetchone()[0]
+        return await self._transaction(rebuild)
+
+    @timed_query
+    async def get_cutoff(self, days: int) -> datetime:
+        def query(conn):
+            return conn.execute("SELECT datetime('now', 'localtime', ?)", (f"{-int(days)} days",)).fetchone()[0]
+        return _parse_time(await self._run(query))
+
+    @timed_query
+    async def fetch_expired(self, last_id: int, cutoff: datetime, limit: int) -> List[ExpiredRow]:
+        def query(conn):
+            return conn.execute("""
+                SELECT id, conversation_id, role, content, timestamp, message_index
+                FROM conversations
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+            """, (last_id, limit)).fetchall()
+
+        expired = []
+        for row_id, conversation_id, role, content, timestamp, message_index in await self._run(query):
+            timestamp = _parse_time(timestamp)
+            if timestamp is not None and timestamp >= cutoff:
+                break
+            expired.append((row_id, conversation_id, role, content, timestamp, message_index))
+        return expired
+
+    @timed_query
+    async def delete_expired(self, first_id: int, last_id: int, removed: Dict[str, int]) -> int:
+        def delete(conn):
+            deleted = conn.execute(
+                "DELETE FROM conversations WHERE id >= ? AND id <= ?", (first_id, last_id)
+            ).rowcount
+            conn.executemany("""
+                UPDATE conversation_summaries
+                SET message_count = message_count - ?,
+                    first_message_time = (
+                        SELECT MIN(timestamp) FROM conversations WHERE conversation_id = ?
+                    )
+                WHERE conversation_id = ?
+            """, [(count, conversation_id, conversation_id) for conversation_id, count in removed.items()])
+            placeholders = ", ".join("?" for _ in removed)
+            conn.execute(
+                f"DELETE FROM conversation_summaries WHERE message_count <= 0 AND conversation_id IN ({placeholders})",
+                tuple(removed)
+            )
+            return deleted
+        return await self._transaction(delete)
+
+    @timed_query
+    async def server_info(self) -> Dict:
+        def query(conn):
+            return conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+        count = await self._run(query)
+        return {"backend": self.name, "version": f"SQLite {sqlite3.sqlite_version}", "messages": count}
+
+    def get_metrics(self) -> Dict:
+        return {
+            "backend": self.name,
+            "path": self.path,
+            "initialized": self._conn is not None,
+            "operations": self.operations,
+            "transactions": self.transactions,
+            "search_index": self.search_index.get_stats(),
+        }
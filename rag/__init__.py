@@ -5,18 +5,29 @@ RAG (Retrieval-Augmented Generation) 模块
 - document: 文档处理
 - vector: 向量化和存储
 - retrieval: 检索和查询
+- jobs / worker: 持久化摄取任务队列和工作池
+- catalog: 持久化文档目录
+- collection: 命名集合
 - api: RAG相关API端点
 """
 
 from .document import DocumentProcessor
 from .vector import VectorStore
 from .retrieval import RAGRetriever
+from .jobs import JobQueue
+from .worker import IngestionWorkerPool
+from .catalog import DocumentCatalog
+from .collection import CollectionManager
 from .models import DocumentInfo, QueryRequest, QueryResponse
 
 __all__ = [
     'DocumentProcessor',
     'VectorStore', 
     'RAGRetriever',
+    'JobQueue',
+    'IngestionWorkerPool',
+    'DocumentCatalog',
+    'CollectionManager',
     'DocumentInfo',
     'QueryRequest',
     'QueryResponse'
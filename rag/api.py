@@ -3,167 +3,887 @@ RAG模块的API端点
 """
 
 import asyncio
-from typing import List, Optional
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
+import os
+import shutil
+import uuid
+from datetime import datetime
+from typing import List, Optional, Dict, Any
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from .models import (
-    DocumentInfo, UploadResponse, ProcessingStatus, 
-    QueryRequest, QueryResponse, DocumentStatus
+    DocumentInfo, DocumentChunk, UploadResponse, ProcessingStatus, 
+    QueryRequest, QueryResponse, DocumentStatus, DocumentType, IngestionJob, JobStatus, BulkIngestReport,
+    CollectionConfig, CollectionCreateRequest
 )
 from .document import DocumentProcessor
 from .vector import VectorStore
-from .retrieval import RAGRetriever
+from .jobs import JobQueue
+from .worker import IngestionWorkerPool
+from .bulk import BulkIngestor, iter_archive_entries, is_archive
+from .events import StatusBroadcaster, format_sse, TERMINAL_STATUSES
+from .catalog import DocumentCatalog, create_catalog_store
+from .collection import Collection, CollectionManager, DEFAULT_COLLECTION
+from .responses import FastJSONResponse
+from .config import RAG_CONFIG
 
-# 创建路由器
-router = APIRouter(prefix="/rag", tags=["RAG"])
+# 创建路由器（默认使用快速JSON序列化）
+router = APIRouter(prefix="/rag", tags=["RAG"], default_response_class=FastJSONResponse)
 
 # 全局实例（实际项目中应该使用依赖注入）
-document_processor = DocumentProcessor()
-vector_store = VectorStore()
-rag_retriever = RAGRetriever(vector_store)
+document_processor = DocumentProcessor(
+    upload_dir=RAG_CONFIG["upload_dir"],
+    text_cache_dir=RAG_CONFIG["text_cache_dir"],
+    chunk_size=RAG_CONFIG["chunk_size"],
+    overlap=RAG_CONFIG["chunk_overlap"]
+)
+# 持久化文档目录（文档信息、处理状态及内容摘要/文件名索引，按集合分别计数）
+catalog = DocumentCatalog(
+    create_catalog_store(RAG_CONFIG["catalog_backend"], RAG_CONFIG["catalog_path"])
+)
+
+# 命名集合：每个集合有独立的向量索引、写锁、统计和配置，按需加载、空闲卸载。
+# 集合的当前一代向量存储始终通过 collection.vector_store 访问，重建索引后会被原子替换
+collections = CollectionManager(
+    catalog.store,
+    catalog.documents,
+    catalog.counters_for,
+    default_config=CollectionConfig(
+        dimension=RAG_CONFIG["vector_dimension"],
+        chunk_size=RAG_CONFIG["chunk_size"],
+        overlap=RAG_CONFIG["chunk_overlap"]
+    ),
+    snapshot_dir=RAG_CONFIG["collections_dir"],
+    idle_seconds=RAG_CONFIG["collection_idle_seconds"],
+    max_loaded=RAG_CONFIG["max_loaded_collections"]
+)
+
+# 只能在API进程内执行的任务类型（需要切换API进程中的索引）
+IN_PROCESS_JOB_KINDS = {"reindex"}
+
+# 持久化摄取任务队列
+job_queue = JobQueue(
+    db_path=RAG_CONFIG["queue_path"],
+    max_attempts=RAG_CONFIG["job_max_attempts"],
+    retry_backoff=RAG_CONFIG["job_retry_backoff"],
+    lease_seconds=RAG_CONFIG["job_lease_seconds"]
+)
+worker_pool: Optional[IngestionWorkerPool] = None
+
+# 处理状态事件推送
+status_broadcaster = StatusBroadcaster()
+remote_status_task: Optional[asyncio.Task] = None
+merge_task: Optional[asyncio.Task] = None
+
+# 集合维护：按间隔写出有变化的快照、卸载空闲集合，关闭时再写出一次
+maintenance_task: Optional[asyncio.Task] = None
+warm_started = False
+
+async def _set_status(document_id: str, status: DocumentStatus, progress: int, message: str,
+                      chunk_count: Optional[int] = None, **counts):
+    """更新文档处理状态（写入目录）并推送给订阅者"""
+    processing_status = ProcessingStatus(
+        document_id=document_id,
+        status=status,
+        progress=progress,
+        message=message,
+        chunk_count=chunk_count,
+        **counts
+    )
+    await catalog.save_status(processing_status)
+    status_broadcaster.publish(processing_status)
+
+def create_bulk_ingestor(collection: Collection, concurrency: Optional[int] = None,
+                         batch_size: Optional[int] = None, on_progress=None) -> BulkIngestor:
+    """创建导入到指定集合的批量导入器（调用方在导入期间占用该集合）"""
 
-# 存储文档信息和处理状态
-documents_db = {}  # document_id -> DocumentInfo
-processing_status = {}  # document_id -> ProcessingStatus
+    async def write_chunks(chunks: List[DocumentChunk]):
+        """批量写入集合的当前一代索引"""
+        async with collection.write_lock:
+            await collection.vector_store.add_chunks(chunks)
+        collection.mark_dirty()
+        # 独立进程中运行时发布给API进程（在登记为完成之前）
+        await collections.publish(collection, {chunk.document_id for chunk in chunks})
+
+    async def register_document(doc_info: DocumentInfo):
+        """登记批量导入完成的文档"""
+        doc_info.collection = collection.name
+        await catalog.save(doc_info)
+        await _set_status(doc_info.id, DocumentStatus.COMPLETED, 100, "批量导入完成", doc_info.chunk_count)
+        collection.stats.record_ingest(doc_info.chunk_count or 0)
+
+    return BulkIngestor(
+        document_processor,
+        write_chunks,
+        register_document=register_document,
+        find_duplicate=lambda content_hash: catalog.content_index.get((collection.name, content_hash)),
+        is_content_referenced=catalog.is_content_referenced,
+        concurrency=concurrency or RAG_CONFIG["bulk_concurrency"],
+        batch_size=batch_size or RAG_CONFIG["bulk_batch_size"],
+        max_file_size=RAG_CONFIG["max_file_size"],
+        chunk_size=collection.config.chunk_size,
+        overlap=collection.config.overlap,
+        on_progress=on_progress
+    )
+
+async def _enqueue_processing(doc_info: DocumentInfo, priority: int = 0) -> IngestionJob:
+    """提交文档处理任务"""
+    doc_info.status = DocumentStatus.UPLOADING
+    doc_info.error_message = None
+    await catalog.save(doc_info)
+    await _set_status(doc_info.id, DocumentStatus.UPLOADING, 0, "文件上传完成，等待处理")
+    
+    job = await job_queue.enqueue(
+        "process_document",
+        {"document": doc_info.model_dump(mode="json")},
+        document_id=doc_info.id,
+        priority=priority
+    )
+    if worker_pool:
+        worker_pool.notify()
+    return job
 
 @router.post("/upload", response_model=UploadResponse)
 async def upload_document(
-    background_tasks: BackgroundTasks,
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    priority: int = 0,
+    replace_document_id: Optional[str] = None,
+    replace_same_name: bool = False,
+    client_id: Optional[str] = None,
+    collection: str = DEFAULT_COLLECTION
 ):
-    """上传文档文件"""
+    """
+    上传文档文件到指定集合
+
+    通过 replace_document_id 指定、或 replace_same_name 为真时集合内同名的文档视为被替换的旧版本，
+    沿用原文档ID增量更新；否则总是创建新文档（同名的不同文件互不覆盖）
+    """
     try:
-        # 检查文件大小（限制为10MB）
-        if file.size and file.size > 10 * 1024 * 1024:
-            raise HTTPException(status_code=413, detail="文件大小超过10MB限制")
+        if await collections.lookup(collection) is None:
+            raise HTTPException(status_code=404, detail=f"集合不存在: {collection}")
+        
+        # 检查文件大小（默认限制为10MB）
+        if file.size and file.size > RAG_CONFIG["max_file_size"]:
+            raise HTTPException(status_code=413, detail="文件大小超过限制")
         
         # 读取文件内容
         file_content = await file.read()
+        content_hash = document_processor.compute_content_hash(file_content)
         
-        # 保存文件并创建文档信息
-        doc_info = await document_processor.save_uploaded_file(file_content, file.filename)
+        # 集合内内容完全相同的文件直接返回已有文档
+        existing = await catalog.find_by_hash(content_hash, collection)
+        if existing:
+            job = None
+            if existing.status in (DocumentStatus.FAILED, DocumentStatus.CANCELLED):
+                if client_id:
+                    status_broadcaster.track(client_id, existing.id)
+                job = await _enqueue_processing(existing, priority)
+            return UploadResponse(
+                success=True,
+                document_id=existing.id,
+                message="文件内容已存在，重新提交处理" if job else "文件内容已存在，无需重复处理",
+                filename=existing.original_name,
+                job_id=job.id if job else None,
+                duplicate=True
+            )
         
-        # 存储文档信息
-        documents_db[doc_info.id] = doc_info
-        rag_retriever.add_document(doc_info)
+        # 显式指定的文档视为新版本，沿用原文档ID以便增量更新
+        previous = await catalog.fetch(replace_document_id) if replace_document_id else None
+        if replace_document_id and previous is None:
+            raise HTTPException(status_code=404, detail="要替换的文档不存在")
+        if previous and previous.collection != collection:
+            raise HTTPException(status_code=400, detail=f"要替换的文档不属于集合 {collection}")
+        if previous is None and replace_same_name:
+            previous = await catalog.find_by_name(file.filename, collection)
+        previous_job = await job_queue.get_latest_for_document(previous.id) if previous else None
         
-        # 初始化处理状态
-        processing_status[doc_info.id] = ProcessingStatus(
-            document_id=doc_info.id,
-            status=DocumentStatus.UPLOADING,
-            progress=0,
-            message="文件上传完成，等待处理"
+        # 保存文件并创建文档信息
+        doc_info = await document_processor.save_uploaded_file(
+            file_content, file.filename,
+            document_id=previous.id if previous else None,
+            content_hash=content_hash
         )
+        doc_info.collection = collection
+        
+        if previous:
+            doc_info.version = previous.version + 1
         
-        # 后台处理文档
-        background_tasks.add_task(process_document_background, doc_info.id)
+        # 存储文档信息（_enqueue_processing 中写入目录）
+        if client_id:
+            status_broadcaster.track(client_id, doc_info.id)
+        
+        # 提交到持久化任务队列
+        job = await _enqueue_processing(doc_info, priority)
+        
+        # 新版本写入目录后，旧版本的文件和提取文本缓存不再被本文档引用；
+        # 旧版本的任务尚未结束时仍要读取文件，跳过删除
+        if previous and previous.filename != doc_info.filename:
+            if previous_job and previous_job.status in (JobStatus.QUEUED, JobStatus.RUNNING):
+                print(f"⚠️ 文档 {previous.id} 旧版本的任务尚未结束，保留旧版本文件 {previous.filename}")
+            else:
+                await _release_content(previous)
         
         return UploadResponse(
             success=True,
             document_id=doc_info.id,
-            message="文件上传成功，正在处理中",
-            filename=doc_info.original_name
+            message=f"新版本(v{doc_info.version})上传成功，正在增量处理" if previous else "文件上传成功，正在处理中",
+            filename=doc_info.original_name,
+            job_id=job.id
         )
         
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
 
-async def process_document_background(document_id: str):
-    """后台处理文档"""
+async def process_document_job(job: IngestionJob) -> Dict[str, Any]:
+    """处理文档摄取任务"""
+    document_id = job.document_id
+    payload_doc = DocumentInfo.model_validate(job.payload["document"])
+    doc_info = await catalog.fetch(document_id)
+    if doc_info is None or doc_info.version < payload_doc.version:
+        # 目录中尚无该版本的记录（例如上传后目录写入失败），从任务载荷恢复
+        doc_info = payload_doc
+        await catalog.save(doc_info)
+
+    async def report(status: DocumentStatus, progress: int, message: str,
+                     chunk_count: Optional[int] = None, **counts):
+        await _set_status(document_id, status, progress, message, chunk_count, **counts)
+        await job_queue.update_progress(job.id, progress, message)
+
+    async with collections.using(doc_info.collection) as collection:
+        return await _process_in_collection(collection, doc_info, report)
+
+async def _process_in_collection(collection: Collection, doc_info: DocumentInfo, report) -> Dict[str, Any]:
+    """按集合的分块参数处理文档并写入集合索引"""
+    document_id = doc_info.id
     try:
-        doc_info = documents_db[document_id]
-        
         # 更新状态：开始处理
-        processing_status[document_id].status = DocumentStatus.PROCESSING
-        processing_status[document_id].progress = 10
-        processing_status[document_id].message = "正在提取文本内容"
+        await report(DocumentStatus.PROCESSING, 10, "正在提取文本内容")
         
         # 处理文档
-        chunks = await document_processor.process_document(doc_info)
+        chunks = await document_processor.process_document(
+            doc_info, collection.config.chunk_size, collection.config.overlap
+        )
         
         # 更新进度
-        processing_status[document_id].progress = 50
-        processing_status[document_id].message = "正在生成向量嵌入"
+        await report(DocumentStatus.PROCESSING, 50, "正在生成向量嵌入")
         
-        # 添加到向量存储
-        await vector_store.add_chunks(chunks)
-        
-        # 更新状态：完成
-        processing_status[document_id].status = DocumentStatus.COMPLETED
-        processing_status[document_id].progress = 100
-        processing_status[document_id].message = "文档处理完成"
-        processing_status[document_id].chunk_count = len(chunks)
+        # 增量写入向量存储：未变化的块复用已有嵌入，删除的块标记为墓碑
+        async with collection.write_lock:
+            counts = await collection.vector_store.upsert_document_chunks(document_id, chunks)
+        collection.mark_dirty()
+        # 独立worker中运行时发布给API进程，先于目录中的完成状态写出
+        await collections.publish(collection, [document_id])
         
         # 更新文档信息
-        documents_db[document_id] = doc_info
+        doc_info.error_message = None
+        doc_info.metadata["last_ingest"] = counts
+        await catalog.save(doc_info)
         
+        # 更新状态：完成
+        await report(
+            DocumentStatus.COMPLETED, 100,
+            f"文档处理完成（复用 {counts['reused_chunks']} 块，新嵌入 {counts['embedded_chunks']} 块）",
+            len(chunks),
+            reused_chunks=counts["reused_chunks"],
+            embedded_chunks=counts["embedded_chunks"]
+        )
+        collection.stats.record_ingest(len(chunks))
+
+        return {"chunk_count": len(chunks), **counts}
+
+    except asyncio.CancelledError:
+        # 首个版本被取消时清理不完整的向量；新版本保留已增量写入的部分
+        if doc_info.version == 1:
+            async with collection.write_lock:
+                await collection.vector_store.delete_document(document_id)
+            collection.mark_dirty()
+        if catalog.get(document_id) is not None:
+            await _set_status(document_id, DocumentStatus.CANCELLED, 0, "处理已取消")
+        raise
+
     except Exception as e:
-        # 更新状态：失败
-        processing_status[document_id].status = DocumentStatus.FAILED
-        processing_status[document_id].progress = 0
-        processing_status[document_id].message = f"处理失败: {str(e)}"
-        
         # 更新文档信息
         doc_info.status = DocumentStatus.FAILED
         doc_info.error_message = str(e)
-        documents_db[document_id] = doc_info
+        await catalog.save(doc_info)
+        
+        # 更新状态：失败（任务队列会按退避策略重试）
+        await _set_status(document_id, DocumentStatus.FAILED, 0, f"处理失败: {str(e)}")
+        raise
+
+async def ingest_archive_job(job: IngestionJob) -> Dict[str, Any]:
+    """处理归档批量导入任务"""
+    archive_path = job.payload["archive_path"]
+
+    async def on_progress(report: BulkIngestReport):
+        # 等待写入完成：进度按批次顺序更新，且都在任务完成之前
+        done = sum(1 for f in report.files if f.status != "pending")
+        await job_queue.update_progress(job.id, 50, f"已处理 {done}/{len(report.files)} 个文件")
+
+    try:
+        async with collections.using(job.payload.get("collection", DEFAULT_COLLECTION)) as collection:
+            ingestor = create_bulk_ingestor(collection, on_progress=on_progress)
+            report = await ingestor.ingest(
+                iter_archive_entries(archive_path, ingestor.max_file_size), source=job.payload.get("filename", "")
+            )
+        return report.model_dump(mode="json")
+    finally:
+        if os.path.exists(archive_path):
+            os.remove(archive_path)
+
+async def _rebuild_documents(target: VectorStore, source: VectorStore, document_ids: List[str],
+                             chunk_size: int, overlap: int) -> Dict[str, int]:
+    """用缓存的提取文本重新分块并写入新一代索引，内容未变化的块复用旧索引中的嵌入"""
+    totals = {"documents": 0, "chunks": 0, "reused_chunks": 0, "embedded_chunks": 0}
+    for document_id in document_ids:
+        doc_info = catalog.get(document_id)
+        if doc_info is None:
+            continue
+        text = await document_processor.get_text(doc_info)
+        chunks = await document_processor.split_text(text, document_id, chunk_size, overlap)
+        counts = await target.upsert_document_chunks(document_id, chunks, embedding_source=source)
+        doc_info.chunk_count = len(chunks)
+        await catalog.save(doc_info)
+        totals["documents"] += 1
+        totals["chunks"] += len(chunks)
+        totals["reused_chunks"] += counts["reused_chunks"]
+        totals["embedded_chunks"] += counts["embedded_chunks"]
+    return totals
+
+async def reindex_job(job: IngestionJob) -> Dict[str, Any]:
+    """
+    蓝绿重建集合索引：在后台按新的分块参数构建新一代索引，构建完成后原子切换。
+    构建期间查询始终使用旧索引，不会看到不完整的结果。
+    """
+    async with collections.using(job.payload.get("collection", DEFAULT_COLLECTION)) as collection:
+        return await _reindex_collection(job, collection)
+
+async def _reindex_collection(job: IngestionJob, collection: Collection) -> Dict[str, Any]:
+    """重建单个集合的索引"""
+    chunk_size = job.payload["chunk_size"]
+    overlap = job.payload["overlap"]
+    started_at = datetime.now()
+    old_store = collection.vector_store
+    new_store = VectorStore(dimension=old_store.dimension)
+
+    document_ids = [
+        doc_info.id for doc_info in catalog.in_collection(collection.name)
+        if doc_info.status == DocumentStatus.COMPLETED
+    ]
+    totals = {"documents": 0, "chunks": 0, "reused_chunks": 0, "embedded_chunks": 0}
+    batch_size = 50
+    for start in range(0, len(document_ids), batch_size):
+        batch_totals = await _rebuild_documents(
+            new_store, old_store, document_ids[start:start + batch_size], chunk_size, overlap
+        )
+        for key, value in batch_totals.items():
+            totals[key] += value
+        done = min(start + batch_size, len(document_ids))
+        await job_queue.update_progress(
+            job.id, int(90 * done / max(len(document_ids), 1)), f"已重建 {done}/{len(document_ids)} 个文档"
+        )
+
+    async with collection.write_lock:
+        current_store = collection.vector_store
+        # 补齐构建期间新处理的文档，移除构建期间删除的文档
+        changed_ids = [
+            doc_info.id for doc_info in catalog.in_collection(collection.name)
+            if doc_info.status == DocumentStatus.COMPLETED
+            and (doc_info.id not in new_store.document_chunks
+                 or (doc_info.process_time and doc_info.process_time >= started_at))
+        ]
+        catch_up = await _rebuild_documents(new_store, current_store, changed_ids, chunk_size, overlap)
+        for doc_id in list(new_store.document_chunks.keys()):
+            if doc_id not in catalog.documents:
+                await new_store.delete_document(doc_id)
+
+        # 后续摄取使用新的分块参数（保存在集合配置中）
+        await collections.update_config(collection.name, chunk_size=chunk_size, overlap=overlap)
+        collection.retriever.swap_vector_store(new_store)
+
+    # 立即写出新一代索引的快照，避免重启后索引与集合配置不一致
+    collection.mark_dirty()
+    await collection.save_snapshot()
+
+    generation = collection.retriever.generation
+    print(f"🔁 集合 {collection.name} 的索引已切换到第 {generation} 代（chunk_size={chunk_size}, overlap={overlap}）")
+    return {
+        "collection": collection.name,
+        "generation": generation,
+        "chunk_size": chunk_size,
+        "overlap": overlap,
+        "documents": totals["documents"] + catch_up["documents"],
+        "chunks": totals["chunks"] + catch_up["chunks"],
+        "reused_chunks": totals["reused_chunks"] + catch_up["reused_chunks"],
+        "embedded_chunks": totals["embedded_chunks"] + catch_up["embedded_chunks"],
+        "caught_up_documents": catch_up["documents"]
+    }
+
+# 任务类型 -> 处理函数
+job_handlers = {
+    "process_document": process_document_job,
+    "ingest_archive": ingest_archive_job,
+    "reindex": reindex_job,
+}
+
+async def _relay_remote_status(interval: float = 2.0):
+    """
+    将其他进程（独立worker）处理的文档状态转发给本进程的订阅者。
+    每个进程只有一个批量查询循环，且仅在有订阅者时查询。
+    """
+    while True:
+        await asyncio.sleep(interval)
+        if status_broadcaster.subscriber_count == 0:
+            continue
+
+        local_documents = worker_pool.running_document_ids() if worker_pool else set()
+        document_ids = list(status_broadcaster.in_flight_documents() - local_documents)
+        if not document_ids:
+            continue
+
+        try:
+            jobs = await job_queue.get_latest_for_documents(document_ids)
+        except Exception as e:
+            print(f"⚠️ 查询远程处理状态失败: {e}")
+            continue
+
+        for document_id, job in jobs.items():
+            status = _status_from_job(job)
+            if status.status in TERMINAL_STATUSES:
+                # 独立worker已将结果写入目录并发布了向量，刷新本进程的缓存并合并向量
+                doc_info = await catalog.fetch(document_id)
+                collection = collections.find(doc_info.collection) if doc_info else None
+                if collection and collection.loaded:
+                    await _apply_published_vectors(collection)
+            status_broadcaster.publish(status)
+
+async def _apply_published_vectors(collection: Collection) -> int:
+    """
+    按发布顺序合并独立worker / 命令行批量导入发布的增量向量，返回合并的文档数。
+
+    内容未变化的块直接使用增量文件中的嵌入，不会重新生成；发布之后已被删除的文档跳过。
+    增量文件在集合下一次写出快照后删除。
+    """
+    merged = 0
+    async with collection.merge_lock:
+        for path in collection.pending_deltas():
+            delta = VectorStore(dimension=collection.config.dimension)
+            try:
+                extra = await delta.load_snapshot(path)
+            except Exception as e:
+                print(f"⚠️ 读取集合 {collection.name} 的增量向量 {path} 失败: {e}")
+                continue
+
+            documents = {}
+            for document_id in extra.get("documents", []):
+                doc_info = catalog.get(document_id) or await catalog.fetch(document_id)
+                documents[document_id] = doc_info if doc_info and doc_info.collection == collection.name else None
+
+            async with collection.write_lock:
+                store = collection.vector_store
+                for document_id, doc_info in documents.items():
+                    chunks = delta.get_document_chunk_list(document_id) if doc_info else []
+                    if chunks:
+                        await store.upsert_document_chunks(document_id, chunks, embedding_source=delta)
+                    else:
+                        await store.delete_document(document_id)
+                    merged += 1
+            collection.applied_deltas.append(path)
+            collection.mark_dirty()
+    return merged
+
+async def _reconcile_collection(collection: Collection):
+    """
+    集合索引加载后与目录核对。
+    
+    先合并其他进程发布的增量向量；快照之后删除的文档从索引中移除；目录中已完成但快照中缺失的文档
+    （快照写出前进程退出）重新提交处理，使目录与索引保持一致。
+    """
+    merged = await _apply_published_vectors(collection)
+    if merged:
+        print(f"📥 集合 {collection.name} 合并了 {merged} 个文档的增量向量")
+    store = collection.vector_store
+    documents = catalog.in_collection(collection.name)
+    document_ids = {doc_info.id for doc_info in documents}
+    for document_id in list(store.document_chunks.keys()):
+        if document_id not in document_ids:
+            await store.delete_document(document_id)
+            collection.mark_dirty()
+
+    missing = [
+        doc_info for doc_info in documents
+        if doc_info.status == DocumentStatus.COMPLETED and doc_info.chunk_count
+        and not store.document_chunks.get(doc_info.id)
+    ]
+    for doc_info in missing:
+        await _enqueue_processing(doc_info)
+    if missing:
+        print(f"📚 集合 {collection.name} 中 {len(missing)} 个文档缺少向量，已重新提交处理")
+
+async def _merge_published_loop(interval: float):
+    """按间隔合并独立worker发布到已加载集合的增量向量"""
+    while True:
+        await asyncio.sleep(interval)
+        for collection in collections.loaded():
+            try:
+                await _apply_published_vectors(collection)
+            except Exception as e:
+                print(f"⚠️ 合并集合 {collection.name} 的增量向量失败: {e}")
+
+async def _maintenance_loop(interval: float):
+    """按间隔写出有变化的集合快照，并卸载空闲集合"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await collections.save_snapshots()
+            await collections.evict_idle()
+        except Exception as e:
+            print(f"⚠️ 集合维护失败: {e}")
+
+async def warm_start():
+    """预热加载文档目录和集合注册信息（集合索引在首次使用时加载）"""
+    global warm_started
+    if warm_started:
+        return
+    warm_started = True
+    started = datetime.now()
+    count = await catalog.load()
+    await collections.init()
+
+    elapsed = (datetime.now() - started).total_seconds()
+    print(f"📚 已加载文档目录 {count} 个文档、{len(collections.all())} 个集合（{elapsed:.2f}s）")
+
+async def start_ingestion():
+    """预热加载目录和默认集合，启动进程内的摄取工作池"""
+    global worker_pool, remote_status_task, maintenance_task, merge_task
+    await warm_start()
+    # 只有API进程写出快照，由它负责加载集合时与目录核对
+    collections.on_load = _reconcile_collection
+    await collections.get(DEFAULT_COLLECTION)
+    if maintenance_task is None:
+        maintenance_task = asyncio.create_task(_maintenance_loop(RAG_CONFIG["snapshot_interval"]))
+    if merge_task is None:
+        merge_task = asyncio.create_task(_merge_published_loop(RAG_CONFIG["merge_interval"]))
+    if RAG_CONFIG["inprocess_workers"] > 0 and worker_pool is None:
+        worker_pool = IngestionWorkerPool(job_queue, job_handlers, concurrency=RAG_CONFIG["inprocess_workers"])
+        await worker_pool.start()
+    if remote_status_task is None:
+        remote_status_task = asyncio.create_task(_relay_remote_status())
+
+async def stop_ingestion():
+    """停止进程内的摄取工作池，写出最终快照"""
+    global worker_pool, remote_status_task, maintenance_task, merge_task
+    if remote_status_task:
+        remote_status_task.cancel()
+        remote_status_task = None
+    if worker_pool:
+        await worker_pool.stop()
+        worker_pool = None
+    if maintenance_task:
+        maintenance_task.cancel()
+        maintenance_task = None
+    if merge_task:
+        merge_task.cancel()
+        merge_task = None
+    await collections.save_snapshots()
+    await catalog.close()
+
+def _status_from_job(job: IngestionJob) -> ProcessingStatus:
+    """根据任务记录推导处理状态（文档由其他进程处理时使用）"""
+    status_map = {
+        JobStatus.QUEUED: DocumentStatus.UPLOADING,
+        JobStatus.RUNNING: DocumentStatus.PROCESSING,
+        JobStatus.COMPLETED: DocumentStatus.COMPLETED,
+        JobStatus.FAILED: DocumentStatus.FAILED,
+        JobStatus.CANCELLED: DocumentStatus.CANCELLED,
+    }
+    return ProcessingStatus(
+        document_id=job.document_id,
+        status=status_map[job.status],
+        progress=job.progress,
+        message=job.last_error if job.status == JobStatus.FAILED and job.last_error else job.message,
+        chunk_count=(job.result or {}).get("chunk_count"),
+        reused_chunks=(job.result or {}).get("reused_chunks"),
+        embedded_chunks=(job.result or {}).get("embedded_chunks")
+    )
+
+@router.post("/ingest/archive")
+async def ingest_archive(file: UploadFile = File(...), priority: int = 0,
+                         collection: str = DEFAULT_COLLECTION):
+    """上传 zip/tar 归档并批量导入其中的文档到指定集合"""
+    if await collections.lookup(collection) is None:
+        raise HTTPException(status_code=404, detail=f"集合不存在: {collection}")
+    incoming_dir = os.path.join(document_processor.upload_dir, "_incoming")
+    os.makedirs(incoming_dir, exist_ok=True)
+    archive_path = os.path.join(incoming_dir, f"{uuid.uuid4()}.archive")
+
+    try:
+        # 分块写入临时文件，避免将整个归档读入内存
+        with open(archive_path, 'wb') as f:
+            await asyncio.to_thread(shutil.copyfileobj, file.file, f, 1024 * 1024)
+
+        if not is_archive(archive_path):
+            raise HTTPException(status_code=400, detail="仅支持 zip / tar 归档文件")
+
+        job = await job_queue.enqueue(
+            "ingest_archive",
+            {"archive_path": archive_path, "filename": file.filename, "collection": collection},
+            priority=priority
+        )
+        if worker_pool:
+            worker_pool.notify()
+
+        return {
+            "success": True,
+            "job_id": job.id,
+            "message": "归档上传成功，正在批量导入，可通过 /rag/jobs/{job_id} 查看汇总报告"
+        }
+
+    except HTTPException:
+        if os.path.exists(archive_path):
+            os.remove(archive_path)
+        raise
+    except Exception as e:
+        if os.path.exists(archive_path):
+            os.remove(archive_path)
+        raise HTTPException(status_code=500, detail=f"归档上传失败: {str(e)}")
+
+@router.post("/reindex")
+async def reindex(chunk_size: int, overlap: int = 200, collection: str = DEFAULT_COLLECTION):
+    """按新的分块参数重建集合索引（后台构建，完成后原子切换）"""
+    if chunk_size <= 0 or overlap < 0 or overlap >= chunk_size:
+        raise HTTPException(status_code=400, detail="分块参数无效：要求 chunk_size > overlap >= 0")
+    if await collections.lookup(collection) is None:
+        raise HTTPException(status_code=404, detail=f"集合不存在: {collection}")
+    if worker_pool is None:
+        raise HTTPException(status_code=409, detail="重建索引需要启用API进程内的摄取worker")
+
+    if any(job.payload.get("collection", DEFAULT_COLLECTION) == collection
+           for job in await job_queue.list_active("reindex")):
+        raise HTTPException(status_code=409, detail=f"集合 {collection} 已有重建索引任务在进行中")
+
+    job = await job_queue.enqueue(
+        "reindex", {"chunk_size": chunk_size, "overlap": overlap, "collection": collection}, priority=10
+    )
+    worker_pool.notify()
+    return {
+        "success": True,
+        "job_id": job.id,
+        "message": "重建索引任务已提交，完成前查询继续使用当前索引"
+    }
 
 @router.get("/status/{document_id}", response_model=ProcessingStatus)
 async def get_processing_status(document_id: str):
     """获取文档处理状态"""
-    if document_id not in processing_status:
+    status = await catalog.fetch_status(document_id)
+    if status and status.status in TERMINAL_STATUSES:
+        return status
+
+    # 任务可能由独立worker进程处理，以任务队列中的记录为准
+    job = await job_queue.get_latest_for_document(document_id)
+    if job:
+        return _status_from_job(job)
+
+    if status is None:
         raise HTTPException(status_code=404, detail="文档不存在")
     
-    return processing_status[document_id]
+    return status
+
+@router.get("/events")
+async def status_events(client_id: Optional[str] = None, document_ids: Optional[str] = None):
+    """
+    以Server-Sent Events推送文档处理状态变化。
+    
+    一个客户端只需一个连接：指定client_id时覆盖该客户端上传的所有文档，
+    也可以通过逗号分隔的document_ids订阅指定文档；都不指定时接收全部事件。
+    """
+    ids = [doc_id for doc_id in document_ids.split(",") if doc_id] if document_ids else None
+    subscription = status_broadcaster.subscribe(client_id, ids)
+
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            
+            # 连接（或重连）时先发送当前状态快照
+            snapshot_ids = set(ids or [])
+            if client_id:
+                snapshot_ids.update(status_broadcaster.tracked_documents(client_id))
+            for doc_id in snapshot_ids:
+                status = catalog.get_status(doc_id)
+                if status:
+                    yield format_sse(status)
+            
+            while True:
+                try:
+                    status = await asyncio.wait_for(subscription.queue.get(), timeout=15)
+                    yield format_sse(status)
+                except asyncio.TimeoutError:
+                    # 保活注释，防止代理断开空闲连接
+                    yield ": keepalive\n\n"
+        finally:
+            status_broadcaster.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        }
+    )
+
+@router.get("/jobs")
+async def list_jobs(status: Optional[str] = None, limit: int = 100):
+    """获取摄取任务列表"""
+    try:
+        job_status = JobStatus(status) if status else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"未知的任务状态: {status}")
+
+    jobs = await job_queue.list_jobs(job_status, limit)
+    return {
+        "jobs": [job.model_dump(mode="json") for job in jobs],
+        "stats": await job_queue.get_stats()
+    }
+
+@router.get("/jobs/{job_id}", response_model=IngestionJob)
+async def get_job(job_id: str):
+    """获取摄取任务详情"""
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+@router.post("/jobs/{job_id}/cancel", response_model=IngestionJob)
+async def cancel_job(job_id: str):
+    """取消摄取任务"""
+    if worker_pool:
+        job = await worker_pool.cancel_job(job_id)
+    else:
+        job = await job_queue.cancel(job_id)
+
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    if job.status == JobStatus.CANCELLED and await catalog.fetch(job.document_id) is not None:
+        await _set_status(job.document_id, DocumentStatus.CANCELLED, 0, "处理已取消")
+    return job
 
 @router.post("/query", response_model=QueryResponse)
 async def query_documents(request: QueryRequest):
-    """查询文档"""
+    """查询指定集合中的文档（未请求的可选字段不出现在响应中）"""
+    if await collections.lookup(request.collection) is None:
+        raise HTTPException(status_code=404, detail=f"集合不存在: {request.collection}")
     try:
-        response = await rag_retriever.query(request)
-        return response
+        async with collections.using(request.collection) as collection:
+            response = await collection.retriever.query(request)
+        # 直接返回响应对象，跳过 FastAPI 对 response_model 的再次校验和编码
+        return FastJSONResponse(response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
 
+# 列表接口可选择返回的字段
+DOCUMENT_FIELDS = ("id", "filename", "collection", "file_size", "file_type", "status", "upload_time",
+                   "process_time", "chunk_count", "version", "progress", "message", "error_message")
+DEFAULT_DOCUMENT_FIELDS = ("id", "filename", "file_size", "file_type", "status", "upload_time",
+                           "chunk_count", "progress", "error_message")
+CHUNK_FIELDS = ("chunk_id", "chunk_index", "content", "metadata")
+
+def _parse_fields(fields: Optional[str], allowed: tuple, default: tuple) -> tuple:
+    """解析逗号分隔的字段列表"""
+    if not fields:
+        return default
+    selected = tuple(field.strip() for field in fields.split(",") if field.strip())
+    unknown = [field for field in selected if field not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"未知字段: {', '.join(unknown)}，可选: {', '.join(allowed)}")
+    return selected
+
+def _document_fields(doc_info: DocumentInfo, status_info: Optional[ProcessingStatus], fields: tuple) -> Dict[str, Any]:
+    """按字段选择组装文档摘要"""
+    values = {
+        "id": lambda: doc_info.id,
+        "filename": lambda: doc_info.original_name,
+        "collection": lambda: doc_info.collection,
+        "file_size": lambda: doc_info.file_size,
+        "file_type": lambda: doc_info.file_type.value,
+        "status": lambda: doc_info.status.value,
+        "upload_time": lambda: doc_info.upload_time.isoformat(),
+        "process_time": lambda: doc_info.process_time.isoformat() if doc_info.process_time else None,
+        "chunk_count": lambda: doc_info.chunk_count,
+        "version": lambda: doc_info.version,
+        "progress": lambda: status_info.progress if status_info else 0,
+        "message": lambda: status_info.message if status_info else "",
+        "error_message": lambda: doc_info.error_message,
+    }
+    return {field: values[field]() for field in fields}
+
 @router.get("/documents")
-async def list_documents():
-    """获取所有文档列表"""
-    documents = []
-    for doc_info in documents_db.values():
-        status_info = processing_status.get(doc_info.id)
-        documents.append({
-            "id": doc_info.id,
-            "filename": doc_info.original_name,
-            "file_size": doc_info.file_size,
-            "file_type": doc_info.file_type.value,
-            "status": doc_info.status.value,
-            "upload_time": doc_info.upload_time.isoformat(),
-            "chunk_count": doc_info.chunk_count,
-            "progress": status_info.progress if status_info else 0,
-            "error_message": doc_info.error_message
-        })
+async def list_documents(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    collection: Optional[str] = None,
+    status: Optional[str] = None,
+    file_type: Optional[str] = None,
+    sort: str = "upload_time",
+    order: str = "desc",
+    fields: Optional[str] = None
+):
+    """
+    分页获取文档列表（键集分页）。
     
-    return {"documents": documents}
+    - cursor: 上一页返回的 next_cursor
+    - collection: 只列出指定集合的文档
+    - status / file_type: 按处理状态、文件类型过滤
+    - sort / order: 排序列（upload_time、original_name、file_size）和方向（asc/desc）
+    - fields: 逗号分隔的返回字段
+    """
+    try:
+        status_filter = DocumentStatus(status) if status else None
+        type_filter = DocumentType(file_type) if file_type else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order 只能为 asc 或 desc")
+    selected = _parse_fields(fields, DOCUMENT_FIELDS, DEFAULT_DOCUMENT_FIELDS)
+
+    try:
+        entries, next_cursor = await catalog.list_page(
+            collection=collection, status=status_filter, file_type=type_filter, sort=sort,
+            descending=order == "desc", cursor=cursor, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "documents": [_document_fields(doc_info, status_info, selected) for doc_info, status_info in entries],
+        "next_cursor": next_cursor,
+        "has_more": next_cursor is not None
+    }
 
 @router.get("/documents/{document_id}")
 async def get_document_info(document_id: str):
     """获取文档详细信息"""
-    if document_id not in documents_db:
+    doc_info = await catalog.fetch(document_id)
+    if doc_info is None:
         raise HTTPException(status_code=404, detail="文档不存在")
     
-    doc_info = documents_db[document_id]
-    status_info = processing_status.get(document_id)
+    status_info = catalog.get_status(document_id)
     
-    # 获取文档块信息
-    chunks = await rag_retriever.get_document_chunks(document_id)
+    # 只取前5个块作为预览
+    async with collections.using(doc_info.collection) as collection:
+        chunks = await collection.retriever.get_document_chunks(document_id, limit=5)
     
     return {
         "document": {
             "id": doc_info.id,
             "filename": doc_info.original_name,
+            "collection": doc_info.collection,
             "file_size": doc_info.file_size,
             "file_type": doc_info.file_type.value,
             "status": doc_info.status.value,
@@ -176,42 +896,168 @@ async def get_document_info(document_id: str):
             "progress": status_info.progress if status_info else 0,
             "message": status_info.message if status_info else ""
         },
-        "chunks": chunks[:5]  # 只返回前5个块作为预览
+        "chunks": chunks
+    }
+
+@router.get("/documents/{document_id}/chunks")
+async def list_document_chunks(
+    document_id: str,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[int] = None,
+    fields: Optional[str] = None
+):
+    """
+    按块索引顺序分页获取文档的块。
+    
+    - cursor: 上一页返回的 next_cursor（最后一个块的索引）
+    - fields: 逗号分隔的返回字段（chunk_id、chunk_index、content、metadata）
+    """
+    doc_info = catalog.get(document_id) or await catalog.fetch(document_id)
+    if doc_info is None:
+        raise HTTPException(status_code=404, detail="文档不存在")
+    selected = _parse_fields(fields, CHUNK_FIELDS, CHUNK_FIELDS)
+
+    async with collections.using(doc_info.collection) as collection:
+        chunks = await collection.retriever.get_document_chunks(document_id, after_index=cursor, limit=limit + 1)
+    has_more = len(chunks) > limit
+    chunks = chunks[:limit]
+
+    return {
+        "document_id": document_id,
+        "chunks": [{field: chunk[field] for field in selected} for chunk in chunks],
+        "next_cursor": chunks[-1]["chunk_index"] if has_more else None,
+        "has_more": has_more
     }
 
 @router.delete("/documents/{document_id}")
 async def delete_document(document_id: str):
     """删除文档"""
-    if document_id not in documents_db:
+    doc_info = await catalog.fetch(document_id)
+    if doc_info is None:
         raise HTTPException(status_code=404, detail="文档不存在")
     
     try:
-        doc_info = documents_db[document_id]
-        
-        # 删除文件
-        await document_processor.delete_document(doc_info)
-        
-        # 删除向量数据
-        await rag_retriever.delete_document(document_id)
-        
-        # 删除记录
-        documents_db.pop(document_id, None)
-        processing_status.pop(document_id, None)
-        
+        await _delete_document(doc_info)
         return {"message": "文档删除成功"}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"删除失败: {str(e)}")
 
+async def _delete_document(doc_info: DocumentInfo):
+    """删除文档的摄取任务、向量、目录记录和文件"""
+    document_id = doc_info.id
+    
+    # 取消尚未完成的摄取任务
+    job = await job_queue.get_latest_for_document(document_id)
+    if job and job.status in (JobStatus.QUEUED, JobStatus.RUNNING):
+        if worker_pool:
+            await worker_pool.cancel_job(job.id)
+        else:
+            await job_queue.cancel(job.id)
+    
+    # 删除向量数据（集合未加载时跳过，下次加载时与目录核对会移除）
+    collection = collections.find(doc_info.collection)
+    if collection and collection.loaded:
+        async with collection.write_lock:
+            await collection.vector_store.delete_document(document_id)
+        collection.mark_dirty()
+    
+    # 删除记录（同时清理内容摘要和文件名索引）
+    await catalog.remove(document_id)
+    
+    await _release_content(doc_info)
+
+async def _release_content(doc_info: DocumentInfo):
+    """删除不再被任何文档引用的文件和提取文本缓存（按内容寻址，其他集合中内容相同的文档共用同一个文件）"""
+    if not doc_info.content_hash or not await catalog.is_content_referenced(doc_info.content_hash):
+        await document_processor.delete_document(doc_info)
+
 @router.get("/stats")
-async def get_rag_stats():
-    """获取RAG系统统计信息"""
+async def get_rag_stats(collection: Optional[str] = None):
+    """获取RAG系统统计信息；指定集合时只返回该集合的统计"""
     try:
-        stats = await rag_retriever.get_stats()
-        return stats
+        if collection:
+            target = await collections.lookup(collection)
+            if target is None:
+                raise HTTPException(status_code=404, detail=f"集合不存在: {collection}")
+            return await target.get_stats()
+
+        per_collection = [await target.get_stats() for target in collections.all()]
+        documents_by_status: Dict[str, int] = {}
+        for stats in per_collection:
+            for status, count in stats.get("documents_by_status", {}).items():
+                documents_by_status[status] = documents_by_status.get(status, 0) + count
+        return {
+            "total_collections": len(per_collection),
+            "loaded_collections": len(collections.loaded()),
+            "total_documents": sum(stats.get("total_documents", 0) for stats in per_collection),
+            "documents_by_status": documents_by_status,
+            "total_bytes": sum(stats.get("total_bytes", 0) for stats in per_collection),
+            "total_chunks": sum(stats.get("total_chunks", 0) for stats in per_collection),
+            "index_memory_bytes": sum(
+                stats.get("index_memory_bytes", 0) for stats in per_collection if stats["loaded"]
+            ),
+            "collections": per_collection
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取统计信息失败: {str(e)}")
 
+def _collection_summary(collection: Collection) -> Dict[str, Any]:
+    """集合摘要"""
+    return {
+        "name": collection.name,
+        "config": collection.config.model_dump(),
+        "created_at": collection.info.created_at.isoformat(),
+        "loaded": collection.loaded,
+        "total_documents": catalog.counters_for(collection.name).total_documents
+    }
+
+@router.get("/collections")
+async def list_collections():
+    """获取集合列表"""
+    return {"collections": [_collection_summary(collection) for collection in collections.all()]}
+
+@router.post("/collections")
+async def create_collection(request: CollectionCreateRequest):
+    """创建集合（可指定向量维度、分块参数和索引类型）"""
+    if await collections.lookup(request.name) is not None:
+        raise HTTPException(status_code=409, detail=f"集合已存在: {request.name}")
+    try:
+        collection = await collections.create(request.name, request.config)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _collection_summary(collection)
+
+@router.get("/collections/{name}")
+async def get_collection(name: str):
+    """获取集合详情和统计（不会触发加载）"""
+    collection = await collections.lookup(name)
+    if collection is None:
+        raise HTTPException(status_code=404, detail=f"集合不存在: {name}")
+    return await collection.get_stats()
+
+@router.delete("/collections/{name}")
+async def delete_collection(name: str):
+    """删除集合及其中的全部文档"""
+    if name == DEFAULT_COLLECTION:
+        raise HTTPException(status_code=400, detail="默认集合不能删除")
+    collection = await collections.lookup(name)
+    if collection is None:
+        raise HTTPException(status_code=404, detail=f"集合不存在: {name}")
+    if collection.busy:
+        raise HTTPException(status_code=409, detail=f"集合 {name} 正在使用中，请稍后再试")
+
+    try:
+        documents = catalog.in_collection(name)
+        for doc_info in documents:
+            await _delete_document(doc_info)
+        await collections.drop(name)
+        return {"message": f"集合已删除（{len(documents)} 个文档）"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"删除集合失败: {str(e)}")
+
 @router.post("/test-query")
 async def test_query(query: str = "测试查询"):
     """测试查询功能"""
@@ -0,0 +1,318 @@
+"""
+批量文档导入
+
+从目录或 zip/tar 归档中流式读取文件，以有限并发提取文本和分块，
+并跨文件批量生成嵌入、批量写入向量存储，最后生成汇总报告。
+
+命令行用法:
+    python -m rag.bulk <目录或归档文件> [--concurrency 8] [--batch-size 256] [--report report.json] [--collection default]
+"""
+
+import argparse
+import asyncio
+import os
+import tarfile
+import time
+import uuid
+import zipfile
+from typing import Awaitable, Callable, Iterator, List, Optional, Tuple
+
+from .document import DocumentProcessor
+from .models import BulkFileResult, BulkIngestReport, DocumentInfo, DocumentChunk, DocumentType, DocumentStatus
+
+Entry = Tuple[str, Optional[bytes], int]  # (文件名, 文件内容（超过大小上限时为 None，不读取）, 文件大小)
+
+SUPPORTED_EXTENSIONS = {f".{file_type.value}" for file_type in DocumentType}
+
+def is_archive(path: str) -> bool:
+    """判断路径是否为支持的归档文件"""
+    return zipfile.is_zipfile(path) or tarfile.is_tarfile(path)
+
+def _oversized(size: int, max_file_size: Optional[int]) -> bool:
+    return max_file_size is not None and size > max_file_size
+
+def iter_directory_entries(root: str, max_file_size: Optional[int] = None) -> Iterator[Entry]:
+    """遍历目录中的文件，超过大小上限的文件不读取"""
+    for dirpath, _, filenames in os.walk(root):
+        for filename in sorted(filenames):
+            file_path = os.path.join(dirpath, filename)
+            name = os.path.relpath(file_path, root)
+            size = os.path.getsize(file_path)
+            if _oversized(size, max_file_size):
+                yield name, None, size
+                continue
+            with open(file_path, 'rb') as f:
+                content = f.read()
+            yield name, content, len(content)
+
+def iter_archive_entries(path: str, max_file_size: Optional[int] = None) -> Iterator[Entry]:
+    """流式读取归档中的文件，不整体解压；按条目头中的大小跳过超过上限的文件，不解压其内容"""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                if _oversized(info.file_size, max_file_size):
+                    yield info.filename, None, info.file_size
+                    continue
+                content = archive.read(info)
+                yield info.filename, content, len(content)
+    else:
+        # 'r|*' 为流式模式，支持任意压缩格式的tar且只顺序读取一遍（跳过的条目不会被读入内存）
+        with tarfile.open(path, 'r|*') as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                if _oversized(member.size, max_file_size):
+                    yield member.name, None, member.size
+                    continue
+                f = archive.extractfile(member)
+                if f is not None:
+                    content = f.read()
+                    yield member.name, content, len(content)
+
+def iter_entries(path: str, max_file_size: Optional[int] = None) -> Iterator[Entry]:
+    """根据路径类型选择遍历方式"""
+    if os.path.isdir(path):
+        return iter_directory_entries(path, max_file_size)
+    return iter_archive_entries(path, max_file_size)
+
+class BulkIngestor:
+    """批量导入器"""
+
+    def __init__(self,
+                 document_processor: DocumentProcessor,
+                 write_chunks: Callable[[List[DocumentChunk]], Awaitable[None]],
+                 register_document: Callable[[DocumentInfo], Awaitable[None]],
+                 find_duplicate: Callable[[str], Optional[str]],
+                 is_content_referenced: Callable[[str], Awaitable[bool]],
+                 concurrency: int = 8,
+                 batch_size: int = 256,
+                 max_file_size: int = 10 * 1024 * 1024,
+                 chunk_size: Optional[int] = None,
+                 overlap: Optional[int] = None,
+                 on_progress: Optional[Callable[[BulkIngestReport], Awaitable[None]]] = None):
+        """
+        Args:
+            document_processor: 文档处理器
+            write_chunks: 批量生成嵌入并写入当前索引的回调
+            register_document: 文档处理完成后登记文档信息的回调
+            find_duplicate: 根据内容摘要查找已存在文档ID的回调
+            is_content_referenced: 内容摘要是否仍被已登记的文档引用（决定失败时能否删除保存的文件）
+            concurrency: 同时提取/分块的文件数
+            batch_size: 累计多少个块后批量生成嵌入并写入索引
+            max_file_size: 单个文件大小上限
+            chunk_size / overlap: 分块参数（为空时使用文档处理器的默认值）
+            on_progress: 每批写入后等待执行的进度回调（在写入锁内调用，按批次顺序执行）
+        """
+        self.document_processor = document_processor
+        self.write_chunks = write_chunks
+        self.register_document = register_document
+        self.find_duplicate = find_duplicate
+        self.is_content_referenced = is_content_referenced
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_file_size = max_file_size
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.on_progress = on_progress
+
+        self._pending: List[Tuple[DocumentInfo, BulkFileResult, List[DocumentChunk]]] = []
+        self._pending_chunks = 0
+        self._flush_lock = asyncio.Lock()
+        self._seen_hashes = {}  # 本次导入中已出现的内容摘要 -> document_id
+        self._report: Optional[BulkIngestReport] = None
+
+    async def ingest(self, entries: Iterator[Entry], source: str = "") -> BulkIngestReport:
+        """导入所有条目并返回汇总报告"""
+        report = BulkIngestReport(source=source)
+        self._report = report
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        start_time = time.time()
+
+        try:
+            while True:
+                # 先获取并发名额再读取下一个条目，限制内存中同时存在的文件数
+                await semaphore.acquire()
+                entry = await asyncio.to_thread(next, entries, None)
+                if entry is None:
+                    semaphore.release()
+                    break
+
+                result = BulkFileResult(name=entry[0], status="pending", file_size=entry[2])
+                report.files.append(result)
+                task = asyncio.create_task(self._process_entry(entry, result, semaphore))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            if tasks:
+                await asyncio.gather(*tasks)
+            await self._flush()
+
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        self._summarize(report, time.time() - start_time)
+        return report
+
+    async def _process_entry(self, entry: Entry, result: BulkFileResult, semaphore: asyncio.Semaphore):
+        """处理单个文件：去重、保存、提取文本并分块"""
+        name, content, size = entry
+        content_hash = document_id = doc_info = None
+        try:
+            file_ext = '.' + name.lower().rsplit('.', 1)[-1] if '.' in name else ''
+            if file_ext not in SUPPORTED_EXTENSIONS:
+                result.status = "skipped"
+                result.error = f"不支持的文件类型: {file_ext or name}"
+                return
+            if content is None or size > self.max_file_size:
+                result.status = "skipped"
+                result.error = "文件大小超过限制"
+                return
+
+            content_hash = self.document_processor.compute_content_hash(content)
+            existing_id = self.find_duplicate(content_hash) or self._seen_hashes.get(content_hash)
+            if existing_id:
+                result.status = "duplicate"
+                result.document_id = existing_id
+                return
+
+            # 在让出事件循环之前登记摘要，避免并发处理相同内容
+            document_id = str(uuid.uuid4())
+            self._seen_hashes[content_hash] = document_id
+            result.document_id = document_id
+
+            doc_info = await self.document_processor.save_uploaded_file(
+                content, os.path.basename(name), document_id=document_id, content_hash=content_hash
+            )
+            doc_info.metadata["source_path"] = name
+
+            chunks = await self.document_processor.process_document(doc_info, self.chunk_size, self.overlap)
+            result.chunk_count = len(chunks)
+            self._pending.append((doc_info, result, chunks))
+            self._pending_chunks += len(chunks)
+
+        except Exception as e:
+            result.status = "failed"
+            result.error = str(e)
+            if document_id:
+                await self._discard(content_hash, document_id, doc_info)
+            return
+
+        finally:
+            semaphore.release()
+
+        if self._pending_chunks >= self.batch_size:
+            await self._flush()
+
+    async def _flush(self):
+        """跨文件批量生成嵌入并写入向量存储"""
+        async with self._flush_lock:
+            batch, self._pending, self._pending_chunks = self._pending, [], 0
+            if not batch:
+                return
+
+            try:
+                await self.write_chunks([chunk for _, _, chunks in batch for chunk in chunks])
+            except Exception as e:
+                for doc_info, result, _ in batch:
+                    doc_info.status = DocumentStatus.FAILED
+                    doc_info.error_message = str(e)
+                    result.status = "failed"
+                    result.error = str(e)
+                    await self._discard(doc_info.content_hash, doc_info.id, doc_info)
+                return
+
+            for doc_info, result, _ in batch:
+                result.status = "completed"
+                await self.register_document(doc_info)
+
+            if self.on_progress and self._report is not None:
+                await self.on_progress(self._report)
+
+    async def _discard(self, content_hash: str, document_id: str, doc_info: Optional[DocumentInfo]):
+        """处理失败的文件：释放登记的内容摘要（之后相同内容的文件可以重新导入），删除不再被引用的已保存文件"""
+        if self._seen_hashes.get(content_hash) == document_id:
+            del self._seen_hashes[content_hash]
+        if doc_info is None:
+            return
+        if await self.is_content_referenced(content_hash):
+            return
+        # 等待期间相同内容的文件可能已重新登记并保存到同一个文件
+        if content_hash not in self._seen_hashes:
+            await self.document_processor.delete_document(doc_info)
+
+    def _summarize(self, report: BulkIngestReport, elapsed: float):
+        """汇总统计"""
+        report.total_files = len(report.files)
+        report.completed = sum(1 for f in report.files if f.status == "completed")
+        report.duplicates = sum(1 for f in report.files if f.status == "duplicate")
+        report.skipped = sum(1 for f in report.files if f.status == "skipped")
+        report.failed = sum(1 for f in report.files if f.status == "failed")
+        report.total_bytes = sum(f.file_size for f in report.files if f.status == "completed")
+        report.total_chunks = sum(f.chunk_count for f in report.files if f.status == "completed")
+        report.elapsed_seconds = round(elapsed, 3)
+        if elapsed > 0:
+            report.files_per_second = round(report.completed / elapsed, 2)
+            report.megabytes_per_second = round(report.total_bytes / 1024 / 1024 / elapsed, 3)
+            report.chunks_per_second = round(report.total_chunks / elapsed, 2)
+
+async def run_bulk_ingest(path: str, concurrency: int, batch_size: int, report_path: Optional[str],
+                          collection_name: str):
+    """命令行批量导入"""
+    # 延迟导入，复用API模块中的全局实例和登记逻辑
+    from .api import create_bulk_ingestor, warm_start, catalog, collections
+    from .catalog import close_shared_pool
+
+    # 快照只由API进程写出（它持有的索引可能比本进程读到的新）；导入的向量发布为增量文件，
+    # 由API进程合并，API进程没有运行时在下一次加载集合时合并
+    if not collections.snapshot_dir:
+        raise SystemExit("❌ 命令行批量导入需要配置 RAG_COLLECTIONS_DIR（与API进程共享），用于发布导入的向量")
+    collections.write_snapshots = False
+    collections.publish_deltas = True
+
+    # 先加载已有目录和集合快照，导入结果与API进程共享同一份目录
+    await warm_start()
+    if await collections.lookup(collection_name) is None:
+        await collections.create(collection_name)
+    async with collections.using(collection_name) as collection:
+        ingestor = create_bulk_ingestor(collection, concurrency=concurrency, batch_size=batch_size)
+        report = await ingestor.ingest(iter_entries(path, ingestor.max_file_size), source=path)
+    await catalog.close()
+    await close_shared_pool()
+
+    print(f"📦 导入完成: {report.total_files} 个文件，成功 {report.completed}，"
+          f"重复 {report.duplicates}，跳过 {report.skipped}，失败 {report.failed}")
+    print(f"⏱️ 耗时 {report.elapsed_seconds}s，{report.files_per_second} 文件/秒，"
+          f"{report.megabytes_per_second} MB/秒，{report.chunks_per_second} 块/秒")
+    for result in report.files:
+        if result.status in ("failed", "skipped"):
+            print(f"   ⚠️ {result.name}: {result.status} - {result.error}")
+
+    if report_path:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            f.write(report.model_dump_json(indent=2))
+        print(f"📝 报告已写入 {report_path}")
+
+def main():
+    """命令行入口"""
+    from .config import RAG_CONFIG
+
+    parser = argparse.ArgumentParser(description="批量导入目录或 zip/tar 归档中的文档")
+    parser.add_argument("path", help="目录或归档文件路径")
+    parser.add_argument("--concurrency", type=int, default=RAG_CONFIG["bulk_concurrency"], help="并发处理的文件数")
+    parser.add_argument("--batch-size", type=int, default=RAG_CONFIG["bulk_batch_size"], help="批量嵌入的块数")
+    parser.add_argument("--report", help="将JSON汇总报告写入指定文件")
+    parser.add_argument("--collection", default="default", help="导入到的集合（不存在时按默认配置创建）")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.path) and not is_archive(args.path):
+        parser.error(f"不是目录或支持的归档文件: {args.path}")
+
+    asyncio.run(run_bulk_ingest(args.path, args.concurrency, args.batch_size, args.report, args.collection))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,658 @@
+"""
+持久化文档目录
+
+文档信息和处理状态保存在持久化存储中（本地默认SQLite，也可以通过 database/ 的配置使用MySQL），
+按 id、集合、状态、上传时间、内容摘要和文件名建立索引。进程内保留一份 write-through 缓存，
+启动时预热加载，重启后无需重新上传即可恢复目录；多个API进程共享同一份目录。
+集合（collection）的注册信息也保存在同一个存储中。
+"""
+
+import asyncio
+import base64
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from .models import (
+    CollectionConfig, CollectionInfo, DocumentInfo, DocumentStatus, DocumentType, ProcessingStatus
+)
+from .stats import DocumentCounters
+
+CatalogEntry = Tuple[DocumentInfo, ProcessingStatus]
+
+COLUMNS = (
+    "id", "filename", "original_name", "file_size", "file_type", "status",
+    "upload_time", "process_time", "error_message", "chunk_count", "content_hash",
+    "version", "metadata", "progress", "status_message", "reused_chunks",
+    "embedded_chunks", "updated_at", "collection"
+)
+
+STATUS_COLUMNS = ("status", "progress", "status_message", "chunk_count",
+                  "reused_chunks", "embedded_chunks", "updated_at")
+
+# 支持服务端排序的列（均有索引），分页游标为 (排序列的值, id)
+SORT_COLUMNS = ("upload_time", "original_name", "file_size")
+
+def _to_row(doc_info: DocumentInfo, status: Optional[ProcessingStatus]) -> tuple:
+    """将文档信息和处理状态转换为数据库行（时间统一存为时间戳）"""
+    return (
+        doc_info.id,
+        doc_info.filename,
+        doc_info.original_name,
+        doc_info.file_size,
+        doc_info.file_type.value,
+        doc_info.status.value,
+        doc_info.upload_time.timestamp(),
+        doc_info.process_time.timestamp() if doc_info.process_time else None,
+        doc_info.error_message,
+        doc_info.chunk_count,
+        doc_info.content_hash,
+        doc_info.version,
+        json.dumps(doc_info.metadata, ensure_ascii=False, default=str),
+        status.progress if status else 0,
+        status.message if status else "",
+        status.reused_chunks if status else None,
+        status.embedded_chunks if status else None,
+        time.time(),
+        doc_info.collection
+    )
+
+def _status_row(status: ProcessingStatus) -> tuple:
+    return (
+        status.status.value, status.progress, status.message, status.chunk_count,
+        status.reused_chunks, status.embedded_chunks, time.time()
+    )
+
+def _sort_value(doc_info: DocumentInfo, sort: str):
+    """取文档在排序列上的值（与数据库中存储的值一致）"""
+    if sort == "upload_time":
+        return doc_info.upload_time.timestamp()
+    return getattr(doc_info, sort)
+
+def encode_cursor(doc_info: DocumentInfo, sort: str) -> str:
+    """生成指向该文档之后的分页游标"""
+    raw = json.dumps([_sort_value(doc_info, sort), doc_info.id], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[Any, str]:
+    """解析分页游标"""
+    try:
+        value, document_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return value, document_id
+    except Exception:
+        raise ValueError("无效的分页游标")
+
+def _page_query(placeholder: str, collection: Optional[str], status: Optional[DocumentStatus],
+                file_type: Optional[DocumentType], sort: str, descending: bool,
+                after: Optional[Tuple[Any, str]], limit: int) -> Tuple[str, list]:
+    """构造键集分页查询：按 (排序列, id) 定位，不使用 OFFSET"""
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f"不支持按 {sort} 排序")
+    conditions = []
+    params: list = []
+    if collection:
+        conditions.append(f"collection = {placeholder}")
+        params.append(collection)
+    if status:
+        conditions.append(f"status = {placeholder}")
+        params.append(status.value)
+    if file_type:
+        conditions.append(f"file_type = {placeholder}")
+        params.append(file_type.value)
+    if after is not None:
+        op = "<" if descending else ">"
+        conditions.append(
+            f"({sort} {op} {placeholder} OR ({sort} = {placeholder} AND id {op} {placeholder}))"
+        )
+        params.extend([after[0], after[0], after[1]])
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    direction = "DESC" if descending else "ASC"
+    params.append(limit)
+    return (f"SELECT * FROM rag_documents {where} "
+            f"ORDER BY {sort} {direction}, id {direction} LIMIT {placeholder}"), params
+
+def _from_row(row: Mapping[str, Any]) -> CatalogEntry:
+    """将数据库行转换为文档信息和处理状态"""
+    doc_info = DocumentInfo(
+        id=row["id"],
+        filename=row["filename"],
+        original_name=row["original_name"],
+        file_size=row["file_size"],
+        file_type=DocumentType(row["file_type"]),
+        status=DocumentStatus(row["status"]),
+        upload_time=datetime.fromtimestamp(row["upload_time"]),
+        process_time=datetime.fromtimestamp(row["process_time"]) if row["process_time"] else None,
+        error_message=row["error_message"],
+        chunk_count=row["chunk_count"],
+        content_hash=row["content_hash"],
+        version=row["version"],
+        collection=row["collection"],
+        metadata=json.loads(row["metadata"]) if row["metadata"] else {}
+    )
+    status = ProcessingStatus(
+        document_id=row["id"],
+        status=doc_info.status,
+        progress=row["progress"],
+        message=row["status_message"] or "",
+        chunk_count=row["chunk_count"],
+        reused_chunks=row["reused_chunks"],
+        embedded_chunks=row["embedded_chunks"]
+    )
+    return doc_info, status
+
+def _find_query(placeholder: str, column: str, collection: Optional[str]) -> str:
+    """按内容摘要或文件名查找最新文档的查询"""
+    if column not in ("content_hash", "original_name"):
+        raise ValueError(f"不支持按 {column} 查找")
+    collection_filter = f" AND collection = {placeholder}" if collection else ""
+    return (f"SELECT id FROM rag_documents WHERE {column} = {placeholder}{collection_filter} "
+            f"ORDER BY upload_time DESC LIMIT 1")
+
+def _collection_from_row(row: Mapping[str, Any]) -> CollectionInfo:
+    return CollectionInfo(
+        name=row["name"],
+        config=CollectionConfig.model_validate(json.loads(row["config"])),
+        created_at=datetime.fromtimestamp(row["created_at"])
+    )
+
+class CatalogStore:
+    """文档目录存储接口"""
+
+    async def init(self):
+        """初始化表结构"""
+
+    async def close(self):
+        """释放连接"""
+
+    async def upsert(self, doc_info: DocumentInfo, status: Optional[ProcessingStatus] = None):
+        raise NotImplementedError
+
+    async def update_status(self, status: ProcessingStatus):
+        raise NotImplementedError
+
+    async def get(self, document_id: str) -> Optional[CatalogEntry]:
+        raise NotImplementedError
+
+    async def find_id(self, column: str, value: str, collection: Optional[str] = None) -> Optional[str]:
+        """按内容摘要（content_hash）或文件名（original_name）查找最新的文档ID；collection 为空时跨集合查找"""
+        raise NotImplementedError
+
+    async def list_entries(self, status: Optional[DocumentStatus] = None) -> List[CatalogEntry]:
+        """按上传时间倒序列出文档"""
+        raise NotImplementedError
+
+    async def list_page(self, collection: Optional[str] = None,
+                        status: Optional[DocumentStatus] = None,
+                        file_type: Optional[DocumentType] = None,
+                        sort: str = "upload_time", descending: bool = True,
+                        after: Optional[Tuple[Any, str]] = None, limit: int = 50) -> List[CatalogEntry]:
+        """键集分页：返回排在 after 之后的最多 limit 个文档"""
+        raise NotImplementedError
+
+    async def delete(self, document_id: str):
+        raise NotImplementedError
+
+    async def list_collections(self) -> List[CollectionInfo]:
+        raise NotImplementedError
+
+    async def save_collection(self, info: CollectionInfo):
+        raise NotImplementedError
+
+    async def delete_collection(self, name: str):
+        raise NotImplementedError
+
+class SQLiteCatalogStore(CatalogStore):
+    """SQLite文档目录（WAL模式，多进程共享同一个文件）"""
+
+    def __init__(self, db_path: str = "data/rag_catalog.db"):
+        self.db_path = db_path
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _execute_sync(self, sql: str, params: tuple = (), fetch: Optional[str] = None):
+        conn = self._connect()
+        try:
+            cursor = conn.execute(sql, params)
+            if fetch == "one":
+                return cursor.fetchone()
+            if fetch == "all":
+                return cursor.fetchall()
+            return None
+        finally:
+            conn.close()
+
+    async def _execute(self, sql: str, params: tuple = (), fetch: Optional[str] = None):
+        return await asyncio.to_thread(self._execute_sync, sql, params, fetch)
+
+    def _init_sync(self):
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rag_documents (
+                    id TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    original_name TEXT NOT NULL,
+                    file_size INTEGER NOT NULL,
+                    file_type TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    upload_time REAL NOT NULL,
+                    process_time REAL,
+                    error_message TEXT,
+                    chunk_count INTEGER,
+                    content_hash TEXT,
+                    version INTEGER NOT NULL DEFAULT 1,
+                    metadata TEXT NOT NULL DEFAULT '{}',
+                    progress INTEGER NOT NULL DEFAULT 0,
+                    status_message TEXT NOT NULL DEFAULT '',
+                    reused_chunks INTEGER,
+                    embedded_chunks INTEGER,
+                    updated_at REAL NOT NULL,
+                    collection TEXT NOT NULL DEFAULT 'default'
+                )
+            """)
+            # 旧版本的表没有 collection 列，已有文档归入默认集合
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(rag_documents)")}
+            if "collection" not in columns:
+                conn.execute("ALTER TABLE rag_documents ADD COLUMN collection TEXT NOT NULL DEFAULT 'default'")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rag_collections (
+                    name TEXT PRIMARY KEY,
+                    config TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_docs_collection ON rag_documents (collection, upload_time, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_docs_status ON rag_documents (status, upload_time, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_docs_file_type ON rag_documents (file_type, upload_time, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_docs_upload_time ON rag_documents (upload_time, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_docs_file_size ON rag_documents (file_size, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_docs_content_hash ON rag_documents (content_hash, collection)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_docs_original_name ON rag_documents (original_name, id)")
+        finally:
+            conn.close()
+
+    async def init(self):
+        await asyncio.to_thread(self._init_sync)
+
+    async def upsert(self, doc_info: DocumentInfo, status: Optional[ProcessingStatus] = None):
+        updates = ", ".join(f"{column} = excluded.{column}" for column in COLUMNS[1:])
+        await self._execute(
+            f"INSERT INTO rag_documents ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)}) "
+            f"ON CONFLICT(id) DO UPDATE SET {updates}",
+            _to_row(doc_info, status)
+        )
+
+    async def update_status(self, status: ProcessingStatus):
+        # chunk_count 为空时保留原值
+        assignments = ", ".join(
+            "chunk_count = COALESCE(?, chunk_count)" if column == "chunk_count" else f"{column} = ?"
+            for column in STATUS_COLUMNS
+        )
+        await self._execute(
+            f"UPDATE rag_documents SET {assignments} WHERE id = ?",
+            (*_status_row(status), status.document_id)
+        )
+
+    async def get(self, document_id: str) -> Optional[CatalogEntry]:
+        row = await self._execute("SELECT * FROM rag_documents WHERE id = ?", (document_id,), "one")
+        return _from_row(row) if row else None
+
+    async def find_id(self, column: str, value: str, collection: Optional[str] = None) -> Optional[str]:
+        params = (value, collection) if collection else (value,)
+        row = await self._execute(_find_query("?", column, collection), params, "one")
+        return row["id"] if row else None
+
+    async def list_entries(self, status: Optional[DocumentStatus] = None) -> List[CatalogEntry]:
+        if status:
+            rows = await self._execute(
+                "SELECT * FROM rag_documents WHERE status = ? ORDER BY upload_time DESC",
+                (status.value,), "all"
+            )
+        else:
+            rows = await self._execute("SELECT * FROM rag_documents ORDER BY upload_time DESC", (), "all")
+        return [_from_row(row) for row in rows]
+
+    async def list_page(self, collection: Optional[str] = None,
+                        status: Optional[DocumentStatus] = None,
+                        file_type: Optional[DocumentType] = None,
+                        sort: str = "upload_time", descending: bool = True,
+                        after: Optional[Tuple[Any, str]] = None, limit: int = 50) -> List[CatalogEntry]:
+        sql, params = _page_query("?", collection, status, file_type, sort, descending, after, limit)
+        rows = await self._execute(sql, tuple(params), "all")
+        return [_from_row(row) for row in rows]
+
+    async def delete(self, document_id: str):
+        await self._execute("DELETE FROM rag_documents WHERE id = ?", (document_id,))
+
+    async def list_collections(self) -> List[CollectionInfo]:
+        rows = await self._execute("SELECT * FROM rag_collections ORDER BY created_at", (), "all")
+        return [_collection_from_row(row) for row in rows]
+
+    async def save_collection(self, info: CollectionInfo):
+        await self._execute(
+            "INSERT INTO rag_collections (name, config, created_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET config = excluded.config",
+            (info.name, info.config.model_dump_json(), info.created_at.timestamp())
+        )
+
+    async def delete_collection(self, name: str):
+        await self._execute("DELETE FROM rag_collections WHERE name = ?", (name,))
+
+class MySQLCatalogStore(CatalogStore):
+    """MySQL文档目录（借用 database/ 中进程共享的连接池）"""
+
+    def __init__(self, pool):
+        """
+        Args:
+            pool: database.DatabasePool，由所属进程负责关闭
+        """
+        self.pool = pool
+        self.database = pool.database
+
+    async def init(self):
+        await self.pool.init()
+        await self._execute("""
+            CREATE TABLE IF NOT EXISTS rag_documents (
+                id VARCHAR(64) PRIMARY KEY,
+                filename VARCHAR(255) NOT NULL,
+                original_name VARCHAR(255) NOT NULL,
+                file_size BIGINT NOT NULL,
+                file_type VARCHAR(16) NOT NULL,
+                status VARCHAR(16) NOT NULL,
+                upload_time DOUBLE NOT NULL,
+                process_time DOUBLE NULL,
+                error_message TEXT NULL,
+                chunk_count INT NULL,
+                content_hash CHAR(64) NULL,
+                version INT NOT NULL DEFAULT 1,
+                metadata JSON NOT NULL,
+                progress INT NOT NULL DEFAULT 0,
+                status_message VARCHAR(512) NOT NULL DEFAULT '',
+                reused_chunks INT NULL,
+                embedded_chunks INT NULL,
+                updated_at DOUBLE NOT NULL,
+                collection VARCHAR(64) NOT NULL DEFAULT 'default',
+                INDEX idx_docs_collection (collection, upload_time, id),
+                INDEX idx_docs_status (status, upload_time, id),
+                INDEX idx_docs_file_type (file_type, upload_time, id),
+                INDEX idx_docs_upload_time (upload_time, id),
+                INDEX idx_docs_file_size (file_size, id),
+                INDEX idx_docs_content_hash (content_hash, collection),
+                INDEX idx_docs_original_name (original_name(191), id)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+        # 旧版本的表没有 collection 列，已有文档归入默认集合
+        column = await self._execute(
+            "SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'rag_documents' AND COLUMN_NAME = 'collection'",
+            (self.database,), "one"
+        )
+        if not column:
+            await self._execute(
+                "ALTER TABLE rag_documents ADD COLUMN collection VARCHAR(64) NOT NULL DEFAULT 'default', "
+                "ADD INDEX idx_docs_collection (collection, upload_time, id)"
+            )
+        await self._execute("""
+            CREATE TABLE IF NOT EXISTS rag_collections (
+                name VARCHAR(64) PRIMARY KEY,
+                config JSON NOT NULL,
+                created_at DOUBLE NOT NULL
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+        print("✅ MySQL文档目录初始化完成")
+
+    async def close(self):
+        # 连接池是共享的，由应用 / 命令行入口统一关闭
+        pass
+
+    async def _execute(self, sql: str, params: tuple = (), fetch: Optional[str] = None):
+        import aiomysql
+
+        async with self.pool.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute(sql, params)
+            if fetch == "one":
+                return await cursor.fetchone()
+            if fetch == "all":
+                return await cursor.fetchall()
+            return None
+
+    async def upsert(self, doc_info: DocumentInfo, status: Optional[ProcessingStatus] = None):
+        updates = ", ".join(f"{column} = VALUES({column})" for column in COLUMNS[1:])
+        await self._execute(
+            f"INSERT INTO rag_documents ({', '.join(COLUMNS)}) VALUES ({', '.join('%s' for _ in COLUMNS)}) "
+            f"ON DUPLICATE KEY UPDATE {updates}",
+            _to_row(doc_info, status)
+        )
+
+    async def update_status(self, status: ProcessingStatus):
+        assignments = ", ".join(
+            "chunk_count = COALESCE(%s, chunk_count)" if column == "chunk_count" else f"{column} = %s"
+            for column in STATUS_COLUMNS
+        )
+        await self._execute(
+            f"UPDATE rag_documents SET {assignments} WHERE id = %s",
+            (*_status_row(status), status.document_id)
+        )
+
+    async def get(self, document_id: str) -> Optional[CatalogEntry]:
+        row = await self._execute("SELECT * FROM rag_documents WHERE id = %s", (document_id,), "one")
+        return _from_row(row) if row else None
+
+    async def find_id(self, column: str, value: str, collection: Optional[str] = None) -> Optional[str]:
+        params = (value, collection) if collection else (value,)
+        row = await self._execute(_find_query("%s", column, collection), params, "one")
+        return row["id"] if row else None
+
+    async def list_entries(self, status: Optional[DocumentStatus] = None) -> List[CatalogEntry]:
+        if status:
+            rows = await self._execute(
+                "SELECT * FROM rag_documents WHERE status = %s ORDER BY upload_time DESC",
+                (status.value,), "all"
+            )
+        else:
+            rows = await self._execute("SELECT * FROM rag_documents ORDER BY upload_time DESC", (), "all")
+        return [_from_row(row) for row in rows]
+
+    async def list_page(self, collection: Optional[str] = None,
+                        status: Optional[DocumentStatus] = None,
+                        file_type: Optional[DocumentType] = None,
+                        sort: str = "upload_time", descending: bool = True,
+                        after: Optional[Tuple[Any, str]] = None, limit: int = 50) -> List[CatalogEntry]:
+        sql, params = _page_query("%s", collection, status, file_type, sort, descending, after, limit)
+        rows = await self._execute(sql, tuple(params), "all")
+        return [_from_row(row) for row in rows]
+
+    async def delete(self, document_id: str):
+        await self._execute("DELETE FROM rag_documents WHERE id = %s", (document_id,))
+
+    async def list_collections(self) -> List[CollectionInfo]:
+        rows = await self._execute("SELECT * FROM rag_collections ORDER BY created_at", (), "all")
+        return [_collection_from_row(row) for row in rows]
+
+    async def save_collection(self, info: CollectionInfo):
+        await self._execute(
+            "INSERT INTO rag_collections (name, config, created_at) VALUES (%s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE config = VALUES(config)",
+            (info.name, info.config.model_dump_json(), info.created_at.timestamp())
+        )
+
+    async def delete_collection(self, name: str):
+        await self._execute("DELETE FROM rag_collections WHERE name = %s", (name,))
+
+def create_catalog_store(backend: str, path: str) -> CatalogStore:
+    """根据配置创建目录存储"""
+    if backend == "sqlite":
+        return SQLiteCatalogStore(path)
+    if backend == "mysql":
+        from database import db_pool
+        return MySQLCatalogStore(db_pool)
+    raise ValueError(f"未知的文档目录存储: {backend}")
+
+async def close_shared_pool():
+    """命令行进程（worker / 批量导入）退出前关闭共享的MySQL连接池"""
+    from .config import RAG_CONFIG
+
+    if RAG_CONFIG["catalog_backend"] == "mysql":
+        from database import db_pool
+        await db_pool.close()
+
+class DocumentCatalog:
+    """
+    文档目录：持久化存储 + 进程内 write-through 缓存。
+
+    缓存在启动时通过 load() 预热；写操作先更新缓存再写入存储。
+    需要看到其他进程写入的数据时使用 fetch() / find_by_* 直接查询存储。
+    """
+
+    def __init__(self, store: CatalogStore):
+        self.store = store
+        self.counters: Dict[str, DocumentCounters] = {}  # collection -> 随缓存增量维护的文档计数
+        self.documents: Dict[str, DocumentInfo] = {}  # document_id -> DocumentInfo
+        self.statuses: Dict[str, ProcessingStatus] = {}  # document_id -> ProcessingStatus
+        self.content_index: Dict[Tuple[str, str], str] = {}  # (collection, content_hash) -> document_id
+        self.name_index: Dict[Tuple[str, str], str] = {}  # (collection, original_name) -> document_id
+        self._initialized = False
+
+    def counters_for(self, collection: str) -> DocumentCounters:
+        """获取集合的文档计数"""
+        if collection not in self.counters:
+            self.counters[collection] = DocumentCounters()
+        return self.counters[collection]
+
+    def in_collection(self, collection: str) -> List[DocumentInfo]:
+        """缓存中属于某个集合的文档"""
+        return [doc_info for doc_info in list(self.documents.values()) if doc_info.collection == collection]
+
+    async def init(self):
+        if not self._initialized:
+            await self.store.init()
+            self._initialized = True
+
+    async def close(self):
+        if self._initialized:
+            await self.store.close()
+            self._initialized = False
+
+    async def load(self) -> int:
+        """从存储预热加载整个目录，返回文档数量"""
+        await self.init()
+        entries = await self.store.list_entries()
+        # 按上传时间从旧到新写入索引，同名/同内容时保留最新的文档
+        for doc_info, status in reversed(entries):
+            self._cache(doc_info, status)
+        return len(entries)
+
+    def _cache(self, doc_info: DocumentInfo, status: Optional[ProcessingStatus] = None):
+        self.documents[doc_info.id] = doc_info
+        self.counters_for(doc_info.collection).update(doc_info.id, doc_info)
+        if status is not None:
+            self.statuses[doc_info.id] = status
+        if doc_info.content_hash:
+            self.content_index[(doc_info.collection, doc_info.content_hash)] = doc_info.id
+        self.name_index[(doc_info.collection, doc_info.original_name)] = doc_info.id
+
+    def get(self, document_id: Optional[str]) -> Optional[DocumentInfo]:
+        """从缓存获取文档信息"""
+        return self.documents.get(document_id) if document_id else None
+
+    def get_status(self, document_id: str) -> Optional[ProcessingStatus]:
+        """从缓存获取处理状态"""
+        return self.statuses.get(document_id)
+
+    async def fetch(self, document_id: str) -> Optional[DocumentInfo]:
+        """从存储读取最新的文档信息并刷新缓存（可能由其他进程写入）"""
+        entry = await self.store.get(document_id)
+        if entry is None:
+            return self.documents.get(document_id)
+        doc_info, status = entry
+        cached = self.documents.get(document_id)
+        if cached is not None and cached.version > doc_info.version:
+            return cached
+        self._cache(doc_info, status)
+        return doc_info
+
+    async def fetch_status(self, document_id: str) -> Optional[ProcessingStatus]:
+        """从存储读取最新的处理状态"""
+        await self.fetch(document_id)
+        return self.statuses.get(document_id)
+
+    async def find_by_hash(self, content_hash: str, collection: str) -> Optional[DocumentInfo]:
+        """在集合内按内容摘要查找文档"""
+        document_id = (self.content_index.get((collection, content_hash))
+                       or await self.store.find_id("content_hash", content_hash, collection))
+        return await self.fetch(document_id) if document_id else None
+
+    async def find_by_name(self, original_name: str, collection: str) -> Optional[DocumentInfo]:
+        """在集合内按原始文件名查找文档"""
+        document_id = (self.name_index.get((collection, original_name))
+                       or await self.store.find_id("original_name", original_name, collection))
+        return await self.fetch(document_id) if document_id else None
+
+    async def is_content_referenced(self, content_hash: str) -> bool:
+        """是否还有文档（任意集合）引用该内容，决定能否删除按内容寻址的文件"""
+        return await self.store.find_id("content_hash", content_hash) is not None
+
+    async def save(self, doc_info: DocumentInfo):
+        """保存文档信息（连同当前处理状态）"""
+        previous = self.documents.get(doc_info.id)
+        if previous is not None and previous.content_hash != doc_info.content_hash:
+            key = (previous.collection, previous.content_hash)
+            if self.content_index.get(key) == doc_info.id:
+                self.content_index.pop(key, None)
+        self._cache(doc_info)
+        await self.store.upsert(doc_info, self.statuses.get(doc_info.id))
+
+    async def save_status(self, status: ProcessingStatus):
+        """保存处理状态，文档状态随之更新"""
+        self.statuses[status.document_id] = status
+        doc_info = self.documents.get(status.document_id)
+        if doc_info is not None:
+            doc_info.status = status.status
+            if status.chunk_count is not None:
+                doc_info.chunk_count = status.chunk_count
+            self.counters_for(doc_info.collection).update(doc_info.id, doc_info)
+        await self.store.update_status(status)
+
+    async def remove(self, document_id: str):
+        """删除文档记录"""
+        doc_info = self.documents.pop(document_id, None)
+        self.statuses.pop(document_id, None)
+        if doc_info is not None:
+            self.counters_for(doc_info.collection).update(document_id, None)
+            hash_key = (doc_info.collection, doc_info.content_hash)
+            name_key = (doc_info.collection, doc_info.original_name)
+            if self.content_index.get(hash_key) == document_id:
+                self.content_index.pop(hash_key, None)
+            if self.name_index.get(name_key) == document_id:
+                self.name_index.pop(name_key, None)
+        await self.store.delete(document_id)
+
+    async def list_page(self, collection: Optional[str] = None,
+                        status: Optional[DocumentStatus] = None,
+                        file_type: Optional[DocumentType] = None,
+                        sort: str = "upload_time", descending: bool = True,
+                        cursor: Optional[str] = None,
+                        limit: int = 50) -> Tuple[List[CatalogEntry], Optional[str]]:
+        """
+        从存储分页列出文档（包含其他进程写入的文档）。
+        
+        Returns:
+            (本页文档, 下一页游标)；没有更多数据时游标为 None
+        """
+        after = decode_cursor(cursor) if cursor else None
+        entries = await self.store.list_page(collection, status, file_type, sort, descending, after, limit + 1)
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        next_cursor = encode_cursor(entries[-1][0], sort) if has_more else None
+        return entries, next_cursor
@@ -0,0 +1,360 @@
+"""
+RAG集合（命名空间）
+
+每个集合拥有独立的向量索引、块存储、写锁、统计和配置（向量维度、分块参数、索引类型），
+一个集合的批量导入不会影响其他集合的查询。集合的索引在首次使用时才加载，
+空闲超时或超过同时加载数量上限时写出快照并从内存中卸载。
+
+快照只由API进程写出。独立worker和命令行批量导入把处理好的文档向量发布为增量文件
+（{快照目录}/{集合}/deltas/*.npz），由API进程按发布顺序合并进索引，写出快照后删除。
+"""
+
+import asyncio
+import os
+import re
+import shutil
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from .catalog import CatalogStore
+from .models import CollectionConfig, CollectionInfo, DocumentInfo
+from .retrieval import RAGRetriever
+from .stats import DocumentCounters, RAGStats
+from .vector import VectorStore
+
+DEFAULT_COLLECTION = "default"
+INDEX_TYPES = ("flat",)  # 目前只支持精确的暴力余弦检索
+COLLECTION_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+class Collection:
+    """单个集合"""
+
+    def __init__(self, info: CollectionInfo, snapshot_dir: str, stats: RAGStats):
+        self.info = info
+        self.snapshot_dir = snapshot_dir
+        self.stats = stats
+        self.retriever: Optional[RAGRetriever] = None  # 未加载时为 None
+        self.write_lock = asyncio.Lock()  # 写入索引与索引切换互斥
+        self.load_lock = asyncio.Lock()
+        self.merge_lock = asyncio.Lock()  # 按顺序合并增量文件
+        self.dirty = False
+        self.last_used = time.monotonic()
+        self.last_index_stats: Optional[Dict] = None  # 卸载前最后一次的统计
+        self.applied_deltas: List[str] = []  # 已合并、等待快照写出后删除的增量文件
+        self._users = 0
+
+    @property
+    def name(self) -> str:
+        return self.info.name
+
+    @property
+    def config(self) -> CollectionConfig:
+        return self.info.config
+
+    @property
+    def loaded(self) -> bool:
+        return self.retriever is not None
+
+    @property
+    def busy(self) -> bool:
+        return self._users > 0
+
+    @property
+    def snapshot_path(self) -> Optional[str]:
+        if not self.snapshot_dir:
+            return None
+        return os.path.join(self.snapshot_dir, self.name, "vectors.npz")
+
+    @property
+    def deltas_dir(self) -> Optional[str]:
+        if not self.snapshot_dir:
+            return None
+        return os.path.join(self.snapshot_dir, self.name, "deltas")
+
+    def pending_deltas(self) -> List[str]:
+        """尚未合并的增量文件，按发布顺序排列"""
+        directory = self.deltas_dir
+        if not directory or not os.path.isdir(directory):
+            return []
+        applied = set(self.applied_deltas)
+        return [
+            path for path in (os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                              if name.endswith(".npz"))
+            if path not in applied
+        ]
+
+    @property
+    def vector_store(self) -> VectorStore:
+        return self.retriever.vector_store
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+    def mark_dirty(self):
+        """标记索引已变化，等待写出快照"""
+        self.dirty = True
+
+    @asynccontextmanager
+    async def use(self):
+        """使用期间集合不会被卸载"""
+        self._users += 1
+        self.touch()
+        try:
+            yield self
+        finally:
+            self._users -= 1
+            self.touch()
+
+    async def save_snapshot(self, force: bool = False):
+        """写出索引快照"""
+        path = self.snapshot_path
+        if not path or not self.loaded or not (self.dirty or force):
+            return
+        self.dirty = False
+        # 快照开始前已合并的增量文件，写出成功后即可删除
+        applied, self.applied_deltas = self.applied_deltas, []
+        try:
+            # 快照取自已发布的只读索引段，无需持有写锁
+            await self.vector_store.save_snapshot(path, extra={
+                "collection": self.name,
+                "config": self.config.model_dump(),
+                "saved_at": datetime.now().isoformat()
+            })
+        except Exception as e:
+            self.dirty = True
+            self.applied_deltas = applied + self.applied_deltas
+            print(f"⚠️ 集合 {self.name} 写出向量快照失败: {e}")
+            return
+        for delta_path in applied:
+            try:
+                os.remove(delta_path)
+            except FileNotFoundError:
+                pass
+
+    async def get_stats(self) -> Dict:
+        """集合统计；未加载时返回卸载前最后一次的索引统计"""
+        if self.loaded:
+            stats = await self.retriever.get_stats()
+        else:
+            # 索引部分沿用卸载前的值，文档计数和速率始终是最新的
+            documents = self.stats.documents
+            stats = {
+                **(self.last_index_stats or {}),
+                "total_documents": documents.total_documents,
+                "documents_by_status": dict(documents.by_status),
+                "documents_by_type": dict(documents.by_type),
+                "total_bytes": documents.total_bytes,
+                "rates": self.stats.rates()
+            }
+        return {
+            "collection": self.name,
+            "loaded": self.loaded,
+            "config": self.config.model_dump(),
+            **stats
+        }
+
+class CollectionManager:
+    """集合管理：注册信息持久化在目录存储中，索引按需加载、空闲卸载"""
+
+    def __init__(self,
+                 store: CatalogStore,
+                 documents: Dict[str, DocumentInfo],
+                 counters_for: Callable[[str], DocumentCounters],
+                 default_config: CollectionConfig,
+                 snapshot_dir: str = "data/collections",
+                 idle_seconds: float = 600,
+                 max_loaded: int = 16,
+                 on_load: Optional[Callable[[Collection], Awaitable[None]]] = None):
+        """
+        Args:
+            store: 目录存储（保存集合注册信息）
+            documents: 文档缓存，供检索结果显示文档名
+            counters_for: 获取集合文档计数的回调（由文档目录维护）
+            default_config: 默认集合及新集合的默认配置
+            snapshot_dir: 各集合快照的根目录（为空表示不持久化向量）
+            idle_seconds: 空闲多久后卸载集合索引
+            max_loaded: 同时加载的集合数量上限
+            on_load: 集合索引加载后的回调（用于与目录核对）
+        """
+        self.store = store
+        self.documents = documents
+        self.counters_for = counters_for
+        self.default_config = default_config
+        self.snapshot_dir = snapshot_dir
+        self.idle_seconds = idle_seconds
+        self.max_loaded = max_loaded
+        self.on_load = on_load
+        self.write_snapshots = True  # 独立worker / 命令行进程只读取快照，不写出
+        self.publish_deltas = False  # 把处理结果发布为增量文件，由API进程合并
+        self._collections: Dict[str, Collection] = {}
+
+    def _wrap(self, info: CollectionInfo) -> Collection:
+        stats = RAGStats(documents=self.counters_for(info.name))
+        return Collection(info, self.snapshot_dir, stats)
+
+    async def init(self):
+        """加载集合注册信息，不存在时创建默认集合"""
+        for info in await self.store.list_collections():
+            if info.name not in self._collections:
+                self._collections[info.name] = self._wrap(info)
+        if DEFAULT_COLLECTION not in self._collections:
+            await self.create(DEFAULT_COLLECTION, self.default_config)
+
+    def all(self) -> List[Collection]:
+        return list(self._collections.values())
+
+    def find(self, name: str) -> Optional[Collection]:
+        """获取集合（不触发加载）"""
+        return self._collections.get(name)
+
+    async def lookup(self, name: str) -> Optional[Collection]:
+        """获取集合（不触发加载），本进程中没有时从注册信息中查找（可能由其他进程创建）"""
+        collection = self._collections.get(name)
+        if collection is None:
+            for info in await self.store.list_collections():
+                if info.name == name:
+                    collection = self._collections.setdefault(name, self._wrap(info))
+        return collection
+
+    def loaded(self) -> List[Collection]:
+        return [collection for collection in self._collections.values() if collection.loaded]
+
+    @staticmethod
+    def validate(name: str, config: CollectionConfig):
+        if not COLLECTION_NAME_PATTERN.match(name):
+            raise ValueError("集合名称只能包含字母、数字、下划线和连字符，长度1-64")
+        if config.index_type not in INDEX_TYPES:
+            raise ValueError(f"不支持的索引类型: {config.index_type}，可选: {', '.join(INDEX_TYPES)}")
+        if config.dimension <= 0:
+            raise ValueError("向量维度必须为正数")
+        if config.chunk_size <= 0 or config.overlap < 0 or config.overlap >= config.chunk_size:
+            raise ValueError("分块参数无效：要求 chunk_size > overlap >= 0")
+
+    async def create(self, name: str, config: Optional[CollectionConfig] = None) -> Collection:
+        """创建集合"""
+        if name in self._collections:
+            raise KeyError(f"集合已存在: {name}")
+        config = config or self.default_config.model_copy()
+        self.validate(name, config)
+        info = CollectionInfo(name=name, config=config, created_at=datetime.now())
+        await self.store.save_collection(info)
+        self._collections[name] = self._wrap(info)
+        print(f"🗂️ 已创建集合 {name}")
+        return self._collections[name]
+
+    async def update_config(self, name: str, **changes) -> CollectionConfig:
+        """更新集合配置（如重建索引后的分块参数）"""
+        collection = self._collections[name]
+        config = collection.config.model_copy(update=changes)
+        self.validate(name, config)
+        collection.info.config = config
+        await self.store.save_collection(collection.info)
+        return config
+
+    async def get(self, name: str) -> Collection:
+        """获取集合，未加载时加载其索引"""
+        collection = await self.lookup(name)
+        if collection is None:
+            raise KeyError(f"集合不存在: {name}")
+
+        collection.touch()
+        if not collection.loaded:
+            async with collection.load_lock:
+                if not collection.loaded:
+                    await self._load(collection)
+        return collection
+
+    @asynccontextmanager
+    async def using(self, name: str):
+        """获取并占用集合，期间不会被卸载"""
+        collection = await self.get(name)
+        async with collection.use():
+            yield collection
+
+    async def _load(self, collection: Collection):
+        """加载集合索引（从快照恢复）"""
+        started = time.monotonic()
+        await self._enforce_capacity(exclude=collection.name)
+
+        store = VectorStore(dimension=collection.config.dimension)
+        path = collection.snapshot_path
+        if path and os.path.exists(path):
+            try:
+                await store.load_snapshot(path)
+            except Exception as e:
+                print(f"⚠️ 加载集合 {collection.name} 的向量快照失败，将重新处理文档: {e}")
+                store = VectorStore(dimension=collection.config.dimension)
+
+        collection.retriever = RAGRetriever(store, documents=self.documents, stats=collection.stats)
+        collection.dirty = False
+        # 未写入快照就卸载时，之前合并过的增量文件需要重新合并
+        collection.applied_deltas = []
+        if self.on_load:
+            await self.on_load(collection)
+
+        stats = await store.get_stats()
+        print(f"📂 已加载集合 {collection.name}：{stats['total_chunks']} 个向量块"
+              f"（{time.monotonic() - started:.2f}s）")
+
+    async def unload(self, collection: Collection):
+        """写出快照后卸载集合索引"""
+        if not collection.loaded or collection.busy:
+            return
+        if self.write_snapshots:
+            await collection.save_snapshot()
+        async with collection.write_lock:
+            if collection.busy:
+                return
+            collection.last_index_stats = await collection.retriever.get_stats()
+            collection.retriever = None
+        print(f"💤 已卸载空闲集合 {collection.name}")
+
+    async def _enforce_capacity(self, exclude: Optional[str] = None):
+        """超过同时加载数量上限时卸载最久未使用的空闲集合"""
+        candidates = sorted(
+            (c for c in self.loaded() if c.name != exclude and not c.busy),
+            key=lambda c: c.last_used
+        )
+        excess = len(self.loaded()) + 1 - self.max_loaded
+        for collection in candidates[:max(excess, 0)]:
+            await self.unload(collection)
+
+    async def evict_idle(self):
+        """卸载空闲超时的集合"""
+        now = time.monotonic()
+        for collection in self.loaded():
+            if not collection.busy and now - collection.last_used > self.idle_seconds:
+                await self.unload(collection)
+
+    async def publish(self, collection: Collection, document_ids: Iterable[str]):
+        """
+        发布文档的当前向量（仅 publish_deltas 模式）。
+
+        增量文件包含这些文档的全部存活块，没有块的文档表示已删除；写入临时文件后原子改名，
+        文件名以纳秒时间戳开头，API进程按文件名顺序合并。
+        """
+        if not self.publish_deltas or not collection.deltas_dir:
+            return
+        path = os.path.join(collection.deltas_dir, f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.npz")
+        await collection.vector_store.save_documents(path, list(document_ids), extra={"collection": collection.name})
+
+    async def save_snapshots(self, force: bool = False):
+        """写出所有已加载集合的快照"""
+        if not self.write_snapshots:
+            return
+        for collection in self.loaded():
+            await collection.save_snapshot(force)
+
+    async def drop(self, name: str):
+        """删除集合注册信息和快照（集合中的文档由调用方先删除）"""
+        collection = self._collections.pop(name, None)
+        if collection is None:
+            raise KeyError(f"集合不存在: {name}")
+        collection.retriever = None
+        await self.store.delete_collection(name)
+        if collection.snapshot_path:
+            await asyncio.to_thread(shutil.rmtree, os.path.dirname(collection.snapshot_path), True)
+        print(f"🗑️ 已删除集合 {name}")
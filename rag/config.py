@@ -0,0 +1,43 @@
+"""
+RAG配置
+"""
+
+import os
+
+# RAG配置
+RAG_CONFIG = {
+    # 上传文件目录和提取文本缓存目录
+    "upload_dir": os.getenv("RAG_UPLOAD_DIR", "uploads"),
+    "text_cache_dir": os.getenv("RAG_TEXT_CACHE_DIR", "data/text_cache"),
+    # 默认集合的向量维度（新集合可单独配置）
+    "vector_dimension": int(os.getenv("RAG_VECTOR_DIMENSION", 768)),
+    # 默认集合的分块大小和重叠
+    "chunk_size": int(os.getenv("RAG_CHUNK_SIZE", 1000)),
+    "chunk_overlap": int(os.getenv("RAG_CHUNK_OVERLAP", 200)),
+    # 摄取任务队列（SQLite持久化）
+    "queue_path": os.getenv("RAG_QUEUE_PATH", "data/rag_jobs.db"),
+    # API进程内启动的工作协程数量（0表示仅由独立的 python -m rag.worker 处理）
+    "inprocess_workers": int(os.getenv("RAG_INPROCESS_WORKERS", 2)),
+    # 任务最大尝试次数和重试退避基数（秒）
+    "job_max_attempts": int(os.getenv("RAG_JOB_MAX_ATTEMPTS", 3)),
+    "job_retry_backoff": float(os.getenv("RAG_JOB_RETRY_BACKOFF", 2.0)),
+    # 任务租约时长（秒），超时未完成的任务会被重新领取
+    "job_lease_seconds": int(os.getenv("RAG_JOB_LEASE_SECONDS", 600)),
+    # 批量导入：并发处理的文件数、跨文件批量嵌入的块数
+    "bulk_concurrency": int(os.getenv("RAG_BULK_CONCURRENCY", 8)),
+    "bulk_batch_size": int(os.getenv("RAG_BULK_BATCH_SIZE", 256)),
+    # 单个文件大小上限（MB）
+    "max_file_size": int(os.getenv("RAG_MAX_FILE_SIZE", 10)) * 1024 * 1024,
+    # 文档目录存储：sqlite（本地文件）或 mysql（使用 database/ 中的连接配置）
+    "catalog_backend": os.getenv("RAG_CATALOG_BACKEND", "sqlite"),
+    "catalog_path": os.getenv("RAG_CATALOG_PATH", "data/rag_catalog.db"),
+    # 各集合向量快照的根目录（{目录}/{集合}/vectors.npz；为空表示不持久化），加载集合时预热
+    "collections_dir": os.getenv("RAG_COLLECTIONS_DIR", "data/collections"),
+    # 索引有变化时写出快照、检查空闲集合的间隔（秒）
+    "snapshot_interval": float(os.getenv("RAG_SNAPSHOT_INTERVAL", 30)),
+    # 合并独立worker发布的增量向量的间隔（秒）
+    "merge_interval": float(os.getenv("RAG_MERGE_INTERVAL", 2)),
+    # 集合空闲多久后从内存卸载（秒），以及同时加载的集合数量上限
+    "collection_idle_seconds": float(os.getenv("RAG_COLLECTION_IDLE_SECONDS", 600)),
+    "max_loaded_collections": int(os.getenv("RAG_MAX_LOADED_COLLECTIONS", 16)),
+}
@@ -4,6 +4,7 @@
 
 import os
 import uuid
+import hashlib
 import aiofiles
 from typing import List, Dict, Any, Optional
 from datetime import datetime
@@ -12,18 +13,34 @@ from .models import DocumentInfo, DocumentType, DocumentStatus, DocumentChunk
 class DocumentProcessor:
     """文档处理器"""
     
-    def __init__(self, upload_dir: str = "uploads"):
+    def __init__(self,
+                 upload_dir: str = "uploads",
+                 text_cache_dir: Optional[str] = "data/text_cache",
+                 chunk_size: int = 1000,
+                 overlap: int = 200):
         self.upload_dir = upload_dir
+        self.text_cache_dir = text_cache_dir  # 提取文本缓存目录，为None时不缓存
+        self.chunk_size = chunk_size
+        self.overlap = overlap
         self.ensure_upload_dir()
     
     def ensure_upload_dir(self):
         """确保上传目录存在"""
         os.makedirs(self.upload_dir, exist_ok=True)
+        if self.text_cache_dir:
+            os.makedirs(self.text_cache_dir, exist_ok=True)
     
-    async def save_uploaded_file(self, file_content: bytes, filename: str) -> DocumentInfo:
-        """保存上传的文件"""
-        # 生成唯一文件ID
-        doc_id = str(uuid.uuid4())
+    @staticmethod
+    def compute_content_hash(content: bytes) -> str:
+        """计算内容的SHA-256摘要"""
+        return hashlib.sha256(content).hexdigest()
+    
+    async def save_uploaded_file(self, file_content: bytes, filename: str,
+                                 document_id: Optional[str] = None,
+                                 content_hash: Optional[str] = None) -> DocumentInfo:
+        """保存上传的文件（按内容摘要寻址存储）"""
+        # 生成唯一文件ID（上传新版本时沿用原文档ID）
+        doc_id = document_id or str(uuid.uuid4())
         
         # 确定文件类型
         file_ext = filename.lower().split('.')[-1]
@@ -32,13 +49,15 @@ class DocumentProcessor:
         except ValueError:
             raise ValueError(f"不支持的文件类型: {file_ext}")
         
-        # 生成存储文件名
-        stored_filename = f"{doc_id}.{file_ext}"
+        # 以内容摘要作为存储文件名，相同内容只存一份
+        content_hash = content_hash or self.compute_content_hash(file_content)
+        stored_filename = f"{content_hash}.{file_ext}"
         file_path = os.path.join(self.upload_dir, stored_filename)
         
         # 异步保存文件
-        async with aiofiles.open(file_path, 'wb') as f:
-            await f.write(file_content)
+        if not os.path.exists(file_path):
+            async with aiofiles.open(file_path, 'wb') as f:
+                await f.write(file_content)
         
         # 创建文档信息
         doc_info = DocumentInfo(
@@ -48,23 +67,29 @@ class DocumentProcessor:
             file_size=len(file_content),
             file_type=file_type,
             status=DocumentStatus.UPLOADING,
-            upload_time=datetime.now()
+            upload_time=datetime.now(),
+            content_hash=content_hash
         )
         
         return doc_info
     
-    async def process_document(self, doc_info: DocumentInfo) -> List[DocumentChunk]:
+    async def process_document(self, doc_info: DocumentInfo,
+                               chunk_size: Optional[int] = None,
+                               overlap: Optional[int] = None) -> List[DocumentChunk]:
         """处理文档，提取文本并分块"""
         try:
             # 更新状态为处理中
             doc_info.status = DocumentStatus.PROCESSING
             
-            # 读取文件内容
-            file_path = os.path.join(self.upload_dir, doc_info.filename)
-            content = await self._extract_text(file_path, doc_info.file_type)
+            # 读取文件内容（优先使用提取文本缓存）
+            content = await self.get_text(doc_info)
             
             # 分块处理
-            chunks = await self._split_text(content, doc_info.id)
+            chunks = await self.split_text(
+                content, doc_info.id,
+                chunk_size or self.chunk_size,
+                overlap if overlap is not None else self.overlap
+            )
             
             # 更新文档信息
             doc_info.status = DocumentStatus.COMPLETED
@@ -78,6 +103,31 @@ class DocumentProcessor:
             doc_info.error_message = str(e)
             raise
     
+    def _text_cache_path(self, doc_info: DocumentInfo) -> Optional[str]:
+        """提取文本缓存路径（按内容摘要寻址）"""
+        if not self.text_cache_dir or not doc_info.content_hash:
+            return None
+        return os.path.join(self.text_cache_dir, f"{doc_info.content_hash}.txt")
+    
+    async def get_text(self, doc_info: DocumentInfo) -> str:
+        """获取文档文本：命中缓存时跳过提取"""
+        cache_path = self._text_cache_path(doc_info)
+        if cache_path and os.path.exists(cache_path):
+            async with aiofiles.open(cache_path, 'r', encoding='utf-8') as f:
+                return await f.read()
+        
+        file_path = os.path.join(self.upload_dir, doc_info.filename)
+        content = await self._extract_text(file_path, doc_info.file_type)
+        
+        if cache_path:
+            # 先写临时文件再重命名，避免并发读到不完整的缓存
+            tmp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+            async with aiofiles.open(tmp_path, 'w', encoding='utf-8') as f:
+                await f.write(content)
+            os.replace(tmp_path, cache_path)
+        
+        return content
+    
     async def _extract_text(self, file_path: str, file_type: DocumentType) -> str:
         """从文件中提取文本"""
         if file_type == DocumentType.TXT:
@@ -125,8 +175,8 @@ class DocumentProcessor:
         # 可以使用 BeautifulSoup 库
         return "HTML文本提取功能待实现"
     
-    async def _split_text(self, text: str, document_id: str, chunk_size: int = 1000, overlap: int = 200) -> List[DocumentChunk]:
-        """将文本分块"""
+    async def split_text(self, text: str, document_id: str, chunk_size: int = 1000, overlap: int = 200) -> List[DocumentChunk]:
+        """将文本分块（处理文档和重建索引共用）"""
         chunks = []
         start = 0
         chunk_index = 0
@@ -142,15 +192,17 @@ class DocumentProcessor:
                     end = start + last_period + 1
                     chunk_text = text[start:end]
             
+            content = chunk_text.strip()
             chunk = DocumentChunk(
                 id=f"{document_id}_chunk_{chunk_index}",
                 document_id=document_id,
-                content=chunk_text.strip(),
+                content=content,
                 chunk_index=chunk_index,
                 metadata={
                     "start_pos": start,
                     "end_pos": end,
-                    "length": len(chunk_text)
+                    "length": len(chunk_text),
+                    "content_hash": hashlib.sha256(content.encode('utf-8')).hexdigest()
                 }
             )
             
@@ -161,7 +213,14 @@ class DocumentProcessor:
         return chunks
     
     async def delete_document(self, doc_info: DocumentInfo):
-        """删除文档文件"""
-        file_path = os.path.join(self.upload_dir, doc_info.filename)
+        """删除文档文件及其提取文本缓存"""
+        await self.delete_file(doc_info.filename)
+        cache_path = self._text_cache_path(doc_info)
+        if cache_path and os.path.exists(cache_path):
+            os.remove(cache_path)
+    
+    async def delete_file(self, filename: str):
+        """删除存储的文件"""
+        file_path = os.path.join(self.upload_dir, filename)
         if os.path.exists(file_path):
             os.remove(file_path)
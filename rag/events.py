@@ -0,0 +1,113 @@
+"""
+文档处理状态事件推送
+
+将 ProcessingStatus 的变化推送给订阅者（SSE连接）。每个客户端只需一个订阅，
+即可覆盖该客户端上传的所有文档，替代逐个文档轮询 /rag/status。
+"""
+
+import asyncio
+import itertools
+from typing import Dict, Iterable, List, Optional, Set
+
+from .models import DocumentStatus, ProcessingStatus
+
+TERMINAL_STATUSES = (DocumentStatus.COMPLETED, DocumentStatus.FAILED, DocumentStatus.CANCELLED)
+
+class StatusSubscription:
+    """单个客户端的状态订阅"""
+
+    def __init__(self, subscription_id: int, client_id: Optional[str],
+                 document_ids: Optional[Set[str]], queue_size: int):
+        self.id = subscription_id
+        self.client_id = client_id
+        self.document_ids = document_ids
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    def push(self, status: ProcessingStatus):
+        """放入事件；队列满时丢弃最旧的事件，慢客户端不会阻塞发布者"""
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(status)
+
+class StatusBroadcaster:
+    """处理状态广播器"""
+
+    def __init__(self, queue_size: int = 256):
+        self.queue_size = queue_size
+        self._subscriptions: Dict[int, StatusSubscription] = {}
+        self._client_documents: Dict[str, Set[str]] = {}  # client_id -> 处理中的document_id
+        self._last_published: Dict[str, tuple] = {}  # document_id -> 上次发布的状态
+        self._ids = itertools.count(1)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscriptions)
+
+    def subscribe(self, client_id: Optional[str] = None,
+                  document_ids: Optional[Iterable[str]] = None) -> StatusSubscription:
+        """创建订阅；不指定client_id和document_ids时接收所有文档的事件"""
+        subscription = StatusSubscription(
+            next(self._ids), client_id,
+            set(document_ids) if document_ids else None,
+            self.queue_size
+        )
+        self._subscriptions[subscription.id] = subscription
+        return subscription
+
+    def unsubscribe(self, subscription: StatusSubscription):
+        """取消订阅"""
+        self._subscriptions.pop(subscription.id, None)
+        client_id = subscription.client_id
+        if client_id and not self._client_documents.get(client_id) and not any(
+            sub.client_id == client_id for sub in self._subscriptions.values()
+        ):
+            self._client_documents.pop(client_id, None)
+
+    def track(self, client_id: str, document_id: str):
+        """登记文档属于某个客户端"""
+        self._client_documents.setdefault(client_id, set()).add(document_id)
+
+    def tracked_documents(self, client_id: str) -> List[str]:
+        """获取客户端处理中的文档"""
+        return list(self._client_documents.get(client_id, ()))
+
+    def in_flight_documents(self) -> Set[str]:
+        """所有客户端处理中的文档"""
+        documents = set()
+        for document_ids in self._client_documents.values():
+            documents.update(document_ids)
+        return documents
+
+    def publish(self, status: ProcessingStatus):
+        """发布状态变化（状态未变化时不重复发布）"""
+        key = (status.status, status.progress, status.message)
+        if self._last_published.get(status.document_id) == key:
+            return
+        self._last_published[status.document_id] = key
+
+        owners = [
+            client_id for client_id, document_ids in self._client_documents.items()
+            if status.document_id in document_ids
+        ]
+        for subscription in list(self._subscriptions.values()):
+            if self._matches(subscription, status.document_id, owners):
+                subscription.push(status)
+
+        if status.status in TERMINAL_STATUSES:
+            self._last_published.pop(status.document_id, None)
+            for client_id in owners:
+                self._client_documents[client_id].discard(status.document_id)
+
+    def _matches(self, subscription: StatusSubscription, document_id: str, owners: List[str]) -> bool:
+        if subscription.document_ids is not None and document_id in subscription.document_ids:
+            return True
+        if subscription.client_id is not None:
+            return subscription.client_id in owners
+        return subscription.document_ids is None
+
+def format_sse(status: ProcessingStatus, event: str = "status") -> str:
+    """格式化为Server-Sent Events消息"""
+    return f"event: {event}\ndata: {status.model_dump_json()}\n\n"
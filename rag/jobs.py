@@ -0,0 +1,382 @@
+"""
+持久化摄取任务队列
+
+基于SQLite实现，支持优先级、失败重试（指数退避）、取消以及租约超时回收。
+多个进程（API进程和 python -m rag.worker）可以共享同一个队列文件。
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .models import IngestionJob, JobStatus
+
+# 按文档ID批量查询时每条 IN (...) 语句的ID数（旧版本 SQLite 每条语句最多 999 个参数）
+ID_BATCH_SIZE = 500
+
+class JobQueue:
+    """SQLite持久化任务队列"""
+
+    def __init__(self,
+                 db_path: str = "data/rag_jobs.db",
+                 max_attempts: int = 3,
+                 retry_backoff: float = 2.0,
+                 lease_seconds: int = 600):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.lease_seconds = lease_seconds
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        """创建数据库连接（每次操作独立连接，便于在线程池中使用）"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_schema(self):
+        """初始化任务表"""
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ingestion_jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    document_id TEXT,
+                    payload TEXT NOT NULL DEFAULT '{}',
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    progress INTEGER NOT NULL DEFAULT 0,
+                    message TEXT NOT NULL DEFAULT '',
+                    last_error TEXT,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    worker_id TEXT,
+                    available_at REAL NOT NULL,
+                    lease_until REAL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_jobs_claim
+                ON ingestion_jobs (status, priority DESC, available_at, created_at)
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_jobs_document
+                ON ingestion_jobs (document_id, created_at)
+            """)
+        finally:
+            conn.close()
+
+    def _row_to_job(self, row: sqlite3.Row) -> IngestionJob:
+        """将数据库行转换为任务模型"""
+        return IngestionJob(
+            id=row["id"],
+            kind=row["kind"],
+            document_id=row["document_id"],
+            payload=json.loads(row["payload"]),
+            priority=row["priority"],
+            status=JobStatus(row["status"]),
+            attempts=row["attempts"],
+            max_attempts=row["max_attempts"],
+            progress=row["progress"],
+            message=row["message"],
+            last_error=row["last_error"],
+            cancel_requested=bool(row["cancel_requested"]),
+            result=json.loads(row["result"]) if row["result"] else None,
+            worker_id=row["worker_id"],
+            available_at=datetime.fromtimestamp(row["available_at"]),
+            created_at=datetime.fromtimestamp(row["created_at"]),
+            updated_at=datetime.fromtimestamp(row["updated_at"])
+        )
+
+    def _fetch_job(self, conn: sqlite3.Connection, job_id: str) -> Optional[IngestionJob]:
+        row = conn.execute("SELECT * FROM ingestion_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    # ---- 同步实现（在线程池中执行） ----
+
+    def _enqueue_sync(self, kind: str, payload: Dict[str, Any], document_id: Optional[str],
+                      priority: int, max_attempts: int) -> IngestionJob:
+        now = time.time()
+        job_id = str(uuid.uuid4())
+        conn = self._connect()
+        try:
+            conn.execute("""
+                INSERT INTO ingestion_jobs
+                    (id, kind, document_id, payload, priority, status, max_attempts,
+                     message, available_at, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (job_id, kind, document_id, json.dumps(payload, ensure_ascii=False), priority,
+                  JobStatus.QUEUED.value, max_attempts, "等待处理", now, now, now))
+            return self._fetch_job(conn, job_id)
+        finally:
+            conn.close()
+
+    def _claim_sync(self, worker_id: str, kinds: Optional[List[str]]) -> Optional[IngestionJob]:
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+
+            # 租约超时且重试次数用尽的任务直接标记失败
+            conn.execute("""
+                UPDATE ingestion_jobs
+                SET status = ?, last_error = '任务租约超时', updated_at = ?
+                WHERE status = ? AND lease_until < ? AND attempts >= max_attempts
+            """, (JobStatus.FAILED.value, now, JobStatus.RUNNING.value, now))
+
+            kind_filter = ""
+            params: List[Any] = [JobStatus.QUEUED.value, now, JobStatus.RUNNING.value, now]
+            if kinds:
+                kind_filter = f"AND kind IN ({','.join('?' for _ in kinds)})"
+                params.extend(kinds)
+
+            row = conn.execute(f"""
+                SELECT id FROM ingestion_jobs
+                WHERE ((status = ? AND available_at <= ?) OR (status = ? AND lease_until < ?))
+                  AND cancel_requested = 0 {kind_filter}
+                ORDER BY priority DESC, available_at, created_at
+                LIMIT 1
+            """, params).fetchone()
+
+            if not row:
+                conn.execute("COMMIT")
+                return None
+
+            conn.execute("""
+                UPDATE ingestion_jobs
+                SET status = ?, attempts = attempts + 1, worker_id = ?,
+                    lease_until = ?, updated_at = ?
+                WHERE id = ?
+            """, (JobStatus.RUNNING.value, worker_id, now + self.lease_seconds, now, row["id"]))
+            conn.execute("COMMIT")
+
+            return self._fetch_job(conn, row["id"])
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _update_sync(self, job_id: str, **fields) -> Optional[IngestionJob]:
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        conn = self._connect()
+        try:
+            conn.execute(f"UPDATE ingestion_jobs SET {assignments} WHERE id = ?",
+                         (*fields.values(), job_id))
+            return self._fetch_job(conn, job_id)
+        finally:
+            conn.close()
+
+    def _release_sync(self, job_id: str) -> Optional[IngestionJob]:
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("""
+                UPDATE ingestion_jobs
+                SET status = ?, attempts = MAX(attempts - 1, 0), worker_id = NULL,
+                    lease_until = NULL, available_at = ?, updated_at = ?
+                WHERE id = ? AND status = ?
+            """, (JobStatus.QUEUED.value, now, now, job_id, JobStatus.RUNNING.value))
+            return self._fetch_job(conn, job_id)
+        finally:
+            conn.close()
+
+    def _fail_sync(self, job_id: str, error: str) -> Optional[IngestionJob]:
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            job = self._fetch_job(conn, job_id)
+            if not job:
+                conn.execute("COMMIT")
+                return None
+
+            if job.cancel_requested:
+                status, available_at = JobStatus.CANCELLED, now
+            elif job.attempts < job.max_attempts:
+                # 指数退避：backoff * 2^(attempts-1)
+                status = JobStatus.QUEUED
+                available_at = now + self.retry_backoff * (2 ** (job.attempts - 1))
+            else:
+                status, available_at = JobStatus.FAILED, now
+
+            conn.execute("""
+                UPDATE ingestion_jobs
+                SET status = ?, last_error = ?, available_at = ?, lease_until = NULL, updated_at = ?
+                WHERE id = ?
+            """, (status.value, error, available_at, now, job_id))
+            conn.execute("COMMIT")
+            return self._fetch_job(conn, job_id)
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _cancel_sync(self, job_id: str) -> Optional[IngestionJob]:
+        now = time.time()
+        conn = self._connect()
+        try:
+            # 排队中的任务直接取消；运行中的任务设置取消标记，由worker中断
+            conn.execute("""
+                UPDATE ingestion_jobs
+                SET status = CASE WHEN status = ? THEN ? ELSE status END,
+                    cancel_requested = 1, updated_at = ?
+                WHERE id = ? AND status IN (?, ?)
+            """, (JobStatus.QUEUED.value, JobStatus.CANCELLED.value, now, job_id,
+                  JobStatus.QUEUED.value, JobStatus.RUNNING.value))
+            return self._fetch_job(conn, job_id)
+        finally:
+            conn.close()
+
+    def _query_sync(self, sql: str, params: tuple) -> List[IngestionJob]:
+        conn = self._connect()
+        try:
+            return [self._row_to_job(row) for row in conn.execute(sql, params).fetchall()]
+        finally:
+            conn.close()
+
+    def _stats_sync(self) -> Dict[str, int]:
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) AS total FROM ingestion_jobs GROUP BY status"
+            ).fetchall()
+            stats = {status.value: 0 for status in JobStatus}
+            stats.update({row["status"]: row["total"] for row in rows})
+            return stats
+        finally:
+            conn.close()
+
+    # ---- 异步接口 ----
+
+    async def enqueue(self,
+                      kind: str,
+                      payload: Optional[Dict[str, Any]] = None,
+                      document_id: Optional[str] = None,
+                      priority: int = 0,
+                      max_attempts: Optional[int] = None) -> IngestionJob:
+        """提交任务，priority越大越先执行"""
+        return await asyncio.to_thread(
+            self._enqueue_sync, kind, payload or {}, document_id, priority,
+            max_attempts or self.max_attempts
+        )
+
+    async def claim(self, worker_id: str, kinds: Optional[List[str]] = None) -> Optional[IngestionJob]:
+        """领取一个可执行的任务（包括租约超时的任务）"""
+        return await asyncio.to_thread(self._claim_sync, worker_id, kinds)
+
+    async def update_progress(self, job_id: str, progress: int, message: str):
+        """更新任务进度，同时续期租约"""
+        await asyncio.to_thread(
+            self._update_sync, job_id, progress=progress, message=message,
+            lease_until=time.time() + self.lease_seconds
+        )
+
+    async def complete(self, job_id: str, result: Optional[Dict[str, Any]] = None) -> Optional[IngestionJob]:
+        """标记任务完成"""
+        return await asyncio.to_thread(
+            self._update_sync, job_id, status=JobStatus.COMPLETED.value, progress=100,
+            lease_until=None, result=json.dumps(result, ensure_ascii=False) if result is not None else None
+        )
+
+    async def fail(self, job_id: str, error: str) -> Optional[IngestionJob]:
+        """记录任务失败，未超过最大尝试次数时按指数退避重新排队"""
+        return await asyncio.to_thread(self._fail_sync, job_id, error)
+
+    async def mark_cancelled(self, job_id: str) -> Optional[IngestionJob]:
+        """标记运行中的任务已被中断取消"""
+        return await asyncio.to_thread(
+            self._update_sync, job_id, status=JobStatus.CANCELLED.value,
+            message="任务已取消", lease_until=None
+        )
+
+    async def release(self, job_id: str) -> Optional[IngestionJob]:
+        """worker停止时归还未完成的任务，不计入尝试次数"""
+        return await asyncio.to_thread(self._release_sync, job_id)
+
+    async def cancel(self, job_id: str) -> Optional[IngestionJob]:
+        """取消任务"""
+        return await asyncio.to_thread(self._cancel_sync, job_id)
+
+    async def is_cancel_requested(self, job_id: str) -> bool:
+        """检查任务是否被请求取消"""
+        job = await self.get(job_id)
+        return bool(job and job.cancel_requested)
+
+    async def get(self, job_id: str) -> Optional[IngestionJob]:
+        """获取任务"""
+        jobs = await asyncio.to_thread(
+            self._query_sync, "SELECT * FROM ingestion_jobs WHERE id = ?", (job_id,)
+        )
+        return jobs[0] if jobs else None
+
+    async def get_latest_for_document(self, document_id: str) -> Optional[IngestionJob]:
+        """获取文档最近一次的任务"""
+        jobs = await asyncio.to_thread(
+            self._query_sync,
+            "SELECT * FROM ingestion_jobs WHERE document_id = ? ORDER BY created_at DESC LIMIT 1",
+            (document_id,)
+        )
+        return jobs[0] if jobs else None
+
+    async def get_latest_for_documents(self, document_ids: List[str]) -> Dict[str, IngestionJob]:
+        """批量获取多个文档最近一次的任务"""
+        latest: Dict[str, IngestionJob] = {}
+        for start in range(0, len(document_ids), ID_BATCH_SIZE):
+            batch = document_ids[start:start + ID_BATCH_SIZE]
+            placeholders = ",".join("?" for _ in batch)
+            jobs = await asyncio.to_thread(
+                self._query_sync,
+                f"""
+                SELECT * FROM ingestion_jobs
+                WHERE document_id IN ({placeholders})
+                ORDER BY created_at
+                """,
+                tuple(batch)
+            )
+            # 按创建时间升序遍历，后出现的覆盖先出现的（同一文档的任务都在同一批中）
+            latest.update((job.document_id, job) for job in jobs)
+        return latest
+
+    async def list_active(self, kind: str) -> List[IngestionJob]:
+        """指定类型尚未结束（排队或运行中）的全部任务，不受 list_jobs 的条数限制"""
+        return await asyncio.to_thread(
+            self._query_sync,
+            "SELECT * FROM ingestion_jobs WHERE kind = ? AND status IN (?, ?) ORDER BY created_at",
+            (kind, JobStatus.QUEUED.value, JobStatus.RUNNING.value)
+        )
+
+    async def list_jobs(self, status: Optional[JobStatus] = None, limit: int = 100) -> List[IngestionJob]:
+        """列出任务"""
+        if status:
+            return await asyncio.to_thread(
+                self._query_sync,
+                "SELECT * FROM ingestion_jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?",
+                (status.value, limit)
+            )
+        return await asyncio.to_thread(
+            self._query_sync, "SELECT * FROM ingestion_jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+        )
+
+    async def get_stats(self) -> Dict[str, int]:
+        """按状态统计任务数量"""
+        return await asyncio.to_thread(self._stats_sync)
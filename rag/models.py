@@ -2,7 +2,7 @@
 RAG模块的数据模型
 """
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from enum import Enum
@@ -13,6 +13,7 @@ class DocumentStatus(Enum):
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
 
 class DocumentType(Enum):
     """支持的文档类型"""
@@ -34,6 +35,9 @@ class DocumentInfo(BaseModel):
     process_time: Optional[datetime] = None
     error_message: Optional[str] = None
     chunk_count: Optional[int] = None
+    content_hash: Optional[str] = None  # 文件内容的SHA-256
+    version: int = 1
+    collection: str = "default"  # 所属集合
     metadata: Dict[str, Any] = {}
 
 class UploadResponse(BaseModel):
@@ -42,6 +46,8 @@ class UploadResponse(BaseModel):
     document_id: str
     message: str
     filename: str
+    job_id: Optional[str] = None
+    duplicate: bool = False  # 内容完全相同的文件已存在
 
 class ProcessingStatus(BaseModel):
     """处理状态响应"""
@@ -50,21 +56,109 @@ class ProcessingStatus(BaseModel):
     progress: int  # 0-100
     message: str
     chunk_count: Optional[int] = None
+    reused_chunks: Optional[int] = None  # 复用已有嵌入的块数
+    embedded_chunks: Optional[int] = None  # 重新生成嵌入的块数
 
 class QueryRequest(BaseModel):
     """查询请求"""
     query: str
     document_ids: Optional[List[str]] = None  # 指定文档范围
+    collection: str = "default"  # 查询的集合
     top_k: int = 5
     similarity_threshold: float = 0.7
+    include_content: bool = True  # 是否返回块内容
+    snippet_length: Optional[int] = Field(None, ge=1)  # 只返回块内容的前N个字符
+    include_metadata: bool = False  # 是否返回块的其他元数据
+
+class QueryResult(BaseModel):
+    """单条查询结果（块内容只出现一次，未请求的字段为空并在响应中省略）"""
+    chunk_id: str
+    document_id: str
+    document_name: str
+    chunk_index: int
+    similarity: float
+    content: Optional[str] = None
+    metadata: Optional[Dict[str, Any]] = None  # 不含 content / document_id / chunk_index
 
 class QueryResponse(BaseModel):
     """查询响应"""
     query: str
-    results: List[Dict[str, Any]]
+    results: List[QueryResult]
     total_results: int
     processing_time: float
 
+class CollectionConfig(BaseModel):
+    """集合配置"""
+    dimension: int = 768
+    chunk_size: int = 1000
+    overlap: int = 200
+    index_type: str = "flat"  # 索引类型
+    description: str = ""
+
+class CollectionInfo(BaseModel):
+    """集合信息"""
+    name: str
+    config: CollectionConfig
+    created_at: datetime
+
+class CollectionCreateRequest(BaseModel):
+    """创建集合请求"""
+    name: str
+    config: Optional[CollectionConfig] = None
+
+class JobStatus(Enum):
+    """摄取任务状态"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+class IngestionJob(BaseModel):
+    """摄取任务模型"""
+    id: str
+    kind: str
+    document_id: Optional[str] = None
+    payload: Dict[str, Any] = {}
+    priority: int = 0
+    status: JobStatus
+    attempts: int = 0
+    max_attempts: int = 3
+    progress: int = 0
+    message: str = ""
+    last_error: Optional[str] = None
+    cancel_requested: bool = False
+    result: Optional[Dict[str, Any]] = None
+    worker_id: Optional[str] = None
+    available_at: datetime
+    created_at: datetime
+    updated_at: datetime
+
+class BulkFileResult(BaseModel):
+    """批量导入中单个文件的结果"""
+    name: str
+    status: str  # completed / duplicate / skipped / failed
+    document_id: Optional[str] = None
+    file_size: int = 0
+    chunk_count: int = 0
+    error: Optional[str] = None
+
+class BulkIngestReport(BaseModel):
+    """批量导入汇总报告"""
+    source: str
+    total_files: int = 0
+    completed: int = 0
+    duplicates: int = 0
+    skipped: int = 0
+    failed: int = 0
+    total_bytes: int = 0
+    total_chunks: int = 0
+    elapsed_seconds: float = 0.0
+    files_per_second: float = 0.0
+    megabytes_per_second: float = 0.0
+    chunks_per_second: float = 0.0
+    files: List[BulkFileResult] = []
+
 class DocumentChunk(BaseModel):
     """文档块模型"""
     id: str
@@ -0,0 +1,45 @@
+"""
+快速JSON响应
+
+安装了 orjson 时用它序列化（直接输出UTF-8字节，原生支持 datetime / Enum / numpy），
+否则退回标准库 json。用于查询结果、文档列表、会话历史等较大的响应。
+"""
+
+import json
+from datetime import date, datetime
+from enum import Enum
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+def _default(value: Any) -> Any:
+    """orjson / json 无法直接序列化的对象"""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json", exclude_none=True)
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if hasattr(value, "tolist"):  # numpy 数组 / 标量
+        return value.tolist()
+    raise TypeError(f"无法序列化的类型: {type(value).__name__}")
+
+def dumps(content: Any) -> bytes:
+    """序列化为紧凑的UTF-8 JSON字节"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """使用 orjson（可用时）序列化的JSON响应"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -4,26 +4,47 @@ RAG检索模块
 
 import time
 from typing import List, Dict, Any, Optional
-from .models import QueryRequest, QueryResponse, DocumentInfo
+from .models import QueryRequest, QueryResponse, QueryResult, DocumentInfo
 from .vector import VectorStore
+from .stats import RAGStats
+
+# 已作为查询结果顶层字段返回的元数据键
+RESULT_FIELDS = {"content", "document_id", "chunk_index"}
 
 class RAGRetriever:
     """RAG检索器"""
     
-    def __init__(self, vector_store: VectorStore):
+    def __init__(self, vector_store: VectorStore, documents: Optional[Dict[str, DocumentInfo]] = None,
+                 stats: Optional[RAGStats] = None):
         self.vector_store = vector_store
-        self.documents = {}  # document_id -> DocumentInfo
+        self.documents = documents if documents is not None else {}  # document_id -> DocumentInfo
+        self.stats = stats or RAGStats()
+        self.generation = 1  # 当前索引代数，每次切换索引加一
+    
+    def swap_vector_store(self, vector_store: VectorStore) -> VectorStore:
+        """
+        原子切换到新一代向量存储。
+        
+        查询在开始时只读取一次 self.vector_store，因此正在执行的查询继续使用旧索引，
+        之后的查询全部使用新索引，不会看到构建到一半的索引。
+        """
+        old_store = self.vector_store
+        self.vector_store = vector_store
+        self.generation += 1
+        return old_store
     
     def add_document(self, doc_info: DocumentInfo):
         """添加文档信息"""
         self.documents[doc_info.id] = doc_info
+        self.stats.documents.update(doc_info.id, doc_info)
     
     async def query(self, request: QueryRequest) -> QueryResponse:
         """执行RAG查询"""
         start_time = time.time()
         
         # 执行向量搜索
-        search_results = await self.vector_store.search(
+        vector_store = self.vector_store
+        search_results = await vector_store.search(
             query=request.query,
             top_k=request.top_k,
             similarity_threshold=request.similarity_threshold
@@ -36,24 +57,32 @@ class RAGRetriever:
                 if result["metadata"]["document_id"] in request.document_ids
             ]
         
-        # 格式化结果
+        # 格式化结果（数据由本模块生成，无需再次校验）
         formatted_results = []
         for result in search_results:
-            doc_id = result["metadata"]["document_id"]
+            metadata = result["metadata"]
+            doc_id = metadata["document_id"]
             doc_info = self.documents.get(doc_id)
             
-            formatted_result = {
-                "chunk_id": result["chunk_id"],
-                "content": result["content"],
-                "similarity": result["similarity"],
-                "document_id": doc_id,
-                "document_name": doc_info.original_name if doc_info else "Unknown",
-                "chunk_index": result["metadata"]["chunk_index"],
-                "metadata": result["metadata"]
-            }
-            formatted_results.append(formatted_result)
+            content = None
+            if request.include_content:
+                content = result["content"]
+                if request.snippet_length:
+                    content = content[:request.snippet_length]
+            
+            formatted_results.append(QueryResult.model_construct(
+                chunk_id=result["chunk_id"],
+                document_id=doc_id,
+                document_name=doc_info.original_name if doc_info else "Unknown",
+                chunk_index=metadata["chunk_index"],
+                similarity=result["similarity"],
+                content=content,
+                metadata={key: value for key, value in metadata.items() if key not in RESULT_FIELDS}
+                if request.include_metadata else None
+            ))
         
         processing_time = time.time() - start_time
+        self.stats.record_query(processing_time)
         
         return QueryResponse(
             query=request.query,
@@ -62,42 +91,62 @@ class RAGRetriever:
             processing_time=processing_time
         )
     
-    async def get_document_chunks(self, document_id: str) -> List[Dict[str, Any]]:
-        """获取指定文档的所有块"""
-        chunks = []
-        for chunk_id, metadata in self.vector_store.metadata.items():
-            if metadata["document_id"] == document_id:
-                chunks.append({
-                    "chunk_id": chunk_id,
-                    "content": self.vector_store.chunks[chunk_id],
-                    "chunk_index": metadata["chunk_index"],
-                    "metadata": metadata
-                })
+    async def get_document_chunks(self, document_id: str, after_index: Optional[int] = None,
+                                  limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        按块索引顺序获取指定文档的块。
+        
+        Args:
+            document_id: 文档ID
+            after_index: 只返回块索引大于该值的块（键集分页游标）
+            limit: 最多返回的块数
+        """
+        vector_store = self.vector_store
+        # 先只按块索引排序和截取，最后再组装本页的块
+        indexed = [
+            (vector_store.metadata[chunk_id]["chunk_index"], chunk_id)
+            for chunk_id in vector_store.document_chunks.get(document_id, ())
+        ]
+        if after_index is not None:
+            indexed = [item for item in indexed if item[0] > after_index]
+        indexed.sort()
+        if limit is not None:
+            indexed = indexed[:limit]
         
-        # 按块索引排序
-        chunks.sort(key=lambda x: x["chunk_index"])
-        return chunks
+        return [
+            {
+                "chunk_id": chunk_id,
+                "content": vector_store.chunks[chunk_id],
+                "chunk_index": chunk_index,
+                "metadata": vector_store.metadata[chunk_id]
+            }
+            for chunk_index, chunk_id in indexed
+        ]
     
     async def delete_document(self, document_id: str):
         """删除文档"""
         await self.vector_store.delete_document(document_id)
         self.documents.pop(document_id, None)
+        self.stats.documents.update(document_id, None)
     
     async def get_stats(self) -> Dict[str, Any]:
         """获取检索器统计信息"""
         vector_stats = await self.vector_store.get_stats()
+        documents = self.stats.documents
         
+        # 只返回增量维护的汇总计数，文档明细通过 /rag/documents 分页获取
         return {
-            "total_documents": len(self.documents),
+            "index_generation": self.generation,
+            "total_documents": documents.total_documents,
+            "documents_by_status": dict(documents.by_status),
+            "documents_by_type": dict(documents.by_type),
+            "total_bytes": documents.total_bytes,
+            "indexed_documents": vector_stats["documents"],
             "total_chunks": vector_stats["total_chunks"],
+            "total_vectors": vector_stats["total_vectors"],
+            "tombstones": vector_stats["tombstones"],
+            "content_bytes": vector_stats["content_bytes"],
+            "index_memory_bytes": vector_stats["index_memory_bytes"],
             "vector_dimension": vector_stats["dimension"],
-            "documents": [
-                {
-                    "id": doc.id,
-                    "name": doc.original_name,
-                    "status": doc.status.value,
-                    "chunk_count": doc.chunk_count
-                }
-                for doc in self.documents.values()
-            ]
+            "rates": self.stats.rates()
         }
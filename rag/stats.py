@@ -0,0 +1,110 @@
+"""
+RAG统计计数器
+
+在文档增删、状态变化、摄取和查询时增量维护，读取统计信息为 O(1)，
+不再在每次请求时遍历全部文档或块。
+"""
+
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+from .models import DocumentInfo
+
+class RateCounter:
+    """滑动窗口速率计数器（按秒分桶）"""
+
+    def __init__(self, window: int = 60):
+        self.window = window
+        self.total = 0
+        self._buckets: deque = deque()  # [秒, 计数]
+
+    def add(self, count: int = 1):
+        now = int(time.time())
+        if self._buckets and self._buckets[-1][0] == now:
+            self._buckets[-1][1] += count
+        else:
+            self._buckets.append([now, count])
+        self.total += count
+        self._expire(now)
+
+    def _expire(self, now: int):
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            self._buckets.popleft()
+
+    def count(self) -> int:
+        """窗口内的计数"""
+        self._expire(int(time.time()))
+        return sum(bucket[1] for bucket in self._buckets)
+
+    def rate(self) -> float:
+        """窗口内的平均每秒速率"""
+        return self.count() / self.window
+
+class DocumentCounters:
+    """
+    文档计数：总数、按状态、按类型、总字节数。
+
+    记录每个文档上次计入的 (状态, 类型, 大小)，更新时先减去旧值再加上新值，
+    即使文档对象在别处被直接修改，下一次更新也能纠正计数。
+    """
+
+    def __init__(self):
+        self.total_documents = 0
+        self.total_bytes = 0
+        self.by_status: Dict[str, int] = {}
+        self.by_type: Dict[str, int] = {}
+        self._counted: Dict[str, Tuple[str, str, int]] = {}  # document_id -> 已计入的值
+
+    def update(self, document_id: str, doc_info: Optional[DocumentInfo]):
+        """文档新增、变化或删除（doc_info 为 None）后更新计数"""
+        previous = self._counted.pop(document_id, None)
+        if previous is not None:
+            self._apply(previous, -1)
+        if doc_info is not None:
+            current = (doc_info.status.value, doc_info.file_type.value, doc_info.file_size)
+            self._counted[document_id] = current
+            self._apply(current, 1)
+
+    def _apply(self, values: Tuple[str, str, int], sign: int):
+        status, file_type, file_size = values
+        self.total_documents += sign
+        self.total_bytes += sign * file_size
+        self.by_status[status] = self.by_status.get(status, 0) + sign
+        self.by_type[file_type] = self.by_type.get(file_type, 0) + sign
+        if not self.by_status[status]:
+            del self.by_status[status]
+        if not self.by_type[file_type]:
+            del self.by_type[file_type]
+
+class RAGStats:
+    """RAG系统统计：文档计数 + 摄取/查询速率"""
+
+    def __init__(self, window: int = 60, documents: Optional[DocumentCounters] = None):
+        self.documents = documents or DocumentCounters()
+        self.ingested_documents = RateCounter(window)
+        self.ingested_chunks = RateCounter(window)
+        self.queries = RateCounter(window)
+        self._query_time_total = 0.0
+
+    def record_ingest(self, chunk_count: int):
+        """记录一个文档完成摄取"""
+        self.ingested_documents.add(1)
+        self.ingested_chunks.add(chunk_count)
+
+    def record_query(self, elapsed: float):
+        """记录一次查询及其耗时（秒）"""
+        self.queries.add(1)
+        self._query_time_total += elapsed
+
+    def rates(self) -> Dict[str, Any]:
+        """摄取和查询速率"""
+        return {
+            "window_seconds": self.queries.window,
+            "ingested_documents_per_minute": round(self.ingested_documents.rate() * 60, 2),
+            "ingested_chunks_per_minute": round(self.ingested_chunks.rate() * 60, 2),
+            "queries_per_second": round(self.queries.rate(), 3),
+            "total_ingested_documents": self.ingested_documents.total,
+            "total_queries": self.queries.total,
+            "avg_query_ms": round(self._query_time_total / self.queries.total * 1000, 2) if self.queries.total else 0.0,
+        }
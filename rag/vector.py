@@ -1,119 +1,494 @@
 """
 向量存储模块
+
+查询与写入互不阻塞：向量保存在不可变的索引段（只读的 float32 矩阵 + 存活掩码）中，
+查询开始时取得当前已发布的段元组，在线程池中计算相似度；写入先在事件循环之外生成嵌入，
+再构建新段、以写时复制的方式更新旧段的存活掩码，最后一次性替换段元组完成发布。
+正在执行的查询始终看到某个完整发布的版本，不会看到写到一半的状态。
 """
 
+import asyncio
+import itertools
 import json
+import os
 import numpy as np
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterable, Optional, Sequence, Tuple
 from .models import DocumentChunk
 
+class IndexSegment:
+    """不可变的索引段"""
+
+    __slots__ = ("id", "chunk_ids", "vectors", "norms", "metadata", "live", "live_count")
+
+    def __init__(self, segment_id: int, chunk_ids: Tuple[str, ...], vectors: np.ndarray,
+                 metadata: Tuple[Dict[str, Any], ...], norms: Optional[np.ndarray] = None,
+                 live: Optional[np.ndarray] = None):
+        self.id = segment_id
+        self.chunk_ids = chunk_ids
+        self.vectors = vectors
+        self.norms = norms if norms is not None else np.linalg.norm(vectors, axis=1)
+        self.metadata = metadata
+        self.live = live if live is not None else np.ones(len(chunk_ids), dtype=bool)
+        for array in (self.vectors, self.norms, self.live):
+            array.setflags(write=False)
+        self.live_count = int(self.live.sum())
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    def without(self, rows: Sequence[int]) -> "IndexSegment":
+        """返回标记了已删除行的新段（共享向量矩阵，只复制存活掩码）"""
+        live = self.live.copy()
+        live[list(rows)] = False
+        return IndexSegment(self.id, self.chunk_ids, self.vectors, self.metadata, self.norms, live)
+
+    @staticmethod
+    def merge(segment_id: int, segments: Sequence["IndexSegment"]) -> "IndexSegment":
+        """合并多个段，只保留存活的行"""
+        rows = [np.nonzero(segment.live)[0] for segment in segments]
+        return IndexSegment(
+            segment_id,
+            tuple(segment.chunk_ids[i] for segment, keep in zip(segments, rows) for i in keep),
+            np.concatenate([segment.vectors[keep] for segment, keep in zip(segments, rows)]),
+            tuple(segment.metadata[i] for segment, keep in zip(segments, rows) for i in keep),
+            np.concatenate([segment.norms[keep] for segment, keep in zip(segments, rows)])
+        )
+
+    def similarities(self, query: np.ndarray, query_norm: float) -> np.ndarray:
+        """计算余弦相似度，已删除的行为 -inf，零向量为 0"""
+        denominator = self.norms * query_norm
+        similarities = np.divide(self.vectors @ query, denominator,
+                                 out=np.zeros(len(self), dtype=np.float32), where=denominator != 0)
+        similarities[~self.live] = -np.inf
+        return similarities
+
+def search_segments(segments: Sequence[IndexSegment], query_vector: Sequence[float], top_k: int,
+                    similarity_threshold: float) -> List[Dict[str, Any]]:
+    """在一组已发布的段中搜索（只读，可在线程中执行）"""
+    query = np.asarray(query_vector, dtype=np.float32)
+    query_norm = float(np.linalg.norm(query))
+
+    candidates = []
+    for segment in segments:
+        similarities = segment.similarities(query, query_norm)
+        rows = np.nonzero(similarities >= similarity_threshold)[0]
+        if len(rows) > top_k:
+            rows = rows[np.argpartition(-similarities[rows], top_k - 1)[:top_k]]
+        candidates.extend((float(similarities[row]), segment, row) for row in rows)
+
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+    return [
+        {
+            "chunk_id": segment.chunk_ids[row],
+            "similarity": similarity,
+            "content": segment.metadata[row]["content"],
+            "metadata": segment.metadata[row]
+        }
+        for similarity, segment, row in candidates[:top_k]
+    ]
+
 class VectorStore:
     """向量存储器"""
-    
+
     def __init__(self, dimension: int = 768):
         self.dimension = dimension
-        self.vectors = {}  # chunk_id -> vector
         self.metadata = {}  # chunk_id -> metadata
         self.chunks = {}  # chunk_id -> chunk_content
-    
+        self.document_chunks = {}  # document_id -> set(chunk_id)，只保留有块的文档
+        self.tombstones = set()  # 已删除但尚未压缩回收的chunk_id
+        self.content_bytes = 0  # 块内容的UTF-8字节数（增量维护，含墓碑块）
+
+        # 已发布的只读索引段，查询只读取这个元组，写入时整体替换
+        self.segments: Tuple[IndexSegment, ...] = ()
+        self._locations: Dict[str, Tuple[int, int]] = {}  # chunk_id -> (段ID, 行号)
+        self._segment_ids = itertools.count(1)
+        # 写入之间互斥（生成嵌入期间不阻塞查询）
+        self._write_lock = asyncio.Lock()
+
     async def add_chunks(self, chunks: List[DocumentChunk]):
-        """添加文档块到向量存储"""
-        for chunk in chunks:
-            # 生成向量嵌入
-            embedding = await self._generate_embedding(chunk.content)
-            
-            # 存储向量和元数据
-            self.vectors[chunk.id] = embedding
-            self.metadata[chunk.id] = {
-                "document_id": chunk.document_id,
-                "chunk_index": chunk.chunk_index,
-                "content": chunk.content,
-                **chunk.metadata
-            }
-            self.chunks[chunk.id] = chunk.content
-    
+        """添加文档块到向量存储（批量生成嵌入，可以跨多个文档）"""
+        if not chunks:
+            return
+
+        async with self._write_lock:
+            # 批量生成向量嵌入
+            embeddings = await self._generate_embeddings([chunk.content for chunk in chunks])
+            self._apply(list(zip(chunks, embeddings)))
+
+    def _put_chunk(self, chunk: DocumentChunk):
+        """存储块的元数据（向量由 _apply 写入新段）"""
+        self._remove_content(chunk.id)
+        self.content_bytes += len(chunk.content.encode("utf-8"))
+        self.metadata[chunk.id] = {
+            "document_id": chunk.document_id,
+            "chunk_index": chunk.chunk_index,
+            "content": chunk.content,
+            **chunk.metadata
+        }
+        self.chunks[chunk.id] = chunk.content
+        self.document_chunks.setdefault(chunk.document_id, set()).add(chunk.id)
+        self.tombstones.discard(chunk.id)
+
+    def _apply(self, puts: List[Tuple[DocumentChunk, Sequence[float]]],
+               tombstones: Iterable[str] = (), deletes: Iterable[str] = ()):
+        """
+        同步应用一次写入并发布新的段元组。
+
+        整个过程不让出事件循环，事件循环中的读取者看到的元数据与已发布的段始终一致。
+        """
+        tombstones, deletes = list(tombstones), list(deletes)
+        # 同一批中重复的块以最后一次为准
+        latest = {chunk.id: (chunk, vector) for chunk, vector in puts}
+        for chunk, _ in latest.values():
+            self._put_chunk(chunk)
+
+        for chunk_id in tombstones:
+            self.tombstones.add(chunk_id)
+        for chunk_id in deletes:
+            self._remove_content(chunk_id)
+            self.metadata.pop(chunk_id, None)
+            self.chunks.pop(chunk_id, None)
+            self.tombstones.discard(chunk_id)
+
+        # 被覆盖、墓碑化或删除的块在旧段中标记为已删除（写时复制存活掩码）
+        dead_rows: Dict[int, List[int]] = {}
+        for chunk_id in itertools.chain(latest.keys(), tombstones, deletes):
+            location = self._locations.pop(chunk_id, None)
+            if location is not None:
+                dead_rows.setdefault(location[0], []).append(location[1])
+
+        segments = []
+        for segment in self.segments:
+            if segment.id in dead_rows:
+                segment = segment.without(dead_rows[segment.id])
+            if segment.live_count:
+                segments.append(segment)
+
+        if latest:
+            chunk_ids = tuple(latest.keys())
+            vectors = np.asarray([vector for _, vector in latest.values()], dtype=np.float32)
+            segments.append(self._new_segment(
+                chunk_ids, vectors.reshape(len(chunk_ids), self.dimension),
+                tuple(self.metadata[chunk_id] for chunk_id in chunk_ids)
+            ))
+
+        self.segments = tuple(self._merge_segments(segments))
+
+    def _new_segment(self, chunk_ids: Tuple[str, ...], vectors: np.ndarray,
+                     metadata: Tuple[Dict[str, Any], ...]) -> IndexSegment:
+        segment = IndexSegment(next(self._segment_ids), chunk_ids, vectors, metadata)
+        self._locate(segment)
+        return segment
+
+    def _locate(self, segment: IndexSegment):
+        for row, chunk_id in enumerate(segment.chunk_ids):
+            if segment.live[row]:
+                self._locations[chunk_id] = (segment.id, row)
+
+    def _merge_segments(self, segments: List[IndexSegment]) -> List[IndexSegment]:
+        """
+        合并大小相近的相邻段（类似二进制计数器），段数保持在 O(log n)，
+        每个块被复制的次数也是 O(log n)；已删除行过半的段单独重写以回收空间。
+        """
+        segments = [
+            self._rewrite([segment]) if segment.live_count * 2 < len(segment) else segment
+            for segment in segments
+        ]
+        while len(segments) > 1 and segments[-2].live_count <= segments[-1].live_count:
+            segments[-2:] = [self._rewrite(segments[-2:])]
+        return segments
+
+    def _rewrite(self, segments: Sequence[IndexSegment]) -> IndexSegment:
+        merged = IndexSegment.merge(next(self._segment_ids), segments)
+        self._locate(merged)
+        return merged
+
+    async def upsert_document_chunks(self, document_id: str, chunks: List[DocumentChunk],
+                                     embedding_source: Optional["VectorStore"] = None) -> Dict[str, int]:
+        """
+        增量更新文档的块：内容未变化的块复用已有嵌入，只为变化的块生成嵌入，
+        新版本中不存在的旧块标记为墓碑。
+
+        Args:
+            document_id: 文档ID
+            chunks: 文档的全部新块
+            embedding_source: 额外的嵌入来源（重建索引时传入旧一代的向量存储）
+
+        Returns:
+            复用、重新嵌入和墓碑化的块数量
+        """
+        async with self._write_lock:
+            old_ids = self.document_chunks.get(document_id, set()) - self.tombstones
+
+            old_vectors = {}
+            if embedding_source is not None:
+                old_vectors.update(embedding_source.get_document_vectors(document_id))
+            old_vectors.update(self.get_document_vectors(document_id))
+
+            reused = 0
+            live_ids = set()
+            puts = []
+            to_embed = []
+            for chunk in chunks:
+                live_ids.add(chunk.id)
+                content_hash = chunk.metadata.get("content_hash")
+
+                # 同一位置内容未变化，无需写入
+                if chunk.id in old_ids and content_hash and self.metadata[chunk.id].get("content_hash") == content_hash:
+                    reused += 1
+                    continue
+
+                if content_hash in old_vectors:
+                    puts.append((chunk, old_vectors[content_hash]))
+                    reused += 1
+                else:
+                    to_embed.append(chunk)
+
+            # 只为变化的块批量生成嵌入；之后的修改一次性完成并发布
+            if to_embed:
+                embeddings = await self._generate_embeddings([chunk.content for chunk in to_embed])
+                puts.extend(zip(to_embed, embeddings))
+
+            removed_ids = old_ids - live_ids
+            self._apply(puts, tombstones=removed_ids)
+            if live_ids:
+                self.document_chunks[document_id] = live_ids
+            else:
+                self.document_chunks.pop(document_id, None)
+
+            if len(self.tombstones) > max(1000, len(self.metadata) // 4):
+                self.compact()
+
+        return {
+            "reused_chunks": reused,
+            "embedded_chunks": len(to_embed),
+            "tombstoned_chunks": len(removed_ids)
+        }
+
+    def _vector(self, chunk_id: str) -> Optional[np.ndarray]:
+        """获取块的向量（从已发布的段中读取）"""
+        location = self._locations.get(chunk_id)
+        if location is None:
+            return None
+        for segment in self.segments:
+            if segment.id == location[0]:
+                return segment.vectors[location[1]]
+        return None
+
+    def get_document_vectors(self, document_id: str) -> Dict[str, np.ndarray]:
+        """获取文档的 内容摘要 -> 向量 映射"""
+        vectors = {}
+        for chunk_id in self.document_chunks.get(document_id, set()) - self.tombstones:
+            content_hash = self.metadata[chunk_id].get("content_hash")
+            vector = self._vector(chunk_id)
+            if content_hash and vector is not None:
+                vectors[content_hash] = vector
+        return vectors
+
+    def compact(self) -> int:
+        """回收墓碑块占用的存储（墓碑块的向量在段合并时回收）"""
+        removed = 0
+        for chunk_id in self.tombstones:
+            if chunk_id in self.metadata:
+                self._remove_content(chunk_id)
+                self.metadata.pop(chunk_id, None)
+                self.chunks.pop(chunk_id, None)
+                removed += 1
+        self.tombstones.clear()
+        return removed
+
+    def _remove_content(self, chunk_id: str):
+        """从内容字节数中减去块的内容"""
+        content = self.chunks.get(chunk_id)
+        if content is not None:
+            self.content_bytes -= len(content.encode("utf-8"))
+
     async def _generate_embedding(self, text: str) -> List[float]:
         """生成文本嵌入向量"""
         # TODO: 实现真实的嵌入生成
         # 可以使用 sentence-transformers, OpenAI embeddings 等
-        
+
         # 这里返回随机向量作为示例
         return np.random.random(self.dimension).tolist()
-    
+
+    async def _generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """批量生成文本嵌入向量（默认逐条调用 _generate_embedding，支持批量接口的模型可以覆盖）"""
+        return [await self._generate_embedding(text) for text in texts]
+
     async def search(self, query: str, top_k: int = 5, similarity_threshold: float = 0.7) -> List[Dict[str, Any]]:
-        """搜索相似文档块"""
+        """搜索相似文档块（在线程中对当前已发布的段计算，不阻塞事件循环和写入）"""
+        # 只读取一次已发布的段，查询期间的写入不影响本次结果
+        segments = self.segments
+
         # 生成查询向量
         query_vector = await self._generate_embedding(query)
-        
-        # 计算相似度
-        similarities = []
-        for chunk_id, vector in self.vectors.items():
-            similarity = self._cosine_similarity(query_vector, vector)
-            if similarity >= similarity_threshold:
-                similarities.append({
-                    "chunk_id": chunk_id,
-                    "similarity": similarity,
-                    "content": self.chunks[chunk_id],
-                    "metadata": self.metadata[chunk_id]
-                })
-        
-        # 按相似度排序
-        similarities.sort(key=lambda x: x["similarity"], reverse=True)
-        
-        return similarities[:top_k]
-    
-    def _cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
-        """计算余弦相似度"""
-        vec1 = np.array(vec1)
-        vec2 = np.array(vec2)
-        
-        dot_product = np.dot(vec1, vec2)
-        norm1 = np.linalg.norm(vec1)
-        norm2 = np.linalg.norm(vec2)
-        
-        if norm1 == 0 or norm2 == 0:
-            return 0.0
-        
-        return dot_product / (norm1 * norm2)
-    
+        if not segments:
+            return []
+
+        return await asyncio.to_thread(search_segments, segments, query_vector, top_k, similarity_threshold)
+
     async def delete_document(self, document_id: str):
         """删除文档的所有向量"""
-        chunk_ids_to_delete = [
-            chunk_id for chunk_id, metadata in self.metadata.items()
-            if metadata["document_id"] == document_id
-        ]
-        
-        for chunk_id in chunk_ids_to_delete:
-            self.vectors.pop(chunk_id, None)
-            self.metadata.pop(chunk_id, None)
-            self.chunks.pop(chunk_id, None)
-    
+        async with self._write_lock:
+            chunk_ids_to_delete = self.document_chunks.pop(document_id, set())
+            self._apply([], deletes=chunk_ids_to_delete)
+
     async def get_stats(self) -> Dict[str, Any]:
-        """获取向量存储统计信息"""
+        """获取向量存储统计信息（均为增量维护的计数）"""
         return {
-            "total_chunks": len(self.vectors),
+            "total_chunks": len(self.metadata) - len(self.tombstones),
+            "total_vectors": sum(len(segment) for segment in self.segments),
             "dimension": self.dimension,
-            "documents": len(set(meta["document_id"] for meta in self.metadata.values()))
+            "documents": len(self.document_chunks),
+            "tombstones": len(self.tombstones),
+            "segments": len(self.segments),
+            "content_bytes": self.content_bytes,
+            # 段中 float32 向量矩阵的实际大小（含尚未回收的已删除行）
+            "index_memory_bytes": sum(segment.vectors.nbytes for segment in self.segments)
         }
-    
+
+    def _live_rows(self) -> Tuple[List[str], np.ndarray, List[Dict[str, Any]]]:
+        """已发布段中的全部存活行"""
+        segments = self.segments
+        merged = IndexSegment.merge(0, segments) if segments else None
+        if merged is None:
+            return [], np.zeros((0, self.dimension), dtype=np.float32), []
+        return list(merged.chunk_ids), merged.vectors, list(merged.metadata)
+
     async def save_to_file(self, filepath: str):
         """保存向量存储到文件"""
+        chunk_ids, matrix, metadata = self._live_rows()
         data = {
             "dimension": self.dimension,
-            "vectors": self.vectors,
-            "metadata": self.metadata,
-            "chunks": self.chunks
+            "vectors": dict(zip(chunk_ids, matrix.tolist())),
+            "metadata": dict(zip(chunk_ids, metadata)),
+            "chunks": {chunk_id: self.chunks[chunk_id] for chunk_id in chunk_ids},
+            "tombstones": []
         }
-        
+
         with open(filepath, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
-    
+
     async def load_from_file(self, filepath: str):
         """从文件加载向量存储"""
         with open(filepath, 'r', encoding='utf-8') as f:
             data = json.load(f)
-        
+
+        tombstones = set(data.get("tombstones", []))
+        chunk_ids = [chunk_id for chunk_id in data["vectors"] if chunk_id not in tombstones]
         self.dimension = data["dimension"]
-        self.vectors = data["vectors"]
-        self.metadata = data["metadata"]
-        self.chunks = data["chunks"]
+        self._load(
+            chunk_ids,
+            np.asarray([data["vectors"][chunk_id] for chunk_id in chunk_ids], dtype=np.float32),
+            [data["metadata"][chunk_id] for chunk_id in chunk_ids]
+        )
+
+    def _load(self, chunk_ids: List[str], matrix: np.ndarray, metadata: List[Dict[str, Any]]):
+        """用加载的数据替换全部内容，重建文档 -> 块索引、内容字节数和索引段"""
+        self.metadata = dict(zip(chunk_ids, metadata))
+        self.chunks = {chunk_id: item["content"] for chunk_id, item in self.metadata.items()}
+        self.tombstones = set()
+        self.document_chunks = {}
+        for chunk_id, item in self.metadata.items():
+            self.document_chunks.setdefault(item["document_id"], set()).add(chunk_id)
+        self.content_bytes = sum(len(content.encode("utf-8")) for content in self.chunks.values())
+
+        self._locations = {}
+        self.segments = ()
+        if chunk_ids:
+            matrix = matrix.reshape(len(chunk_ids), self.dimension)
+            self.segments = (self._new_segment(tuple(chunk_ids), matrix, tuple(metadata)),)
+
+    async def save_snapshot(self, filepath: str, extra: Optional[Dict[str, Any]] = None):
+        """
+        保存二进制快照：向量存为 float32 矩阵，其余数据存为JSON，写入临时文件后原子替换。
+        比 save_to_file 的JSON格式小得多，重启时可以在数秒内加载。
+
+        快照取自已发布的段（只读），写出期间不阻塞写入和查询；墓碑块不写入快照。
+        """
+        segments = self.segments
+
+        def build_and_write():
+            merged = IndexSegment.merge(0, segments) if segments else None
+            meta = {
+                "dimension": self.dimension,
+                "chunk_ids": list(merged.chunk_ids) if merged else [],
+                "metadata": list(merged.metadata) if merged else [],
+                "tombstones": [],
+                "extra": extra or {}
+            }
+            matrix = merged.vectors if merged else np.zeros((0, self.dimension), dtype=np.float32)
+            self._write_snapshot(filepath, matrix, meta)
+
+        await asyncio.to_thread(build_and_write)
+
+    async def save_documents(self, filepath: str, document_ids: List[str], extra: Optional[Dict[str, Any]] = None):
+        """
+        把指定文档的当前向量写成与快照格式相同的增量文件（extra["documents"] 中列出全部文档，
+        其中没有块的文档表示已删除），供其他进程通过 load_snapshot 读取后合并。
+        """
+        chunk_ids = [
+            chunk_id for document_id in document_ids
+            for chunk_id in sorted(self.document_chunks.get(document_id, set()) - self.tombstones)
+            if self._vector(chunk_id) is not None
+        ]
+        matrix = np.asarray([self._vector(chunk_id) for chunk_id in chunk_ids], dtype=np.float32)
+        meta = {
+            "dimension": self.dimension,
+            "chunk_ids": chunk_ids,
+            "metadata": [self.metadata[chunk_id] for chunk_id in chunk_ids],
+            "tombstones": [],
+            "extra": {**(extra or {}), "documents": list(document_ids)}
+        }
+        await asyncio.to_thread(
+            self._write_snapshot, filepath, matrix.reshape(len(chunk_ids), self.dimension), meta
+        )
+
+    def get_document_chunk_list(self, document_id: str) -> List[DocumentChunk]:
+        """由存储的元数据还原文档的块（不含向量），按块索引排序"""
+        chunks = []
+        for chunk_id in self.document_chunks.get(document_id, set()) - self.tombstones:
+            metadata = dict(self.metadata[chunk_id])
+            chunks.append(DocumentChunk(
+                id=chunk_id,
+                document_id=metadata.pop("document_id"),
+                content=metadata.pop("content"),
+                chunk_index=metadata.pop("chunk_index"),
+                metadata=metadata
+            ))
+        return sorted(chunks, key=lambda chunk: chunk.chunk_index)
+
+    @staticmethod
+    def _write_snapshot(filepath: str, matrix: np.ndarray, meta: Dict[str, Any]):
+        directory = os.path.dirname(filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{filepath}.tmp"
+        meta_bytes = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, vectors=matrix, meta=np.frombuffer(meta_bytes, dtype=np.uint8))
+        os.replace(tmp_path, filepath)
+
+    async def load_snapshot(self, filepath: str) -> Dict[str, Any]:
+        """加载快照（兼容 save_to_file 写出的JSON文件），返回保存时附带的额外信息"""
+        if filepath.endswith(".json"):
+            await self.load_from_file(filepath)
+            return {}
+
+        matrix, meta = await asyncio.to_thread(self._read_snapshot, filepath)
+        tombstones = set(meta["tombstones"])
+        keep = [row for row, chunk_id in enumerate(meta["chunk_ids"]) if chunk_id not in tombstones]
+        self.dimension = meta["dimension"]
+        self._load(
+            [meta["chunk_ids"][row] for row in keep],
+            matrix[keep].astype(np.float32, copy=False),
+            [meta["metadata"][row] for row in keep]
+        )
+        return meta.get("extra", {})
+
+    @staticmethod
+    def _read_snapshot(filepath: str):
+        with np.load(filepath, allow_pickle=False) as data:
+            matrix = data["vectors"]
+            meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+        return matrix, meta
@@ -0,0 +1,175 @@
+"""
+摄取任务工作池
+
+从持久化任务队列领取任务并以有限并发执行。既可以嵌入在API进程中运行，
+也可以通过 `python -m rag.worker` 作为独立进程运行，使摄取与API独立扩容。
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import uuid
+from typing import Awaitable, Callable, Dict, Optional, Any
+
+from .jobs import JobQueue
+from .models import IngestionJob
+
+JobHandler = Callable[[IngestionJob], Awaitable[Optional[Dict[str, Any]]]]
+
+class IngestionWorkerPool:
+    """摄取任务工作池"""
+
+    def __init__(self,
+                 queue: JobQueue,
+                 handlers: Dict[str, JobHandler],
+                 concurrency: int = 2,
+                 poll_interval: float = 1.0,
+                 cancel_check_interval: float = 2.0):
+        self.queue = queue
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.cancel_check_interval = cancel_check_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._workers: list = []
+        self._running: Dict[str, asyncio.Task] = {}  # job_id -> 执行中的任务
+        self._running_documents: Dict[str, str] = {}  # job_id -> document_id
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+    async def start(self):
+        """启动工作协程"""
+        self._stopping = False
+        self._workers = [
+            asyncio.create_task(self._worker_loop(index))
+            for index in range(self.concurrency)
+        ]
+        print(f"👷 摄取工作池已启动: {self.worker_id}，并发数 {self.concurrency}")
+
+    async def stop(self):
+        """停止工作池，未完成的任务归还队列"""
+        self._stopping = True
+        self._wakeup.set()
+        for task in self._running.values():
+            task.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        print(f"👷 摄取工作池已停止: {self.worker_id}")
+
+    def notify(self):
+        """有新任务时唤醒空闲的worker"""
+        self._wakeup.set()
+
+    def running_document_ids(self) -> set:
+        """本进程中正在处理的文档"""
+        return set(self._running_documents.values())
+
+    async def cancel_job(self, job_id: str) -> Optional[IngestionJob]:
+        """取消任务；本进程内运行中的任务会被立即中断"""
+        job = await self.queue.cancel(job_id)
+        task = self._running.get(job_id)
+        if task:
+            task.cancel()
+        return job
+
+    async def _worker_loop(self, index: int):
+        """单个worker的循环"""
+        kinds = list(self.handlers.keys())
+        while not self._stopping:
+            try:
+                job = await self.queue.claim(f"{self.worker_id}#{index}", kinds)
+            except Exception as e:
+                print(f"⚠️ 领取任务失败: {e}")
+                job = None
+
+            if not job:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._run_job(job)
+
+    async def _run_job(self, job: IngestionJob):
+        """执行任务并处理取消、重试"""
+        handler = self.handlers[job.kind]
+        task = asyncio.create_task(handler(job))
+        self._running[job.id] = task
+        if job.document_id:
+            self._running_documents[job.id] = job.document_id
+
+        try:
+            # 定期检查跨进程的取消请求
+            while not task.done():
+                done, _ = await asyncio.wait({task}, timeout=self.cancel_check_interval)
+                if not done and await self.queue.is_cancel_requested(job.id):
+                    task.cancel()
+
+            result = task.result()
+            await self.queue.complete(job.id, result)
+
+        except asyncio.CancelledError:
+            if self._stopping:
+                await self.queue.release(job.id)
+                raise
+            await self.queue.mark_cancelled(job.id)
+            print(f"🛑 任务已取消: {job.id}")
+
+        except Exception as e:
+            updated = await self.queue.fail(job.id, str(e))
+            if updated:
+                print(f"❌ 任务 {job.id} 第 {updated.attempts} 次执行失败（{updated.status.value}）: {e}")
+
+        finally:
+            self._running.pop(job.id, None)
+            self._running_documents.pop(job.id, None)
+
+async def run_worker(concurrency: int):
+    """以独立进程方式运行摄取worker"""
+    # 延迟导入，避免与API模块循环依赖
+    from .api import job_queue, job_handlers, catalog, collections, warm_start, IN_PROCESS_JOB_KINDS
+    from .catalog import close_shared_pool
+    from .config import RAG_CONFIG
+
+    # 向量只能通过集合目录下的增量文件交给API进程，没有集合目录时处理结果无法被查询
+    if not collections.snapshot_dir:
+        raise SystemExit("❌ 独立worker需要配置 RAG_COLLECTIONS_DIR（与API进程共享），用于发布处理好的向量")
+
+    # 快照由API进程写出；独立worker只读取快照，处理结果发布为增量文件由API进程合并
+    collections.write_snapshots = False
+    collections.publish_deltas = True
+    await warm_start()
+    handlers = {kind: handler for kind, handler in job_handlers.items() if kind not in IN_PROCESS_JOB_KINDS}
+    pool = IngestionWorkerPool(job_queue, handlers, concurrency=concurrency)
+    await pool.start()
+    try:
+        # 空闲的集合直接卸载，下次使用时重新读取API进程写出的最新快照
+        while True:
+            await asyncio.sleep(RAG_CONFIG["snapshot_interval"])
+            await collections.evict_idle()
+    finally:
+        await pool.stop()
+        await catalog.close()
+        await close_shared_pool()
+
+def main():
+    """命令行入口"""
+    from .config import RAG_CONFIG
+
+    parser = argparse.ArgumentParser(description="RAG文档摄取worker")
+    parser.add_argument("--concurrency", type=int, default=max(RAG_CONFIG["inprocess_workers"], 1),
+                        help="并发处理的任务数")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run_worker(args.concurrency))
+    except KeyboardInterrupt:
+        print("\n👋 摄取worker已停止")
+
+if __name__ == "__main__":
+    main()
@@ -13,12 +13,101 @@ class RAGUploadManager {
         
         this.uploadingFiles = new Map(); // 跟踪上传中的文件
         this.documents = new Map(); // 存储文档信息
+        this.pendingStatuses = new Map(); // 上传响应返回前先到达的状态事件
+        this.clientId = this.generateClientId(); // 本页面的订阅标识
+        this.eventSource = null;
+        this.pollTimer = null;
+        this.reloadTimer = null;
+        this.documentsCursor = null; // 文档列表下一页的游标
+        this.documentPageSize = 50;
         
         this.initEventListeners();
         this.loadDocuments();
         
-        // 定期更新进度
-        setInterval(() => this.updateProgress(), 2000);
+        // 订阅服务器推送的处理进度
+        this.connectEvents();
+    }
+
+    generateClientId() {
+        if (window.crypto && window.crypto.randomUUID) {
+            return window.crypto.randomUUID();
+        }
+        return 'client_' + Date.now() + '_' + Math.random().toString(36).substr(2, 9);
+    }
+
+    connectEvents() {
+        // 不支持EventSource的浏览器退回到轮询
+        if (!window.EventSource) {
+            this.startPolling();
+            return;
+        }
+
+        this.eventSource = new EventSource(`/rag/events?client_id=${encodeURIComponent(this.clientId)}`);
+
+        this.eventSource.addEventListener('status', (e) => {
+            this.handleStatusEvent(JSON.parse(e.data));
+        });
+
+        this.eventSource.addEventListener('open', () => {
+            this.stopPolling();
+        });
+
+        this.eventSource.addEventListener('error', () => {
+            // EventSource会自动重连；连接断开期间临时轮询
+            if (this.eventSource.readyState !== EventSource.OPEN) {
+                this.startPolling();
+            }
+        });
+    }
+
+    startPolling() {
+        if (!this.pollTimer) {
+            this.pollTimer = setInterval(() => this.updateProgress(), 2000);
+        }
+    }
+
+    stopPolling() {
+        if (this.pollTimer) {
+            clearInterval(this.pollTimer);
+            this.pollTimer = null;
+        }
+    }
+
+    handleStatusEvent(status) {
+        const fileInfo = this.uploadingFiles.get(status.document_id);
+        if (!fileInfo) {
+            // 上传请求尚未返回，暂存最新状态
+            this.pendingStatuses.set(status.document_id, status);
+            return;
+        }
+        this.applyStatus(status.document_id, fileInfo, status);
+    }
+
+    applyStatus(documentId, fileInfo, status) {
+        this.updateProgressItem(
+            fileInfo.progressId,
+            status.status,
+            status.progress,
+            status.message
+        );
+
+        // 如果处理完成、失败或取消，从跟踪列表中移除
+        if (['completed', 'failed', 'cancelled'].includes(status.status)) {
+            this.uploadingFiles.delete(documentId);
+            
+            // 3秒后移除进度条
+            setTimeout(() => {
+                this.removeProgressItem(fileInfo.progressId);
+            }, 3000);
+
+            // 重新加载文档列表（合并短时间内的多次完成事件）
+            this.scheduleReload();
+        }
+    }
+
+    scheduleReload() {
+        clearTimeout(this.reloadTimer);
+        this.reloadTimer = setTimeout(() => this.loadDocuments(), 500);
     }
 
     initEventListeners() {
@@ -94,7 +183,7 @@ class RAGUploadManager {
             // 显示上传进度
             const progressId = this.addProgressItem(file.name, 'uploading', 0);
             
-            const response = await fetch('/rag/upload', {
+            const response = await fetch(`/rag/upload?client_id=${encodeURIComponent(this.clientId)}`, {
                 method: 'POST',
                 body: formData
             });
@@ -105,15 +194,28 @@ class RAGUploadManager {
 
             const result = await response.json();
             
-            if (result.success) {
+            if (result.success && result.duplicate && !result.job_id) {
+                // 内容相同的文件已处理过
+                this.updateProgressItem(progressId, 'completed', 100, result.message);
+                setTimeout(() => this.removeProgressItem(progressId), 3000);
+                this.showSuccess(`文件 ${file.name} 已存在`);
+            } else if (result.success) {
                 // 更新进度状态
                 this.updateProgressItem(progressId, 'processing', 10, '文件上传成功，正在处理...');
                 
                 // 跟踪文档ID
-                this.uploadingFiles.set(result.document_id, {
+                const fileInfo = {
                     progressId: progressId,
                     filename: file.name
-                });
+                };
+                this.uploadingFiles.set(result.document_id, fileInfo);
+
+                // 应用上传响应返回前已推送的状态
+                const pending = this.pendingStatuses.get(result.document_id);
+                if (pending) {
+                    this.pendingStatuses.delete(result.document_id);
+                    this.applyStatus(result.document_id, fileInfo, pending);
+                }
 
                 this.showSuccess(`文件 ${file.name} 上传成功`);
             } else {
@@ -172,37 +274,20 @@ class RAGUploadManager {
             'uploading': '上传中',
             'processing': '处理中',
             'completed': '完成',
-            'failed': '失败'
+            'failed': '失败',
+            'cancelled': '已取消'
         };
         return statusMap[status] || status;
     }
 
     async updateProgress() {
+        // 兼容模式：事件推送不可用时逐个轮询处理状态
         for (let [documentId, fileInfo] of this.uploadingFiles) {
             try {
                 const response = await fetch(`/rag/status/${documentId}`);
                 if (response.ok) {
                     const status = await response.json();
-                    
-                    this.updateProgressItem(
-                        fileInfo.progressId,
-                        status.status,
-                        status.progress,
-                        status.message
-                    );
-
-                    // 如果处理完成或失败，从跟踪列表中移除
-                    if (status.status === 'completed' || status.status === 'failed') {
-                        this.uploadingFiles.delete(documentId);
-                        
-                        // 3秒后移除进度条
-                        setTimeout(() => {
-                            this.removeProgressItem(fileInfo.progressId);
-                        }, 3000);
-
-                        // 重新加载文档列表
-                        this.loadDocuments();
-                    }
+                    this.applyStatus(documentId, fileInfo, status);
                 }
             } catch (error) {
                 console.error('更新进度失败:', error);
@@ -210,22 +295,37 @@ class RAGUploadManager {
         }
     }
 
-    async loadDocuments() {
+    async loadDocuments(append = false) {
         try {
-            const response = await fetch('/rag/documents');
+            const params = new URLSearchParams({
+                limit: this.documentPageSize,
+                fields: 'id,filename,file_size,file_type,status,upload_time,chunk_count,error_message'
+            });
+            if (append && this.documentsCursor) {
+                params.set('cursor', this.documentsCursor);
+            }
+            
+            const response = await fetch(`/rag/documents?${params}`);
             if (response.ok) {
                 const data = await response.json();
-                this.displayDocuments(data.documents);
+                this.documentsCursor = data.next_cursor;
+                this.displayDocuments(data.documents, append);
             }
         } catch (error) {
             console.error('加载文档列表失败:', error);
         }
     }
 
-    displayDocuments(documents) {
-        this.documentList.innerHTML = '';
+    displayDocuments(documents, append = false) {
+        if (!append) {
+            this.documentList.innerHTML = '';
+        }
+        const loadMore = this.documentList.querySelector('.load-more');
+        if (loadMore) {
+            loadMore.remove();
+        }
         
-        if (documents.length === 0) {
+        if (documents.length === 0 && !append) {
             this.documentList.innerHTML = '<p style="text-align: center; color: #666;">暂无文档</p>';
             return;
         }
@@ -253,6 +353,15 @@ class RAGUploadManager {
             `;
             this.documentList.insertAdjacentHTML('beforeend', docHTML);
         });
+        
+        // 还有更多文档时显示"加载更多"
+        if (this.documentsCursor) {
+            this.documentList.insertAdjacentHTML('beforeend', `
+                <div class="load-more" style="text-align: center; margin-top: 10px;">
+                    <button class="btn" onclick="ragManager.loadDocuments(true)">加载更多</button>
+                </div>
+            `);
+        }
     }
 
     async deleteDocument(documentId) {
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+会话存储后端基准：比较 SQLite（WAL）与 MySQL 后端的单条写入、批量写入和最近消息读取延迟
+
+直接调用存储后端（不经过最近消息缓存）；MySQL 无法连接时只测 SQLite，
+测试数据写入以 bench- 开头的会话并在结束后删除
+"""
+
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+from database import ConversationStore, DatabasePool, MySQLConversationStore, SQLiteConversationStore, DB_CONFIG
+
+CONVERSATIONS = 20
+MESSAGES = 50
+BATCH = 50
+
+def report(name: str, latencies: list):
+    latencies = sorted(latency * 1000 for latency in latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"  {name:<10} {len(latencies):5d} 次  p50 {statistics.median(latencies):7.3f} ms  "
+          f"p95 {p95:7.3f} ms  max {latencies[-1]:7.3f} ms")
+
+async def timed(latencies: list, coro):
+    started = time.perf_counter()
+    result = await coro
+    latencies.append(time.perf_counter() - started)
+    return result
+
+async def bench(store: ConversationStore):
+    """单条追加、批量追加、读取最近20条"""
+    await store.init()
+    conversation_ids = [f"bench-{uuid.uuid4().hex[:8]}" for _ in range(CONVERSATIONS)]
+    appends, batches, reads = [], [], []
+
+    async def append_conversation(conversation_id: str):
+        for index in range(1, MESSAGES + 1):
+            await timed(appends, store.insert_messages([(conversation_id, "user", f"消息{index} " * 20, index)]))
+            await timed(reads, store.fetch_messages(conversation_id, 20))
+
+    await asyncio.gather(*(append_conversation(conversation_id) for conversation_id in conversation_ids))
+    for conversation_id in conversation_ids:
+        rows = [(conversation_id, "assistant", "批量回复 " * 20, index)
+                for index in range(MESSAGES + 1, MESSAGES + BATCH + 1)]
+        await timed(batches, store.insert_messages(rows))
+
+    print(f"\n{store.name}: {CONVERSATIONS} 个会话并发，每个 {MESSAGES} 条单条写入 + 1 批 {BATCH} 条")
+    report("append", appends)
+    report("batch", batches)
+    report("recent20", reads)
+    print(f"  指标: {store.get_metrics()}")
+
+    for conversation_id in conversation_ids:
+        await store.delete_conversation(conversation_id)
+    await store.close()
+
+async def test_store_latency():
+    """各后端的写入和读取延迟"""
+    with tempfile.TemporaryDirectory() as directory:
+        await bench(SQLiteConversationStore(os.path.join(directory, "conversations.db")))
+
+    mysql = MySQLConversationStore(DatabasePool(**DB_CONFIG, health_check_interval=0))
+    try:
+        await mysql.init()
+    except Exception as e:
+        print(f"\n⏭️ 跳过 MySQL 后端（无法连接: {e}）")
+    else:
+        await bench(mysql)
+
+async def main():
+    """主测试函数"""
+    print("🚀 开始会话存储后端基准...")
+    await test_store_latency()
+    print("\n✅ 会话存储后端基准完成！")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+查询响应序列化基准：top_k=50 时比较旧格式（块内容重复出现在 metadata 中、标准库编码）
+与精简结果模型 + 快速JSON响应的字节数和编码耗时
+"""
+
+import asyncio
+import time
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from rag.models import DocumentChunk, DocumentInfo, DocumentStatus, DocumentType, QueryRequest
+from rag.responses import FastJSONResponse, orjson
+from rag.retrieval import RAGRetriever
+from rag.vector import VectorStore
+
+TOP_K = 50
+CHUNK_SIZE = 1000
+ROUNDS = 200
+
+async def build_retriever() -> RAGRetriever:
+    """构建含200个1000字符块的检索器"""
+    store = VectorStore(dimension=64)
+    chunks = [
+        DocumentChunk(
+            id=f"doc{i % 10}_chunk_{i}",
+            document_id=f"doc{i % 10}",
+            content=("检索增强生成的示例文本。" * 100)[:CHUNK_SIZE],
+            chunk_index=i,
+            metadata={"content_hash": f"{i:064x}", "start_pos": i * CHUNK_SIZE, "end_pos": (i + 1) * CHUNK_SIZE}
+        )
+        for i in range(200)
+    ]
+    await store.add_chunks(chunks)
+    documents = {
+        f"doc{i}": DocumentInfo(id=f"doc{i}", filename=f"doc{i}.txt", original_name=f"文档{i}.txt",
+                                file_type=DocumentType.TXT, file_size=CHUNK_SIZE * 20, upload_time=time.time(),
+                                status=DocumentStatus.COMPLETED)
+        for i in range(10)
+    }
+    return RAGRetriever(store, documents=documents)
+
+def legacy_payload(response) -> dict:
+    """旧格式：每条结果带 content，metadata 中再带一份 content"""
+    return {
+        "query": response.query,
+        "results": [
+            {
+                "chunk_id": result.chunk_id,
+                "content": result.content,
+                "similarity": result.similarity,
+                "document_id": result.document_id,
+                "document_name": result.document_name,
+                "chunk_index": result.chunk_index,
+                "metadata": {"document_id": result.document_id, "chunk_index": result.chunk_index,
+                             "content": result.content, **result.metadata}
+            }
+            for result in response.results
+        ],
+        "total_results": response.total_results,
+        "processing_time": response.processing_time
+    }
+
+def measure(name: str, encode):
+    """多次编码取平均耗时"""
+    body = encode()
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        encode()
+    elapsed = (time.perf_counter() - started) / ROUNDS * 1000
+    print(f"{name:<40} {len(body):>9,} 字节  {elapsed:7.3f} ms/次")
+    return len(body), elapsed
+
+async def test_query_serialization():
+    """序列化基准"""
+    retriever = await build_retriever()
+    query = dict(query="示例", top_k=TOP_K, similarity_threshold=-1.0)
+
+    full = await retriever.query(QueryRequest(**query, include_metadata=True))
+    legacy = legacy_payload(full)
+    print(f"top_k={TOP_K}，块大小 {CHUNK_SIZE} 字符，orjson: {'可用' if orjson else '不可用（使用标准库json）'}\n")
+
+    baseline, _ = measure("旧格式 + JSONResponse(jsonable_encoder)",
+                          lambda: JSONResponse(jsonable_encoder(legacy)).body)
+    measure("旧格式 + FastJSONResponse", lambda: FastJSONResponse(legacy).body)
+
+    for label, options in [
+        ("精简结果（含内容）", {}),
+        ("精简结果 + 元数据", {"include_metadata": True}),
+        ("精简结果 + 200字摘要", {"snippet_length": 200}),
+        ("精简结果（不含内容）", {"include_content": False}),
+    ]:
+        response = await retriever.query(QueryRequest(**query, **options))
+        size, _ = measure(f"{label} + FastJSONResponse", lambda: FastJSONResponse(response).body)
+        assert size < baseline
+
+async def main():
+    """主测试函数"""
+    print("🚀 开始查询响应序列化基准...")
+    await test_query_serialization()
+    print("\n✅ 查询响应序列化基准完成！")
+
+if __name__ == "__main__":
+    asyncio.run(main())
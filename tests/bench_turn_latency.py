@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+对话轮次写入延迟基准：比较 strict 与 buffered 两种写入模式下，
+一轮对话（保存用户消息 + 保存AI回复）在响应路径上等待数据库的时间
+
+需要可连接的MySQL（database/config.py 的配置），测试数据写入以 bench- 开头的会话并在结束后删除
+"""
+
+import asyncio
+import statistics
+import time
+import uuid
+
+from database import ConversationDatabase, db_pool, message_buffer
+
+CONVERSATIONS = 20
+TURNS = 10
+
+async def run_turns(db: ConversationDatabase, conversation_id: str, latencies: list):
+    """模拟一个会话的多轮对话，只计时保存消息的部分"""
+    for turn in range(TURNS):
+        started = time.perf_counter()
+        await db.save_message(conversation_id, "user", f"第{turn}轮问题")
+        user_saved = time.perf_counter()
+        await asyncio.sleep(0)  # 模型生成回复
+        reply_started = time.perf_counter()
+        await db.save_message(conversation_id, "assistant", f"第{turn}轮回答 " * 20)
+        latencies.append((user_saved - started) + (time.perf_counter() - reply_started))
+
+async def measure(durability: str) -> list:
+    """并发运行多个会话，返回每轮的写入耗时，并校验落库后的顺序"""
+    db = ConversationDatabase(durability=durability)
+    conversation_ids = [f"bench-{durability}-{uuid.uuid4().hex[:8]}" for _ in range(CONVERSATIONS)]
+    latencies = []
+
+    await asyncio.gather(*(run_turns(db, conversation_id, latencies) for conversation_id in conversation_ids))
+    for conversation_id in conversation_ids:
+        messages = await db.get_recent_messages(conversation_id, limit=TURNS * 2)
+        assert [m["message_index"] for m in messages] == list(range(1, TURNS * 2 + 1))
+        assert [m["role"] for m in messages] == ["user", "assistant"] * TURNS
+        await db.delete_conversation(conversation_id)
+    return latencies
+
+def report(name: str, latencies: list):
+    latencies = sorted(latency * 1000 for latency in latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:<10} {len(latencies)} 轮  p50 {statistics.median(latencies):7.3f} ms  "
+          f"p95 {p95:7.3f} ms  max {latencies[-1]:7.3f} ms")
+
+async def test_turn_latency():
+    """strict 与 buffered 模式的轮次写入延迟"""
+    await ConversationDatabase().init_database()
+    print(f"{CONVERSATIONS} 个会话并发，每个 {TURNS} 轮\n")
+    for durability in ("strict", "buffered"):
+        report(durability, await measure(durability))
+    print(f"\n写缓冲: {message_buffer.get_stats()}")
+    print(f"连接池: {db_pool.get_metrics()}")
+
+async def main():
+    """主测试函数"""
+    print("🚀 开始轮次写入延迟基准...")
+    try:
+        await test_turn_latency()
+    finally:
+        await message_buffer.close()
+        await db_pool.close()
+    print("\n✅ 轮次写入延迟基准完成！")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+会话存储后端一致性测试：同一组用例分别在 SQLite 和 MySQL 后端上运行
+
+SQLite 使用临时文件；MySQL 使用 database/config.py 的配置，无法连接时跳过，
+测试数据写入以 conformance- 开头的会话并在结束后删除
+"""
+
+import asyncio
+import os
+import tempfile
+import uuid
+
+from database import (ConversationDatabase, ConversationStore, DatabasePool, DuplicateMessageError,
+                      MySQLConversationStore, SQLiteConversationStore, DB_CONFIG)
+
+def new_conversation_id() -> str:
+    return f"conformance-{uuid.uuid4().hex[:8]}"
+
+async def check_append_and_read(db: ConversationDatabase):
+    """写入后按序号正序读取，序号从1连续递增"""
+    conversation_id = new_conversation_id()
+    for i in range(5):
+        index = await db.save_message(conversation_id, "user" if i % 2 == 0 else "assistant", f"消息{i}")
+        assert index == i + 1
+
+    # 绕过最近消息缓存，直接读存储
+    messages = await db.store.fetch_messages(conversation_id, 3)
+    assert [m["message_index"] for m in messages] == [3, 4, 5]
+    assert [m["content"] for m in messages] == ["消息2", "消息3", "消息4"]
+    assert all(m["timestamp"] for m in messages)
+    assert await db.store.load_max_index(conversation_id) == 5
+
+    # 新实例（空缓存、空序号）续写
+    fresh = ConversationDatabase(store=db.store)
+    assert await fresh.save_message(conversation_id, "user", "续写") == 6
+    recent = await fresh.get_recent_messages(conversation_id, limit=10)
+    assert [m["message_index"] for m in recent] == [1, 2, 3, 4, 5, 6]
+    await db.delete_conversation(conversation_id)
+
+async def check_duplicate_index(db: ConversationDatabase):
+    """序号冲突整批回滚并抛出 DuplicateMessageError；insert_message 重新分配序号"""
+    conversation_id = new_conversation_id()
+    await db.save_message(conversation_id, "user", "第一条")
+    try:
+        await db.store.insert_messages([
+            (conversation_id, "assistant", "新消息", 2),
+            (conversation_id, "assistant", "重复", 1),
+        ])
+        raise AssertionError("重复序号应当失败")
+    except DuplicateMessageError:
+        pass
+    assert await db.store.load_max_index(conversation_id) == 1
+    summary = await db.get_conversation_summary(conversation_id)
+    assert summary["total_messages"] == 1
+
+    # 另一个进程（独立的序号分配器）写入同一会话
+    other = ConversationDatabase(store=db.store)
+    await other.save_message(conversation_id, "assistant", "其他进程")
+    assert await db.save_message(conversation_id, "user", "冲突后重试") == 3
+    await db.delete_conversation(conversation_id)
+
+async def check_pages_and_export(db: ConversationDatabase):
+    """键集分页和流式导出"""
+    conversation_id = new_conversation_id()
+    await db.store.insert_messages([(conversation_id, "user", f"消息{i}", i) for i in range(1, 26)])
+
+    page = await db.get_messages_page(conversation_id, limit=10)
+    assert page["oldest_index"] == 16 and page["has_older"] and not page["has_newer"]
+    page = await db.get_messages_page(conversation_id, limit=10, before=page["oldest_index"])
+    assert [m["message_index"] for m in page["messages"]] == list(range(6, 16)) and page["has_older"]
+    page = await db.get_messages_page(conversation_id, limit=10, before=page["oldest_index"])
+    assert page["oldest_index"] == 1 and not page["has_older"]
+    page = await db.get_messages_page(conversation_id, limit=10, after=20)
+    assert [m["message_index"] for m in page["messages"]] == list(range(21, 26)) and not page["has_newer"]
+
+    exported = []
+    async for batch in db.iter_messages(conversation_id, batch_size=7):
+        assert len(batch) <= 7
+        exported.extend(m["message_index"] for m in batch)
+    assert exported == list(range(1, 26))
+    await db.delete_conversation(conversation_id)
+
+async def check_summaries(db: ConversationDatabase):
+    """会话摘要随写入更新，分页列表不重复不遗漏，重建后与写入时一致"""
+    conversation_ids = [new_conversation_id() for _ in range(5)]
+    for count, conversation_id in enumerate(conversation_ids, 1):
+        await db.store.insert_messages([(conversation_id, "user", "问题", i) for i in range(1, count + 1)])
+
+    summary = await db.get_conversation_summary(conversation_ids[2])
+    assert summary["total_messages"] == 3 and summary["last_message_index"] == 3
+    assert summary["first_message_time"] and summary["last_message_time"]
+
+    listed, cursor = [], None
+    while True:
+        page, cursor = await db.list_conversations(limit=2, cursor=cursor)
+        listed.extend(s["conversation_id"] for s in page)
+        if not cursor:
+            break
+    assert set(conversation_ids) <= set(listed) and len(listed) == len(set(listed))
+    assert set(conversation_ids) <= set(await db.get_all_conversations())
+
+    await db.rebuild_summaries()
+    rebuilt = await db.get_conversation_summary(conversation_ids[2])
+    assert rebuilt["total_messages"] == 3 and rebuilt["last_message_index"] == 3
+
+    for conversation_id in conversation_ids:
+        await db.delete_conversation(conversation_id)
+    assert (await db.get_conversation_summary(conversation_ids[0]))["total_messages"] == 0
+
+async def check_retention(db: ConversationDatabase):
+    """过期消息按主键范围删除；不早于截止时间的消息不会被读出"""
+    conversation_id = new_conversation_id()
+    await db.store.insert_messages([(conversation_id, "user", "旧消息", 1), (conversation_id, "assistant", "回复", 2)])
+    cutoff = await db.store.get_cutoff(1)
+    assert conversation_id not in {row[1] for row in await db.store.fetch_expired(0, cutoff, 10000)}
+
+    # 以未来的时间作为截止时间，刚写入的消息全部过期
+    future = await db.store.get_cutoff(-1)
+    expired = [row for row in await db.store.fetch_expired(0, future, 10000) if row[1] == conversation_id]
+    assert [row[5] for row in expired] == [1, 2]
+    deleted = await db.store.delete_expired(expired[0][0], expired[-1][0], {conversation_id: 2})
+    assert deleted >= 2
+    assert await db.store.fetch_messages(conversation_id, 10) == []
+    assert await db.store.get_summary(conversation_id) is None
+
+async def check_buffered_writes(db: ConversationDatabase):
+    """buffered 模式批量写入，读取前先落库"""
+    conversation_id = new_conversation_id()
+    buffered = ConversationDatabase(durability="buffered", store=db.store)
+    for i in range(30):
+        await buffered.save_message(conversation_id, "user", f"消息{i}")
+    summary = await buffered.get_conversation_summary(conversation_id)
+    assert summary["total_messages"] == 30
+    await buffered.buffer.close()
+    assert buffered.buffer.get_stats()["batches"] >= 1
+    await db.delete_conversation(conversation_id)
+
+async def check_search(db: ConversationDatabase):
+    """全文搜索按时间倒序分页，不区分大小写，高亮匹配，已删除的消息不再返回"""
+    tag = uuid.uuid4().hex[:8]
+    first, second = new_conversation_id(), new_conversation_id()
+    await db.save_message(first, "user", f"我的订单号是 ORD-{tag}，还没有发货")
+    await db.save_message(first, "assistant", "好的，我帮您查一下")
+    await db.save_message(second, "user", f"订单 ord-{tag} 需要开发票 <急>")
+    await db.save_message(second, "user", f"ORD-{tag[:4]} 只是前缀")
+
+    results, cursor = await db.search_messages(f"ORD-{tag}", limit=1)
+    assert [(r["conversation_id"], r["message_index"]) for r in results] == [(second, 1)] and cursor
+    assert f"<mark>ord-{tag}</mark>" in results[0]["snippet"] and "&lt;急&gt;" in results[0]["snippet"]
+    results, cursor = await db.search_messages(f"ORD-{tag}", limit=1, cursor=cursor)
+    assert [(r["conversation_id"], r["message_index"]) for r in results] == [(first, 1)] and cursor is None
+
+    try:
+        await db.search_messages("a")
+        raise AssertionError("过短的搜索词应当失败")
+    except ValueError:
+        pass
+
+    await db.delete_conversation(second)
+    results, _ = await db.search_messages(f"ORD-{tag}")
+    assert [r["conversation_id"] for r in results] == [first]
+    await db.delete_conversation(first)
+
+CHECKS = [check_append_and_read, check_duplicate_index, check_pages_and_export, check_summaries,
+         check_retention, check_buffered_writes, check_search]
+
+async def run_suite(store: ConversationStore):
+    db = ConversationDatabase(store=store)
+    await db.init_database()
+    for check in CHECKS:
+        await check(db)
+        print(f"  ✅ {store.name}: {check.__doc__.strip().splitlines()[0]}")
+    await db.close_connection_pool()
+
+async def test_conversation_store_conformance():
+    """所有后端通过同一组用例"""
+    with tempfile.TemporaryDirectory() as directory:
+        await run_suite(SQLiteConversationStore(os.path.join(directory, "conversations.db")))
+
+    mysql = MySQLConversationStore(DatabasePool(**DB_CONFIG, health_check_interval=0))
+    try:
+        await mysql.init()
+    except Exception as e:
+        print(f"  ⏭️ 跳过 MySQL 后端（无法连接: {e}）")
+    else:
+        await run_suite(mysql)
+
+async def main():
+    """主测试函数"""
+    print("🚀 开始会话存储后端一致性测试...")
+    await test_conversation_store_conformance()
+    print("\n✅ 会话存储后端一致性测试完成！")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+摄取任务队列测试：租约超时回收、失败重试（指数退避）和取消，使用临时的任务库文件
+"""
+
+import asyncio
+import os
+import tempfile
+
+from rag.jobs import ID_BATCH_SIZE, JobQueue
+from rag.models import JobStatus
+
+async def test_lease_expiry():
+    """worker 失联后租约超时的任务由其他 worker 领取；重试次数用尽时标记失败"""
+    with tempfile.TemporaryDirectory() as directory:
+        queue = JobQueue(os.path.join(directory, "jobs.db"), max_attempts=2, lease_seconds=0.1)
+        job = await queue.enqueue("process_document", {"n": 1}, document_id="doc-1")
+
+        claimed = await queue.claim("worker-a")
+        assert claimed.id == job.id and claimed.status == JobStatus.RUNNING and claimed.attempts == 1
+        # 租约有效期内其他 worker 领取不到
+        assert await queue.claim("worker-b") is None
+
+        # 续期租约后仍然领取不到
+        await asyncio.sleep(0.06)
+        await queue.update_progress(job.id, 50, "处理中")
+        await asyncio.sleep(0.06)
+        assert await queue.claim("worker-b") is None
+
+        await asyncio.sleep(0.1)
+        reclaimed = await queue.claim("worker-b")
+        assert reclaimed.id == job.id and reclaimed.worker_id == "worker-b" and reclaimed.attempts == 2
+
+        # 第二次也超时：尝试次数用尽，下一次领取时标记失败而不是再次领取
+        await asyncio.sleep(0.15)
+        assert await queue.claim("worker-c") is None
+        failed = await queue.get(job.id)
+        assert failed.status == JobStatus.FAILED and failed.last_error == "任务租约超时"
+
+async def test_retry_backoff():
+    """失败后按指数退避重新排队，退避期间领取不到；超过最大尝试次数后失败"""
+    with tempfile.TemporaryDirectory() as directory:
+        queue = JobQueue(os.path.join(directory, "jobs.db"), max_attempts=3, retry_backoff=0.1)
+        job = await queue.enqueue("process_document", document_id="doc-1")
+
+        await queue.claim("worker")
+        retried = await queue.fail(job.id, "第一次失败")
+        assert retried.status == JobStatus.QUEUED and retried.last_error == "第一次失败"
+        assert await queue.claim("worker") is None
+        await asyncio.sleep(0.12)
+        assert (await queue.claim("worker")).attempts == 2
+
+        # 第二次退避时间翻倍
+        await queue.fail(job.id, "第二次失败")
+        await asyncio.sleep(0.12)
+        assert await queue.claim("worker") is None
+        await asyncio.sleep(0.12)
+        assert (await queue.claim("worker")).attempts == 3
+
+        failed = await queue.fail(job.id, "第三次失败")
+        assert failed.status == JobStatus.FAILED and failed.attempts == 3
+        await asyncio.sleep(0.5)
+        assert await queue.claim("worker") is None
+
+        # worker 停止时归还的任务不计入尝试次数，立即可以再次领取
+        job = await queue.enqueue("process_document", document_id="doc-2")
+        await queue.claim("worker")
+        released = await queue.release(job.id)
+        assert released.status == JobStatus.QUEUED and released.attempts == 0
+        assert (await queue.claim("worker")).attempts == 1
+
+async def test_cancel():
+    """排队的任务直接取消；运行中的任务设置取消标记，失败时记为取消而不是重试"""
+    with tempfile.TemporaryDirectory() as directory:
+        queue = JobQueue(os.path.join(directory, "jobs.db"), lease_seconds=0.1)
+        queued = await queue.enqueue("process_document", document_id="doc-1")
+        running = await queue.enqueue("process_document", document_id="doc-2", priority=10)
+
+        # 优先级高的先领取
+        assert (await queue.claim("worker")).id == running.id
+
+        cancelled = await queue.cancel(queued.id)
+        assert cancelled.status == JobStatus.CANCELLED and cancelled.cancel_requested
+        assert await queue.claim("worker") is None
+
+        requested = await queue.cancel(running.id)
+        assert requested.status == JobStatus.RUNNING and await queue.is_cancel_requested(running.id)
+        # 租约超时后也不会被其他 worker 重新领取
+        await asyncio.sleep(0.15)
+        assert await queue.claim("worker-b") is None
+
+        assert (await queue.fail(running.id, "已中断")).status == JobStatus.CANCELLED
+        # 已结束的任务不能再取消
+        assert (await queue.cancel(running.id)).status == JobStatus.CANCELLED
+        completed = await queue.enqueue("process_document", document_id="doc-3")
+        await queue.claim("worker")
+        await queue.complete(completed.id, {"chunks": 1})
+        assert (await queue.cancel(completed.id)).status == JobStatus.COMPLETED
+
+        stats = await queue.get_stats()
+        assert stats[JobStatus.CANCELLED.value] == 2 and stats[JobStatus.COMPLETED.value] == 1
+        print(f"  📊 {stats}")
+
+async def test_latest_for_documents():
+    """文档数超过单条 IN (...) 的批量大小时分批查询，每个文档返回最近一次的任务"""
+    with tempfile.TemporaryDirectory() as directory:
+        queue = JobQueue(os.path.join(directory, "jobs.db"))
+        assert await queue.get_latest_for_documents([]) == {}
+
+        document_ids = [f"doc-{i}" for i in range(ID_BATCH_SIZE * 2 + 200)]
+        for document_id in document_ids:
+            await queue.enqueue("process_document", document_id=document_id)
+        latest = await queue.enqueue("process_document", {"v": 2}, document_id=document_ids[-1])
+
+        jobs = await queue.get_latest_for_documents(document_ids)
+        assert len(jobs) == len(document_ids) and jobs[document_ids[-1]].id == latest.id
+
+async def main():
+    """主测试函数"""
+    print("🚀 开始摄取任务队列测试...")
+    await test_lease_expiry()
+    print("  ✅ 租约超时回收")
+    await test_retry_backoff()
+    print("  ✅ 失败重试")
+    await test_cancel()
+    print("  ✅ 取消")
+    await test_latest_for_documents()
+    print("  ✅ 分批查询文档最近的任务")
+    print("\n✅ 摄取任务队列测试完成！")
+
+if __name__ == "__main__":
+    asyncio.run(main())
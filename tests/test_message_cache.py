@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+最近消息缓存测试：读取期间有写入时不用过期的读取结果填充缓存（填充标记），
+以及乱序追加、容量和LRU淘汰（SQLite 后端）
+"""
+
+import asyncio
+import os
+import tempfile
+
+from database import ConversationDatabase, MessageCache, SQLiteConversationStore
+
+class PausedStore(SQLiteConversationStore):
+    """读取消息后暂停，直到 resume 被设置：模拟慢查询返回之前有新的写入"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fetched = asyncio.Event()
+        self.resume = asyncio.Event()
+        self.resume.set()
+
+    async def fetch_messages(self, *args, **kwargs):
+        messages = await super().fetch_messages(*args, **kwargs)
+        self.fetched.set()
+        await self.resume.wait()
+        return messages
+
+def message(index: int) -> dict:
+    return {"role": "user", "content": f"消息{index}", "timestamp": "", "message_index": index}
+
+def test_fill_token():
+    """begin_fill 和 end_fill 之间的写入、失效和清空都使读取结果不能填充缓存"""
+    cache = MessageCache(messages_per_conversation=5, max_conversations=10)
+
+    token = cache.begin_fill("c1")
+    assert cache.end_fill("c1", token)
+
+    for write in (lambda: cache.append("c1", message(1)), lambda: cache.invalidate("c1"), cache.clear):
+        token = cache.begin_fill("c1")
+        write()
+        assert not cache.end_fill("c1", token)
+
+    # 两个重叠的读取：写入发生在第二个读取开始之前，只有第一个过期
+    first = cache.begin_fill("c1")
+    cache.append("c1", message(2))
+    second = cache.begin_fill("c1")
+    assert not cache.end_fill("c1", first)
+    assert cache.end_fill("c1", second)
+
+    # 读取进行中不创建新会话的空缓存（读取结果可能包含更早的消息）
+    token = cache.begin_fill("c2")
+    cache.start("c2")
+    assert cache.get("c2", 1) is None
+    cache.end_fill("c2", token)
+    cache.start("c2")
+    assert cache.get("c2", 1) == []
+
+def test_append_and_evict():
+    """乱序追加按序号插入；超过容量后不再完整；超过会话数后淘汰最久未使用的"""
+    cache = MessageCache(messages_per_conversation=3, max_conversations=2)
+    cache.put("c1", [message(1), message(3)], complete=True)
+    cache.append("c1", message(2))
+    assert [m["message_index"] for m in cache.get("c1", 10)] == [1, 2, 3]
+
+    cache.append("c1", message(4))
+    assert [m["message_index"] for m in cache.get("c1", 3)] == [2, 3, 4]
+    assert cache.get("c1", 4) is None
+
+    cache.put("c2", [], complete=True)
+    cache.get("c1", 1)
+    cache.put("c3", [], complete=True)
+    assert cache.get("c2", 1) is None and cache.get("c1", 1) is not None
+    assert cache.get_stats()["evictions"] == 1
+
+async def test_fill_race():
+    """慢查询返回之前有新消息写入：不用过期的结果填充缓存，下一次读取得到新消息"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = PausedStore(os.path.join(directory, "cache.db"))
+        db = ConversationDatabase(store=store, durability="strict")
+        await db.init_database()
+        await db.save_message("c1", "user", "消息1")
+        await db.save_message("c1", "assistant", "消息2")
+        db.cache.invalidate("c1")
+
+        store.fetched.clear()
+        store.resume.clear()
+        read = asyncio.create_task(db.get_recent_messages("c1", 10))
+        await store.fetched.wait()
+        assert await db.save_message("c1", "user", "消息3") == 3
+        store.resume.set()
+
+        stale = await read
+        assert [m["content"] for m in stale] == ["消息1", "消息2"]
+        assert db.cache.get("c1", 10) is None
+
+        fresh = await db.get_recent_messages("c1", 10)
+        assert [m["content"] for m in fresh] == ["消息1", "消息2", "消息3"]
+        assert db.cache.get("c1", 10) == fresh
+        print(f"  📊 {db.cache.get_stats()}")
+        await store.close()
+
+async def main():
+    """主测试函数"""
+    print("🚀 开始最近消息缓存测试...")
+    test_fill_token()
+    print("  ✅ 填充标记")
+    test_append_and_evict()
+    print("  ✅ 乱序追加和淘汰")
+    await test_fill_race()
+    print("  ✅ 读取期间写入不填充过期结果")
+    print("\n✅ 最近消息缓存测试完成！")
+
+if __name__ == "__main__":
+    asyncio.run(main())
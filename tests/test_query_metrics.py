@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+查询耗时统计测试：用 SQLite 后端验证按操作名记录的直方图、慢查询日志和采样日志
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+
+from database import ConversationDatabase, SQLiteConversationStore, query_metrics
+
+async def test_query_metrics():
+    """直方图按操作名和阶段记录，慢查询总是写日志"""
+    with tempfile.TemporaryDirectory() as directory:
+        log_file = os.path.join(directory, "queries.log")
+        query_metrics.close()
+        query_metrics.reset()
+        query_metrics.log_file = log_file
+        query_metrics.slow_query_ms = 0
+        query_metrics.sample_rate = 1.0
+
+        db = ConversationDatabase(store=SQLiteConversationStore(os.path.join(directory, "metrics.db")))
+        await db.init_database()
+        for i in range(5):
+            await db.save_message("m1", "user", f"消息{i}")
+        await db.store.fetch_messages("m1", 10)
+        batches = [batch async for batch in db.iter_messages("m1", batch_size=2)]
+        assert sum(len(batch) for batch in batches) == 5
+
+        stats = query_metrics.get_stats()["operations"]
+        assert stats["insert_messages"]["total"]["count"] == 5
+        # SQLite 的 iter_messages 按批调用 fetch_messages（2 + 2 + 1），内层操作单独计数
+        assert stats["fetch_messages"]["total"]["count"] == 4
+        assert stats["fetch_messages"]["acquire"]["count"] == 4
+        assert stats["fetch_messages"]["execute"]["count"] == 4
+        assert stats["iter_messages"]["total"]["count"] == 1
+
+        # 慢查询阈值：超过阈值的操作写 slow_query 日志，不受采样率影响
+        query_metrics.slow_query_ms = 0.000001
+        query_metrics.sample_rate = 0.0
+        await db.store.fetch_messages("m1", 10)
+        query_metrics.close()
+        with open(log_file, encoding="utf-8") as f:
+            events = [json.loads(line) for line in f]
+        assert any(e["event"] == "message_saved" for e in events)
+        slow = [e for e in events if e["event"] == "slow_query"]
+        assert len(slow) == 1 and slow[0]["operation"] == "fetch_messages"
+        assert query_metrics.get_stats()["slow_queries"] == 1
+
+        print(f"  📊 fetch_messages: {stats['fetch_messages']['total']}")
+        await db.close_connection_pool()
+
+async def main():
+    """主测试函数"""
+    print("🚀 开始查询耗时统计测试...")
+    await test_query_metrics()
+    print("\n✅ 查询耗时统计测试完成！")
+
+if __name__ == "__main__":
+    asyncio.run(main())
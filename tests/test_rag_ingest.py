@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+RAG摄取测试：上传去重、显式替换旧版本（复用/重新嵌入的块数）、同名文件默认不覆盖，
+以及批量导入写入失败后释放内容摘要并删除保存的文件。使用临时目录中的上传目录、任务库和目录库
+"""
+
+import asyncio
+import io
+import os
+import tempfile
+
+directory = tempfile.TemporaryDirectory()
+# 在导入 rag.api 之前配置，使全局实例使用临时目录
+os.environ.update({
+    "RAG_UPLOAD_DIR": os.path.join(directory.name, "uploads"),
+    "RAG_TEXT_CACHE_DIR": os.path.join(directory.name, "text_cache"),
+    "RAG_QUEUE_PATH": os.path.join(directory.name, "jobs.db"),
+    "RAG_CATALOG_BACKEND": "sqlite",
+    "RAG_CATALOG_PATH": os.path.join(directory.name, "catalog.db"),
+    "RAG_COLLECTIONS_DIR": "",
+    "RAG_VECTOR_DIMENSION": "16",
+    "RAG_CHUNK_SIZE": "40",
+    "RAG_CHUNK_OVERLAP": "0",
+    "RAG_INPROCESS_WORKERS": "0",
+})
+
+from fastapi import UploadFile
+
+from rag import api
+from rag.bulk import BulkIngestor
+from rag.document import DocumentProcessor
+
+def text(letters: str) -> bytes:
+    """每个字母重复40次组成一块（分块大小40、无重叠）"""
+    return "".join(letter * 40 for letter in letters).encode("utf-8")
+
+async def upload(content: bytes, filename: str, **kwargs):
+    return await api.upload_document(
+        file=UploadFile(io.BytesIO(content), filename=filename, size=len(content)),
+        priority=0, client_id=None, collection=api.DEFAULT_COLLECTION, **{
+            "replace_document_id": None, "replace_same_name": False, **kwargs
+        }
+    )
+
+async def process_next():
+    """领取并执行下一个任务，返回文档的处理状态"""
+    job = await api.job_queue.claim("test")
+    result = await api.process_document_job(job)
+    await api.job_queue.complete(job.id, result)
+    return await api.get_processing_status(job.document_id)
+
+async def test_upload_versions():
+    """相同内容去重；同名的不同文件默认作为新文档；显式替换时只为变化的块生成嵌入"""
+    await api.warm_start()
+
+    first = await upload(text("abcd"), "report.txt")
+    status = await process_next()
+    assert status.chunk_count == 4 and status.embedded_chunks == 4 and status.reused_chunks == 0
+
+    duplicate = await upload(text("abcd"), "copy.txt")
+    assert duplicate.duplicate and duplicate.document_id == first.document_id and duplicate.job_id is None
+
+    # 同名但不相关的文件不会覆盖已有文档
+    other = await upload(text("wxyz"), "report.txt")
+    assert other.document_id != first.document_id
+    await process_next()
+    assert api.catalog.get(first.document_id).version == 1
+
+    # 显式替换：沿用文档ID，未变化的三块复用已有嵌入
+    replaced = await upload(text("abce"), "report.txt", replace_document_id=first.document_id)
+    assert replaced.document_id == first.document_id and "v2" in replaced.message
+    status = await process_next()
+    assert status.reused_chunks == 3 and status.embedded_chunks == 1
+    assert api.catalog.get(first.document_id).version == 2
+
+    # 按名称替换需要显式开启：替换集合内最近上传的同名文档
+    by_name = await upload(text("abcf"), "report.txt", replace_same_name=True)
+    assert by_name.document_id == first.document_id and "v3" in by_name.message
+    status = await process_next()
+    assert status.reused_chunks == 3 and status.embedded_chunks == 1
+    print(f"  📊 {status.message}")
+
+async def test_bulk_write_failure():
+    """写入索引失败的文件释放内容摘要：之后相同内容的文件重新导入，而不是报告为重复；没有引用的文件被删除"""
+    upload_dir = os.path.join(directory.name, "bulk_uploads")
+    processor = DocumentProcessor(upload_dir=upload_dir, text_cache_dir=None, chunk_size=40, overlap=0)
+    registered = []
+    failures = 1
+
+    async def write_chunks(chunks):
+        nonlocal failures
+        if failures:
+            failures -= 1
+            raise ConnectionError("模拟写入失败")
+
+    async def register_document(doc_info):
+        registered.append(doc_info)
+
+    async def is_content_referenced(content_hash):
+        return any(doc_info.content_hash == content_hash for doc_info in registered)
+
+    def ingestor():
+        return BulkIngestor(processor, write_chunks, register_document,
+                            find_duplicate=lambda content_hash: None,
+                            is_content_referenced=is_content_referenced,
+                            concurrency=1, batch_size=1)
+
+    entries = [(name, text("abcd"), 160) for name in ("a.txt", "b.txt")]
+    report = await ingestor().ingest(iter(entries))
+    assert [f.status for f in report.files] == ["failed", "completed"]
+    assert registered and report.files[1].document_id == registered[0].id
+    assert os.listdir(upload_dir) == [registered[0].filename]
+
+    failures = 1
+    report = await ingestor().ingest(iter([("c.txt", text("efgh"), 160)]))
+    assert report.files[0].status == "failed"
+    assert os.listdir(upload_dir) == [registered[0].filename]
+
+async def main():
+    """主测试函数"""
+    print("🚀 开始RAG摄取测试...")
+    try:
+        await test_upload_versions()
+        print("  ✅ 去重和版本替换")
+        await test_bulk_write_failure()
+        print("  ✅ 批量导入写入失败")
+        await api.catalog.close()
+    finally:
+        directory.cleanup()
+    print("\n✅ RAG摄取测试完成！")
+
+if __name__ == "__main__":
+    asyncio.run(main())
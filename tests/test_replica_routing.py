@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+只读副本路由测试：用两个 SQLite 文件分别充当主库和副本（手动“复制”数据以模拟复制延迟）
+
+验证读己之写（写入后固定读主库、副本落后时改读主库）、只读查询路由到副本，以及副本故障时的转移和恢复
+"""
+
+import asyncio
+import os
+import tempfile
+
+from database import ConversationDatabase, MessageCache, SQLiteConversationStore
+
+class FlakyStore(SQLiteConversationStore):
+    """可以模拟故障的副本"""
+
+    broken = False
+
+    async def fetch_messages(self, *args, **kwargs):
+        if self.broken:
+            raise ConnectionError("副本连接失败")
+        return await super().fetch_messages(*args, **kwargs)
+
+async def replicate(primary: SQLiteConversationStore, replica: SQLiteConversationStore, conversation_id: str):
+    """把主库中该会话的消息复制到副本"""
+    rows = [(conversation_id, m["role"], m["content"], m["message_index"])
+            for m in await primary.fetch_messages(conversation_id, 1000)]
+    await replica.insert_messages(rows)
+
+async def test_replica_routing():
+    """读己之写、路由到副本、故障转移"""
+    with tempfile.TemporaryDirectory() as directory:
+        primary = SQLiteConversationStore(os.path.join(directory, "primary.db"))
+        replica = FlakyStore(os.path.join(directory, "replica.db"))
+        db = ConversationDatabase(store=primary, replicas=[replica])
+        await db.init_database()
+        await replica.init()
+        # 关闭最近消息缓存，每次读取都经过路由
+        db.cache = MessageCache(messages_per_conversation=0)
+        db.replicas.sticky_seconds = 0.05
+        db.replicas.retry_interval = 0.05
+        stats = db.replicas.get_stats
+
+        # 刚写入：固定读主库
+        for i in range(3):
+            await db.save_message("c1", "user", f"消息{i}")
+        assert len(await db.get_recent_messages("c1")) == 3
+        assert stats()["pinned_reads"] == 1
+
+        # 固定期已过但副本尚未复制：副本结果落后于本进程的写入，改读主库
+        await asyncio.sleep(0.06)
+        assert len(await db.get_recent_messages("c1")) == 3
+        summary = await db.get_conversation_summary("c1")
+        assert summary["total_messages"] == 3
+        assert stats()["stale_reads"] == 2 and stats()["primary_reads"] == 2
+
+        # 副本追上后读副本
+        await replicate(primary, replica, "c1")
+        assert len(await db.get_recent_messages("c1")) == 3
+        assert stats()["primary_reads"] == 2 and stats()["replicas"][0]["reads"] == 3
+
+        # 其他进程写入、只存在于副本中的会话：读取走副本
+        await replica.insert_messages([("c2", "user", "只在副本", 1)])
+        assert [m["content"] for m in await db.get_recent_messages("c2")] == ["只在副本"]
+        assert set(await db.get_all_conversations()) == {"c1", "c2"}
+
+        # 副本故障：改读主库，在重试间隔内不再尝试该副本
+        replica.broken = True
+        assert len(await db.get_recent_messages("c1")) == 3
+        assert len(await db.get_recent_messages("c1")) == 3
+        assert stats()["failovers"] == 1 and not stats()["replicas"][0]["healthy"]
+
+        # 重试间隔后试探成功即恢复
+        replica.broken = False
+        await asyncio.sleep(0.06)
+        reads = stats()["replicas"][0]["reads"]
+        assert len(await db.get_recent_messages("c1")) == 3
+        assert stats()["replicas"][0]["healthy"] and stats()["replicas"][0]["reads"] == reads + 1
+
+        # 删除后固定读主库，不会从副本读到已删除的会话
+        await db.delete_conversation("c1")
+        assert await db.get_recent_messages("c1") == []
+
+        print(f"  📊 {stats()}")
+        await db.close_connection_pool()
+
+async def main():
+    """主测试函数"""
+    print("🚀 开始只读副本路由测试...")
+    await test_replica_routing()
+    print("\n✅ 只读副本路由测试完成！")
+
+if __name__ == "__main__":
+    asyncio.run(main())
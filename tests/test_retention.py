@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+消息保留策略测试：按主键分批删除过期消息并归档为 gzip NDJSON 分段文件，
+遇到第一条未过期的消息即停止，删除后更新会话摘要并丢弃缓存（SQLite 后端）
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+
+from database import ConversationDatabase, RetentionJob, SQLiteConversationStore
+
+def backdate(path: str, ids, days: int):
+    """把指定主键的消息时间改为 days 天前"""
+    conn = sqlite3.connect(path)
+    try:
+        conn.executemany(
+            "UPDATE conversations SET timestamp = datetime('now', 'localtime', ?) WHERE id = ?",
+            [(f"-{days} days", row_id) for row_id in ids]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+async def test_batched_retention():
+    """分批删除和归档，报告删除行数、批次和归档文件"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "retention.db")
+        archive_dir = os.path.join(directory, "archive")
+        store = SQLiteConversationStore(path)
+        db = ConversationDatabase(store=store, durability="strict")
+        await db.init_database()
+
+        # 主键 1-7 过期（两个会话），8-9 未过期，10 过期但排在未过期的消息之后
+        for i in range(7):
+            await db.save_message("old" if i < 4 else "mixed", "user", f"旧消息{i}")
+        await db.save_message("mixed", "assistant", "新消息0")
+        await db.save_message("mixed", "user", "新消息1")
+        await db.save_message("late", "user", "时间被改早的消息")
+        backdate(path, [*range(1, 8), 10], 40)
+        await db.get_recent_messages("mixed", 10)
+
+        job = RetentionJob(db, batch_size=3, batch_sleep=0, archive_dir=archive_dir, segment_rows=4)
+        try:
+            await job.run_once(0)
+            raise AssertionError("保留天数为0应当被拒绝")
+        except ValueError:
+            pass
+
+        report = await job.run_once(30)
+        assert report["deleted_rows"] == 7 and report["batches"] == 3 and report["conversations"] == 2
+        assert len(report["archive_files"]) == 2 and job.get_stats()["last_run"] is report
+        print(f"  📊 删除 {report['deleted_rows']} 条，{report['batches']} 批，{report['rows_per_second']} 行/秒")
+
+        # 归档按行数分段，内容与删除的消息一致
+        archived = []
+        for archive_path in report["archive_files"]:
+            with gzip.open(archive_path, "rt", encoding="utf-8") as f:
+                archived.append([json.loads(line) for line in f])
+        assert [len(segment) for segment in archived] == [4, 3]
+        rows = [row for segment in archived for row in segment]
+        assert [row["id"] for row in rows] == list(range(1, 8))
+        assert rows[0]["conversation_id"] == "old" and rows[0]["content"] == "旧消息0" and rows[0]["timestamp"]
+
+        # 会话摘要随删除更新，全部删除的会话不再有摘要；被删除消息的会话缓存失效
+        assert await store.get_summary("old") is None
+        assert (await db.get_conversation_summary("mixed"))["total_messages"] == 2
+        assert db.cache.get("mixed", 10) is None
+        remaining = await db.get_recent_messages("mixed", 10)
+        assert [m["content"] for m in remaining] == ["新消息0", "新消息1"]
+        assert [m["content"] for m in await db.get_recent_messages("late", 10)] == ["时间被改早的消息"]
+
+        # 再次运行没有可删除的消息
+        report = await job.run_once(30)
+        assert report["deleted_rows"] == 0 and report["archive_files"] == []
+        await store.close()
+
+async def test_flush_before_cleanup():
+    """buffered 模式下先写入缓冲中的消息再清理；没有配置归档目录时直接删除"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "retention.db")
+        store = SQLiteConversationStore(path)
+        db = ConversationDatabase(store=store, durability="buffered")
+        await db.init_database()
+        for i in range(3):
+            await db.save_message("c1", "user", f"消息{i}")
+        assert db.buffer.pending == 3
+
+        report = await RetentionJob(db, batch_size=10, batch_sleep=0).run_once(30)
+        assert report["deleted_rows"] == 0 and report["archive_files"] == []
+        assert db.buffer.pending == 0 and await store.load_max_index("c1") == 3
+
+        backdate(path, [1, 2, 3], 40)
+        report = await RetentionJob(db, batch_size=10, batch_sleep=0).run_once(30)
+        assert report["deleted_rows"] == 3 and report["batches"] == 1 and report["archive_files"] == []
+        await db.buffer.close()
+        await store.close()
+
+async def main():
+    """主测试函数"""
+    print("🚀 开始消息保留策略测试...")
+    await test_batched_retention()
+    print("  ✅ 分批删除和归档")
+    await test_flush_before_cleanup()
+    print("  ✅ 清理前写入缓冲")
+    print("\n✅ 消息保留策略测试完成！")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+MySQL 表结构 v2 测试：长消息压缩、按月分区的辅助函数，以及 v1 -> v2 在线迁移
+
+迁移测试使用 database/config.py 的 MySQL 配置，在单独创建的临时数据库中运行并在结束后删除，
+无法连接时跳过
+"""
+
+import asyncio
+import uuid
+from datetime import date
+
+from database import DatabasePool, MySQLConversationStore, SchemaMigration, DB_CONFIG
+from database.schema import (check_partition, ensure_partitions, month_partitions, months_ahead,
+                             pack_content, unpack_content, write_schema_state)
+
+class FakeCursor:
+    """记录执行的语句，fetchall 返回预设的分区名"""
+
+    def __init__(self, partitions):
+        self.partitions = partitions
+        self.statements = []
+
+    async def execute(self, sql, params=None):
+        self.statements.append(" ".join(sql.split()))
+
+    async def fetchall(self):
+        return [(name,) for name in self.partitions]
+
+def test_pack_content():
+    """达到阈值且压缩后更小才压缩，解压还原原文"""
+    long_text = "长消息内容" * 200
+    text, packed = pack_content(long_text, 1024)
+    assert text is None and packed is not None and len(packed) < len(long_text.encode("utf-8"))
+    assert unpack_content(text, packed) == long_text
+
+    # 阈值为0不压缩；未达到阈值不压缩
+    assert pack_content(long_text, 0) == (long_text, None)
+    assert pack_content("短消息", 1024) == ("短消息", None)
+    assert unpack_content("短消息", None) == "短消息"
+
+    # 压缩后不更小（随机内容）时保留原文
+    random_text = uuid.uuid4().hex
+    assert pack_content(random_text, 8) == (random_text, None)
+
+def test_month_partitions():
+    """按月生成分区名和上界，跨年正确"""
+    assert month_partitions(date(2024, 11, 15), date(2025, 2, 1)) == [
+        ("p202411", "2024-12-01"),
+        ("p202412", "2025-01-01"),
+        ("p202501", "2025-02-01"),
+        ("p202502", "2025-03-01"),
+    ]
+    assert month_partitions(date(2025, 3, 1), date(2025, 2, 28)) == []
+
+    assert months_ahead(date(2024, 11, 20), 0) == date(2024, 11, 1)
+    assert months_ahead(date(2024, 11, 20), 3) == date(2025, 2, 1)
+    assert months_ahead(date(2024, 12, 31), 13) == date(2026, 1, 1)
+
+    check_partition("none", single_writer=False)
+    check_partition("month", single_writer=True)
+    for partition, single_writer in (("month", False), ("week", True)):
+        try:
+            check_partition(partition, single_writer)
+            raise AssertionError(f"{partition} 应当被拒绝")
+        except ValueError:
+            pass
+
+async def test_ensure_partitions():
+    """从 pmax 中拆出缺少的月份；没有 pmax（未分区）或已经足够时不做修改"""
+    today = date.today()
+    last = date(today.year - 1, today.month, 1)
+    cursor = FakeCursor([f"p{last:%Y%m}", "pmax"])
+    added = await ensure_partitions(cursor, "messages", 2)
+    expected = month_partitions(months_ahead(last, 1), months_ahead(today, 2))
+    assert added == len(expected) == 14
+    alter = cursor.statements[-1]
+    assert alter.startswith("ALTER TABLE messages REORGANIZE PARTITION pmax INTO (")
+    assert f"PARTITION {expected[0][0]} VALUES LESS THAN ('{expected[0][1]}')" in alter
+    assert alter.endswith("PARTITION pmax VALUES LESS THAN (MAXVALUE))")
+
+    ahead = months_ahead(today, 3)
+    cursor = FakeCursor([f"p{ahead:%Y%m}", "pmax"])
+    assert await ensure_partitions(cursor, "messages", 3) == 0 and len(cursor.statements) == 1
+
+    cursor = FakeCursor([])
+    assert await ensure_partitions(cursor, "messages", 3) == 0 and len(cursor.statements) == 1
+
+class InterleavedMigration(SchemaMigration):
+    """第一轮复制之后模拟并发写入：提交一条主键较小的迟到消息，并删除一条已复制的消息"""
+
+    async def _copy_all(self, source: str, sleep: bool = True):
+        await super()._copy_all(source, sleep)
+        if source == "conversations":
+            async with self.pool.transaction() as cursor:
+                await cursor.execute("""
+                    INSERT INTO conversations (id, conversation_id, role, content, message_index)
+                    VALUES (3, 'migration-a', 'assistant', '迟到的消息', 3)
+                """)
+                await cursor.execute("DELETE FROM conversations WHERE id = 1")
+
+async def run_migration(pool: DatabasePool):
+    async with pool.cursor() as cursor:
+        await write_schema_state(cursor, version=1)
+    store = MySQLConversationStore(pool)
+    await store.init()
+    assert store.version == 1
+
+    long_text = "长消息内容" * 300
+    async with pool.transaction() as cursor:
+        # 主键 3 留空：模拟分配较早、提交较晚的事务
+        await cursor.executemany("""
+            INSERT INTO conversations (id, conversation_id, role, content, message_index)
+            VALUES (%s, %s, %s, %s, %s)
+        """, [
+            (1, "migration-a", "user", "第一条", 1),
+            (2, "migration-a", "assistant", "第二条", 2),
+            (4, "migration-a", "user", long_text, 4),
+            (5, "migration-b", "user", "另一个会话", 1),
+            (6, "migration-b", "assistant", "回复", 2),
+        ])
+
+    migration = InterleavedMigration(pool, batch_size=2, batch_sleep=0, partition="none", compress_threshold=1024)
+    report = await migration.run()
+    assert report["late_copied"] == 1 and report["removed"] == 1 and report["compressed"] == 1
+    print(f"  📊 {report}")
+
+    async with pool.cursor() as cursor:
+        await cursor.execute("SELECT id FROM messages ORDER BY id")
+        assert [row[0] for row in await cursor.fetchall()] == [2, 3, 4, 5, 6]
+
+    # 运行中的存储在下一次访问时切换到 v2，读取时解压
+    messages = await store.fetch_messages("migration-a", 10)
+    assert store.version == 2
+    assert [m["message_index"] for m in messages] == [2, 3, 4]
+    assert messages[1]["content"] == "迟到的消息" and messages[2]["content"] == long_text
+
+    # 已完成的迁移再次运行不做任何事
+    assert (await SchemaMigration(pool).run())["copied"] == 0
+
+async def test_mysql_migration():
+    """v1 -> v2 迁移补齐复制之后才提交的消息、删除复制后被删除的消息"""
+    database = f"{DB_CONFIG['database']}_migration_{uuid.uuid4().hex[:8]}"
+    admin = DatabasePool(**DB_CONFIG, health_check_interval=0)
+    try:
+        await admin.init()
+    except Exception as e:
+        print(f"  ⏭️ 跳过 MySQL 迁移测试（无法连接: {e}）")
+        return
+
+    try:
+        # 连接池初始化时创建数据库
+        pool = DatabasePool(**{**DB_CONFIG, "database": database}, health_check_interval=0)
+        try:
+            await run_migration(pool)
+        finally:
+            await pool.close()
+    finally:
+        async with admin.cursor() as cursor:
+            await cursor.execute(f"DROP DATABASE IF EXISTS `{database}`")
+        await admin.close()
+
+async def main():
+    """主测试函数"""
+    print("🚀 开始表结构 v2 测试...")
+    test_pack_content()
+    print("  ✅ 长消息压缩")
+    test_month_partitions()
+    print("  ✅ 按月分区的分区名和上界")
+    await test_ensure_partitions()
+    print("  ✅ 补齐未来的分区")
+    await test_mysql_migration()
+    print("\n✅ 表结构 v2 测试完成！")
+
+if __name__ == "__main__":
+    asyncio.run(main())
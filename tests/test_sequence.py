@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+消息序号分配测试：进程内并发分配不重复；其他进程占用序号后重新读取最大值重试，重试次数用尽时抛出
+"""
+
+import asyncio
+import os
+import tempfile
+
+from database import ConversationDatabase, DuplicateMessageError, SequenceAllocator, SQLiteConversationStore
+from database.conversation import MAX_APPEND_RETRIES, insert_message
+
+class ConflictingStore:
+    """每次写入都报告序号冲突的存储（另一个进程总是抢先写入）"""
+
+    def __init__(self):
+        self.max_index = 0
+        self.inserts = 0
+
+    async def load_max_index(self, conversation_id: str) -> int:
+        return self.max_index
+
+    async def insert_messages(self, rows):
+        self.inserts += 1
+        self.max_index += 1
+        raise DuplicateMessageError(f"序号 {rows[0][3]} 已存在")
+
+async def test_concurrent_allocation():
+    """同一进程内并发分配的序号连续且不重复，只读取一次最大值"""
+    sequences = SequenceAllocator()
+    loads = 0
+
+    async def load_max() -> int:
+        nonlocal loads
+        loads += 1
+        await asyncio.sleep(0.01)
+        return 7
+
+    indexes = await asyncio.gather(*(sequences.allocate("c1", load_max) for _ in range(20)))
+    assert sorted(indexes) == list(range(8, 28)) and loads == 1
+    assert sequences.last_allocated("c1") == 27 and sequences.last_allocated("c2") is None
+
+    sequences.forget("c1")
+    assert await sequences.allocate("c1", load_max) == 8 and loads == 2
+
+async def test_lru_eviction():
+    """缓存的会话数超过上限后淘汰最久未使用的，再分配时重新读取最大值；冲突编号被淘汰后不会回到旧值"""
+    sequences = SequenceAllocator(max_conversations=2)
+
+    async def load_max() -> int:
+        return 10
+
+    for conversation_id in ("c1", "c2", "c1", "c3"):
+        await sequences.allocate(conversation_id, load_max)
+    assert sequences.last_allocated("c2") is None and sequences.last_allocated("c1") == 12
+    assert await sequences.allocate("c2", load_max) == 11
+    stats = sequences.get_stats()
+    assert stats["cached_conversations"] == 2 and stats["seeded"] == 4 and stats["evictions"] == 2
+
+    sequences.conflict("c1")
+    first = sequences.generation("c1")
+    sequences.conflict("c2")
+    sequences.conflict("c3")
+    assert sequences.generation("c1") == 0
+    sequences.conflict("c1")
+    assert sequences.generation("c1") not in (0, first)
+
+    sequences.forget("c1")
+    assert sequences.generation("c1") == 0 and sequences.last_allocated("c1") is None
+
+async def test_evicted_buffered():
+    """buffered 模式下会话被淘汰后再写入：先写入缓冲中的消息再读取最大值，不分配重复的序号"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteConversationStore(os.path.join(directory, "sequence.db"))
+        db = ConversationDatabase(store=store, durability="buffered")
+        db.sequences = SequenceAllocator(max_conversations=1)
+        db.buffer.sequences = db.sequences
+        await db.init_database()
+
+        assert await db.save_message("c1", "user", "第一条") == 1
+        assert await db.save_message("c2", "user", "其他会话") == 1
+        assert db.buffer.pending == 2 and db.sequences.last_allocated("c1") is None
+
+        assert await db.save_message("c1", "assistant", "第二条") == 2
+        await db.buffer.flush()
+        messages = await db.get_recent_messages("c1", 10)
+        assert [(m["message_index"], m["content"]) for m in messages] == [(1, "第一条"), (2, "第二条")]
+        await db.buffer.close()
+        await store.close()
+
+async def test_conflict_retry():
+    """另一个进程（独立的分配器）写入同一会话后，冲突的消息重新分配序号，缓存的历史失效"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteConversationStore(os.path.join(directory, "sequence.db"))
+        a = ConversationDatabase(store=store)
+        b = ConversationDatabase(store=store)
+        await a.init_database()
+
+        assert [await a.save_message("c1", "user", f"a{i}") for i in range(2)] == [1, 2]
+        assert [await b.save_message("c1", "assistant", f"b{i}") for i in range(2)] == [3, 4]
+
+        # a 缓存的下一个序号是3，写入冲突后重新读取最大值
+        assert await a.save_message("c1", "user", "a2") == 5
+        stats = a.sequences.get_stats()
+        assert stats["conflicts"] == 1 and stats["seeded"] == 2
+        assert a.cache.get("c1", 10) is None
+
+        # 之后的分配继续使用新的缓存值，不再冲突
+        assert await a.save_message("c1", "assistant", "a3") == 6
+        messages = await a.get_recent_messages("c1", 10)
+        assert [m["message_index"] for m in messages] == [1, 2, 3, 4, 5, 6]
+        assert [m["content"] for m in messages][-2:] == ["a2", "a3"]
+        print(f"  📊 {a.sequences.get_stats()}")
+
+        await store.close()
+
+async def test_retry_exhausted():
+    """每次都冲突时最多尝试 MAX_APPEND_RETRIES 次，然后抛出 DuplicateMessageError"""
+    store = ConflictingStore()
+    sequences = SequenceAllocator()
+    try:
+        await insert_message(store, sequences, "c1", "user", "消息")
+        raise AssertionError("重试次数用尽时应当抛出")
+    except DuplicateMessageError:
+        pass
+    assert store.inserts == MAX_APPEND_RETRIES
+    assert sequences.conflicts == MAX_APPEND_RETRIES - 1 and sequences.seeded == MAX_APPEND_RETRIES
+
+async def main():
+    """主测试函数"""
+    print("🚀 开始消息序号分配测试...")
+    await test_concurrent_allocation()
+    print("  ✅ 进程内并发分配")
+    await test_lru_eviction()
+    print("  ✅ LRU淘汰")
+    await test_evicted_buffered()
+    print("  ✅ 淘汰后在缓冲模式下写入")
+    await test_conflict_retry()
+    print("  ✅ 序号冲突后重新分配")
+    await test_retry_exhausted()
+    print("  ✅ 重试次数用尽")
+    print("\n✅ 消息序号分配测试完成！")
+
+if __name__ == "__main__":
+    asyncio.run(main())
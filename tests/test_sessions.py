@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+会话管理测试：LRU 上限、空闲淘汰、使用中的会话不被淘汰，以及淘汰后透明重建
+"""
+
+import asyncio
+import os
+import tempfile
+
+from agents import AgentChat, AgentType
+from app.sessions import SessionManager
+from database import ConversationDatabase, SQLiteConversationStore
+
+async def test_session_manager():
+    """LRU 和空闲淘汰、重建"""
+    with tempfile.TemporaryDirectory() as directory:
+        db = ConversationDatabase(store=SQLiteConversationStore(os.path.join(directory, "sessions.db")))
+        await db.init_database()
+
+        async def factory(conversation_id: str) -> AgentChat:
+            # 测试不调用模型，model_client 为空
+            return AgentChat(None, conversation_id, db=db)
+
+        sessions = SessionManager(factory, max_sessions=2, idle_ttl=0.05)
+
+        # 超过上限时淘汰最久未使用的会话
+        a = await sessions.get("a")
+        await sessions.get("b")
+        assert await sessions.get("a") is a
+        a.current_agent_type = AgentType.CODER
+        await sessions.get("c")
+        assert len(sessions) == 2 and sessions.peek("b") is None
+        assert sessions.get_stats()["evicted_lru"] == 1
+
+        # 使用中的会话不被淘汰
+        with sessions.hold("a"):
+            await sessions.get("d")
+            assert sessions.peek("a") is a and sessions.peek("c") is None
+
+        # 空闲超过 TTL 的会话被淘汰，重建后恢复淘汰前的 agent 类型
+        await asyncio.sleep(0.06)
+        assert await sessions.sweep() == 2 and len(sessions) == 0
+        assert sessions.get_agent_type("a") == AgentType.CODER
+        rebuilt = await sessions.get("a")
+        assert rebuilt is not a and rebuilt.current_agent_type == AgentType.CODER
+
+        # 清除会话后不保留 agent 类型
+        await sessions.remove("a")
+        assert sessions.get_agent_type("a") is None
+
+        stats = sessions.get_stats()
+        assert stats["rehydrated"] == 1 and stats["evicted_idle"] == 2 and stats["removed"] == 1
+        assert stats["memory_estimate_bytes"] == 0
+        print(f"  📊 {stats}")
+
+        await sessions.close()
+        await db.close_connection_pool()
+        await db.store.close()
+
+async def test_hold_before_create():
+    """请求在创建会话之前持有，释放前不会被淘汰；已关闭的会话继续使用时重新加载历史"""
+    with tempfile.TemporaryDirectory() as directory:
+        db = ConversationDatabase(store=SQLiteConversationStore(os.path.join(directory, "sessions.db")))
+        await db.init_database()
+
+        async def factory(conversation_id: str) -> AgentChat:
+            return AgentChat(None, conversation_id, db=db)
+
+        sessions = SessionManager(factory, max_sessions=1, idle_ttl=0)
+        sessions.acquire("a")
+        a = await sessions.get("a")
+        await a._load_history()
+        await a.save_message("user", "第一条")
+        await sessions.get("b")
+        assert sessions.peek("a") is a and len(sessions) == 1
+        sessions.release("a")
+
+        # 释放后被淘汰；仍持有旧引用的请求继续使用时从存储重新加载历史
+        await sessions.get("c")
+        assert sessions.peek("a") is None and not a.conversation_history
+        await a._load_history()
+        assert [m["content"] for m in a.conversation_history] == ["第一条"]
+
+        await sessions.close()
+        await db.close_connection_pool()
+        await db.store.close()
+
+async def main():
+    """主测试函数"""
+    print("🚀 开始会话管理测试...")
+    await test_session_manager()
+    await test_hold_before_create()
+    print("\n✅ 会话管理测试完成！")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+会话共享历史测试：历史每个会话只从数据库加载一次，新建agent不访问数据库，
+切换agent时补上其他agent处理的对话（用 ReplayChatCompletionClient 代替真实模型）
+"""
+
+import asyncio
+import os
+import tempfile
+
+from autogen_ext.models.replay import ReplayChatCompletionClient
+
+from agents import AgentChat, AgentType
+from agents.chat import HISTORY_LIMIT
+from database import ConversationDatabase, SQLiteConversationStore
+
+class CountingDatabase(ConversationDatabase):
+    """统计历史读取次数"""
+
+    history_reads = 0
+
+    async def get_recent_messages(self, conversation_id: str, limit: int = 20):
+        self.history_reads += 1
+        return await super().get_recent_messages(conversation_id, limit)
+
+async def test_shared_history():
+    """一次加载、增量追加、切换agent补齐上下文"""
+    with tempfile.TemporaryDirectory() as directory:
+        db = CountingDatabase(store=SQLiteConversationStore(os.path.join(directory, "history.db")))
+        await db.init_database()
+        await db.save_message("h1", "user", "之前的问题")
+        await db.save_message("h1", "assistant", "之前的回答")
+
+        chat = AgentChat(ReplayChatCompletionClient(["回复1", "回复2", "回复3"]), "h1", db=db)
+        replies = []
+        for message in ["你好", "帮我计算 1+1", "再说一遍"]:
+            replies.append("".join([chunk async for chunk in chat.process_message(message)]))
+
+        # 三轮对话、两个agent：历史只读取一次，回复不包含用户消息
+        assert db.history_reads == 1
+        assert replies == ["回复1", "回复2", "回复3"]
+        assert set(chat.agents) == {AgentType.GENERAL, AgentType.CALCULATOR}
+
+        # general agent 回到前台时补上了 calculator 处理的那一轮，且没有重复的消息
+        context = await chat.agents[AgentType.GENERAL].model_context.get_messages()
+        assert [message.content for message in context] == [
+            "之前的问题", "之前的回答", "你好", "回复1", "帮我计算 1+1", "回复2", "再说一遍", "回复3"
+        ]
+        assert [m["content"] for m in chat.conversation_history][-2:] == ["再说一遍", "回复3"]
+
+        await chat.close()
+        await db.store.close()
+
+async def test_idle_agent_gap():
+    """agent 闲置期间其他agent处理的消息超过共享历史的保留条数：从数据库补齐最近的 HISTORY_LIMIT 条"""
+    with tempfile.TemporaryDirectory() as directory:
+        db = CountingDatabase(store=SQLiteConversationStore(os.path.join(directory, "history.db")))
+        await db.init_database()
+
+        turns = HISTORY_LIMIT // 2 + 2
+        chat = AgentChat(ReplayChatCompletionClient([f"回复{i}" for i in range(turns + 2)]), "h2", db=db)
+        messages = ["你好"] + [f"计算 {i}+{i}" for i in range(turns)] + ["回到通用"]
+        for message in messages:
+            "".join([chunk async for chunk in chat.process_message(message)])
+
+        # 共享历史只保留最近 HISTORY_LIMIT 条；general agent 只补齐 calculator 处理的最近 HISTORY_LIMIT 条消息
+        assert len(chat.conversation_history) == HISTORY_LIMIT
+        context = await chat.agents[AgentType.GENERAL].model_context.get_messages()
+        replies = [f"回复{i}" for i in range(len(messages))]
+        full = [content for pair in zip(messages, replies) for content in pair]
+        assert [message.content for message in context] == full[:2] + full[-2 - HISTORY_LIMIT:]
+
+        await chat.close()
+        await db.store.close()
+
+async def test_reindex_reload():
+    """写缓冲中的消息因其他进程写入被重新编号后，共享历史重新加载，agent 从新的历史重建"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteConversationStore(os.path.join(directory, "history.db"))
+        db = CountingDatabase(store=store, durability="buffered")
+        db.buffer.flush_interval = 10
+        await db.init_database()
+
+        chat = AgentChat(ReplayChatCompletionClient(["回复1", "回复2"]), "h3", db=db)
+        "".join([chunk async for chunk in chat.process_message("你好")])
+        assert [m["message_index"] for m in chat.conversation_history] == [1, 2]
+
+        # 另一个进程在缓冲写入之前写入了序号1，缓冲中的两条消息被重新编号为2、3
+        other = ConversationDatabase(store=store, durability="strict")
+        await other.save_message("h3", "user", "其他进程")
+        await db.buffer.flush()
+        assert db.sequences.generation("h3") > 0
+
+        "".join([chunk async for chunk in chat.process_message("继续")])
+        assert db.history_reads == 2
+        assert [(m["message_index"], m["content"]) for m in chat.conversation_history] == [
+            (1, "其他进程"), (2, "你好"), (3, "回复1"), (4, "继续"), (5, "回复2")
+        ]
+        context = await chat.agents[AgentType.GENERAL].model_context.get_messages()
+        assert [message.content for message in context] == ["其他进程", "你好", "回复1", "继续", "回复2"]
+
+        await chat.close()
+        await db.buffer.close()
+        await store.close()
+
+async def main():
+    """主测试函数"""
+    print("🚀 开始会话共享历史测试...")
+    await test_shared_history()
+    await test_idle_agent_gap()
+    await test_reindex_reload()
+    print("\n✅ 会话共享历史测试完成！")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+向量存储并发测试：并发摄取（新增、新版本、删除）的同时持续查询
+"""
+
+import asyncio
+import random
+import time
+from rag.models import DocumentChunk
+from rag.vector import VectorStore
+
+DIMENSION = 32
+DOCUMENTS = 40
+CHUNKS_PER_VERSION = {1: 6, 2: 4, 3: 9}
+
+class RemoteEmbeddingStore(VectorStore):
+    """模拟远程嵌入服务：生成嵌入时让出事件循环"""
+
+    async def _generate_embeddings(self, texts):
+        await asyncio.sleep(0.001)
+        return await super()._generate_embeddings(texts)
+
+def make_chunks(document_id: str, version: int):
+    """生成文档某个版本的全部块，块元数据记录版本号"""
+    def content_hash(index: int) -> str:
+        # v3 的前两块与 v2 的后两块内容相同（段落移动），会复用已有嵌入
+        if version == 3 and index < 2:
+            return f"{document_id}-2-{index + 2}"
+        return f"{document_id}-{version}-{index}"
+
+    return [
+        DocumentChunk(
+            id=f"{document_id}_chunk_{index}",
+            document_id=document_id,
+            content=f"{document_id} v{version} 第{index}块",
+            chunk_index=index,
+            metadata={"content_hash": content_hash(index), "version": version}
+        )
+        for index in range(CHUNKS_PER_VERSION[version])
+    ]
+
+def check_snapshot(results):
+    """每个文档的块必须来自同一个完整发布的版本"""
+    by_document = {}
+    for result in results:
+        metadata = result["metadata"]
+        by_document.setdefault(metadata["document_id"], []).append(metadata["version"])
+    for document_id, versions in by_document.items():
+        assert len(set(versions)) == 1, f"{document_id} 出现多个版本的块: {sorted(set(versions))}"
+        assert len(versions) == CHUNKS_PER_VERSION[versions[0]], \
+            f"{document_id} v{versions[0]} 的块不完整: {len(versions)}"
+
+async def writer(store: VectorStore, document_ids, stats):
+    """依次写入多个版本，穿插删除"""
+    for document_id in document_ids:
+        await store.add_chunks(make_chunks(document_id, 1))
+        stats["writes"] += 1
+    for document_id in document_ids:
+        for version in (2, 3):
+            await store.upsert_document_chunks(document_id, make_chunks(document_id, version))
+            stats["writes"] += 1
+            await asyncio.sleep(0)
+        if random.random() < 0.3:
+            await store.delete_document(document_id)
+            stats["writes"] += 1
+
+async def reader(store: VectorStore, stop: asyncio.Event, stats):
+    """持续查询全部块并校验快照一致性"""
+    while not stop.is_set():
+        results = await store.search("查询", top_k=DOCUMENTS * 10, similarity_threshold=-1.0)
+        check_snapshot(results)
+        stats["queries"] += 1
+        await asyncio.sleep(0)
+
+async def test_concurrent_ingest_and_query():
+    """并发摄取与查询"""
+    print("🧪 开始并发摄取与查询测试...")
+    store = RemoteEmbeddingStore(dimension=DIMENSION)
+    stats = {"writes": 0, "queries": 0}
+    stop = asyncio.Event()
+
+    document_ids = [f"doc{i}" for i in range(DOCUMENTS)]
+    started = time.time()
+    readers = [asyncio.create_task(reader(store, stop, stats)) for _ in range(8)]
+    await asyncio.gather(*(writer(store, document_ids[i::4], stats) for i in range(4)))
+    stop.set()
+    await asyncio.gather(*readers)
+
+    # 最终状态：元数据、已发布的段与统计一致
+    results = await store.search("查询", top_k=DOCUMENTS * 10, similarity_threshold=-1.0)
+    check_snapshot(results)
+    vector_stats = await store.get_stats()
+    live_chunks = sum(len(chunk_ids) for chunk_ids in store.document_chunks.values())
+    assert len(results) == live_chunks == vector_stats["total_chunks"], (len(results), live_chunks, vector_stats)
+    assert {r["metadata"]["version"] for r in results} <= {3}
+
+    print(f"写入 {stats['writes']} 次，查询 {stats['queries']} 次，耗时 {time.time() - started:.2f}s")
+    print(f"最终 {vector_stats['documents']} 个文档、{vector_stats['total_chunks']} 个块、{vector_stats['segments']} 个段")
+
+async def main():
+    """主测试函数"""
+    print("🚀 开始向量存储并发测试...")
+    await test_concurrent_ingest_and_query()
+    print("\n✅ 向量存储并发测试完成！")
+
+if __name__ == "__main__":
+    asyncio.run(main())
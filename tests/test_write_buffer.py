@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+消息写缓冲测试：strict / buffered 两种写入模式、批量和定时刷新、读己之写、写入失败重试、
+批量写入序号冲突时逐条重写，以及关闭时写完剩余消息（SQLite 后端）
+"""
+
+import asyncio
+import os
+import tempfile
+
+from database import ConversationDatabase, MessageWriteBuffer, SQLiteConversationStore
+
+class FlakyStore(SQLiteConversationStore):
+    """可以让接下来的若干次写入失败的 SQLite 存储（先放行 fail_after 次写入）"""
+
+    fail_next = 0
+    fail_after = 0
+
+    async def insert_messages(self, rows):
+        if self.fail_next:
+            if self.fail_after:
+                self.fail_after -= 1
+            else:
+                self.fail_next -= 1
+                raise ConnectionError("模拟写入失败")
+        return await super().insert_messages(rows)
+
+def buffered_database(store: SQLiteConversationStore, batch_size: int = 3,
+                      flush_interval: float = 0.05) -> ConversationDatabase:
+    db = ConversationDatabase(store=store, durability="buffered")
+    db.buffer = MessageWriteBuffer(store, db.sequences, batch_size=batch_size, flush_interval=flush_interval)
+    db.buffer.on_reindex = db.cache.invalidate
+    return db
+
+async def test_durability_modes():
+    """strict 写入后返回；buffered 入队后返回，按批量或超时写入，读取前先写入缓冲"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteConversationStore(os.path.join(directory, "buffer.db"))
+        strict = ConversationDatabase(store=store, durability="strict")
+        await strict.init_database()
+        await strict.save_message("strict", "user", "消息")
+        assert await store.load_max_index("strict") == 1 and strict.buffer.pending == 0
+
+        try:
+            ConversationDatabase(store=store, durability="async")
+            raise AssertionError("未知的写入模式应当被拒绝")
+        except ValueError:
+            pass
+
+        db = buffered_database(store, batch_size=3, flush_interval=10)
+        assert [await db.save_message("c1", "user", f"消息{i}") for i in range(2)] == [1, 2]
+        assert db.buffer.pending == 2 and await store.load_max_index("c1") == 0
+
+        # 达到批量大小时立即写入（不等 flush_interval）
+        await db.save_message("c1", "assistant", "消息2")
+        await asyncio.sleep(0.05)
+        assert db.buffer.pending == 0 and await store.load_max_index("c1") == 3
+
+        # 读取会话前先写入它在缓冲中的消息
+        await db.save_message("c1", "user", "消息3")
+        page = await db.get_messages_page("c1", limit=2, before=5)
+        assert [m["content"] for m in page["messages"]] == ["消息2", "消息3"]
+        assert db.buffer.pending == 0
+
+        # 未达到批量大小时等待 flush_interval 后写入
+        db = buffered_database(store, batch_size=100, flush_interval=0.05)
+        await db.save_message("c2", "user", "定时刷新")
+        assert await store.load_max_index("c2") == 0
+        await asyncio.sleep(0.15)
+        assert await store.load_max_index("c2") == 1
+
+        stats = db.buffer.get_stats()
+        assert stats["written"] == 1 and stats["batches"] == 1
+        await store.close()
+
+async def test_failure_and_close():
+    """写入失败的消息留在队列中由后台重试；关闭时写完剩余消息"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = FlakyStore(os.path.join(directory, "buffer.db"))
+        db = buffered_database(store, batch_size=100, flush_interval=0.02)
+        await db.init_database()
+
+        store.fail_next = 2
+        for i in range(5):
+            await db.save_message("c1", "user", f"消息{i}")
+        await asyncio.sleep(0.2)
+        assert db.buffer.failures == 2 and db.buffer.pending == 0
+        assert await store.load_max_index("c1") == 5
+
+        # 手动刷新失败时抛出，消息保留
+        store.fail_next = 1
+        await db.save_message("c1", "assistant", "关闭前")
+        try:
+            await db.buffer.flush()
+            raise AssertionError("写入失败应当抛出")
+        except ConnectionError:
+            pass
+        assert db.buffer.pending == 1
+
+        await db.buffer.close()
+        assert db.buffer.pending == 0 and await store.load_max_index("c1") == 6
+        print(f"  📊 {db.buffer.get_stats()}")
+        await store.close()
+
+async def test_batch_conflict():
+    """批量写入遇到其他进程占用的序号时整批回滚、逐条写入，重新分配序号并通知缓存失效"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteConversationStore(os.path.join(directory, "buffer.db"))
+        db = buffered_database(store, batch_size=100, flush_interval=10)
+        await db.init_database()
+
+        await db.save_message("c1", "user", "第一条")
+        await db.buffer.flush()
+        await db.get_recent_messages("c1", 10)
+        assert db.cache.get("c1", 10) is not None
+
+        # 另一个进程（独立的分配器，strict 模式）抢先写入序号2
+        other = ConversationDatabase(store=store, durability="strict")
+        assert await other.save_message("c1", "assistant", "其他进程") == 2
+
+        await db.save_message("c1", "user", "缓冲中的消息")
+        await db.buffer.flush()
+        assert db.cache.get("c1", 10) is None
+
+        messages = await db.get_recent_messages("c1", 10)
+        assert [(m["message_index"], m["content"]) for m in messages] == [
+            (1, "第一条"), (2, "其他进程"), (3, "缓冲中的消息")
+        ]
+        await store.close()
+
+async def test_partial_fallback():
+    """逐条写入到一半失败：已写入的消息出队，重试只写入剩余的消息，不重复写入"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = FlakyStore(os.path.join(directory, "buffer.db"))
+        db = buffered_database(store, batch_size=100, flush_interval=10)
+        await db.init_database()
+
+        # 缓冲中的 c1 序号1 被另一个进程抢先写入，整批冲突后逐条写入
+        await db.save_message("c1", "user", "缓冲中的消息")
+        other = ConversationDatabase(store=store, durability="strict")
+        assert await other.save_message("c1", "assistant", "其他进程") == 1
+        await db.save_message("c2", "user", "first")
+        await db.save_message("c2", "assistant", "second")
+
+        # 放行整批写入、c1 的两次写入（序号1冲突后改用序号2）和 c2 第一条，c2 第二条写入失败
+        store.fail_after, store.fail_next = 4, 1
+        try:
+            await db.buffer.flush()
+            raise AssertionError("写入失败应当抛出")
+        except ConnectionError:
+            pass
+        assert db.buffer.pending == 1 and db.buffer.written == 2
+
+        await db.buffer.flush()
+        messages = await db.get_recent_messages("c2", 10)
+        assert [(m["message_index"], m["content"]) for m in messages] == [(1, "first"), (2, "second")]
+        assert [m["content"] for m in await db.get_recent_messages("c1", 10)] == ["其他进程", "缓冲中的消息"]
+        assert db.buffer.written == 3 and db.buffer.pending == 0
+        await store.close()
+
+async def main():
+    """主测试函数"""
+    print("🚀 开始消息写缓冲测试...")
+    await test_durability_modes()
+    print("  ✅ 写入模式和刷新")
+    await test_failure_and_close()
+    print("  ✅ 写入失败重试和关闭")
+    await test_batch_conflict()
+    print("  ✅ 批量写入序号冲突")
+    await test_partial_fallback()
+    print("  ✅ 逐条写入中途失败")
+    print("\n✅ 消息写缓冲测试完成！")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,43 +1,81 @@
 #!/usr/bin/env python3
 """
-MySQL数据库管理工具
-用于查看、管理会话数据
+会话数据库管理工具
+用于查看、管理会话数据（MySQL 或 SQLite 后端，由 CONVERSATION_BACKEND 选择）
 """
 
 import asyncio
+import contextlib
+import html
+import json
+import shlex
 import sys
-from database import ConversationDatabase, DB_CONFIG
+from database import (
+    ConversationDatabase, DB_BACKEND_CONFIG, DB_CONFIG, DatabasePool, MySQLConversationStore, SchemaMigration,
+    create_conversation_store, schema_stats,
+)
 
-async def show_all_conversations():
-    """显示所有会话"""
-    db = ConversationDatabase(**DB_CONFIG)
+async def show_all_conversations(limit: int = 50, cursor: str = None):
+    """分页显示会话（只读会话摘要表，一页一次查询）"""
+    db = ConversationDatabase(store=create_conversation_store())
     await db.init_database()
     
-    conversations = await db.get_all_conversations()
+    conversations, next_cursor = await db.list_conversations(limit=limit, cursor=cursor)
     
     if not conversations:
         print("📭 没有找到任何会话")
+        await db.close_connection_pool()
         return
     
-    print(f"📋 找到 {len(conversations)} 个会话:")
+    print(f"📋 本页 {len(conversations)} 个会话:")
     print("-" * 80)
     
-    for conv_id in conversations:
-        summary = await db.get_conversation_summary(conv_id)
-        print(f"🗨️  会话ID: {conv_id}")
+    for summary in conversations:
+        print(f"🗨️  会话ID: {summary['conversation_id']}")
         print(f"   📊 消息总数: {summary['total_messages']}")
         print(f"   🕐 首次消息: {summary['first_message_time']}")
         print(f"   🕑 最后消息: {summary['last_message_time']}")
         print("-" * 40)
     
+    if next_cursor:
+        print(f"➡️  下一页: python utils/db_manager.py list {limit} {next_cursor}")
+    
+    await db.close_connection_pool()
+
+async def search_messages(query: str, limit: int = 20, cursor: str = None):
+    """全文搜索消息内容（按时间倒序分页）"""
+    db = ConversationDatabase(store=create_conversation_store())
+    await db.init_database()
+    
+    results, next_cursor = await db.search_messages(query, limit=limit, cursor=cursor)
+    
+    if not results:
+        print(f"📭 没有找到包含 '{query}' 的消息")
+        await db.close_connection_pool()
+        return
+    
+    print(f"🔍 本页 {len(results)} 条包含 '{query}' 的消息:")
+    print("-" * 80)
+    
+    for result in results:
+        role_icon = "👤" if result["role"] == "user" else "🤖"
+        snippet = result["snippet"].replace("<mark>", "【").replace("</mark>", "】")
+        print(f"🗨️  {result['conversation_id']} #{result['message_index']} {role_icon} [{result['timestamp']}]")
+        print(f"   {html.unescape(snippet)}")
+        print("-" * 40)
+    
+    if next_cursor:
+        print(f"➡️  下一页: python utils/db_manager.py search {shlex.quote(query)} {limit} {next_cursor}")
+    
     await db.close_connection_pool()
 
-async def show_conversation_detail(conversation_id: str):
-    """显示指定会话的详细内容"""
-    db = ConversationDatabase(**DB_CONFIG)
+async def show_conversation_detail(conversation_id: str, limit: int = 100, before: int = None):
+    """分页显示指定会话的消息（默认最新一页，before 为序号时显示更早的一页）"""
+    db = ConversationDatabase(store=create_conversation_store())
     await db.init_database()
     
-    messages = await db.get_recent_messages(conversation_id, limit=100)
+    page = await db.get_messages_page(conversation_id, limit=limit, before=before)
+    messages = page["messages"]
     
     if not messages:
         print(f"📭 会话 {conversation_id} 没有找到任何消息")
@@ -47,20 +85,47 @@ async def show_conversation_detail(conversation_id: str):
     print(f"💬 会话 {conversation_id} 的消息记录:")
     print("=" * 80)
     
-    for i, msg in enumerate(messages, 1):
+    for msg in messages:
         role_icon = "👤" if msg["role"] == "user" else "🤖"
-        print(f"{i}. {role_icon} {msg['role'].upper()} [{msg['timestamp']}]")
+        print(f"{msg['message_index']}. {role_icon} {msg['role'].upper()} [{msg['timestamp']}]")
         print(f"   {msg['content']}")
         print("-" * 40)
     
+    if page["has_older"]:
+        print(f"⬅️  更早的消息: python utils/db_manager.py show {conversation_id} {limit} {page['oldest_index']}")
+    
     await db.close_connection_pool()
 
+async def export_conversation(conversation_id: str, output_path: str = None):
+    """以 NDJSON 流式导出会话的全部消息（服务器端游标，内存占用与会话长度无关）"""
+    output = open(output_path, "w", encoding="utf-8") if output_path else sys.stdout
+    count = 0
+    # 导出到标准输出时，日志改写到标准错误，不混入数据
+    with contextlib.redirect_stdout(sys.stderr):
+        db = ConversationDatabase(store=create_conversation_store())
+        try:
+            await db.init_database()
+            async for batch in db.iter_messages(conversation_id):
+                output.write("".join(
+                    json.dumps({"conversation_id": conversation_id, **message}, ensure_ascii=False) + "\n"
+                    for message in batch
+                ))
+                count += len(batch)
+        finally:
+            if output_path:
+                output.close()
+            await db.close_connection_pool()
+        
+        print(f"✅ 已导出会话 {conversation_id} 的 {count} 条消息" + (f"到 {output_path}" if output_path else ""))
+
 async def delete_conversation_interactive():
     """交互式删除会话"""
-    db = ConversationDatabase(**DB_CONFIG)
+    db = ConversationDatabase(store=create_conversation_store())
     await db.init_database()
     
-    conversations = await db.get_all_conversations()
+    # 最近活跃的会话（一次查询摘要表）
+    summaries, _ = await db.list_conversations(limit=50)
+    conversations = [summary["conversation_id"] for summary in summaries]
     
     if not conversations:
         print("📭 没有找到任何会话")
@@ -68,9 +133,8 @@ async def delete_conversation_interactive():
         return
     
     print("🗑️  选择要删除的会话:")
-    for i, conv_id in enumerate(conversations, 1):
-        summary = await db.get_conversation_summary(conv_id)
-        print(f"{i}. {conv_id} ({summary['total_messages']} 条消息)")
+    for i, summary in enumerate(summaries, 1):
+        print(f"{i}. {summary['conversation_id']} ({summary['total_messages']} 条消息)")
     
     try:
         choice = int(input("\n请输入序号 (0 取消): "))
@@ -96,61 +160,139 @@ async def delete_conversation_interactive():
     
     await db.close_connection_pool()
 
+async def cleanup_messages(days: int):
+    """分批清理超过指定天数的旧消息（按 MYSQL_RETENTION_* 配置限速和归档）"""
+    db = ConversationDatabase(store=create_conversation_store())
+    await db.init_database()
+    report = await db.cleanup_old_messages(days)
+    print(f"📊 删除 {report['deleted_rows']} 条消息，涉及 {report['conversations']} 个会话，"
+          f"{report['batches']} 批，耗时 {report['elapsed_seconds']}s，{report['rows_per_second']} 行/秒")
+    for path in report["archive_files"]:
+        print(f"   📦 归档: {path}")
+    await db.close_connection_pool()
+
+async def rebuild_summaries():
+    """从消息表重建会话摘要"""
+    db = ConversationDatabase(store=create_conversation_store())
+    await db.init_database()
+    await db.rebuild_summaries()
+    await db.close_connection_pool()
+
+async def migrate_schema(batch_size: int = 1000):
+    """把 MySQL 会话表在线迁移到 v2（代理键 + 长消息压缩），应用可以继续运行"""
+    if DB_BACKEND_CONFIG["backend"] != "mysql":
+        print("❌ 表结构迁移只适用于 MySQL 后端")
+        return
+    pool = DatabasePool(**DB_CONFIG, health_check_interval=0)
+    try:
+        report = await SchemaMigration(pool, batch_size=batch_size).run()
+        print(f"📊 {json.dumps(report, ensure_ascii=False)}")
+    finally:
+        await pool.close()
+
+async def add_fulltext_index():
+    """给旧版本升级来的 MySQL 消息表添加全文索引（建索引期间阻塞写入，在低峰期运行）"""
+    if DB_BACKEND_CONFIG["backend"] != "mysql":
+        print("❌ 全文索引只适用于 MySQL 后端")
+        return
+    store = MySQLConversationStore(DatabasePool(**DB_CONFIG, health_check_interval=0))
+    try:
+        if not await store.add_fulltext_index():
+            print("✅ 消息表已有全文索引")
+    finally:
+        await store.close()
+
+async def show_schema_stats(samples: int = 50):
+    """显示各表的数据 / 索引大小和两种表结构的历史读取延迟（迁移前后对比）"""
+    if DB_BACKEND_CONFIG["backend"] != "mysql":
+        print("❌ 表结构统计只适用于 MySQL 后端")
+        return
+    pool = DatabasePool(**DB_CONFIG, health_check_interval=0)
+    try:
+        report = await schema_stats(pool, samples)
+    finally:
+        await pool.close()
+
+    print("📦 表大小（information_schema 估算值）:")
+    for name, table in report["tables"].items():
+        print(f"   {name:<24} {table['rows']:>10} 行  数据 {table['data_mb']:>9} MB  索引 {table['index_mb']:>9} MB")
+    print("⏱️  读取最近消息的延迟（毫秒）:")
+    for version, latency in report["read_latency_ms"].items():
+        if latency:
+            print(f"   {version}: p50 {latency['p50']}  p95 {latency['p95']}（{latency['samples']} 个会话）")
+
 async def test_connection():
     """测试数据库连接"""
-    print("🔌 测试MySQL数据库连接...")
+    backend = DB_BACKEND_CONFIG["backend"]
+    print(f"🔌 测试会话数据库连接（{backend}）...")
     print(f"配置信息:")
-    print(f"  主机: {DB_CONFIG['host']}:{DB_CONFIG['port']}")
-    print(f"  数据库: {DB_CONFIG['database']}")
-    print(f"  用户: {DB_CONFIG['user']}")
+    if backend == "sqlite":
+        print(f"  文件: {DB_BACKEND_CONFIG['sqlite_path']}")
+    else:
+        print(f"  主机: {DB_CONFIG['host']}:{DB_CONFIG['port']}")
+        print(f"  数据库: {DB_CONFIG['database']}")
+        print(f"  用户: {DB_CONFIG['user']}")
     
     try:
-        db = ConversationDatabase(**DB_CONFIG)
+        db = ConversationDatabase(store=create_conversation_store())
         await db.init_database()
         
-        async with db.get_connection() as cursor:
-            await cursor.execute("SELECT VERSION()")
-            version = await cursor.fetchone()
-            print(f"✅ 连接成功！MySQL版本: {version[0]}")
-            
-            await cursor.execute("SELECT COUNT(*) FROM conversations")
-            count = await cursor.fetchone()
-            print(f"📊 当前数据库中有 {count[0]} 条消息")
+        info = await db.store.server_info()
+        print(f"✅ 连接成功！版本: {info['version']}" + (f"，表结构 v{info['schema']}" if info.get("schema") else ""))
+        print(f"📊 当前数据库中有 {info['messages']} 条消息")
         
         await db.close_connection_pool()
         
     except Exception as e:
         print(f"❌ 连接失败: {e}")
         print("\n💡 请检查:")
-        print("  1. MySQL服务器是否正在运行")
+        print("  1. MySQL服务器是否正在运行（SQLite 后端检查文件路径是否可写）")
         print("  2. 连接配置是否正确")
         print("  3. 用户权限是否足够")
 
 def print_help():
     """显示帮助信息"""
     print("""
-🛠️  MySQL数据库管理工具
+🛠️  会话数据库管理工具
 
 用法: python utils/db_manager.py [命令] [参数]
 
 命令:
-  list                    - 显示所有会话
-  show <conversation_id>  - 显示指定会话的详细内容
+  list [limit] [cursor]   - 分页显示会话（默认每页50个）
+  show <conversation_id> [limit] [before]
+                          - 分页显示指定会话的消息（before 为序号，显示更早的一页）
+  search <keyword> [limit] [cursor]
+                          - 全文搜索消息内容（至少2个字符，按时间倒序分页）
+  export <conversation_id> [file]
+                          - 以 NDJSON 流式导出会话全部消息（不指定文件时输出到标准输出）
   delete                  - 交互式删除会话
+  cleanup <days>          - 分批清理超过指定天数的旧消息（可配置归档目录）
+  rebuild-summaries       - 从消息表重建会话摘要
+  migrate-schema [batch_size]
+                          - 把 MySQL 会话表在线迁移到 v2（代理键、长消息压缩，可按月分区）
+  schema-stats [samples]  - 显示表和索引大小、历史读取延迟（迁移前后对比）
+  add-fulltext-index      - 给旧版本升级来的 MySQL 消息表添加全文索引（期间阻塞写入，低峰期运行）
   test                    - 测试数据库连接
   help                    - 显示此帮助信息
 
 示例:
   python utils/db_manager.py list
   python utils/db_manager.py show user123
+  python utils/db_manager.py search ORD-20240917
+  python utils/db_manager.py export user123 user123.ndjson
   python utils/db_manager.py test
 
 环境变量配置:
+  CONVERSATION_BACKEND=mysql        # 或 sqlite
+  CONVERSATION_SQLITE_PATH=data/conversations.db
   MYSQL_HOST=localhost
   MYSQL_PORT=3306
   MYSQL_USER=root
   MYSQL_PASSWORD=your_password
   MYSQL_DATABASE=ai_assistant
+  MYSQL_COMPRESS_THRESHOLD=0        # v2 长消息压缩阈值（字节），压缩的消息不参与搜索
+  MYSQL_SCHEMA_PARTITION=none       # 或 month（需要 MYSQL_SINGLE_WRITER=1）
+  MYSQL_SINGLE_WRITER=0             # 只有一个进程写入会话消息
     """)
 
 async def main():
@@ -162,17 +304,53 @@ async def main():
     command = sys.argv[1].lower()
     
     if command == "list":
-        await show_all_conversations()
+        limit = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+        cursor = sys.argv[3] if len(sys.argv) > 3 else None
+        await show_all_conversations(limit, cursor)
     
     elif command == "show":
         if len(sys.argv) < 3:
             print("❌ 请提供会话ID")
             return
-        await show_conversation_detail(sys.argv[2])
+        limit = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+        before = int(sys.argv[4]) if len(sys.argv) > 4 else None
+        await show_conversation_detail(sys.argv[2], limit, before)
+    
+    elif command == "search":
+        if len(sys.argv) < 3:
+            print("❌ 请提供搜索词")
+            return
+        limit = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+        cursor = sys.argv[4] if len(sys.argv) > 4 else None
+        await search_messages(sys.argv[2], limit, cursor)
+    
+    elif command == "export":
+        if len(sys.argv) < 3:
+            print("❌ 请提供会话ID")
+            return
+        await export_conversation(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
     
     elif command == "delete":
         await delete_conversation_interactive()
     
+    elif command == "cleanup":
+        if len(sys.argv) < 3:
+            print("❌ 请提供保留天数")
+            return
+        await cleanup_messages(int(sys.argv[2]))
+    
+    elif command == "rebuild-summaries":
+        await rebuild_summaries()
+    
+    elif command == "migrate-schema":
+        await migrate_schema(int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
+    
+    elif command == "schema-stats":
+        await show_schema_stats(int(sys.argv[2]) if len(sys.argv) > 2 else 50)
+    
+    elif command == "add-fulltext-index":
+        await add_fulltext_index()
+    
     elif command == "test":
         await test_connection()
     